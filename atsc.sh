@@ -107,12 +107,13 @@ declare SFO_ATSC_CHANNEL_LIST=( 7 13 19 27 29 30 33 38 39 40 41 43 44)
 declare SOAPY_DEVICE_LIST=( 0 )
 declare ATSC_PILOT_AUDIO_EXPECTED=1441       ### Tune this many Hz below the pilot frequency and expect an audio tone of this frequency in Hz
 
-### Tunes 1440 Hz below the pilot carriers, records 2 seconds of audio, then runs 'sox -n stat -freq' to see how much the audio frequency differs from 1440 Hz.
+### Tunes 1441 Hz below the pilot carriers, records 2 seconds of audio, then measures how much the audio frequency differs from 1441 Hz.
+### All the channels are captured and measured by one sdr_calibrate.py process, which analyzes each capture while sdrTest records the next one
 function atsc_scan() {
     local soapy_device=$1
-    local index 
-    for (( index=0 ; index<${#SFO_ATSC_CHANNEL_LIST[@]}; index++)); do
-        local channel_number=${SFO_ATSC_CHANNEL_LIST[${index}]}
+    local carrier_list=()
+    local channel_number
+    for channel_number in ${SFO_ATSC_CHANNEL_LIST[@]} ; do
         local atsc_pilot_frequency=""
         atsc_get_pilot_freq atsc_pilot_frequency ${channel_number} 
         local ret_code=$?
@@ -120,28 +121,19 @@ function atsc_scan() {
              wd_logger 0 "ERROR: atsc_get_pilot_tuning_freq  ${channel_number} not valid: ${atsc_pilot_frequency}"
             continue
         fi
-        local test_expected_audio_freq=${ATSC_PILOT_AUDIO_EXPECTED}
-        local tuning_frequency=$(( atsc_pilot_frequency - ${test_expected_audio_freq} ))
-        local center_frequency=$(( atsc_pilot_frequency - (atsc_pilot_frequency % ${TUNING_CENTER_OFFSET_HZ}) ))
-
-        wd_logger 3 "receive ch #${channel_number} at ${atsc_pilot_frequency} by tuning to freq ${tuning_frequency}"
-        local measured_audio_freq="none"
-        sdr_measure_error measured_audio_freq ${soapy_device} ${tuning_frequency} ${center_frequency} ${test_expected_audio_freq}
-        local ret_code=$?
-        if [[ ${ret_code} -ne 0 ]]; then
-             wd_logger 0 " sdr_measure_error() => ${ret_code} for test device #${soapy_device} at center ${center_frequency} / test ${tuning_frequency}, expecting %4d Hz audio report\n" \
-                ${test_expected_audio_freq}
-            continue
-        fi
-
-        local tuning_error_hz=$(( ${test_expected_audio_freq} - ${measured_audio_freq} ))
-        local ppm_error=0
-        if [[ ${tuning_error_hz} -ne 0 ]]; then
-            ppm_error=$( bc <<< "scale=4; ( 1000000/ (${tuning_frequency} / ${tuning_error_hz}) )" )
-        fi
-         wd_logger 0 "device #${soapy_device} tuned to ATSC channel #%2d pilot carrier at ${tuning_frequency}, center ${center_frequency}. Expected %4d Hz audio, measured %4d Hz audio, so tuning is off by %4d Hz = %5.4f ppm\n" \
-                ${channel_number} ${test_expected_audio_freq} ${measured_audio_freq} ${tuning_error_hz} ${ppm_error}
+        carrier_list+=( ${channel_number}:${atsc_pilot_frequency} )
     done
+    wd_logger 3 "measure device #${soapy_device} on the ATSC pilot carriers ${carrier_list[*]}"
+
+    local sweep_output
+    sweep_output=$( python3 ${SDR_CALIBRATE_CMD} sweep --device ${soapy_device} --sps ${SDR_AUDIO_SPS} --seconds ${SDR_SAMPLE_TIME} --audio-freq ${ATSC_PILOT_AUDIO_EXPECTED} \
+                                               --center-step ${TUNING_CENTER_OFFSET_HZ} ${carrier_list[@]} 2>&1 )
+    local ret_code=$?
+    wd_logger 0 "device #${soapy_device} tuned ${ATSC_PILOT_AUDIO_EXPECTED} Hz below the ATSC pilot carriers:\n${sweep_output}"
+    if [[ ${ret_code} -ne 0 ]]; then
+        wd_logger 0 "ERROR: one or more of the ATSC pilot carriers couldn't be measured"
+    fi
+    return ${ret_code}
 }
 
 declare ATSC_CENTER_OFFSET_HZ=100000     ### For ATSC pilot carrier measurements, set the center 100 kHz below the pilot carrier frequecy
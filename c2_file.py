@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: c2_file.py
+# Shared reader of the C2 files written by 'wsprd -c'.  The file is a 26 byte header:
+#     char name[14]  e.g. '000000_0001.c2',  int32 wspr_type (2 => WSPR-2),  float64 dial frequency in MHz
+# followed by 45000 interleaved float32 I/Q samples, i.e. 120 seconds at 375 sps.
+#
+# read_c2() memory maps the file, validates the header and returns the samples as a read-only zero-copy complex64 view,
+# so c2_noise.py and any other C2 analytics can stay in single precision without copying or de-interleaving the samples.
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+C2_HEADER = struct.Struct('<14sid')
+C2_SAMPLE_RATE = 375
+C2_SAMPLES = 45000
+C2_WSPR_TYPES = (2, 15)
+
+C2File = namedtuple('C2File', 'name wspr_type freq_mhz samples')
+
+
+class C2FormatError(ValueError):
+    pass
+
+
+def read_c2(path, expected_samples=C2_SAMPLES):
+    file_size = os.path.getsize(path)
+    if file_size < C2_HEADER.size:
+        raise C2FormatError("'%s' has only %d bytes, which is less than a C2 header" % (path, file_size))
+    with open(path, 'rb') as fp:
+        raw_name, wspr_type, freq_mhz = C2_HEADER.unpack(fp.read(C2_HEADER.size))
+
+    name = raw_name.split(b'\0', 1)[0].decode('ascii', errors='replace')
+    if not name.endswith('.c2'):
+        raise C2FormatError("'%s' header name '%s' is not a C2 filename" % (path, name))
+    if wspr_type not in C2_WSPR_TYPES:
+        raise C2FormatError("'%s' has wspr_type %d, not one of %s" % (path, wspr_type, C2_WSPR_TYPES))
+    if not 0.0 < freq_mhz < 10000.0:
+        raise C2FormatError("'%s' has invalid frequency %r MHz" % (path, freq_mhz))
+    sample_bytes = file_size - C2_HEADER.size
+    if sample_bytes % 8 or (expected_samples and sample_bytes // 8 != expected_samples):
+        raise C2FormatError("'%s' has %d bytes of I/Q samples, not the %d complex samples expected" % (path, sample_bytes, expected_samples))
+
+    samples = np.memmap(path, dtype=np.complex64, mode='r', offset=C2_HEADER.size, shape=(sample_bytes // 8,))
+    return C2File(name, wspr_type, freq_mhz, samples)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: c2_waterfall.py
+# Per WSPR cycle waterfall 'tiles' of the C2 spectrogram which c2_noise.py already computes, and a reader and renderer which
+# builds waterfalls of many hours from the tiles without reprocessing any audio.
+#
+# A .c2wf tile is:
+#     header   'C2WF', uint8 version, uint16 rows, uint16 bins, float64 dial MHz, float32 first bin Hz, float32 bin Hz,
+#              float32 dB of code 0, float32 dB per code, float32 C2 noise level
+#     float32  [bins]           median over the cycle of the power in dB of each bin, i.e. the noise floor of each bin
+#     uint8    [rows][bins]     the power in dB of each of the 180 FFTs, quantized to 'dB of code 0 + code * dB per code'
+# so the 180x175 bins of the flat part of the passband take about 32 KB per band per cycle.
+#
+# decoding.sh has c2_noise.py write a tile of each cycle into signal_levels/RECEIVER/BAND/waterfall/YYMMDD/HHMM.c2wf when
+# WD_C2_WATERFALL="yes"
+#
+# Usage:
+#     c2_waterfall.py info   TILE ...
+#     c2_waterfall.py floor  [--start YYMMDD_HHMM] [--end YYMMDD_HHMM] WATERFALL_DIR     ### print the median noise floor of each bin
+#     c2_waterfall.py render [--start YYMMDD_HHMM] [--end YYMMDD_HHMM] [--rows-per-tile N] --output FILE.png|FILE.pgm WATERFALL_DIR
+
+import argparse
+import calendar
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+C2WF_MAGIC = b'C2WF'
+C2WF_VERSION = 1
+C2WF_HEADER = struct.Struct('<4sBHHdfffff')
+C2WF_MIN_DB_PER_CODE = 0.25
+C2_CYCLE_SECS = 120
+
+
+class C2WaterfallError(ValueError):
+    pass
+
+
+def write_tile(path, power, dial_mhz, first_bin_hz, bin_hz, noise_level):
+    # power is the [rows][bins] array of the FFT powers of one cycle
+    power_db = 10 * np.log10(power + 1e-30, dtype=np.float32)
+    floor_db = np.median(power_db, axis=0).astype(np.float32)
+    low_db = float(np.floor(power_db.min()))
+    db_per_code = max((float(power_db.max()) - low_db) / 255, C2WF_MIN_DB_PER_CODE)
+    codes = np.clip(np.rint((power_db - low_db) / db_per_code), 0, 255).astype(np.uint8)
+    rows, bins = codes.shape
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(C2WF_HEADER.pack(C2WF_MAGIC, C2WF_VERSION, rows, bins, dial_mhz, first_bin_hz, bin_hz, low_db, db_per_code, noise_level))
+        fp.write(floor_db.tobytes())
+        fp.write(codes.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_tile(path):
+    # Returns (header dict, floor_db[bins], codes[rows][bins])
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if len(data) < C2WF_HEADER.size:
+        raise C2WaterfallError("'%s' is too short to be a waterfall tile" % path)
+    magic, version, rows, bins, dial_mhz, first_bin_hz, bin_hz, low_db, db_per_code, noise_level = C2WF_HEADER.unpack_from(data)
+    if magic != C2WF_MAGIC or version != C2WF_VERSION:
+        raise C2WaterfallError("'%s' is not a version %d waterfall tile" % (path, C2WF_VERSION))
+    if len(data) != C2WF_HEADER.size + 4 * bins + rows * bins:
+        raise C2WaterfallError("'%s' has %d bytes, not the %d expected" % (path, len(data), C2WF_HEADER.size + 4 * bins + rows * bins))
+    header = {'rows': rows, 'bins': bins, 'dial_mhz': dial_mhz, 'first_bin_hz': first_bin_hz, 'bin_hz': bin_hz,
+              'low_db': low_db, 'db_per_code': db_per_code, 'noise_level': noise_level}
+    floor_db = np.frombuffer(data, dtype=np.float32, count=bins, offset=C2WF_HEADER.size)
+    codes = np.frombuffer(data, dtype=np.uint8, offset=C2WF_HEADER.size + 4 * bins).reshape(rows, bins)
+    return header, floor_db, codes
+
+
+def tile_power_db(header, codes):
+    return header['low_db'] + codes.astype(np.float32) * header['db_per_code']
+
+
+def cycle_epoch(cycle_name):
+    # 'YYMMDD_HHMM' => UTC epoch
+    return calendar.timegm(time.strptime(cycle_name, '%y%m%d_%H%M'))
+
+
+def find_tiles(waterfall_dir, start=None, end=None):
+    # Returns the sorted list of (epoch, path) of the tiles in the YYMMDD/HHMM.c2wf files under waterfall_dir
+    tiles = []
+    for day in sorted(os.listdir(waterfall_dir)):
+        day_dir = os.path.join(waterfall_dir, day)
+        if not os.path.isdir(day_dir):
+            continue
+        for file_name in sorted(os.listdir(day_dir)):
+            if not file_name.endswith('.c2wf'):
+                continue
+            cycle_name = '%s_%s' % (day, file_name[:4])
+            if (start and cycle_name < start) or (end and cycle_name > end):
+                continue
+            try:
+                tiles.append((cycle_epoch(cycle_name), os.path.join(day_dir, file_name)))
+            except ValueError:
+                continue
+    return tiles
+
+
+def build_waterfall(tiles, rows_per_tile):
+    # Returns the [rows][bins] dB waterfall of the tiles, oldest at the top.  Each tile is reduced to rows_per_tile rows by
+    # keeping the peak of each group of FFTs, so short interference is not averaged away.  Missing cycles are left as NaN rows
+    if not tiles:
+        raise C2WaterfallError('no waterfall tiles found')
+    first_epoch = tiles[0][0]
+    cycles = (tiles[-1][0] - first_epoch) // C2_CYCLE_SECS + 1
+    waterfall = None
+    for epoch, path in tiles:
+        try:
+            header, _, codes = read_tile(path)
+        except (OSError, C2WaterfallError) as err:
+            print('WARNING: %s' % err, file=sys.stderr)
+            continue
+        if waterfall is None:
+            bins = header['bins']
+            waterfall = np.full((cycles * rows_per_tile, bins), np.nan, dtype=np.float32)
+        if header['bins'] != waterfall.shape[1] or header['rows'] % rows_per_tile:
+            print("WARNING: skipping '%s' which has %dx%d bins" % (path, header['rows'], header['bins']), file=sys.stderr)
+            continue
+        row = (epoch - first_epoch) // C2_CYCLE_SECS * rows_per_tile
+        peak_codes = codes.reshape(rows_per_tile, -1, header['bins']).max(axis=1)
+        waterfall[row:row + rows_per_tile] = tile_power_db(header, peak_codes)
+    if waterfall is None:
+        raise C2WaterfallError('none of the %d waterfall tiles could be read' % len(tiles))
+    return waterfall
+
+
+def write_image(path, waterfall, low_db=None, high_db=None):
+    finite = waterfall[np.isfinite(waterfall)]
+    low_db = float(np.percentile(finite, 1)) if low_db is None else low_db
+    high_db = float(np.percentile(finite, 99.9)) if high_db is None else high_db
+    pixels = np.nan_to_num((waterfall - low_db) / max(high_db - low_db, 1e-3), nan=0.0)
+    pixels = (np.clip(pixels, 0.0, 1.0) * 255).astype(np.uint8)
+    if path.endswith('.pgm'):
+        with open(path, 'wb') as fp:
+            fp.write(b'P5\n%d %d\n255\n' % (pixels.shape[1], pixels.shape[0]))
+            fp.write(pixels.tobytes())
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.imsave(path, pixels, cmap='viridis', vmin=0, vmax=255)
+
+
+def cmd_info(args):
+    for path in args.tiles:
+        try:
+            header, floor_db, _ = read_tile(path)
+        except (OSError, C2WaterfallError) as err:
+            print('ERROR: %s' % err, file=sys.stderr)
+            return 1
+        print('%s: %dx%d bins of %.3f Hz from %.1f Hz at %.6f MHz, C2 noise %.2f, median floor %.1f dB' %
+              (path, header['rows'], header['bins'], header['bin_hz'], header['first_bin_hz'], header['dial_mhz'], header['noise_level'],
+               float(np.median(floor_db))))
+    return 0
+
+
+def cmd_floor(args):
+    floors = []
+    first_header = None
+    for _, path in find_tiles(args.waterfall_dir, args.start, args.end):
+        try:
+            header, floor_db, _ = read_tile(path)
+        except (OSError, C2WaterfallError):
+            continue
+        first_header = first_header or header
+        if header['bins'] == first_header['bins']:
+            floors.append(floor_db)
+    if not floors:
+        print('ERROR: no waterfall tiles found', file=sys.stderr)
+        return 1
+    floor_db = np.median(np.array(floors), axis=0)
+    for i, level in enumerate(floor_db):
+        print('%8.2f %7.2f' % (first_header['first_bin_hz'] + i * first_header['bin_hz'], level))
+    return 0
+
+
+def cmd_render(args):
+    try:
+        waterfall = build_waterfall(find_tiles(args.waterfall_dir, args.start, args.end), args.rows_per_tile)
+        write_image(args.output, waterfall, args.low_db, args.high_db)
+    except (OSError, C2WaterfallError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    except ImportError:
+        print("ERROR: matplotlib is needed to write '%s', but a .pgm image can be written without it" % args.output, file=sys.stderr)
+        return 1
+    print('Wrote %dx%d waterfall to %s' % (waterfall.shape[0], waterfall.shape[1], args.output), file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read and render the C2 waterfall tiles written by c2_noise.py')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    info_parser = subparsers.add_parser('info', help='Print the header of tiles')
+    info_parser.add_argument('tiles', nargs='+')
+    floor_parser = subparsers.add_parser('floor', help='Print the median noise floor of each bin over a time range')
+    render_parser = subparsers.add_parser('render', help='Render the tiles of a time range into one waterfall image')
+    for sub_parser in (floor_parser, render_parser):
+        sub_parser.add_argument('--start', default=None, help='First cycle, YYMMDD_HHMM')
+        sub_parser.add_argument('--end', default=None, help='Last cycle, YYMMDD_HHMM')
+        sub_parser.add_argument('waterfall_dir', help='e.g. ~/wsprdaemon/signal_levels/KIWI_0/20/waterfall')
+    render_parser.add_argument('--output', required=True, help='A .pgm file, or any image type matplotlib can save')
+    render_parser.add_argument('--rows-per-tile', type=int, default=180, help='Keep the peak of each group of 180/N FFTs of a cycle')
+    render_parser.add_argument('--low-db', type=float, default=None, help='dB of the darkest pixel, default the 1st percentile')
+    render_parser.add_argument('--high-db', type=float, default=None, help='dB of the brightest pixel, default the 99.9th percentile')
+    args = parser.parse_args(argv)
+    if args.command == 'info':
+        return cmd_info(args)
+    if args.command == 'floor':
+        return cmd_floor(args)
+    return cmd_render(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -338,7 +338,7 @@ function get_suntimes()
     local lat=$2
     local lon=$3
 
-    python3 ${SUNTIMES_PYTHON_PROGRAM} ${lat} ${lon} > suntimes.txt 2> /dev/null
+    ${WD_PY_CMD} suntimes ${lat} ${lon} > suntimes.txt 2> /dev/null
     rc=$?
     if [[ ${rc} -ne 0 ]]; then
         wd_logger 1 "ERROR: 'python3 ${SUNTIMES_PYTHON_PROGRAM} ${lat} ${lon}' => ${rc}"
@@ -11,6 +11,31 @@ declare FFT_WINDOW_CMD=${WSPRDAEMON_ROOT_DIR}/wav_window.py
 
 declare C2_FFT_ENABLED="yes"          ### If "yes", then use the c2 file produced by wsprd to calculate FFT noise levels
 declare C2_FFT_CMD=${WSPRDAEMON_ROOT_DIR}/c2_noise.py
+declare WD_NOISE_CAL_CMD=${WSPRDAEMON_ROOT_DIR}/wd_noise_cal.py                 ### If WD_NOISE_CAL="yes", calculates and applies the noise level calibration in place of the awk and bc forks
+declare WD_C2_WATERFALL=${WD_C2_WATERFALL-no}                         ### If "yes", c2_noise.py also saves the spectrogram of each cycle as a waterfall tile.  See c2_waterfall.py
+declare WD_C2_WATERFALL_KEEP_DAYS=${WD_C2_WATERFALL_KEEP_DAYS-7}      ### Delete the tiles of older days
+
+### Returns the path of the waterfall tile of a cycle:  signal_levels/RECEIVER/BAND/waterfall/YYMMDD/HHMM.c2wf
+### When a new day's directory is created, the directories of days older than WD_C2_WATERFALL_KEEP_DAYS are deleted
+function get_c2_waterfall_tile_path() {
+    local return_variable_name=$1
+    local receiver_name=${2//\//=}
+    local receiver_band=$3
+    local cycle_name=$4          ### YYMMDD_HHMM
+
+    local waterfall_dir=${WSPRDAEMON_ROOT_DIR}/signal_levels/${receiver_name}/${receiver_band}/waterfall
+    local day_dir=${waterfall_dir}/${cycle_name:0:6}
+    if [[ ! -d ${day_dir} ]]; then
+        mkdir -p ${day_dir}
+        local -a day_dir_list=( $( find ${waterfall_dir} -mindepth 1 -maxdepth 1 -type d -name '[0-9][0-9][0-9][0-9][0-9][0-9]' | sort ) )
+        local old_day_count=$(( ${#day_dir_list[@]} - WD_C2_WATERFALL_KEEP_DAYS ))
+        if (( old_day_count > 0 )); then
+            wd_logger 1 "Deleting the ${old_day_count} oldest days of waterfall tiles in ${waterfall_dir}"
+            rm -rf ${day_dir_list[@]:0:${old_day_count}}
+        fi
+    fi
+    eval ${return_variable_name}=${day_dir}/${cycle_name:7:4}.c2wf
+}
 
 ### Default per-band KA9Q/RX888 noise calibration.  The sox noise calibration was derived for a KiwiSDR and is not
 ### calibrated for the RX888 chain, so KA9Q noise over-reads by a band-dependent ~5-10 dB.  These offsets (dRMS, dC2 =
@@ -103,6 +128,27 @@ function calculate_nl_adjustments() {
 
     local rc
     local wspr_band_freq_khz=$(get_wspr_band_freq_khz ${receiver_band})
+
+    local antenna_factor_adjust
+    get_af_db antenna_factor_adjust ${receiver_name} ${receiver_band}
+    rc=$? ; if (( rc )); then
+        wd_logger 1 "ERROR: can't find AF for ${receiver_name} ${receiver_band}"
+        exit 1
+    fi
+    wd_logger 1 "Got AF = ${antenna_factor_adjust} for ${receiver_name} ${receiver_band}"
+
+    if [[ ${WD_NOISE_CAL-no} == "yes" ]]; then
+        local nl_adjustments
+        nl_adjustments=( $( python3 ${WD_NOISE_CAL_CMD} coefficients --freq-khz ${wspr_band_freq_khz} --af-db ${antenna_factor_adjust} ) )
+        rc=$? ; if (( rc == 0 && ${#nl_adjustments[@]} == 2 )); then
+            wd_logger 1 "${WD_NOISE_CAL_CMD##*/} calculated rms_nl_adjust=${nl_adjustments[0]} and fft_nl_adjust=${nl_adjustments[1]}"
+            eval ${return_rms_corrections_variable_name}=${nl_adjustments[0]}
+            eval ${return_fft_corrections_variable_name}="'${nl_adjustments[1]}'"
+            return 0
+        fi
+        wd_logger 1 "ERROR: 'python3 ${WD_NOISE_CAL_CMD} coefficients --freq-khz ${wspr_band_freq_khz} --af-db ${antenna_factor_adjust}' => ${rc}, so calculate them with awk"
+    fi
+
     local wspr_band_freq_mhz=$(awk "BEGIN {printf \"%.6f\", $wspr_band_freq_khz / 1000}")
     local wspr_band_freq_hz=$(awk "BEGIN {printf \"%.0f\", $wspr_band_freq_khz * 1000}")
     wd_logger 1 "CALCS: wspr_band_freq_khz=${wspr_band_freq_khz}, wspr_band_freq_mhz=${wspr_band_freq_mhz}, wspr_band_freq_hz=${wspr_band_freq_hz}"
@@ -150,14 +196,6 @@ EOF
         wd_logger 1 "Don't make a correcction since wspr_band_freq_mhz=${wspr_band_freq_mhz} > 30"
     fi
 
-    local antenna_factor_adjust
-    get_af_db antenna_factor_adjust ${receiver_name} ${receiver_band}
-    rc=$? ; if (( rc )); then
-        wd_logger 1 "ERROR: can't find AF for ${receiver_name} ${receiver_band}"
-        exit 1
-    fi
-    wd_logger 1 "Got AF = ${antenna_factor_adjust} for ${receiver_name} ${receiver_band}"
-
     local rx_khz_offset=$(get_receiver_khz_offset_list_from_name ${receiver_name})
     wd_logger 1  "local total_correction_db=\$(bc <<< 'scale = 10; ${kiwi_amplitude_versus_frequency_correction} + ${antenna_factor_adjust})'" 
     local total_correction_db=$(awk -v a="$kiwi_amplitude_versus_frequency_correction" -v b="$antenna_factor_adjust" 'BEGIN { printf "%.10f\n", a + b }')
@@ -172,6 +210,46 @@ EOF
     eval ${return_fft_corrections_variable_name}="'${calculated_fft_nl_adjust}'"
 }
 
+### Applies the noise calibration to the C2 noise and the raw sox levels of a cycle in one 'wd_noise_cal.py apply', rather than in the chain of bc forks in decoding_daemon()
+### Like that chain, it uses the receiver_name and receiver_band of the calling decoding_daemon()
+function calculate_noise_levels() {
+    local return_fft_noise_level_var=$1
+    local return_rms_noise_level_var=$2
+    local return_rms_line_var=$3
+    local wav_filename=$4
+    local c2_noise_level=$5
+    local rms_nl_adjust=$6
+    local fft_nl_adjust=$7
+    local peak_level_dbfs=$8
+    local channel_gain=$9
+    local n0_level=${10}
+    local rc
+
+    local raw_rms_level
+    local raw_levels_line
+    get_rms_levels raw_rms_level raw_levels_line ${wav_filename} ""
+    rc=$? ; if (( rc )); then
+        wd_logger 1 "ERROR: 'get_rms_levels raw_rms_level raw_levels_line ${wav_filename}' => ${rc}"
+        return ${rc}
+    fi
+    local raw_levels_list=( ${raw_levels_line} )
+    local noise_cal_args=( --receiver ${receiver_name} --band ${receiver_band} --rms-nl-adjust ${rms_nl_adjust} --fft-nl-adjust ${fft_nl_adjust} --c2 "${c2_noise_level}"
+                           --peak-dbfs "${peak_level_dbfs}" --channel-gain "${channel_gain}" --ka9q-use-band-cal ${KA9Q_USE_BAND_CAL:-yes}
+                           --ka9q-rms-cal-offset ${KA9Q_RMS_CAL_OFFSET[${receiver_band}]:-0} --ka9q-c2-cal-offset ${KA9Q_C2_CAL_OFFSET[${receiver_band}]:-0}
+                           --ka9q-use-radiod-n0 ${KA9Q_USE_RADIOD_N0:-no} --ka9q-n0 "${n0_level}" --ka9q-n0-cal-offset ${KA9Q_N0_CAL_OFFSET_DB:-0.0} -- ${raw_levels_list[@]:0:12} )
+    local noise_levels_list
+    noise_levels_list=( $( ${WD_PY_CMD} wd_noise_cal apply "${noise_cal_args[@]}" 2> noise_cal.stderr ) )
+    rc=$? ; if (( rc || ${#noise_levels_list[@]} != 15 )); then
+        wd_logger 1 "ERROR: '${WD_PY_CMD} wd_noise_cal apply ${noise_cal_args[*]}' => ${rc} and printed ${#noise_levels_list[@]} levels:\n$(< noise_cal.stderr)"
+        return 1
+    fi
+    eval ${return_rms_line_var}=\"${noise_levels_list[*]:0:13}\"
+    eval ${return_fft_noise_level_var}=${noise_levels_list[13]}
+    eval ${return_rms_noise_level_var}=${noise_levels_list[14]}
+    wd_logger 1 "From c2=${c2_noise_level} and sox levels '${raw_levels_list[*]:0:12}': fft=${noise_levels_list[13]} rms=${noise_levels_list[14]} rms_line='${noise_levels_list[*]:0:13}'"
+    return 0
+}
+
 declare WAV_SAMPLES_LIST=(
     "${SIGNAL_LEVEL_PRE_TX_SEC} ${SIGNAL_LEVEL_PRE_TX_LEN}"
     "${SIGNAL_LEVEL_TX_SEC} ${SIGNAL_LEVEL_TX_LEN}"
@@ -241,6 +319,11 @@ function get_wav_levels()
     wd_logger 2 "Got sox dB values: '${wav_levels_list[*]}'"
 
     local return_line=""
+    if [[ -z "${rms_adjust}" ]]; then
+        ### calculate_noise_levels() applies the calibration to the raw sox levels itself
+        eval ${__return_levels_var}=\"${wav_levels_list[*]}\"
+        return 0
+    fi
     for db_val in ${wav_levels_list[@]}; do
         local adjusted_val=$(bc <<< "scale = 2; (${db_val} + ${rms_adjust})/1")           ### '/1' forces bc to use the scale = 2 setting
         return_line="${return_line} ${adjusted_val}"
@@ -364,6 +447,7 @@ function decode_wspr_wav_file() {
     local stdout_file=$4
     local wsprd_cmd_flags="$5"                  ### ${WSPRD_CMD_FLAGS}
     local wsprd_spreading_cmd_flags="$6"        ### ${WSPRD_CMD_FLAGS}
+    local receiver_band=$7                      ### Only for the wd_trace_run records
     local rc
 
     wd_logger 2 "Decode file ${wav_file_name} for frequency ${wspr_decode_capture_freq_hz} and send stdout to ${stdout_file}.  rx_khz_offset=${rx_khz_offset}, wsprd_cmd_flags='${wsprd_cmd_flags}'"
@@ -378,7 +462,7 @@ function decode_wspr_wav_file() {
     sort -k 1,2 -k 5,5 ALL_WSPR.TXT > ALL_WSPR.TXT.save
     cp -p ALL_WSPR.TXT.save ALL_WSPR.TXT
 
-    timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_CMD} -c ${wsprd_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}
+    wd_trace_run wsprd "${receiver_band}" ${wav_file_name%.wav} timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_CMD} -c ${wsprd_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}
     rc=$? ; if (( rc )); then
         wd_logger 1 "ERROR: Command 'timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_CMD} -c ${wsprd_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}' returned error ${rc}"
         return ${rc}
@@ -400,7 +484,7 @@ function decode_wspr_wav_file() {
         wd_logger 2 "Skipping wsprd second pass because WSPRD_TWO_PASS == 'no'"
         >  ${stdout_file}.spreading
     else
-        timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_SPREADING_CMD} ${n_arg} -c ${wsprd_spreading_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}.spreading
+        wd_trace_run wsprd_spreading "${receiver_band}" ${wav_file_name%.wav} timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_SPREADING_CMD} ${n_arg} -c ${wsprd_spreading_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}.spreading
         rc=$? ; if (( rc )); then
             wd_logger 1 "ERROR: Command 'timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${WSPR_CMD_NICE_LEVEL} ${WSPRD_SPREADING_CMD} -n -c ${wsprd_spreading_cmd_flags} -f ${wspr_decode_capture_freq_mhz} ${wav_file_name} > ${stdout_file}.spreading' returned error ${rc}"
             # return ${rc}
@@ -787,10 +871,115 @@ COMMENTED_OUT_LINES
     return 0
 } 
 
+### When WD_WAV_READY="yes", the watchdog spawns wav_ready_daemon() which watches the recording dirs with inotify and writes 'READY WAV_FILE_PATH FRAMES SAMPLE_RATE'
+### to the FIFO of each decoding daemon as soon as each of its wav files is complete.  So get_wav_file_list() blocks in 'read' rather than polling with lsof and stat.  See wd_wav_ready.py
+declare WD_WAV_READY_CMD=${WSPRDAEMON_ROOT_DIR}/wd_wav_ready.py
+declare WD_WAV_READY_PORT=${WD_WAV_READY_PORT-58035}        ### UDP port on 127.0.0.1 where the decoding daemons send START and WATCH
+declare WAV_READY_FIFO="wav_ready.fifo"
+declare WAV_READY_FILES_MAX=${WAV_READY_FILES_MAX-100}      ### Forget the ready files which have been deleted once there are this many
+declare WAV_READY_DAEMON_PID_FILE=${WSPRDAEMON_TMP_DIR}/wav_ready_daemon.pid   ### Written by spawn_daemon() for the watchdog's 'wav_ready_daemon ${WSPRDAEMON_TMP_DIR}'
+declare WAV_READY_ALIVE_CHECK_SECS=5                        ### While waiting on the FIFO, check this often that wd_wav_ready.py is still running
+declare wav_ready_fd=""
+declare -A wav_ready_files=()                               ### The complete wav files reported by wd_wav_ready.py
+
+function wav_ready_notify()
+{
+    local message="$*"
+
+    if ! printf "%s\n" "${message}" 2> /dev/null > /dev/udp/127.0.0.1/${WD_WAV_READY_PORT} ; then
+        wd_logger 1 "ERROR: failed to send '${message}' to wd_wav_ready.py on UDP port ${WD_WAV_READY_PORT}"
+        return 1
+    fi
+    return 0
+}
+
+### Returns 0 if the wav_ready_daemon.pid file holds the pid of a running wd_wav_ready.py
+function wav_ready_daemon_is_running()
+{
+    local wav_ready_pid
+    wav_ready_pid=$( cat ${WAV_READY_DAEMON_PID_FILE} 2> /dev/null )
+    [[ -n "${wav_ready_pid}" ]] && kill -0 ${wav_ready_pid} 2> /dev/null
+}
+
+### Returns 0 once wd_wav_ready.py has reported one or more newly complete wav files and adds them to wav_ready_files[], or 1 after waiting for 'timeout' seconds
+### Returns 1 at once if wd_wav_ready.py isn't running, or within WAV_READY_ALIVE_CHECK_SECS if it dies, so the caller falls back to checking the files
+function wav_ready_wait()
+{
+    local wav_recording_dir=$1
+    local wav_file_regex=$2
+    local timeout=$3
+    local ready_fifo=${PWD}/${WAV_READY_FIFO}
+
+    if ! wav_ready_daemon_is_running; then
+        wd_logger 1 "wd_wav_ready.py isn't running, so check the '${wav_file_regex}' files in ${wav_recording_dir} with lsof and their ages"
+        return 1
+    fi
+    if [[ -z "${wav_ready_fd}" ]]; then
+        if [[ ! -p ${ready_fifo} ]]; then
+            rm -f ${ready_fifo}
+            mkfifo ${ready_fifo}
+        fi
+        exec {wav_ready_fd}<> ${ready_fifo}      ### Open for read and write, so the open doesn't block and 'read' never sees EOF
+        wd_logger 1 "Waiting for wd_wav_ready.py to report '${wav_file_regex}' files in ${wav_recording_dir} in ${ready_fifo}"
+        wav_ready_notify START ${ready_fifo} ${wav_recording_dir} "${wav_file_regex}"
+    else
+        wav_ready_notify WATCH ${ready_fifo} ${wav_recording_dir} "${wav_file_regex}"
+    fi
+
+    local ready_line
+    local wait_secs=0
+    while ! read -t $(( timeout - wait_secs < WAV_READY_ALIVE_CHECK_SECS ? timeout - wait_secs : WAV_READY_ALIVE_CHECK_SECS )) -u ${wav_ready_fd} ready_line; do
+        (( wait_secs += WAV_READY_ALIVE_CHECK_SECS ))
+        if (( wait_secs >= timeout )); then
+            wd_logger 1 "wd_wav_ready.py reported no complete '${wav_file_regex}' file in ${timeout} seconds"
+            return 1
+        fi
+        if ! wav_ready_daemon_is_running; then
+            wd_logger 1 "wd_wav_ready.py stopped running while we waited for it, so check the '${wav_file_regex}' files in ${wav_recording_dir} with lsof and their ages"
+            return 1
+        fi
+    done
+    local ready_count=0
+    while true; do
+        local ready_fields=( ${ready_line} )
+        if [[ ${ready_fields[0]} == "READY" && -n "${ready_fields[1]-}" ]]; then
+            wav_ready_files[${ready_fields[1]}]="${ready_fields[2]-} ${ready_fields[3]-}"
+            wd_logger 2 "'${ready_fields[1]##*/}' is complete with ${ready_fields[2]-?} frames at ${ready_fields[3]-?} sps"
+            (( ++ready_count ))
+        else
+            wd_logger 1 "ERROR: unexpected line '${ready_line}' from ${ready_fifo}"
+        fi
+        read -t 0.01 -u ${wav_ready_fd} ready_line || break       ### Take the other lines written at the same time, e.g. all the complete files reported after START
+    done
+
+    if (( ${#wav_ready_files[@]} > WAV_READY_FILES_MAX )); then
+        local wav_file
+        for wav_file in ${!wav_ready_files[@]}; do
+            [[ -f ${wav_file} ]] || unset "wav_ready_files[${wav_file}]"
+        done
+    fi
+    (( ready_count > 0 ))
+}
+
+function wav_ready_daemon()
+{
+    local root_dir=$1
+    local wav_ready_args=( --port ${WD_WAV_READY_PORT} --quiet-secs ${KIWIRECORDER_WRITE_IS_FINISHED_SECONDS-2} --expire-secs $(( 3 * ${WAIT_FOR_FILE_TO_CLOSE_SECONDS-65} )) --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_WAV_READY_CMD} "${wav_ready_args[@]}"
+}
+
 function file_is_open() {
     local file_path="${1}"
     local kiwirecorder_file_must_be_closed_seconds=${2}  ### If the file is being written by kiwirecorder, then typically wait for it to be 2+ seconds old before report back that the wav file is filled
 
+    if [[ ${WD_WAV_READY-no} == "yes" && -n "${wav_ready_fd}" ]]; then
+        if [[ -n "${wav_ready_files[${file_path}]-}" ]]; then
+            wd_logger 1 "wd_wav_ready.py has reported that ${file_path} is complete"
+            return 1
+        fi
+        wd_logger 2 "wd_wav_ready.py hasn't reported that ${file_path} is complete, so check it with lsof or its age"
+    fi
+
     local file_directory="${file_path%/*}"
     if [[ "${file_directory}" != "${PWD}" ]]; then
         if lsof ${file_path} >& /dev/null; then
@@ -1140,6 +1329,11 @@ function get_wav_file_list() {
         if [[ ${wait_for_newest_file_to_close} == "yes" ]]; then
             ### We previously found a list but couldn't create a return_list[], so wait until the newest file is closed before checking again
             wd_logger 1 "wait_for_newest_file_to_close=${wait_for_newest_file_to_close}, so wait for newest wav.tmp to clcose"
+            if [[ ${WD_WAV_READY-no} == "yes" ]] && wav_ready_wait ${wav_recording_dir} "${wav_file_regex}" ${WAIT_FOR_FILE_TO_CLOSE_SECONDS-65}; then
+                wd_logger 2 "wd_wav_ready.py has reported a newly complete file, so cancel wait_for_newest_file_to_close and check again"
+                wait_for_newest_file_to_close="no"
+                continue
+            fi
             wait_until_newest_tmp_file_is_closed ${wav_recording_dir} "${wav_file_regex}" ${receiver_name} ${receiver_band}
             wd_logger 2 "Done waiting.  So check for newest *.wav file to be closed"
             wd_logger 2 "Waiting for ${WAIT_FOR_FILE_TO_CLOSE_SECONDS-65} seconds for the newest file ${newest_file_name} to be closed or not written to for ${KIWIRECORDER_WRITE_IS_FINISHED_SECONDS-2} seconds"
@@ -1162,6 +1356,10 @@ function get_wav_file_list() {
 
         if (( ${#find_files_list[@]} <= 2 )); then
             wd_logger 1 "Found only ${#find_files_list[@]} closed wav files in ${wav_recording_dir}, so wait until the newest (minute '$(minute_from_filename ${newest_file_name})') file ${newest_file_name##*/} is not being written"
+            if [[ ${WD_WAV_READY-no} == "yes" ]] && wav_ready_wait ${wav_recording_dir} "${wav_file_regex}" ${WAIT_FOR_FILE_TO_CLOSE_SECONDS-65}; then
+                wd_logger 1 "wd_wav_ready.py has reported a newly complete file, so start search for files again"
+                continue
+            fi
             if file_is_closed_or_last_write_was_seconds_ago ${newest_file_name}  ${WAIT_FOR_FILE_TO_CLOSE_SECONDS-65} ${KIWIRECORDER_WRITE_IS_FINISHED_SECONDS-2}; then
                 wd_logger 1 "' ${newest_file_name}' is closed, so start search for files again"
                 sleep 1
@@ -1677,6 +1875,44 @@ declare SOX_MAX_PEAK_LEVEL="${SOX_MAX_PEAK_LEVEL--1.0}"
 
 declare GET_PEAK_WAV_SAMPLE_CMD="${WSPRDAEMON_ROOT_DIR}/get-peak-wav-sample.py"     ### A little script created by chatgbt
 declare GET_PEAK_WAV_SAMPLE_LOG_FILE="./get-peak-wav-sample.log"                     ### This file should have the peak amplitude in linear and also in dbFS
+declare WD_WAV_ASSEMBLE_LOG_FILE="./wd_wav_assemble.log"                             ### The levels printed by wd_wav_assemble.py
+
+### When WD_WAV_ASSEMBLER="yes", create the decoder's 16 bit wav file with wd_wav_assemble.py, which reads each of the one minute wav files once
+### rather than the two sox passes, the 'sox -n stats' of the output and get-peak-wav-sample.py.  It returns the same peak levels get-peak-wav-sample.py printed
+function assemble_decoder_wav_file() {
+    local return_peak_linear_variable_name=$1
+    local return_peak_dbfs_variable_name=$2
+    local decoder_input_wav_filepath=$3
+    local receiver_band=$4
+    local trace_cycle=$5
+    shift 5
+    local wav_files_list=( "$@" )
+    local sox_normalization_dBFS=${SOX_NORMALIZATION_DBFS--1}
+
+    local rc
+    wd_trace_run wav_assemble "${receiver_band}" ${trace_cycle} ${WD_PY_CMD} wd_wav_assemble --norm ${sox_normalization_dBFS} --output ${decoder_input_wav_filepath} ${wav_files_list[@]} > ${WD_WAV_ASSEMBLE_LOG_FILE} 2>&1
+    rc=$? ; if (( rc )); then
+        wd_logger 1 "ERROR: 'wd_wav_assemble --norm ${sox_normalization_dBFS} --output ${decoder_input_wav_filepath} ${wav_files_list[*]##*/}' => ${rc}:\n$(< ${WD_WAV_ASSEMBLE_LOG_FILE})"
+        rm -f ${decoder_input_wav_filepath} ${decoder_input_wav_filepath}.tmp
+        return ${rc}
+    fi
+    local input_peak_linear input_peak_dbfs gain_in_db output_peak_dbfs output_rms_dbfs output_samples
+    { read input_peak_linear; read input_peak_dbfs; read gain_in_db; read output_peak_dbfs; read output_rms_dbfs; read output_samples; } < ${WD_WAV_ASSEMBLE_LOG_FILE}
+    if ! is_a_float "${input_peak_dbfs}" ; then
+        wd_logger 1 "ERROR: can't get the peak level of the one minute wav files from ${WD_WAV_ASSEMBLE_LOG_FILE}:\n$(< ${WD_WAV_ASSEMBLE_LOG_FILE})"
+        rm -f ${decoder_input_wav_filepath}
+        return 1
+    fi
+    wd_logger 1 "Created ${decoder_input_wav_filepath} of ${output_samples} samples from ${#wav_files_list[@]} one minute wav files whose peak is ${input_peak_linear} (${input_peak_dbfs} dBFS), so applied ${gain_in_db} dB gain"
+    if [[ $( echo "${output_peak_dbfs} > ${SOX_MAX_PEAK_LEVEL}" | bc ) == "1" ]]; then
+        wd_logger 1 "ERROR: created a wav file overrange: Pk lev dB ${output_peak_dbfs}, RMS lev dB ${output_rms_dbfs}"
+    else
+        wd_logger 1 "Created a wav file with these characteristics:  Pk lev dB ${output_peak_dbfs}, RMS lev dB ${output_rms_dbfs}"
+    fi
+    eval ${return_peak_linear_variable_name}=\${input_peak_linear}
+    eval ${return_peak_dbfs_variable_name}=\${input_peak_dbfs}
+    return 0
+}
 
 function is_a_float() {
     local value=$1
@@ -2156,15 +2392,6 @@ function decoding_daemon() {
                 else
                     iq_file_name="${wav_files_list[0]}"
                 fi
-                local wav_file_stat_list=( $(sox ${iq_file_name} -n stat |&  awk '/Samples read/{printf "%s ", $3};  /Maximum amplitude/{printf "%s ", $3};  /Minimum amplitude/{printf "%s\n", $3}' ) )
-                local wav_file_stats_list=( $(sox ${iq_file_name} -n stats |&  awk '/Pk lev dB/{printf "%s ", $4};  /RMS Pk dB/{printf "%s ", $4};  /RMS Tr dB/{printf "%s\n", $4}' ) )
-                local wav_file_samples=${wav_file_stat_list[0]}            ### Always an integer which should be 1920000
-                local wav_file_peak_dBFS_value=${wav_file_stats_list[0]}   ### Always a float less than 1 with the format '0.xxxx', so chop off the '0.' to convert it to an integer for easy bash compmarisons
-                local wav_file_RMS_dBFS_value=${wav_file_stats_list[1]}    ### Always a float greatthan -1 with the format '-0.xxxx', so chop off the '-0.' to convert it to an integer for easy bash compmarison   
-                local wav_file_RMS_Trough_value=${wav_file_stats_list[2]}  ### Always a float greatthan -1 with the format '-0.xxxx', so chop off the '-0.' to convert it to an integer for easy bash compmarison   
-
-                wd_logger 1 "IQ file INFO: '${iq_file_name}' contains ${wav_file_samples} samples. dbFS peak value = ${wav_file_peak_dBFS_value}, RMS_dBFS = ${wav_file_RMS_dBFS_value}, RMS Trough dB = ${wav_file_RMS_Trough_value}"
-
                 local expected_samples
                 case ${receiver_modes_list[0]} in
                     I1)
@@ -2183,6 +2410,25 @@ function decoding_daemon() {
                         ;;
                 esac
 
+                if [[ ${WD_IQ_INGEST-no} == "yes" ]]; then
+                    ingest_iq_file ${iq_file_name} ${receiver_name} ${receiver_band} ${expected_samples}
+                    rc=$? ; if (( rc )); then
+                        wd_logger 1 "ERROR: 'ingest_iq_file ${iq_file_name} ${receiver_name} ${receiver_band} ${expected_samples}' => ${rc}"
+                    else
+                        wd_logger 1 "Archived wav file ${iq_file_name}  ${receiver_name} ${receiver_band}"
+                    fi
+                    continue
+                fi
+
+                local wav_file_stat_list=( $(sox ${iq_file_name} -n stat |&  awk '/Samples read/{printf "%s ", $3};  /Maximum amplitude/{printf "%s ", $3};  /Minimum amplitude/{printf "%s\n", $3}' ) )
+                local wav_file_stats_list=( $(sox ${iq_file_name} -n stats |&  awk '/Pk lev dB/{printf "%s ", $4};  /RMS Pk dB/{printf "%s ", $4};  /RMS Tr dB/{printf "%s\n", $4}' ) )
+                local wav_file_samples=${wav_file_stat_list[0]}            ### Always an integer which should be 1920000
+                local wav_file_peak_dBFS_value=${wav_file_stats_list[0]}   ### Always a float less than 1 with the format '0.xxxx', so chop off the '0.' to convert it to an integer for easy bash compmarisons
+                local wav_file_RMS_dBFS_value=${wav_file_stats_list[1]}    ### Always a float greatthan -1 with the format '-0.xxxx', so chop off the '-0.' to convert it to an integer for easy bash compmarison   
+                local wav_file_RMS_Trough_value=${wav_file_stats_list[2]}  ### Always a float greatthan -1 with the format '-0.xxxx', so chop off the '-0.' to convert it to an integer for easy bash compmarison   
+
+                wd_logger 1 "IQ file INFO: '${iq_file_name}' contains ${wav_file_samples} samples. dbFS peak value = ${wav_file_peak_dBFS_value}, RMS_dBFS = ${wav_file_RMS_dBFS_value}, RMS Trough dB = ${wav_file_RMS_Trough_value}"
+
                 if (( wav_file_samples != expected_samples )); then
                     wd_logger 1 "ERROR: IQ file ' ${iq_file_name}' has ${wav_file_samples} samples, not the expected ${expected_samples} samples, so flush it;\n$(sox  ${iq_file_name} -n stat 2>&1 )"
                     wd_rm ${iq_file_name}
@@ -2211,6 +2457,8 @@ function decoding_daemon() {
             local first_wav_file_name=${wav_files_list[0]##*/}
             local decoder_input_wav_filename="${first_wav_file_name:2:6}_${first_wav_file_name:9:4}.wav"
             local decoder_input_wav_filepath=$(realpath ${decoder_input_wav_filename})
+            local trace_cycle=${decoder_input_wav_filename%.wav}
+            wd_trace_span wav_ready "${receiver_band}" ${trace_cycle} +${returned_seconds}     ### From the end of the cycle until all its wav files were found
 
             local sox_effects="${SOX_ASSEMBLE_WAV_FILE_EFFECTS-}"
 
@@ -2221,68 +2469,85 @@ function decoding_daemon() {
             ### so add '-b 16 -e signed-integer' to instruct sox to alway output a 16 bit PCM file which is the format accepted by wsprd and jt9
             ### from: chatgbt:  sox --combine concatenate file1.wav file2.wav -b 16 -e signed-integer output.wav
 
-            ### Get stats on the input files
             local rc
-            sox --combine concatenate ${wav_files_list[@]} -n stat >& ${SOX_LOG_FILE}
-            rc=$? ; if (( rc )); then
-                 wd_logger 1 "ERROR: while getting stats for the one minute files with 'sox --combine concatenate ${wav_files_list[@]} -n stat >& ${SOX_LOG_FILE}' => ${rc}:\n$(< ${SOX_LOG_FILE})"
-             fi
-            local max_input_float_amplitude=$(awk  '/Maximum amplitude:/{print $3}' ${SOX_LOG_FILE})
-            local gain_in_db    ### In case we can't get the gain from sox
-            local sox_normalization_dBFS=${SOX_NORMALIZATION_DBFS--1}        ### Default -1 dBFS creates 16 bit int wav file with max value 0.891251
-            local sox_normalization_linear=$(bc -l <<< "scale = 6; e(${sox_normalization_dBFS}/20 * l(10))")
-            if ! is_a_float "${max_input_float_amplitude}" ; then
-                gain=0
-                wd_logger 1 "ERROR: can't get 'Maximum amplitude' of the input wav files from ${SOX_LOG_FILE}:\n$(<${SOX_LOG_FILE})"
-            elif [[ "${max_input_float_amplitude}" =~ ^-?0+(\.0+)?$ ]]; then
-                gain=0
-                wd_logger 1 "ERROR: ${max_input_float_amplitude} is an int or float zero in ${SOX_LOG_FILE}:\n$(<${SOX_LOG_FILE})"
-            else
-                ### We are certain that ${max_input_float_amplitude} is not a zero
-                local gain_in_db=$(bc -l <<< "scale = 1; 20 * l( ${sox_normalization_linear} / ${max_input_float_amplitude} ) / l(10)")
-                wd_logger 1 "The 'Maximum amplitude' of the input files is ${max_input_float_amplitude}, so sox will automatically apply ${gain_in_db} dB gain while creating the 16bit PCM wav file"
+            local python_peak_level_linear_float=0
+            local python_peak_level_dBFS_float=0
+            local wav_file_assembled="no"
+            if [[ ${WD_WAV_ASSEMBLER-no} == "yes" ]]; then
+                if [[ -n "${sox_effects}" ]]; then
+                    wd_logger 1 "WD_WAV_ASSEMBLER='yes', but only sox can apply SOX_ASSEMBLE_WAV_FILE_EFFECTS='${sox_effects}'"
+                else
+                    assemble_decoder_wav_file python_peak_level_linear_float python_peak_level_dBFS_float ${decoder_input_wav_filepath} ${receiver_band} ${trace_cycle} ${wav_files_list[@]}
+                    rc=$? ; if (( rc )); then
+                        wd_logger 1 "ERROR: 'assemble_decoder_wav_file ${decoder_input_wav_filepath} ...' => ${rc}, so create it with sox"
+                    else
+                        wav_file_assembled="yes"
+                    fi
+                fi
             fi
-            wd_logger 2 "Finished getting AGC stats"
+            if [[ ${wav_file_assembled} == "no" ]]; then
+                ### Get stats on the input files
+                sox --combine concatenate ${wav_files_list[@]} -n stat >& ${SOX_LOG_FILE}
+                rc=$? ; if (( rc )); then
+                     wd_logger 1 "ERROR: while getting stats for the one minute files with 'sox --combine concatenate ${wav_files_list[@]} -n stat >& ${SOX_LOG_FILE}' => ${rc}:\n$(< ${SOX_LOG_FILE})"
+                 fi
+                local max_input_float_amplitude=$(awk  '/Maximum amplitude:/{print $3}' ${SOX_LOG_FILE})
+                local gain_in_db    ### In case we can't get the gain from sox
+                local sox_normalization_dBFS=${SOX_NORMALIZATION_DBFS--1}        ### Default -1 dBFS creates 16 bit int wav file with max value 0.891251
+                local sox_normalization_linear=$(bc -l <<< "scale = 6; e(${sox_normalization_dBFS}/20 * l(10))")
+                if ! is_a_float "${max_input_float_amplitude}" ; then
+                    gain=0
+                    wd_logger 1 "ERROR: can't get 'Maximum amplitude' of the input wav files from ${SOX_LOG_FILE}:\n$(<${SOX_LOG_FILE})"
+                elif [[ "${max_input_float_amplitude}" =~ ^-?0+(\.0+)?$ ]]; then
+                    gain=0
+                    wd_logger 1 "ERROR: ${max_input_float_amplitude} is an int or float zero in ${SOX_LOG_FILE}:\n$(<${SOX_LOG_FILE})"
+                else
+                    ### We are certain that ${max_input_float_amplitude} is not a zero
+                    local gain_in_db=$(bc -l <<< "scale = 1; 20 * l( ${sox_normalization_linear} / ${max_input_float_amplitude} ) / l(10)")
+                    wd_logger 1 "The 'Maximum amplitude' of the input files is ${max_input_float_amplitude}, so sox will automatically apply ${gain_in_db} dB gain while creating the 16bit PCM wav file"
+                fi
+                wd_logger 2 "Finished getting AGC stats"
 
-            ### Create a 16 bit int wav file from a list of input int or float wav files and normalize the output to -1 dBFS
-            ### Replace the '-' with '_' in the print string or wd_logger's echo command gets confused by them
-            wd_logger 1 "Creating a single 2 minute wav file with: 'sox __combine concatenate ${wav_files_list[*]} _b 16 _e signed_integer ${decoder_input_wav_filepath} __norm=${sox_normalization_dBFS}  ${sox_effects}'"
+                ### Create a 16 bit int wav file from a list of input int or float wav files and normalize the output to -1 dBFS
+                ### Replace the '-' with '_' in the print string or wd_logger's echo command gets confused by them
+                wd_logger 1 "Creating a single 2 minute wav file with: 'sox __combine concatenate ${wav_files_list[*]} _b 16 _e signed_integer ${decoder_input_wav_filepath} __norm=${sox_normalization_dBFS}  ${sox_effects}'"
 
-            sox --combine concatenate ${wav_files_list[@]} -b 16 -e signed-integer ${decoder_input_wav_filepath} --norm=${sox_normalization_dBFS}  ${sox_effects} >& ${SOX_LOG_FILE}
-            rc=$? ; if (( rc )); then
-                wd_logger 1 "ERROR: 'sox ${wav_files_list[*]} ${decoder_input_wav_filepath}  ${sox_effects} -n stat' => ${rc}:\n$(<  ${SOX_LOG_FILE})"
-                if [[ -f ${decoder_input_wav_filepath} ]]; then
-                    local rc1
-                    wd_rm ${decoder_input_wav_filepath}
-                    rc1=$? ; if (( rc1 )); then
-                        wd_logger 1 "ERROR: after sox returned error ${rc}, then 'wd_rm ${decoder_input_wav_filepath} returned error ${rc1}"
+                wd_trace_run sox_assemble "${receiver_band}" ${trace_cycle} sox --combine concatenate ${wav_files_list[@]} -b 16 -e signed-integer ${decoder_input_wav_filepath} --norm=${sox_normalization_dBFS}  ${sox_effects} >& ${SOX_LOG_FILE}
+                rc=$? ; if (( rc )); then
+                    wd_logger 1 "ERROR: 'sox ${wav_files_list[*]} ${decoder_input_wav_filepath}  ${sox_effects} -n stat' => ${rc}:\n$(<  ${SOX_LOG_FILE})"
+                    if [[ -f ${decoder_input_wav_filepath} ]]; then
+                        local rc1
+                        wd_rm ${decoder_input_wav_filepath}
+                        rc1=$? ; if (( rc1 )); then
+                            wd_logger 1 "ERROR: after sox returned error ${rc}, then 'wd_rm ${decoder_input_wav_filepath} returned error ${rc1}"
+                        fi
                     fi
+                    sleep 1
+                    continue
+                fi
+                wd_logger 1 "sox created ${decoder_input_wav_filepath} from ${#wav_files_list[@]} one minute wav files"
+                if [[ ${verbosity} -ge 2 ]]; then
+                    wd_logger 2 "     $(sox ${decoder_input_wav_filepath} -n stats 2>&1 )"
                 fi
-                sleep 1
-                continue
-            fi
-            wd_logger 1 "sox created ${decoder_input_wav_filepath} from ${#wav_files_list[@]} one minute wav files"
-            wd_logger 2 "     $(sox ${decoder_input_wav_filepath} -n stats 2>&1 )"
-
-            ### Get statistics about the newly created wav file directly from sox
-            sox ${decoder_input_wav_filepath} -n stats >& ${SOX_LOG_FILE}
-            local sox_peak_level_db_float=$(awk '/^Pk lev/{print $NF}' ${SOX_LOG_FILE})
-            rc=$( echo "${sox_peak_level_db_float} > ${SOX_MAX_PEAK_LEVEL}" | bc )
-            if (( rc == 1 )); then
-                wd_logger 1 "ERROR: sox reports a wav file overrange: $( awk '/^Pk lev/ || /RMS/ { printf "%s, ", $0 }' ${SOX_LOG_FILE})"
-            else
-                wd_logger 1 "sox created a wav file with these characteristics:  $( awk '/^Pk lev/ || /RMS/ { printf "%s, ", $0 }' ${SOX_LOG_FILE})"
-            fi
 
-            ## Get statistics about the max level info directly from the input wav files
-            local python_peak_level_linear_float=0
-            local python_peak_level_dBFS_float=0
-            python3 ${GET_PEAK_WAV_SAMPLE_CMD} ${wav_files_list[@]} >& ${GET_PEAK_WAV_SAMPLE_LOG_FILE}    ### Dump all output to a log file so it can be printed out if there is an error
-            rc=$? ; if (( rc )); then
-                wd_logger 1 "ERROR: 'python3 ${GET_PEAK_WAV_SAMPLE_CMD##*/} ${wav_files_list[*]##*/}' => ${rc}:\n$(<${GET_PEAK_WAV_SAMPLE_LOG_FILE})"
-            else
-                { read python_peak_level_linear_float; read python_peak_level_dBFS_float; } < ${GET_PEAK_WAV_SAMPLE_LOG_FILE}    ### Very efficient way to extract those two lines into variables
-                wd_logger 1 "python3 '${GET_PEAK_WAV_SAMPLE_CMD##*/} ${wav_files_list[*]##*/}' reported python_peak_level_linear_float=${python_peak_level_linear_float}, python_peak_level_dBFS_float=${python_peak_level_dBFS_float}"
+                ### Get statistics about the newly created wav file directly from sox
+                wd_trace_run sox_stats "${receiver_band}" ${trace_cycle} sox ${decoder_input_wav_filepath} -n stats >& ${SOX_LOG_FILE}
+                local sox_peak_level_db_float=$(awk '/^Pk lev/{print $NF}' ${SOX_LOG_FILE})
+                rc=$( echo "${sox_peak_level_db_float} > ${SOX_MAX_PEAK_LEVEL}" | bc )
+                if (( rc == 1 )); then
+                    wd_logger 1 "ERROR: sox reports a wav file overrange: $( awk '/^Pk lev/ || /RMS/ { printf "%s, ", $0 }' ${SOX_LOG_FILE})"
+                else
+                    wd_logger 1 "sox created a wav file with these characteristics:  $( awk '/^Pk lev/ || /RMS/ { printf "%s, ", $0 }' ${SOX_LOG_FILE})"
+                fi
+
+                ## Get statistics about the max level info directly from the input wav files
+                wd_trace_run peak_wav "${receiver_band}" ${trace_cycle} ${WD_PY_CMD} get_peak_wav_sample ${wav_files_list[@]} >& ${GET_PEAK_WAV_SAMPLE_LOG_FILE}    ### Dump all output to a log file so it can be printed out if there is an error
+                rc=$? ; if (( rc )); then
+                    wd_logger 1 "ERROR: 'python3 ${GET_PEAK_WAV_SAMPLE_CMD##*/} ${wav_files_list[*]##*/}' => ${rc}:\n$(<${GET_PEAK_WAV_SAMPLE_LOG_FILE})"
+                else
+                    { read python_peak_level_linear_float; read python_peak_level_dBFS_float; } < ${GET_PEAK_WAV_SAMPLE_LOG_FILE}    ### Very efficient way to extract those two lines into variables
+                    wd_logger 1 "python3 '${GET_PEAK_WAV_SAMPLE_CMD##*/} ${wav_files_list[*]##*/}' reported python_peak_level_linear_float=${python_peak_level_linear_float}, python_peak_level_dBFS_float=${python_peak_level_dBFS_float}"
+                fi
             fi
 
             ### To mimnimize the amount of Linux process schedule thrashing, limit the number of active decoding jobs to the number of physical CPUs
@@ -2300,8 +2565,11 @@ function decoding_daemon() {
                     wd_logger 1 "The configured value DECODING_FREE_CPUS=${DECODING_FREE_CPUS} on this CPU with $(nproc) cores has resulted in max_running_decodes=${max_running_decodes}"
                 fi
                 local max_job_wait_secs=${DECODE_CPU_MAX_WAIT_SECS-60}   ### Proceed with decoding after 60 seconds whether or not there is a free CPU
+                local claim_cpu_start_epoch=${EPOCHREALTIME}
                 claim_cpu ${max_running_decodes} ${max_job_wait_secs}
-                rc=$? ; if (( rc )); then
+                rc=$?
+                wd_trace_span claim_cpu "${receiver_band}" ${trace_cycle} ${claim_cpu_start_epoch}
+                if (( rc )); then
                     got_cpu_semaphore="no"
                     wd_logger 1 "ERROR: 'claim_cpu ${max_running_decodes} ${max_job_wait_secs}' => ${rc}, but start decoding anyway"
                 else
@@ -2338,7 +2606,7 @@ function decoding_daemon() {
                 ln ${decoder_input_wav_filepath} ${decoder_input_wav_filename} 
 
                 local start_time=${SECONDS}
-                decode_wspr_wav_file ${decoder_input_wav_filename}  ${wav_file_freq_hz} ${rx_khz_offset} wsprd_stdout.txt "${wsprd_flags}" "${wsprd_spreading_flags}"
+                decode_wspr_wav_file ${decoder_input_wav_filename}  ${wav_file_freq_hz} ${rx_khz_offset} wsprd_stdout.txt "${wsprd_flags}" "${wsprd_spreading_flags}" "${receiver_band}"
                 rc=$?
 
                 rm  ${decoder_input_wav_filename}
@@ -2386,7 +2654,11 @@ function decoding_daemon() {
                         return 1
                     fi
                     local c2_fft_noise_level_float
-                    nice -n ${WSPR_CMD_NICE_LEVEL} python3 ${C2_FFT_CMD} ${c2_filename} > ${c2_filename}.out 2> ${c2_filename}.stderr
+                    local c2_waterfall_tile=""
+                    if [[ ${WD_C2_WATERFALL} == "yes" ]]; then
+                        get_c2_waterfall_tile_path c2_waterfall_tile ${receiver_name} ${receiver_band} ${trace_cycle}
+                    fi
+                    wd_trace_run c2_noise "${receiver_band}" ${trace_cycle} nice -n ${WSPR_CMD_NICE_LEVEL} ${WD_PY_CMD} c2_noise ${c2_filename} ${c2_waterfall_tile} > ${c2_filename}.out 2> ${c2_filename}.stderr
                     rc=$? ; if (( rc )); then
                         wd_logger 1 "ERROR: 'python3 ${C2_FFT_CMD} ${c2_filename}' => ${rc}:\n$(< ${c2_filename}.stderr)"
                         c2_fft_noise_level_float="0.0"
@@ -2394,92 +2666,104 @@ function decoding_daemon() {
                         c2_fft_noise_level_float=$(< ${c2_filename}.out)
                     fi
 
-                    fft_noise_level_float=$(bc <<< "scale=2;var=${c2_fft_noise_level_float};var+=${fft_nl_adjust};(var * 100)/100")
-                    if [[ -z "${sdr_noise_level_adjust_float}" ]]; then
-
-                        wd_logger 1 "fft_noise_level_float=${fft_noise_level_float} which is calculated from 'local fft_noise_level_float=\$(bc <<< 'scale=2;var=${c2_fft_noise_level_float};var+=${fft_nl_adjust};var/=1;var')"
-                    else
-                        ### sox has normalized the wav file level, so subtract from the measured FFT levels to compensate for the gain applied by sox
-                        ### For KiwiSDRs, fft_nl_adjust (via cal_c2_correction) was calibrated on actual Kiwi hardware so it already includes the Kiwi +60 dB hardware gain.
-                        ### Therefore, just like the RMS correction below, we must add +60 to sdr_noise_level_adjust_float before applying it to the FFT.
-                        local fft_sdr_adjust=${sdr_noise_level_adjust_float}
-                        if ! [[ $receiver_name =~ KA9Q ]]; then
-                            fft_sdr_adjust=$( echo "scale=1;(${sdr_noise_level_adjust_float} + 60.0)" | bc )
-                            wd_logger 1 "KiwiSDR: adjusting FFT sdr correction from ${sdr_noise_level_adjust_float} to ${fft_sdr_adjust} dB (+60 dB since fft_nl_adjust already includes Kiwi hardware gain)"
+                    local noise_levels_calculated="no"
+                    if [[ ${WD_NOISE_CAL-no} == "yes" ]]; then
+                        calculate_noise_levels fft_noise_level_float sox_rms_noise_level_float rms_line ${decoder_input_wav_filename} "${c2_fft_noise_level_float}" ${rms_nl_adjust} ${fft_nl_adjust} \
+                                               "${python_peak_level_dBFS_float}" "${ka9q_channel_gain_float}" "${ka9q_n0_float}"
+                        rc=$? ; if (( rc )); then
+                            wd_logger 1 "ERROR: 'calculate_noise_levels ...' => ${rc}, so calculate them with bc"
+                        else
+                            noise_levels_calculated="yes"
                         fi
-                        local corrected_fft_noise_level_float
-                        corrected_fft_noise_level_float=$( echo "scale=1;(${fft_noise_level_float} - ${fft_sdr_adjust})/1" | bc )
-                        wd_logger 2 "Since fft_sdr_adjust=$fft_sdr_adjust, correct measured FFT noise from ${fft_noise_level_float} to ${corrected_fft_noise_level_float}"
-                        fft_noise_level_float=${corrected_fft_noise_level_float}
                     fi
- 
-                    get_rms_levels  "sox_rms_noise_level_float" "rms_line" ${decoder_input_wav_filename} ${rms_nl_adjust}
-                    rc=$? ; if (( rc )); then
-                        wd_logger 1 "ERROR:  'get_rms_levels  sox_rms_noise_level_float rms_line ${decoder_input_wav_filename} ${rms_nl_adjust}' => ${rc}"
-                        if [[ ${got_cpu_semaphore} == "yes" ]]; then
-                            free_cpu
-                            rc=$? ; if (( rc )); then
-                            wd_logger 1 "ERROR: 'free_cpu' => ${rc}, but ignoring since we are aborting decoding because of a sox error"
+                    if [[ ${noise_levels_calculated} == "no" ]]; then
+                        fft_noise_level_float=$(bc <<< "scale=2;var=${c2_fft_noise_level_float};var+=${fft_nl_adjust};(var * 100)/100")
+                        if [[ -z "${sdr_noise_level_adjust_float}" ]]; then
+
+                            wd_logger 1 "fft_noise_level_float=${fft_noise_level_float} which is calculated from 'local fft_noise_level_float=\$(bc <<< 'scale=2;var=${c2_fft_noise_level_float};var+=${fft_nl_adjust};var/=1;var')"
                         else
-                            wd_logger 1 "Put semaphore now that decoding is done"
+                            ### sox has normalized the wav file level, so subtract from the measured FFT levels to compensate for the gain applied by sox
+                            ### For KiwiSDRs, fft_nl_adjust (via cal_c2_correction) was calibrated on actual Kiwi hardware so it already includes the Kiwi +60 dB hardware gain.
+                            ### Therefore, just like the RMS correction below, we must add +60 to sdr_noise_level_adjust_float before applying it to the FFT.
+                            local fft_sdr_adjust=${sdr_noise_level_adjust_float}
+                            if ! [[ $receiver_name =~ KA9Q ]]; then
+                                fft_sdr_adjust=$( echo "scale=1;(${sdr_noise_level_adjust_float} + 60.0)" | bc )
+                                wd_logger 1 "KiwiSDR: adjusting FFT sdr correction from ${sdr_noise_level_adjust_float} to ${fft_sdr_adjust} dB (+60 dB since fft_nl_adjust already includes Kiwi hardware gain)"
                             fi
+                            local corrected_fft_noise_level_float
+                            corrected_fft_noise_level_float=$( echo "scale=1;(${fft_noise_level_float} - ${fft_sdr_adjust})/1" | bc )
+                            wd_logger 2 "Since fft_sdr_adjust=$fft_sdr_adjust, correct measured FFT noise from ${fft_noise_level_float} to ${corrected_fft_noise_level_float}"
+                            fft_noise_level_float=${corrected_fft_noise_level_float}
                         fi
-                        return 1
-                    fi
-                    if [[ -n "${sdr_noise_level_adjust_float}" ]]; then
-                        if ! [[ $receiver_name =~ KA9Q ]]; then
-                            local kiwisdr_noise_level_adjust_float=$( echo "scale=1;(${sdr_noise_level_adjust_float} + 60.0)" | bc )
-                            wd_logger 1 "KiwiSDRs are set for +60 dB audio channel gain, so subtract that from the levels reported by sox, so sdr_noise_level_adjust_float=$sdr_noise_level_adjust_float => kiwisdr_noise_level_adjust_float=$kiwisdr_noise_level_adjust_float"
-                            sdr_noise_level_adjust_float=$kiwisdr_noise_level_adjust_float
+ 
+                        get_rms_levels  "sox_rms_noise_level_float" "rms_line" ${decoder_input_wav_filename} ${rms_nl_adjust}
+                        rc=$? ; if (( rc )); then
+                            wd_logger 1 "ERROR:  'get_rms_levels  sox_rms_noise_level_float rms_line ${decoder_input_wav_filename} ${rms_nl_adjust}' => ${rc}"
+                            if [[ ${got_cpu_semaphore} == "yes" ]]; then
+                                free_cpu
+                                rc=$? ; if (( rc )); then
+                                wd_logger 1 "ERROR: 'free_cpu' => ${rc}, but ignoring since we are aborting decoding because of a sox error"
+                            else
+                                wd_logger 1 "Put semaphore now that decoding is done"
+                                fi
+                            fi
+                            return 1
                         fi
-                        local corrected_sox_rms_noise_level_float
-                        corrected_sox_rms_noise_level_float=$( echo "scale=1;(${sox_rms_noise_level_float} - ${sdr_noise_level_adjust_float})/1" | bc )
-                        wd_logger 2 "Correcting measured FFT noise from ${sox_rms_noise_level_float} to ${corrected_sox_rms_noise_level_float}"
-                        sox_rms_noise_level_float=${corrected_sox_rms_noise_level_float}
-
-                        wd_logger 2 "Sox reports rms_line '${rms_line}'"
-                        local adjusted_rms_line=""
-                        for rms_value_float in ${rms_line} ; do
-                            local adjusted_rms_value_float
-                            adjusted_rms_value_float=$(echo "scale=2;(${rms_value_float} - ${sdr_noise_level_adjust_float})/1" | bc )
-                            adjusted_rms_line="${adjusted_rms_line} ${adjusted_rms_value_float}"
-                        done
-                        wd_logger 1 "Adjusted rms_line to '${adjusted_rms_line}'"
-                        rms_line="${adjusted_rms_line}"
-                    fi
-                    wd_logger 1 "sox_rms_noise_level_float=${sox_rms_noise_level_float}"
-
-                    ### === KA9Q/RX888 noise calibration ===
-                    ### The sox noise calibration (cal_rms_offset=-50.4, cal_c2_correction, the +60 gain) was derived for a
-                    ### KiwiSDR at --agc-gain=60 (G3ZIL/AI6VN 2019); it is NOT calibrated for the RX888 chain and over-reads by a
-                    ### band-dependent ~5-10 dB.  Preferred fix: per-band offsets measured against a co-located calibrated KiwiSDR
-                    ### (KIWI treated as truth), with separate RMS and C2 corrections (KA9Q_*_CAL_OFFSET[] in WD.conf).
-                    ### Alternative: KA9Q_USE_RADIOD_N0=yes reports radiod's calibrated N0 directly (needs metadump status checking).
-                    if [[ ${receiver_name} =~ ^KA9Q && ${KA9Q_USE_BAND_CAL:-yes} == "yes" ]]; then
-                        local rms_off="${KA9Q_RMS_CAL_OFFSET[${receiver_band}]:-0}"
-                        local c2_off="${KA9Q_C2_CAL_OFFSET[${receiver_band}]:-0}"
-                        if [[ "${rms_off}" != "0" || "${c2_off}" != "0" ]]; then
-                            wd_logger 1 "KA9Q_USE_BAND_CAL: band ${receiver_band} rms_offset=${rms_off} c2_offset=${c2_off}; correcting C2=${fft_noise_level_float} RMS=${sox_rms_noise_level_float}"
-                            fft_noise_level_float=$( echo "scale=1; (${fft_noise_level_float} + ${c2_off})/1" | bc )
-                            sox_rms_noise_level_float=$( echo "scale=1; (${sox_rms_noise_level_float} + ${rms_off})/1" | bc )
-                            local -a _rms_in=( ${rms_line} ) _rms_out=()                              ### apply the RMS offset to all sox fields (12 signal-level stats + RMS_noise)
-                            local _v
-                            for _v in "${_rms_in[@]}"; do _rms_out+=( "$( echo "scale=2; (${_v} + ${rms_off})/1" | bc )" ); done
-                            rms_line="${_rms_out[*]}"
-                        else
-                            wd_logger 1 "KA9Q_USE_BAND_CAL=yes but no KA9Q_*_CAL_OFFSET defined for band '${receiver_band}'; leaving sox noise uncorrected"
+                        if [[ -n "${sdr_noise_level_adjust_float}" ]]; then
+                            if ! [[ $receiver_name =~ KA9Q ]]; then
+                                local kiwisdr_noise_level_adjust_float=$( echo "scale=1;(${sdr_noise_level_adjust_float} + 60.0)" | bc )
+                                wd_logger 1 "KiwiSDRs are set for +60 dB audio channel gain, so subtract that from the levels reported by sox, so sdr_noise_level_adjust_float=$sdr_noise_level_adjust_float => kiwisdr_noise_level_adjust_float=$kiwisdr_noise_level_adjust_float"
+                                sdr_noise_level_adjust_float=$kiwisdr_noise_level_adjust_float
+                            fi
+                            local corrected_sox_rms_noise_level_float
+                            corrected_sox_rms_noise_level_float=$( echo "scale=1;(${sox_rms_noise_level_float} - ${sdr_noise_level_adjust_float})/1" | bc )
+                            wd_logger 2 "Correcting measured FFT noise from ${sox_rms_noise_level_float} to ${corrected_sox_rms_noise_level_float}"
+                            sox_rms_noise_level_float=${corrected_sox_rms_noise_level_float}
+
+                            wd_logger 2 "Sox reports rms_line '${rms_line}'"
+                            local adjusted_rms_line=""
+                            for rms_value_float in ${rms_line} ; do
+                                local adjusted_rms_value_float
+                                adjusted_rms_value_float=$(echo "scale=2;(${rms_value_float} - ${sdr_noise_level_adjust_float})/1" | bc )
+                                adjusted_rms_line="${adjusted_rms_line} ${adjusted_rms_value_float}"
+                            done
+                            wd_logger 1 "Adjusted rms_line to '${adjusted_rms_line}'"
+                            rms_line="${adjusted_rms_line}"
                         fi
-                    elif [[ ${receiver_name} =~ ^KA9Q && ${KA9Q_USE_RADIOD_N0:-no} == "yes" ]]; then
-                        if is_a_float "${ka9q_n0_float}" && [[ $(bc <<< "${ka9q_n0_float} > -900") == "1" ]]; then
-                            local ka9q_reported_noise=$( echo "scale=1; (${ka9q_n0_float} + ${KA9Q_N0_CAL_OFFSET_DB:-0.0})/1" | bc )
-                            wd_logger 1 "KA9Q_USE_RADIOD_N0: replaced sox noise (RMS=${sox_rms_noise_level_float}, C2=${fft_noise_level_float}) with radiod N0=${ka9q_n0_float} + ${KA9Q_N0_CAL_OFFSET_DB:-0.0} => ${ka9q_reported_noise} dBm/Hz"
-                            fft_noise_level_float=${ka9q_reported_noise}
-                            sox_rms_noise_level_float=${ka9q_reported_noise}
-                            local -a _rms_line_arr=( ${rms_line} )
-                            _rms_line_arr[$(( ${#_rms_line_arr[@]} - 1 ))]=${ka9q_reported_noise}
-                            rms_line="${_rms_line_arr[*]}"
-                        else
-                            wd_logger 1 "KA9Q_USE_RADIOD_N0=yes but ka9q_n0_float='${ka9q_n0_float}' is invalid - is KA9Q_METADUMP_STATUS_CHECKING_ENABLED=yes?  Keeping sox-derived noise."
+                        wd_logger 1 "sox_rms_noise_level_float=${sox_rms_noise_level_float}"
+
+                        ### === KA9Q/RX888 noise calibration ===
+                        ### The sox noise calibration (cal_rms_offset=-50.4, cal_c2_correction, the +60 gain) was derived for a
+                        ### KiwiSDR at --agc-gain=60 (G3ZIL/AI6VN 2019); it is NOT calibrated for the RX888 chain and over-reads by a
+                        ### band-dependent ~5-10 dB.  Preferred fix: per-band offsets measured against a co-located calibrated KiwiSDR
+                        ### (KIWI treated as truth), with separate RMS and C2 corrections (KA9Q_*_CAL_OFFSET[] in WD.conf).
+                        ### Alternative: KA9Q_USE_RADIOD_N0=yes reports radiod's calibrated N0 directly (needs metadump status checking).
+                        if [[ ${receiver_name} =~ ^KA9Q && ${KA9Q_USE_BAND_CAL:-yes} == "yes" ]]; then
+                            local rms_off="${KA9Q_RMS_CAL_OFFSET[${receiver_band}]:-0}"
+                            local c2_off="${KA9Q_C2_CAL_OFFSET[${receiver_band}]:-0}"
+                            if [[ "${rms_off}" != "0" || "${c2_off}" != "0" ]]; then
+                                wd_logger 1 "KA9Q_USE_BAND_CAL: band ${receiver_band} rms_offset=${rms_off} c2_offset=${c2_off}; correcting C2=${fft_noise_level_float} RMS=${sox_rms_noise_level_float}"
+                                fft_noise_level_float=$( echo "scale=1; (${fft_noise_level_float} + ${c2_off})/1" | bc )
+                                sox_rms_noise_level_float=$( echo "scale=1; (${sox_rms_noise_level_float} + ${rms_off})/1" | bc )
+                                local -a _rms_in=( ${rms_line} ) _rms_out=()                              ### apply the RMS offset to all sox fields (12 signal-level stats + RMS_noise)
+                                local _v
+                                for _v in "${_rms_in[@]}"; do _rms_out+=( "$( echo "scale=2; (${_v} + ${rms_off})/1" | bc )" ); done
+                                rms_line="${_rms_out[*]}"
+                            else
+                                wd_logger 1 "KA9Q_USE_BAND_CAL=yes but no KA9Q_*_CAL_OFFSET defined for band '${receiver_band}'; leaving sox noise uncorrected"
+                            fi
+                        elif [[ ${receiver_name} =~ ^KA9Q && ${KA9Q_USE_RADIOD_N0:-no} == "yes" ]]; then
+                            if is_a_float "${ka9q_n0_float}" && [[ $(bc <<< "${ka9q_n0_float} > -900") == "1" ]]; then
+                                local ka9q_reported_noise=$( echo "scale=1; (${ka9q_n0_float} + ${KA9Q_N0_CAL_OFFSET_DB:-0.0})/1" | bc )
+                                wd_logger 1 "KA9Q_USE_RADIOD_N0: replaced sox noise (RMS=${sox_rms_noise_level_float}, C2=${fft_noise_level_float}) with radiod N0=${ka9q_n0_float} + ${KA9Q_N0_CAL_OFFSET_DB:-0.0} => ${ka9q_reported_noise} dBm/Hz"
+                                fft_noise_level_float=${ka9q_reported_noise}
+                                sox_rms_noise_level_float=${ka9q_reported_noise}
+                                local -a _rms_line_arr=( ${rms_line} )
+                                _rms_line_arr[$(( ${#_rms_line_arr[@]} - 1 ))]=${ka9q_reported_noise}
+                                rms_line="${_rms_line_arr[*]}"
+                            else
+                                wd_logger 1 "KA9Q_USE_RADIOD_N0=yes but ka9q_n0_float='${ka9q_n0_float}' is invalid - is KA9Q_METADUMP_STATUS_CHECKING_ENABLED=yes?  Keeping sox-derived noise."
+                            fi
                         fi
                     fi
 
@@ -2518,7 +2802,7 @@ function decoding_daemon() {
                 else
                     ### Don't linger in that F_xxx subdir, since wd_logger ... would get logged there
                     cd ${decode_dir_path}
-                    timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${JT9_CMD_NICE_LEVEL} ${JT9_CMD} -a ${decode_dir_path} -p ${returned_seconds} --fst4w  -p ${returned_seconds} -f 1500 -F 100 ${decoder_input_wav_filename} >& jt9_output.txt
+                    wd_trace_run jt9 "${receiver_band}" ${trace_cycle} timeout ${WSPRD_TIMEOUT_SECS-110} nice -n ${JT9_CMD_NICE_LEVEL} ${JT9_CMD} -a ${decode_dir_path} -p ${returned_seconds} --fst4w  -p ${returned_seconds} -f 1500 -F 100 ${decoder_input_wav_filename} >& jt9_output.txt
                     rc=$?
                     cd - >& /dev/null
                     ### Out of the subdir
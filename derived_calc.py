@@ -8,8 +8,7 @@
 # In the script the following lines preceed this code and there's an EOF added at the end
 # G3ZIL python script that gets copied into /tmp/derived_calc.py and is run there
 
-import numpy as np
-from numpy import genfromtxt
+# numpy is imported by main(), so the wd_py.py pool can load this file without it
 import sys
 import csv
 
@@ -30,115 +29,122 @@ def loc_to_lat_lon (locator):
         lon=lon-(1)+((ord(decomp[4])-ascii_base)/12)-(1/24)
     return(lat, lon)
 
-# get the rx_locator, tx_locator and frequency from the command line arguments
-tx_locator=sys.argv[1]
-print(tx_locator)
-rx_locator=sys.argv[2]
-print(rx_locator)
-frequency=sys.argv[3]
+def main(argv=None):
+    import numpy as np
+    argv = sys.argv[1:] if argv is None else argv
+    # get the rx_locator, tx_locator and frequency from the command line arguments
+    tx_locator=argv[0]
+    print(tx_locator)
+    rx_locator=argv[1]
+    print(rx_locator)
+    frequency=argv[2]
 
-print(tx_locator, rx_locator, frequency)
+    print(tx_locator, rx_locator, frequency)
 
-# open file for output as a csv file, to which we will put the calculated values
-with open("derived_azi.csv", "w") as out_file:
-    out_writer=csv.writer(out_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    # loop to calculate  azimuths at tx and rx (wsprnet only does the tx azimuth)
-    if tx_locator!="none":
-        (tx_lat,tx_lon)=loc_to_lat_lon (tx_locator)    # call function to do conversion, then convert to radians
-        phi_tx_lat = np.radians(tx_lat)
-        lambda_tx_lon = np.radians(tx_lon)
-        (rx_lat,rx_lon)=loc_to_lat_lon (rx_locator)    # call function to do conversion, then convert to radians
-        phi_rx_lat = np.radians(rx_lat)
-        lambda_rx_lon = np.radians(rx_lon)
-        delta_phi = (phi_tx_lat - phi_rx_lat)
-        delta_lambda=(lambda_tx_lon-lambda_rx_lon)
+    # open file for output as a csv file, to which we will put the calculated values
+    with open("derived_azi.csv", "w") as out_file:
+        out_writer=csv.writer(out_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        # loop to calculate  azimuths at tx and rx (wsprnet only does the tx azimuth)
+        if tx_locator!="none":
+            (tx_lat,tx_lon)=loc_to_lat_lon (tx_locator)    # call function to do conversion, then convert to radians
+            phi_tx_lat = np.radians(tx_lat)
+            lambda_tx_lon = np.radians(tx_lon)
+            (rx_lat,rx_lon)=loc_to_lat_lon (rx_locator)    # call function to do conversion, then convert to radians
+            phi_rx_lat = np.radians(rx_lat)
+            lambda_rx_lon = np.radians(rx_lon)
+            delta_phi = (phi_tx_lat - phi_rx_lat)
+            delta_lambda=(lambda_tx_lon-lambda_rx_lon)
 
-        # calculate azimuth at the rx
-        y = np.sin(delta_lambda) * np.cos(phi_tx_lat)
-        x = np.cos(phi_rx_lat)*np.sin(phi_tx_lat) - np.sin(phi_rx_lat)*np.cos(phi_tx_lat)*np.cos(delta_lambda)
-        rx_azi = (np.degrees(np.arctan2(y, x))) % 360
+            # calculate azimuth at the rx
+            y = np.sin(delta_lambda) * np.cos(phi_tx_lat)
+            x = np.cos(phi_rx_lat)*np.sin(phi_tx_lat) - np.sin(phi_rx_lat)*np.cos(phi_tx_lat)*np.cos(delta_lambda)
+            rx_azi = (np.degrees(np.arctan2(y, x))) % 360
 
-        # calculate azimuth at the tx
-        p = np.sin(-delta_lambda) * np.cos(phi_rx_lat)
-        q = np.cos(phi_tx_lat)*np.sin(phi_rx_lat) - np.sin(phi_tx_lat)*np.cos(phi_rx_lat)*np.cos(-delta_lambda)
-        tx_azi = (np.degrees(np.arctan2(p, q))) % 360
-        # calculate the vertex, the lat lon at the point on the great circle path nearest the nearest pole, this is the highest latitude on the path
-        # no need to calculate special case of both transmitter and receiver on the equator, is handled OK
-        # Need special case for any meridian, where vertex longitude is the meridian longitude and the vertex latitude is the lat nearest the N or S pole
-        if tx_lon==rx_lon:
-            v_lon=tx_lon
-            v_lat=max([tx_lat, rx_lat], key=abs)
-        else:
-            v_lat=np.degrees(np.arccos(np.sin(np.radians(rx_azi))*np.cos(phi_rx_lat)))
-        if v_lat>90.0:
-            v_lat=180-v_lat
-        if rx_azi<180:
-            v_lon=((rx_lon+np.degrees(np.arccos(np.tan(phi_rx_lat)/np.tan(np.radians(v_lat)))))+360) % 360
-        else:
-            v_lon=((rx_lon-np.degrees(np.arccos(np.tan(phi_rx_lat)/np.tan(np.radians(v_lat)))))+360) % 360
-        if v_lon>180:
-            v_lon=-(360-v_lon)
-        # now test if vertex is not  on great circle track, if so, lat/lon nearest pole is used
-        if v_lon < min(tx_lon, rx_lon) or v_lon > max(tx_lon, rx_lon):
-        # this is the off track case
-            v_lat=max([tx_lat, rx_lat], key=abs)
-            if v_lat==tx_lat:
+            # calculate azimuth at the tx
+            p = np.sin(-delta_lambda) * np.cos(phi_rx_lat)
+            q = np.cos(phi_tx_lat)*np.sin(phi_rx_lat) - np.sin(phi_tx_lat)*np.cos(phi_rx_lat)*np.cos(-delta_lambda)
+            tx_azi = (np.degrees(np.arctan2(p, q))) % 360
+            # calculate the vertex, the lat lon at the point on the great circle path nearest the nearest pole, this is the highest latitude on the path
+            # no need to calculate special case of both transmitter and receiver on the equator, is handled OK
+            # Need special case for any meridian, where vertex longitude is the meridian longitude and the vertex latitude is the lat nearest the N or S pole
+            if tx_lon==rx_lon:
                 v_lon=tx_lon
+                v_lat=max([tx_lat, rx_lat], key=abs)
+            else:
+                v_lat=np.degrees(np.arccos(np.sin(np.radians(rx_azi))*np.cos(phi_rx_lat)))
+            if v_lat>90.0:
+                v_lat=180-v_lat
+            if rx_azi<180:
+                v_lon=((rx_lon+np.degrees(np.arccos(np.tan(phi_rx_lat)/np.tan(np.radians(v_lat)))))+360) % 360
             else:
-                v_lon=rx_lon
-        # now calculate the short path great circle distance
-        a=np.sin(delta_phi/2)*np.sin(delta_phi/2)+np.cos(phi_rx_lat)*np.cos(phi_tx_lat)*np.sin(delta_lambda/2)*np.sin(delta_lambda/2)
-        c=2*np.arctan2(np.sqrt(a), np.sqrt(1-a))
-        km=6371*c
-    else: 
-        v_lon=absent_data
-        v_lat=absent_data
-        tx_lon=absent_data  
-        tx_lat=absent_data
-        rx_lon=absent_data
-        rx_lat=absent_data
-        rx_azi=absent_data
-        tx_azi=absent_data
-        km=absent_data
-        # end of list of absent data values for where tx_locator = "none"
-     
-    # derive the band in metres (except 70cm and 23cm reported as 70 and 23) from the frequency
-    band=9999
-    freq=int(10*float(frequency))
-    if freq==1:
-        band=2200
-    if freq==4:
-        band=630
-    if freq==18:
-        band=160
-    if freq==35:
-        band=80
-    if freq==52 or freq==53:
-       band=60
-    if freq==70:
-        band=40
-    if freq==101:
-        band=30
-    if freq==140:
-        band=20
-    if freq==181:
-        band=17
-    if freq==210:
-        band=15
-    if freq==249:
-        band=12
-    if freq==281:
-        band=10
-    if freq==502:
-        band=6
-    if freq==700:
-        band=4
-    if freq==1444:
-        band=2
-    if freq==4323:
-        band=70
-    if freq==12965:
-        band=23
-    # output the original data, except for pwr in W and miles, and add lat lon at tx and rx, azi at tx and rx, vertex lat lon and the band
-    out_writer.writerow([band, "%.0f" % (km), "%.0f" % (rx_azi), "%.3f" % (rx_lat),  "%.3f" % (rx_lon), "%.0f" % (tx_azi),  "%.1f" % (tx_lat), "%.1f" % (tx_lon), "%.3f" % (v_lat), "%.3f" % (v_lon)])
+                v_lon=((rx_lon-np.degrees(np.arccos(np.tan(phi_rx_lat)/np.tan(np.radians(v_lat)))))+360) % 360
+            if v_lon>180:
+                v_lon=-(360-v_lon)
+            # now test if vertex is not  on great circle track, if so, lat/lon nearest pole is used
+            if v_lon < min(tx_lon, rx_lon) or v_lon > max(tx_lon, rx_lon):
+            # this is the off track case
+                v_lat=max([tx_lat, rx_lat], key=abs)
+                if v_lat==tx_lat:
+                    v_lon=tx_lon
+                else:
+                    v_lon=rx_lon
+            # now calculate the short path great circle distance
+            a=np.sin(delta_phi/2)*np.sin(delta_phi/2)+np.cos(phi_rx_lat)*np.cos(phi_tx_lat)*np.sin(delta_lambda/2)*np.sin(delta_lambda/2)
+            c=2*np.arctan2(np.sqrt(a), np.sqrt(1-a))
+            km=6371*c
+        else: 
+            v_lon=absent_data
+            v_lat=absent_data
+            tx_lon=absent_data  
+            tx_lat=absent_data
+            rx_lon=absent_data
+            rx_lat=absent_data
+            rx_azi=absent_data
+            tx_azi=absent_data
+            km=absent_data
+            # end of list of absent data values for where tx_locator = "none"
+
+        # derive the band in metres (except 70cm and 23cm reported as 70 and 23) from the frequency
+        band=9999
+        freq=int(10*float(frequency))
+        if freq==1:
+            band=2200
+        if freq==4:
+            band=630
+        if freq==18:
+            band=160
+        if freq==35:
+            band=80
+        if freq==52 or freq==53:
+           band=60
+        if freq==70:
+            band=40
+        if freq==101:
+            band=30
+        if freq==140:
+            band=20
+        if freq==181:
+            band=17
+        if freq==210:
+            band=15
+        if freq==249:
+            band=12
+        if freq==281:
+            band=10
+        if freq==502:
+            band=6
+        if freq==700:
+            band=4
+        if freq==1444:
+            band=2
+        if freq==4323:
+            band=70
+        if freq==12965:
+            band=23
+        # output the original data, except for pwr in W and miles, and add lat lon at tx and rx, azi at tx and rx, vertex lat lon and the band
+        out_writer.writerow([band, "%.0f" % (km), "%.0f" % (rx_azi), "%.3f" % (rx_lat),  "%.3f" % (rx_lon), "%.0f" % (tx_azi),  "%.1f" % (tx_lat), "%.1f" % (tx_lon), "%.3f" % (v_lat), "%.3f" % (v_lon)])
+    return 0
+
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -94,6 +94,10 @@ function grape_return_code_is_error() {
 declare -r PSWS_SERVER_URL='pswsnetwork.eng.ua.edu'
 declare -r UPLOAD_TO_PSWS_SERVER_COMPLETED_FILE_NAME='pswsnetwork_upload_completed'
 declare -r WAV2GRAPE_PYTHON_CMD="${WSPRDAEMON_ROOT_DIR}/wav2grape.py"
+declare -r GRAPE_WV_ARCHIVE_CHECK_CMD="${WSPRDAEMON_ROOT_DIR}/grape_wv_archive_check.py"    ### Checks and repairs all the bands of a date in one pass and leaves a JSON integrity report in the date dir
+declare    GRAPE_WV_ARCHIVE_CHECK="${GRAPE_WV_ARCHIVE_CHECK-yes}"                             ### Set to "no" to go back to checking each .wv file with 'wvunpack -v'
+declare -r GRAPE_DRF_VERIFY_CMD="${WSPRDAEMON_ROOT_DIR}/wd_drf_verify.py"                   ### Reads back each DRF dataset written by wav2grape.py and checks it against its 24 hour wav files
+declare    GRAPE_DRF_VERIFY="${GRAPE_DRF_VERIFY-no}"                                          ### Set to "yes" to verify the DRF datasets and not upload those which fail
 
 ### '-u ' sub menu
 function grape_upload_all_local_wavs() {
@@ -250,6 +254,16 @@ function upload_24hour_wavs_to_grape_drf_server() {
             return 1
         fi
 
+        if [[ ${GRAPE_DRF_VERIFY} == "yes" ]]; then
+            local verify_output
+            verify_output=$( python3 ${GRAPE_DRF_VERIFY_CMD} "${receiver_dir}:${receiver_tmp_dir}" 2>&1 )
+            rc=$? ; if (( rc )); then
+                wd_logger 1 "ERROR: '${GRAPE_DRF_VERIFY_CMD##*/} ${receiver_dir}:${receiver_tmp_dir}' => ${rc}, so don't upload it:\n${verify_output}"
+                return ${rc}
+            fi
+            wd_logger 1 "${verify_output}"
+        fi
+
         wd_logger 1  "The DRF files have been created under ${receiver_tmp_dir}.  Now upload them.."
 
         local psws_trigger_dir_name="c${receiver_tmp_dir##*/}_\#${psws_instrument_id}_\#$(date -u +%Y-%m%dT%H-%M)"       ### The root directory of where our DRF file tree will go on th ePSWS server
@@ -284,6 +298,7 @@ function upload_24hour_wavs_to_grape_drf_server() {
     done
     touch "${reporter_upload_complete_file_name}"
     wd_logger 1  "Upload was successful, so create '${reporter_upload_complete_file_name}'"
+    wav_archive_manager_notify DELIVERED ${reporter_wav_root_dir}
 }
 
 function grape_test_auto_login() {
@@ -383,6 +398,10 @@ function grape_get_date_status() {
         wd_logger 1 "Can't find ${date_root_dir}"
         return 1
     fi
+    if [[ ${GRAPE_WV_ARCHIVE_CHECK} == "yes" ]] && python3 ${GRAPE_WV_ARCHIVE_CHECK_CMD} status ${date_root_dir} ; then
+        ### Print the report left by the last 'grape_wv_archive_check.py check' of this date rather than rescanning it
+        return 0
+    fi
     local rc=0
     local band_dir_list=( $( find -L ${date_root_dir} -mindepth 3 -type d  -regex '.*/\(WWV\|CHU\|K_BEACON\).*' | awk -F_ '{print $(NF-1), $NF, $0}' | sort -k1,1r -k2,2n  | cut -d' ' -f3) )
     wd_logger 1 "Found ${#band_dir_list[@]} bands for UTC date ${date}"
@@ -431,6 +450,28 @@ function grape_repair_band_bad_compressed_files() {
         wd_logger 1 "Band '${band_dir}' is not a WWV or CHU band, so skip repairing"
         return 0
     fi
+    local rc
+    if [[ ${GRAPE_WV_ARCHIVE_CHECK} == "yes" ]]; then
+        local check_output
+        check_output=$( python3 ${GRAPE_WV_ARCHIVE_CHECK_CMD} band --repair ${band_dir} 2> /tmp/grape_wv_archive_check.log )
+        rc=$?
+        if (( rc == 3 )); then
+            wd_logger 1 "There are no good .wv files in this ${band_dir}"
+            return 1
+        elif (( rc )); then
+            wd_logger 1 "ERROR: 'python3 ${GRAPE_WV_ARCHIVE_CHECK_CMD} band --repair ${band_dir}' => ${rc}, so check each file with 'wvunpack -v':\n$(< /tmp/grape_wv_archive_check.log)"
+        else
+            local silence_files_added=${check_output##*silence_added=}
+            wd_logger 1 "${GRAPE_WV_ARCHIVE_CHECK_CMD##*/} checked ${band_dir}: ${check_output}"
+            if [[ -s /tmp/grape_wv_archive_check.log ]]; then
+                wd_logger 1 "It deleted these corrupt .wv files:\n$(< /tmp/grape_wv_archive_check.log)"
+            fi
+            if (( silence_files_added >=  GRAPE_ERROR_RETURN_BASE)); then
+                silence_files_added=$(( ${GRAPE_ERROR_RETURN_BASE} - 1 ))
+            fi
+            return ${silence_files_added}
+        fi
+    fi
     local compressed_wav_file_list=( $( find -L ${band_dir} -name '*.wv' | sort) )
     if [[ ${#compressed_wav_file_list[@]} -eq 0 ]]; then
         wd_logger 1 "There are no .wv files in ${band_dir}, so returning an this as an error"
@@ -438,7 +479,6 @@ function grape_repair_band_bad_compressed_files() {
     fi
 
     wd_logger 1 "Checking all the ${#compressed_wav_file_list[@]} .wv files in band dir ${band_dir} are present and valid and that the wav files they contain are valid"
-    local rc
     local bad_wav_file_count=0
     local good_wav_file_count=0
     local compressed_wav_file
@@ -538,6 +578,16 @@ function grape_repair_date_wvs() {
         return 1
     fi
 
+    if [[ ${GRAPE_WV_ARCHIVE_CHECK} == "yes" ]]; then
+        ### Validate all the .wv files of all the bands in parallel and apply all the repairs in one pass
+        local rc
+        python3 ${GRAPE_WV_ARCHIVE_CHECK_CMD} check --repair ${date_root_dir}
+        rc=$? ; if (( ! rc )); then
+            return 0
+        fi
+        wd_logger 1 "ERROR: 'python3 ${GRAPE_WV_ARCHIVE_CHECK_CMD} check --repair ${date_root_dir}' => ${rc}, so repair each band with 'wvunpack -v'"
+    fi
+
     ### Get a list of bands sorted so the WWV bands are first and in frequency order followed by the CHU bands in frequency order. Thanks to chatgbt:
     local band_dir_list=( $( find -L ${date_root_dir} -mindepth 3 -type d  -regex '.*/\(WWV\|CHU\|K_BEACON\).*' | awk -F_ '{print $(NF-1), $NF, $0}' | sort -k1,1r -k2,2n  | cut -d' ' -f3) )
     wd_logger 1 "Repairing any defective and/or missing .wv files in these ${#band_dir_list[@]} bands: ${band_dir_list[*]##*/}"
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: grape_wv_archive_check.py
+# Checks and repairs the GRAPE wav archive of one minute WavPack compressed IQ files:
+#     wav-archive/<YYYYMMDD>/<CALL_GRID>/<RECEIVER>@<PSWS_ID>/<BAND>/<YYYYMMDD>T<HHMM>00Z_<FREQ>_iq.wv
+# Replaces the per-file 'wvunpack -v' loop and the 24 x 60 expected name loop of grape_repair_band_bad_compressed_files():
+#   - each band directory is scanned once and compared with the index of the 1440 expected minute file names
+#   - the WavPack block headers of every file are validated in a process pool without decoding the audio:
+#     'wvpk' block ids, block sizes which exactly fill the file, contiguous block indexes, and a sample count
+#     which matches both the file header and one minute at the file's sample rate
+#   - all repairs are applied in one pass: corrupt and unexpected files are deleted, and each missing minute is linked
+#     to one-minute-silent-float.wv
+#   - a JSON integrity report is written to each date directory, which 'status' prints for grape_show_all_dates_status()
+#     and which lets later runs skip re-validating band directories whose files haven't changed
+#
+# Usage:
+#     grape_wv_archive_check.py check  [--repair] [--jobs N] [--force] [--deep] DATE_DIR ...
+#     grape_wv_archive_check.py band   [--repair] BAND_DIR          ### prints 'silence_added=N', used by grape_repair_band_bad_compressed_files()
+#                                                                    ### exits with 3 if there are no good files, so as not to be confused with a python error's 1
+#     grape_wv_archive_check.py status DATE_DIR ...                 ### exits with 2 if a DATE_DIR has no report
+
+import argparse
+import json
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SILENT_WV_FILE_PATH = os.path.join(WD_ROOT_DIR, 'one-minute-silent-float.wv')
+REPORT_FILE_NAME = 'grape_wv_archive_report.json'
+BAND_DIR_REGEX = re.compile(r'^(WWV|CHU|K_BEACON)')
+WV_FILE_REGEX = re.compile(r'^(\d{8})T(\d{2})(\d{2})00Z_(\d+)_iq\.wv$')
+NO_GOOD_FILES_EXIT_CODE = 3
+
+WV_BLOCK_HEADER = struct.Struct('<4sIHBBIIIII')     # ckID, ckSize, version, block_index_u8, total_samples_u8, total_samples, block_index, block_samples, flags, crc
+WV_MIN_VERSION = 0x402
+WV_MAX_VERSION = 0x410
+WV_INITIAL_BLOCK = 0x800
+WV_SAMPLE_RATES = (6000, 8000, 9600, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000, 64000, 88200, 96000, 192000)
+SECONDS_PER_FILE = 60
+
+
+def validate_wv_file(path):
+    # Returns None if the WavPack block headers of 'path' are consistent, else a string describing the problem
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as fp:
+            offset = 0
+            samples = 0
+            total_samples = None
+            total_samples_unknown = False
+            sample_rate = None
+            while offset < file_size:
+                fp.seek(offset)
+                header = fp.read(WV_BLOCK_HEADER.size)
+                if len(header) < WV_BLOCK_HEADER.size:
+                    return 'truncated block header at byte %d' % offset
+                ck_id, ck_size, version, block_index_u8, total_samples_u8, block_total, block_index, block_samples, flags, _ = WV_BLOCK_HEADER.unpack(header)
+                if ck_id != b'wvpk':
+                    if total_samples is not None and header[:3] in (b'APE', b'TAG'):
+                        break                       # A trailing tag
+                    return "no 'wvpk' block id at byte %d" % offset
+                if not WV_MIN_VERSION <= version <= WV_MAX_VERSION:
+                    return 'unsupported version 0x%x at byte %d' % (version, offset)
+                if offset + ck_size + 8 > file_size:
+                    return 'block at byte %d is truncated' % offset
+                if total_samples is None:
+                    total_samples = block_total + (total_samples_u8 << 32)
+                    total_samples_unknown = block_total == 0xffffffff
+                    rate_index = (flags >> 23) & 0xf
+                    sample_rate = WV_SAMPLE_RATES[rate_index] if rate_index < len(WV_SAMPLE_RATES) else None
+                if flags & WV_INITIAL_BLOCK and block_samples:
+                    if block_index + (block_index_u8 << 32) != samples:
+                        return 'block at byte %d starts at sample %d, not %d' % (offset, block_index, samples)
+                    samples += block_samples
+                offset += ck_size + 8
+    except OSError as err:
+        return str(err)
+    if total_samples is None:
+        return 'no WavPack blocks'
+    if not total_samples_unknown and samples != total_samples:
+        return 'blocks hold %d samples, but the header says %d' % (samples, total_samples)
+    if sample_rate and samples != sample_rate * SECONDS_PER_FILE:
+        return 'holds %d samples, not %d seconds at %d sps' % (samples, SECONDS_PER_FILE, sample_rate)
+    return None
+
+
+def validate_wv_file_deep(path):
+    error = validate_wv_file(path)
+    if error is None:
+        result = subprocess.run(['wvunpack', '-q', '-v', path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            error = 'wvunpack -v: ' + (result.stderr.decode(errors='replace').strip().splitlines() or ['failed'])[-1]
+    return path, error
+
+
+def validate_wv_file_quick(path):
+    return path, validate_wv_file(path)
+
+
+def find_band_dirs(date_dir):
+    # <DATE>/<CALL_GRID>/<RECEIVER>/<BAND>
+    band_dirs = []
+    for dir_path, dir_names, _ in os.walk(date_dir, followlinks=True):
+        depth = os.path.relpath(dir_path, date_dir).count(os.sep) + 1 if dir_path != date_dir else 0
+        if depth == 2:
+            band_dirs += [os.path.join(dir_path, name) for name in dir_names if BAND_DIR_REGEX.match(name)]
+            dir_names[:] = []
+    return sorted(band_dirs)
+
+
+class BandIndex:
+    # The expected vs present minute files of one band directory, from a single scandir()
+    def __init__(self, band_dir):
+        self.band_dir = band_dir
+        self.files = {}                     # name => is silence link
+        self.fingerprint = [0, 0, 0]        # count, bytes, newest mtime
+        dates = {}
+        freqs = {}
+        with os.scandir(band_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.wv'):
+                    continue
+                self.files[entry.name] = entry.is_symlink()
+                stat = entry.stat(follow_symlinks=False)
+                self.fingerprint[0] += 1
+                self.fingerprint[1] += stat.st_size
+                self.fingerprint[2] = max(self.fingerprint[2], int(stat.st_mtime))
+                match = WV_FILE_REGEX.match(entry.name)
+                if match:
+                    dates[match.group(1)] = dates.get(match.group(1), 0) + 1
+                    freqs[match.group(4)] = freqs.get(match.group(4), 0) + 1
+        date_from_path = [element for element in band_dir.split(os.sep) if re.match(r'^\d{8}$', element)]
+        self.date = date_from_path[-1] if date_from_path else (max(dates, key=dates.get) if dates else None)
+        self.freq = max(freqs, key=freqs.get) if freqs else None
+        self.expected = set()
+        if self.date and self.freq:
+            self.expected = {'%sT%02d%02d00Z_%s_iq.wv' % (self.date, hour, minute, self.freq) for hour in range(24) for minute in range(60)}
+
+    def files_to_validate(self):
+        return [os.path.join(self.band_dir, name) for name, is_link in self.files.items() if not is_link and name in self.expected]
+
+
+def repair_band(index, corrupt, repair, silence_file):
+    band_result = {'present': 0, 'silence_links': 0, 'corrupt': sorted(os.path.basename(path) for path in corrupt), 'extra': [], 'missing': 0,
+                   'silence_added': 0, 'freq': index.freq}
+    extra = sorted(name for name in index.files if name not in index.expected)
+    band_result['extra'] = extra
+    for name in extra + band_result['corrupt']:
+        if repair:
+            try:
+                os.remove(os.path.join(index.band_dir, name))
+            except OSError:
+                pass
+            index.files.pop(name, None)
+    missing = sorted(index.expected - set(index.files)) if index.files else []
+    band_result['missing'] = len(missing)
+    if repair:
+        for name in missing:
+            try:
+                os.symlink(silence_file, os.path.join(index.band_dir, name))
+                index.files[name] = True
+                band_result['silence_added'] += 1
+            except OSError:
+                pass
+    band_result['present'] = sum(1 for is_link in index.files.values() if not is_link)
+    band_result['silence_links'] = sum(1 for is_link in index.files.values() if is_link)
+    return band_result
+
+
+def load_report(date_dir):
+    try:
+        with open(os.path.join(date_dir, REPORT_FILE_NAME)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def check_band_dirs(band_dirs, args, previous_bands=None):
+    # Validate all the files of all of band_dirs in one process pool, then repair each band.  Returns {band_dir: result}
+    indexes = [BandIndex(band_dir) for band_dir in band_dirs]
+    to_validate = []
+    reused = {}
+    for index in indexes:
+        previous = (previous_bands or {}).get(index.band_dir)
+        if previous and not args.force and previous.get('fingerprint') == index.fingerprint and not previous.get('corrupt'):
+            reused[index.band_dir] = previous
+        else:
+            to_validate += index.files_to_validate()
+    validator = validate_wv_file_deep if args.deep else validate_wv_file_quick
+    corrupt = {}
+    if to_validate:
+        with ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+            for path, error in pool.map(validator, to_validate, chunksize=64):
+                if error:
+                    print('%s: %s' % (path, error), file=sys.stderr)
+                    corrupt.setdefault(os.path.dirname(path), []).append(path)
+    results = {}
+    for index in indexes:
+        if index.band_dir in reused:
+            results[index.band_dir] = reused[index.band_dir]
+            continue
+        band_result = repair_band(index, corrupt.get(index.band_dir, []), args.repair, args.silence_file)
+        if args.repair:
+            index.fingerprint = BandIndex(index.band_dir).fingerprint
+        band_result['fingerprint'] = index.fingerprint
+        results[index.band_dir] = band_result
+    return results
+
+
+def cmd_check(args):
+    rc = 0
+    for date_dir in args.date_dirs:
+        date_dir = os.path.abspath(date_dir)
+        if not os.path.isdir(date_dir):
+            print("Can't find %s" % date_dir, file=sys.stderr)
+            rc = 1
+            continue
+        previous = load_report(date_dir) or {}
+        start = time.perf_counter()
+        results = check_band_dirs(find_band_dirs(date_dir), args, previous.get('bands'))
+        report = {'date': os.path.basename(date_dir), 'checked_epoch': int(time.time()), 'repaired': args.repair, 'bands': results}
+        with open(os.path.join(date_dir, REPORT_FILE_NAME + '.tmp'), 'w') as fp:
+            json.dump(report, fp, indent=1)
+        os.replace(os.path.join(date_dir, REPORT_FILE_NAME + '.tmp'), os.path.join(date_dir, REPORT_FILE_NAME))
+        corrupt_count = sum(len(band['corrupt']) for band in results.values())
+        silence_count = sum(band['silence_added'] for band in results.values())
+        print('%s: checked %d bands in %.1f seconds, found %d corrupt files, added %d silence files' %
+              (date_dir, len(results), time.perf_counter() - start, corrupt_count, silence_count))
+    return rc
+
+
+def cmd_band(args):
+    band_dir = os.path.abspath(args.band_dir)
+    result = check_band_dirs([band_dir], args)[band_dir]
+    print('present=%d corrupt=%d extra=%d silence_added=%d' % (result['present'], len(result['corrupt']), len(result['extra']), result['silence_added']))
+    return 0 if result['present'] else NO_GOOD_FILES_EXIT_CODE
+
+
+def cmd_status(args):
+    rc = 0
+    for date_dir in args.date_dirs:
+        report = load_report(date_dir)
+        if report is None:
+            rc = 2
+            continue
+        print('Found %d bands for UTC date %s, checked at %s' % (len(report['bands']), report['date'], time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(report['checked_epoch']))))
+        for band_dir, band in sorted(report['bands'].items()):
+            line = 'In %-90s found %d .wv files' % (band_dir, band['present'] + band['silence_links'])
+            if band['silence_links']:
+                line += ', of which %d are silence files' % band['silence_links']
+            if report['repaired'] and band['corrupt']:
+                line += ', after deleting %d corrupt files' % len(band['corrupt'])
+            elif band['corrupt'] or band['missing'] > band['silence_added']:
+                line += ', %d corrupt and %d missing' % (len(band['corrupt']), band['missing'] - band['silence_added'])
+            print(line)
+    return rc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and repair the GRAPE archive of one minute .wv files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    check_parser = subparsers.add_parser('check', help='Check (and with --repair, repair) all the bands of each DATE_DIR')
+    check_parser.add_argument('date_dirs', nargs='+')
+    band_parser = subparsers.add_parser('band', help='Check (and with --repair, repair) one band directory')
+    band_parser.add_argument('band_dir')
+    for sub_parser in (check_parser, band_parser):
+        sub_parser.add_argument('--repair', action='store_true', help='Delete corrupt and unexpected files and link silence files for missing minutes')
+        sub_parser.add_argument('--jobs', type=int, default=0, help='Number of validating processes (default: number of CPUs)')
+        sub_parser.add_argument('--force', action='store_true', help="Validate bands even if they haven't changed since the last report")
+        sub_parser.add_argument('--deep', action='store_true', help="Also decode and verify the CRCs of each file with 'wvunpack -v'")
+        sub_parser.add_argument('--silence-file', default=SILENT_WV_FILE_PATH)
+    status_parser = subparsers.add_parser('status', help='Print the integrity report of each DATE_DIR')
+    status_parser.add_argument('date_dirs', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        return cmd_check(args)
+    if args.command == 'band':
+        return cmd_band(args)
+    return cmd_status(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
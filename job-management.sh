@@ -426,10 +426,52 @@ function add_remove_jobs_in_running_file() {
 declare -r HHMM_SCHED_FILE=${WSPRDAEMON_ROOT_DIR}/hhmm.sched       ### Contains the schedule from wsprdaemon.conf with sunrise/sunset entries fixed in HHMM_SCHED[]
 declare -r EXPECTED_JOBS_FILE=${WSPRDAEMON_ROOT_DIR}/expected.jobs ### Based upon current HHMM, this is the job list from EXPECTED_JOBS_FILE[] which should be running in EXPECTED_LIST[]
 declare -r RUNNING_JOBS_FILE=${WSPRDAEMON_ROOT_DIR}/running.jobs   ### This is the list of jobs we programmed to be running in RUNNING_LIST[]
+declare -r COMPILED_SCHED_FILE=${WSPRDAEMON_ROOT_DIR}/compiled.sched  ### HHMM_SCHED[] as a table of the jobs for each minute of the day, see wd_schedule.py
+declare    WD_SCHEDULE_CMD=${WSPRDAEMON_ROOT_DIR}/wd_schedule.py
+declare    WD_SCHEDULE_COMPILER=${WD_SCHEDULE_COMPILER-yes}              ### If "no", or if wd_schedule.py fails, the schedule is resolved by the bash code below
+
+### Creates hhmm.sched and compiled.sched with wd_schedule.py when the conf file or the local date (and so sunrise/sunset) has changed since they were compiled
+function compile_schedule() {
+    local schedule_key="$( $GET_FILE_MOD_TIME_CMD ${WSPRDAEMON_CONFIG_FILE} ) $( printf "%(%Y%m%d)T" -1 )"
+    local compiled_key_line=""
+
+    if [[ -f ${COMPILED_SCHED_FILE} && -f ${HHMM_SCHED_FILE} ]]; then
+        read -r compiled_key_line < ${COMPILED_SCHED_FILE}
+        if [[ "${compiled_key_line}" == "declare COMPILED_SCHED_KEY=\"${schedule_key}\"" ]]; then
+            wd_logger 2 "${COMPILED_SCHED_FILE} was compiled from the current conf file today, so no update is needed"
+            return 0
+        fi
+    fi
+
+    source ${WSPRDAEMON_CONFIG_FILE}      ### declares RECEIVER_LIST[] and WSPR_SCHEDULE[]
+    local compile_output
+    compile_output=$( {
+        local receiver_line
+        for receiver_line in "${RECEIVER_LIST[@]}"; do
+            local receiver_fields=( ${receiver_line} )
+            echo "RECEIVER ${receiver_fields[0]} ${receiver_fields[3]}"
+        done
+        local sched_line
+        for sched_line in "${WSPR_SCHEDULE[@]}"; do
+            echo "SCHEDULE ${sched_line}"
+        done
+        } | python3 ${WD_SCHEDULE_CMD} compile --key "${schedule_key}" --compiled-file ${COMPILED_SCHED_FILE} --hhmm-sched-file ${HHMM_SCHED_FILE} 2>&1 )
+    local rc=$?
+    if (( rc )); then
+        wd_logger 1 "ERROR: 'python3 ${WD_SCHEDULE_CMD} compile ...' => ${rc}:\n${compile_output}"
+        rm -f ${COMPILED_SCHED_FILE}
+        return ${rc}
+    fi
+    wd_logger 1 "Compiled the schedule for key '${schedule_key}':\n${compile_output}"
+    return 0
+}
 
 ### Reads wsprdaemon.conf and if there are sunrise/sunset job times it gets the current sunrise/sunset times
 ### After calculating HHMM for sunrise and sunset array elements, it creates hhmm.sched with job times in HHMM_SCHED[]
 function update_hhmm_sched_file() {
+    if [[ ${WD_SCHEDULE_COMPILER} == "yes" ]] && compile_schedule ; then
+        return
+    fi
     update_suntimes_file      ### sunrise/sunset times change daily
 
     ### EXPECTED_JOBS_FILE only should need to be updated if WSPRDAEMON_CONFIG_FILE or SUNTIMES_FILE has changed
@@ -574,7 +616,18 @@ function setup_expected_jobs_file () {
     ### Search the entires in the hhmm.sched file for the element which applies to the current time
     local index_now=0
     local index_now_time=0
-    for index in $(seq 0 ${index_max_hhmm_sched}) ; do
+    if [[ ${WD_SCHEDULE_COMPILER} == "yes" && -f ${COMPILED_SCHED_FILE} ]]; then
+        ### COMPILED_SCHED_INDEX[] has the start minute of the schedule entry in effect at each minute of the day
+        source ${COMPILED_SCHED_FILE}
+        local current_hhmm
+        printf -v current_hhmm "%(%H%M)T" -1
+        local current_minute=$(( 10#${current_hhmm:0:2} * 60 + 10#${current_hhmm:2:2} ))
+        index_now=${COMPILED_SCHED_INDEX[${current_minute}]}
+        index_now_time=$(( (index_now / 60) * 100 + index_now % 60 ))
+        hhmm_expected_jobs=( ${COMPILED_SCHED_JOBS[${index_now}]} )
+        index_max_hhmm_sched=-1                                     ### So the search of HHMM_SCHED[] below is skipped
+    fi
+    for (( index = 0; index <= index_max_hhmm_sched; ++index )) ; do
         hhmm_job=( ${HHMM_SCHED[${index}]}  )
         local receiver_name=${hhmm_job[1]%,*}   ### I assume that all of the Receivers in this job are in the same grid as the Kiwi in the first job
         local receiver_grid="$(get_receiver_grid_from_name ${receiver_name})"
@@ -635,6 +688,12 @@ function update_running_jobs_to_match_expected_jobs()
 
     ### Check that posting jobs which should be running are still running, and terminate any jobs currently running which will no longer be running 
     ### posting_daemon() will ensure that decoding_daemon() and recording_daemon()s are running
+    local -A expected_jobs_table=()
+    local expected_job
+    for expected_job in ${EXPECTED_JOBS[@]-}; do
+        expected_jobs_table[${expected_job}]=1
+    done
+
     local running_job
     local schedule_change="no"
     for running_job in ${temp_running_jobs[*]}; do
@@ -648,23 +707,17 @@ function update_running_jobs_to_match_expected_jobs()
         local running_receiver=${running_job_fields[0]}
         local running_band=${running_job_fields[1]}
         local running_modes=${running_job_fields[2]-DEFAULT}
-        local found_it="no"
         wd_logger 2 "Checking status of job ${running_job}"
-        for index_schedule_jobs in $( seq 0 $(( ${#EXPECTED_JOBS[*]} - 1)) ) ; do
-            if [[ ${running_job} == ${EXPECTED_JOBS[$index_schedule_jobs]} ]]; then
-                found_it="yes"
-                ### Verify that it is still running
-                local status
-                if status=$(get_posting_status ${running_receiver} ${running_band}) ; then
-                    wd_logger 2 "Found posting_daemon() job ${running_receiver} ${running_band} is running"
-                else
-                    wd_logger 1 "Found dead posting_daemon() job '${running_receiver},${running_band}'. get_recording_status() returned '$status', so starting job"
-                    start_stop_job a ${running_receiver} ${running_band} ${running_modes}
-                fi
-                break    ## No need to look further
+        if [[ -n "${expected_jobs_table[${running_job}]-}" ]]; then
+            ### Verify that it is still running
+            local status
+            if status=$(get_posting_status ${running_receiver} ${running_band}) ; then
+                wd_logger 2 "Found posting_daemon() job ${running_receiver} ${running_band} is running"
+            else
+                wd_logger 1 "Found dead posting_daemon() job '${running_receiver},${running_band}'. get_recording_status() returned '$status', so starting job"
+                start_stop_job a ${running_receiver} ${running_band} ${running_modes}
             fi
-        done
-        if [[ $found_it == "no" ]]; then
+        else
             wd_logger 1 "Found Schedule has changed. Terminating posting job '${running_receiver},${running_band}'"
             ### start_stop_job() will fix up the ${RUNNING_JOBS_FILE} and tell the posting_daemon to stop. It polls every 5 seconds and if there are no more clients will signal the recording deamon to stop
             start_stop_job z ${running_receiver} ${running_band} ${running_modes}
@@ -680,20 +733,11 @@ function update_running_jobs_to_match_expected_jobs()
     fi
 
     ### Find any jobs which will be new and start them
-    local index_expected_jobs
-    for index_expected_jobs in $( seq 0 $(( ${#EXPECTED_JOBS[*]} - 1)) ) ; do
-        local expected_job=${EXPECTED_JOBS[${index_expected_jobs}]}
-        local found_it="no"
+    for expected_job in ${EXPECTED_JOBS[@]-}; do
         ### RUNNING_JOBS_FILE may have been changed each time through this loop, so reload it
         unset RUNNING_JOBS
         source ${RUNNING_JOBS_FILE}                           ### RUNNING_JOBS_FILE may have been changed above, so reload it
-        temp_running_jobs=( ${RUNNING_JOBS[*]-} ) 
-        for index_running_jobs in $(seq 0 $((${#temp_running_jobs[*]} - 1 )) ); do
-            if [[ ${expected_job} == ${temp_running_jobs[$index_running_jobs]} ]]; then
-                found_it="yes"
-            fi
-        done
-        if [[ ${found_it} == "no" ]]; then
+        if [[ ! " ${RUNNING_JOBS[*]-} " =~ " ${expected_job} " ]]; then
             wd_logger 1 "Found that the schedule has changed. Starting new job '${expected_job}'"
             local expected_job_fields=( ${expected_job//,/ } )
             local expected_receiver=${expected_job_fields[0]}
@@ -106,6 +106,24 @@ declare    SIGNAL_LEVEL_POST_TX_LEN=${SIGNAL_LEVEL_POST_TX_LEN-5}
 declare    SIGNAL_LEVEL_LOG_FILE_NAME="signal_levels.txt"
 declare    SIGNAL_LEVEL_CSV_FILE_NAME="signal_levels.csv"
 
+### When WD_NOISE_STATS="yes", fold the noise lines added to each signal_levels.txt since the last odd minute into the hourly histograms of its noise_stats.wdns
+### Run 'python3 wd_noise_stats.py query --hour 3 KIWI_0 40' to get the percentiles of the last 30 days without rescanning the signal_levels.txt files
+function update_noise_stats() {
+    local signal_levels_root_dir=${WSPRDAEMON_ROOT_DIR}/signal_levels
+    if [[ ! -d ${signal_levels_root_dir} ]]; then
+        wd_logger 2 "'${signal_levels_root_dir}' doesn't exist"
+        return 0
+    fi
+    nice -n ${NOISE_PLOT_CMD_NICE_LEVEL} ${WD_PY_CMD} wd_noise_stats update --root ${signal_levels_root_dir} >& noise_stats.log
+    local rc=$?
+    if (( rc )); then
+        wd_logger 1 "ERROR: 'wd_noise_stats update --root ${signal_levels_root_dir}' => ${rc}:\n$(< noise_stats.log)"
+        return ${rc}
+    fi
+    wd_logger 2 "Updated the noise stats under ${signal_levels_root_dir}"
+    return 0
+}
+
 function setup_signal_levels_log_file() {
     local return_signal_levels_log_file_variable_name=$1   ### Return the full path to the log file which will be added to during each wspr packet decode 
     local receiver_name=$2
@@ -247,8 +265,12 @@ function plot_noise() {
 
     wd_logger 1 "Creating  ${NOISE_GRAPH_TMP_FILE}"
     local plot_csv_file_list_string=$( echo ${sorted_csv_file_list[@]} | tr '\n' ' ')
-    nice -n ${NOISE_PLOT_CMD_NICE_LEVEL} python3 ${NOISE_PLOT_CMD} ${SIGNAL_LEVEL_UPLOAD_ID-wsprdaemon.sh}  ${my_maidenhead} ${NOISE_GRAPH_TMP_FILE} ${noise_calibration_file} "${plot_csv_file_list_string}" \
-               ${NOISE_GRAPHS_Y_MIN--175} ${NOISE_GRAPHS_Y_MAX--105} ${NOISE_GRAPHS_X_PIXEL-40} ${NOISE_GRAPHS_Y_PIXEL-30} >& noise_plot.log
+    local noise_envelope_days=0
+    if [[ ${WD_NOISE_STATS-no} == "yes" ]]; then
+        noise_envelope_days=${WD_NOISE_STATS_PLOT_DAYS-30}     ### Overlay the hourly p10/p50/p90 of this many days
+    fi
+    nice -n ${NOISE_PLOT_CMD_NICE_LEVEL} ${WD_PY_CMD} noise_plot ${SIGNAL_LEVEL_UPLOAD_ID-wsprdaemon.sh}  ${my_maidenhead} ${NOISE_GRAPH_TMP_FILE} ${noise_calibration_file} "${plot_csv_file_list_string}" \
+               ${NOISE_GRAPHS_Y_MIN--175} ${NOISE_GRAPHS_Y_MAX--105} ${NOISE_GRAPHS_X_PIXEL-40} ${NOISE_GRAPHS_Y_PIXEL-30} ${noise_envelope_days} >& noise_plot.log
     local ret_code=$?
     if [[ ${ret_code} -eq 0 ]]; then
         wd_logger 2 "'python3 ${NOISE_PLOT_CMD} ${SIGNAL_LEVEL_UPLOAD_ID-wsprdaemon.sh}  ${my_maidenhead} ${NOISE_GRAPH_TMP_FILE} ${noise_calibration_file} '${sorted_csv_file_list[*]} ${NOISE_GRAPHS_Y_MIN--175} ${NOISE_GRAPHS_Y_MAX--105} ${NOISE_GRAPHS_X_PIXEL-40} ${NOISE_GRAPHS_Y_PIXEL-30} ' => ${ret_code}"
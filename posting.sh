@@ -104,6 +104,11 @@ function posting_daemon()
         supplier_dirs_list+=(${this_rx_local_link_name})
     done
 
+    if [[ ${WD_POSTING_ASSEMBLER-no} == "yes" ]]; then
+        post_assembled_cycles ${posting_receiver_band} ${posting_receiver_modes} ${wsprnet_upload_dir} "${real_receiver_list[*]}" ${supplier_dirs_list[@]}
+        ### It only returns when the posting assembler has stopped running, so fall back to polling with 'find' until this daemon is restarted
+    fi
+
     wd_logger 1 "Searching in subdirs: '${supplier_dirs_list[*]}' for '*_spots.txt' files"
     while true; do
         wd_logger 1 "Searching for at least one spot file"
@@ -161,6 +166,92 @@ function posting_daemon()
    done
 }
 
+### When WD_POSTING_ASSEMBLER="yes", the watchdog spawns posting_assembler_daemon() which watches the supplier dirs of all the posting daemons with inotify
+### and writes each complete WSPR cycle as the line 'YYMMDD_HHMM SPOT_FILE_PATH...' to the FIFO of the posting daemon.  See wd_posting_assembler.py
+declare WD_POSTING_ASSEMBLER_CMD=${WSPRDAEMON_ROOT_DIR}/wd_posting_assembler.py
+declare WD_POSTING_ASSEMBLER_PORT=${WD_POSTING_ASSEMBLER_PORT-58034}        ### UDP port on 127.0.0.1 where the posting daemons send START and WATCH
+declare POSTING_CYCLES_FIFO="posting_cycles.fifo"
+declare POSTING_ASSEMBLER_PID_FILE=${WSPRDAEMON_TMP_DIR}/posting_assembler_daemon.pid   ### Written by spawn_daemon() for the watchdog's 'posting_assembler_daemon ${WSPRDAEMON_TMP_DIR}'
+declare POSTING_ASSEMBLER_MAX_MISSED_POLLS=${POSTING_ASSEMBLER_MAX_MISSED_POLLS-3}    ### Fall back to 'find' polling after this many polls without a running assembler
+
+function posting_assembler_notify()
+{
+    local message="$*"
+
+    if ! printf "%s\n" "${message}" 2> /dev/null > /dev/udp/127.0.0.1/${WD_POSTING_ASSEMBLER_PORT} ; then
+        wd_logger 1 "ERROR: failed to send '${message}' to the posting assembler on UDP port ${WD_POSTING_ASSEMBLER_PORT}"
+        return 1
+    fi
+    return 0
+}
+
+### Returns 0 if the posting_assembler_daemon.pid file holds the pid of a running wd_posting_assembler.py
+function posting_assembler_is_running()
+{
+    local assembler_pid
+    assembler_pid=$( cat ${POSTING_ASSEMBLER_PID_FILE} 2> /dev/null )
+    [[ -n "${assembler_pid}" ]] && kill -0 ${assembler_pid} 2> /dev/null
+}
+
+### Called by posting_daemon() in its posting dir.  Blocks in 'read' on its FIFO until the assembler reports a complete cycle, so there is no 'find' polling
+### Returns 1 if the assembler isn't running at POSTING_ASSEMBLER_MAX_MISSED_POLLS polls in a row, so posting_daemon() can fall back to its 'find' polling
+function post_assembled_cycles()
+{
+    local posting_receiver_band=$1
+    local posting_receiver_modes=$2
+    local wsprnet_upload_dir=$3
+    local real_receiver_list=( $4 )
+    local supplier_dirs_list=( ${@:5} )
+    supplier_dirs_list=( ${supplier_dirs_list[@]/#/${PWD}/} )     ### The assembler needs their full paths
+
+    local cycles_fifo=${PWD}/${POSTING_CYCLES_FIFO}
+    if [[ ! -p ${cycles_fifo} ]]; then
+        rm -f ${cycles_fifo}
+        mkfifo ${cycles_fifo}
+    fi
+    local cycles_fd
+    exec {cycles_fd}<> ${cycles_fifo}      ### Open for read and write, so the open doesn't block and 'read' never sees EOF
+
+    wd_logger 1 "Waiting for the posting assembler to report cycles from '${supplier_dirs_list[*]}' in ${cycles_fifo}"
+    posting_assembler_notify START ${cycles_fifo} ${supplier_dirs_list[@]}
+    local missed_polls=0
+    while true; do
+        run_recording_daemons ${posting_receiver_band} ${posting_receiver_modes} ${real_receiver_list[@]}
+        local cycle_line
+        if ! read -t ${POSTING_DAEMON_POLLING_RATE} -u ${cycles_fd} cycle_line; then
+            if posting_assembler_is_running; then
+                missed_polls=0
+            elif (( ++missed_polls >= POSTING_ASSEMBLER_MAX_MISSED_POLLS )); then
+                wd_logger 1 "ERROR: the posting assembler wasn't running at the last ${missed_polls} polls, so fall back to searching for spot files with 'find'"
+                exec {cycles_fd}<&-
+                return 1
+            fi
+            posting_assembler_notify WATCH ${cycles_fifo} ${supplier_dirs_list[@]}
+            continue
+        fi
+        local cycle_fields=( ${cycle_line} )
+        local spot_file_time=${cycle_fields[0]}
+        local spot_file_time_list=()
+        local spot_file
+        for spot_file in ${cycle_fields[@]:1}; do
+            [[ -f ${spot_file} ]] && spot_file_time_list+=( ${spot_file} )    ### e.g. after a restart the assembler may report files we have already posted
+        done
+        if [[ ${#spot_file_time_list[@]} -eq 0 ]]; then
+            wd_logger 1 "The spot files of cycle ${spot_file_time} have already been posted"
+            continue
+        fi
+        wd_logger 1 "Posting ${#spot_file_time_list[@]} spot files of ${#supplier_dirs_list[@]} suppliers for WSPR cycle ${spot_file_time}: '${spot_file_time_list[*]}'"
+        post_files ${posting_receiver_band} ${wsprnet_upload_dir} ${spot_file_time} ${spot_file_time_list[@]}
+    done
+}
+
+function posting_assembler_daemon()
+{
+    local root_dir=$1
+    local assembler_args=( --port ${WD_POSTING_ASSEMBLER_PORT} --timeout-secs ${WD_POSTING_ASSEMBLER_TIMEOUT_SECS-30} --expire-secs $(( 4 * POSTING_DAEMON_POLLING_RATE + 60 )) --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_POSTING_ASSEMBLER_CMD} "${assembler_args[@]}"
+}
+
 ### The wsprnet server processes spot lines with this block of PHP code.
 ### Our ALL_WSPR.TXT spot lines contain 16 or 17 fields, so to communicate the 'mode' we need to shorten type 1 spots which include the tx grid to 11 fields
 ### and put 'sync' in field #3 and 'mode' in field #11
@@ -222,7 +313,9 @@ function post_files()
     local wsprnet_uploads_queue_directory=$2   ### This is derived from the call and grid and will differ from the real receiver when we are posting for a MERGEd (i.e.logical) receiver
     local spot_time=$3
     local spot_file_list=(${@:4})              ### The rest of the args are the *_spot.txt files in this WSPR cycle
+    local post_start_epoch=${EPOCHREALTIME}
 
+    wd_trace_span post_wait ${receiver_band} ${spot_time} +${WSPR_CYCLE_SECONDS}     ### From the end of the cycle until all of its spot files were found
     wd_logger 1 "Post spots from ${#spot_file_list[@]} files: '${spot_file_list[*]}'"
 
     cat ${spot_file_list[@]} > spots.ALL
@@ -235,6 +328,8 @@ function post_files()
     if [[ ! -s spots.ALL ]]; then
         wd_logger 1 "The spot file(s) are empty, so just flush them"
         wd_rm ${spot_file_list[@]}
+        wd_trace_span post ${receiver_band} ${spot_time} ${post_start_epoch}
+        wsprnet_upload_scheduler_notify ${wsprnet_uploads_queue_directory} ${spot_time}
         return 0
     fi
     ### There are spots to uploaded
@@ -328,6 +423,8 @@ function post_files()
         else
             wd_logger 1 "ERROR: 'format_spots_file_for_wsprnet  spots.BEST wn_format_spots.txt' => ${rc}"
         fi
+        wd_trace_span post ${receiver_band} ${spot_time} ${post_start_epoch}
+        wsprnet_upload_scheduler_notify ${wsprnet_uploads_queue_directory} ${spot_time}
     fi
 
     if [[ ${SIGNAL_LEVEL_UPLOAD-yes} == "no" ]]; then
@@ -375,7 +472,7 @@ function add_derived() {
         exit 1
     fi
     local rc
-    timeout ${DERIVED_NAX_RUN_SECS-20} nice -n ${AZI_CMD_NICE_LEVEL} python3 ${AZI_PYTHON_CMD} ${spot_grid} ${my_grid} ${spot_freq} 1>add_derived.txt 2> add_derived.log
+    timeout ${DERIVED_NAX_RUN_SECS-20} nice -n ${AZI_CMD_NICE_LEVEL} ${WD_PY_CMD} derived_calc ${spot_grid} ${my_grid} ${spot_freq} 1>add_derived.txt 2> add_derived.log
     rc=$?
     if [[ ${rc} -ne 0 ]]; then
         wd_logger 1 "ERROR: timeout or error in running "${AZI_PYTHON_CMD} ${spot_grid} ${my_grid} ${spot_freq}" => ${rc}"
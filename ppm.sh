@@ -19,6 +19,8 @@
 
 declare SDR_AUDIO_SPS=12000      ### 'wsprd' wants a 12000 sps audio file
 declare SDR_SAMPLE_TIME=2        ### how many seconds to sample
+declare SDR_CALIBRATE_CMD=${WSPRDAEMON_ROOT_DIR}/sdr_calibrate.py   ### Finds the audio tone to a fraction of a Hz, rather than in the 2.9 Hz bins of 'sox -n stat -freq'
+declare SDR_MEASURED_AUDIO_FREQ_HZ=""                               ### sdr_measure_error() returns the tone rounded to an integer Hz and leaves the fractional Hz value here
 
 function sdr_measure_error() {
     local ret_string_name=$1
@@ -36,23 +38,22 @@ function sdr_measure_error() {
         eval "${ret_string_name}='sdrTest failed'"
         return ${ret_code}
     fi
-    cat sdraudio.raw | sox -r ${SDR_AUDIO_SPS} -t raw -e s -b 16 -c 1 - -n stat -freq > sdrspectrum.txt 2>&1
-    local audio_freq=$(awk '/^[1-9]/ && $2 > 50000' sdrspectrum.txt | sort -k 2,2n | tail -1 | awk '{print $1}')
-    audio_freq=${audio_freq//.*/}    ### truncate to an integer freq
-    if [[ -z "${audio_freq}" ]]; then
-        wd_logger 3 "failed to find a peak audio band > 50000"
+    ### Prints 'PEAK_AUDIO_HZ RMS_AMPLITUDE SNR_DB' and returns 1 if the RMS amplitude or SNR is too low for the peak to be a signal
+    local peak_info_list
+    peak_info_list=( $( python3 ${SDR_CALIBRATE_CMD} peak sdraudio.raw --sps ${SDR_AUDIO_SPS} 2> sdrpeak.log ) )
+    ret_code=$?
+    if (( ret_code > 1 || ${#peak_info_list[@]} < 3 )); then
+        wd_logger 3 "failed to find a peak audio frequency: 'python3 ${SDR_CALIBRATE_CMD} peak sdraudio.raw' => ${ret_code}:\n$(< sdrpeak.log)"
         eval "${ret_string_name}='sdrTest failed to find audio peak frequency'"
         return 2
     fi
-    local audio_mean_level=$(awk '/RMS.*amplitude/{print $3}' sdrspectrum.txt)
+    SDR_MEASURED_AUDIO_FREQ_HZ=${peak_info_list[0]}
+    local audio_freq=$( printf "%.0f" ${SDR_MEASURED_AUDIO_FREQ_HZ} )    ### round to an integer freq for the callers' bash arithmetic
+    local audio_mean_level=${peak_info_list[1]}
     local audio_error=$(( audio_freq - expected_audio_freq))
-    local ppm_error=0
-    if [[ ${audio_error} -ne 0 ]]; then
-        ppm_error=$( bc <<< "scale=2; ( 1000000/ (${tuning_frequency} / ${audio_error}) )" )
-    fi
     eval "${ret_string_name}=${audio_freq}"
-    if [[ $(bc <<< "(${audio_mean_level} < 0.15)") -eq 1 ]]; then
-         wd_logger 1 "found audio_freq=${audio_freq}, audio_mean_level=${audio_mean_level}, audio_error=${audio_error}. No signal was detected, so returning error = 1"
+    if (( ret_code == 1 )); then
+         wd_logger 1 "found audio_freq=${SDR_MEASURED_AUDIO_FREQ_HZ}, audio_mean_level=${audio_mean_level}, snr=${peak_info_list[2]} dB, audio_error=${audio_error}. No signal was detected, so returning error = 1"
         return 1
     fi
      wd_logger 3 "found audio_freq=${audio_freq}, audio_mean_level=${audio_mean_level}, audio_error=${audio_error}. A signal was detected, so returning sucess = 0"
@@ -170,10 +171,7 @@ function get_tuning_error_hz() {
     fi
 
     local tuning_error_hz=$(( - ( ${measured_audio_freq} - ${test_expected_audio_freq} ) ))   ### When oscillator is low, the audio tone will be too high
-    local ppm_error=0
-    if [[ ${tuning_error_hz} -ne 0 ]]; then
-        ppm_error=$( bc <<< "scale=10;( 1000000/ (${tuning_frequency} / ${tuning_error_hz}) )" )
-    fi
+    local ppm_error=$( bc <<< "scale=10; ( 1000000 * (${test_expected_audio_freq} - ${SDR_MEASURED_AUDIO_FREQ_HZ}) / ${tuning_frequency} )" )   ### Use the fractional Hz tone
     eval "${measured_hz_ret_variable}='${measured_audio_freq}'"
     eval "${measured_ppm_ret_variable}='${ppm_error}'"
      wd_logger 2 "centered device #${soapy_device} at ${center_frequency} and tuned to ${tuning_frequency}. Expected %4d Hz audio, measured %4d Hz audio, so tuning is off by %4d Hz = %5.4f ppm\n" \
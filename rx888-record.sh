@@ -159,6 +159,116 @@ function rx888_record_daemon()
    done
 }
 
+### The one minute raw files in the CACHE_DIR are compressed by wd_rx888_archive.py into seekable archives from which any time slice can be
+### extracted without decompressing the whole minute.  Its frames are compressed in parallel by a pool of RX888_ARCHIVER_JOBS processes (0 => one per CPU).
+### It needs the python3-zstandard package installed by wd-setup.sh, since its zlib codec is too slow to keep up with a RX888.
+### If RX888_ARCHIVER="no", python3-zstandard isn't installed, or the archiver fails, each file is compressed by 'zstd -T0' into a .zst file which can't be seeked
+declare RX888_ARCHIVER=${RX888_ARCHIVER-yes}
+declare RX888_ARCHIVER_CMD=${RX888_ARCHIVER_CMD-${CMD_DIR}/wd_rx888_archive.py}
+declare RX888_ARCHIVER_JOBS=${RX888_ARCHIVER_JOBS-0}
+declare RX888_ARCHIVER_FRAME_SAMPLES=${RX888_ARCHIVER_FRAME_SAMPLES-4194304}
+declare RX_COMPRESS_POLL_SECS=${RX_COMPRESS_POLL_SECS-10}
+declare rx888_compress_child_pid=""
+
+### Runs a compression command in the background and waits for it, so that rx888_compress_daemon_stop() can kill it
+function rx888_compress_run()
+{
+    "$@" >> ${RX_COMPRESS_DAEMON_LOG_FILE} 2>&1 &
+    rx888_compress_child_pid=$!
+    wait ${rx888_compress_child_pid}
+    local rc=$?
+    rx888_compress_child_pid=""
+    return ${rc}
+}
+
+function rx888_compress_cached_files()
+{
+    local cached_files_list=( $(ls -1tr ${CACHE_DIR} | grep -v '\.part$') )
+    if (( ${#cached_files_list[@]} < 2 )); then
+        [[ ${VERBOSITY} -ge 2 ]] && echo "$(date): There are no completed raw files in ${CACHE_DIR}" >> ${RX_COMPRESS_DAEMON_LOG_FILE}
+        return 0
+    fi
+    unset 'cached_files_list[-1]'          ### The newest file is still being recorded
+    local cached_paths_list=( ${cached_files_list[@]/#/${CACHE_DIR}/} )
+
+    if [[ ${RX888_ARCHIVER} == "yes" ]] && ! python3 -c "import zstandard" 2> /dev/null; then
+        echo "$(date): ERROR: the python3-zstandard package needed by ${RX888_ARCHIVER_CMD##*/} is not installed, so compress with 'zstd -T0'.  Run wd-setup.sh to install it" >> ${RX_COMPRESS_DAEMON_LOG_FILE}
+        RX888_ARCHIVER="no"
+    fi
+    local rc
+    if [[ ${RX888_ARCHIVER} == "yes" ]]; then
+        rx888_compress_run python3 ${RX888_ARCHIVER_CMD} compress --delete --jobs ${RX888_ARCHIVER_JOBS} --frame-samples ${RX888_ARCHIVER_FRAME_SAMPLES} --output-dir ${ARCHIVE_DIR} ${cached_paths_list[@]}
+        rc=$?
+        if (( rc == 0 )); then
+            return 0
+        fi
+        echo "$(date): ERROR: '${RX888_ARCHIVER_CMD} compress ...' => ${rc}, so compress any files it didn't archive with zstd" >> ${RX_COMPRESS_DAEMON_LOG_FILE}
+    fi
+    local cached_path
+    for cached_path in ${cached_paths_list[@]}; do
+        [[ -f ${cached_path} ]] || continue
+        rx888_compress_run zstd -q -T0 --rm ${cached_path} -o ${ARCHIVE_DIR}/${cached_path##*/}.zst
+        rc=$?
+        if (( rc != 0 )); then
+            echo "$(date): ERROR: 'zstd -q -T0 --rm ${cached_path} -o ${ARCHIVE_DIR}/${cached_path##*/}.zst' => ${rc}" >> ${RX_COMPRESS_DAEMON_LOG_FILE}
+        fi
+    done
+}
+
+### 'kill' of the daemon's pid only stops this bash loop, so pass the TERM on to the archiver (which then stops its process pool) or zstd
+function rx888_compress_daemon_stop()
+{
+    if [[ -n "${rx888_compress_child_pid}" ]]; then
+        kill ${rx888_compress_child_pid} 2> /dev/null
+        wait ${rx888_compress_child_pid}
+    fi
+    exit 0
+}
+
+function rx888_compress_daemon()
+{
+    trap rx888_compress_daemon_stop TERM
+    while true; do
+        rx888_compress_cached_files
+        sleep ${RX_COMPRESS_POLL_SECS} &
+        wait $!
+    done
+}
+
+function spawn_rx_compress_daemon()
+{
+    if [[ -f ${RX_COMPRESS_DAEMON_PID_FILE} ]]; then
+        local daemon_pid=$( < ${RX_COMPRESS_DAEMON_PID_FILE})
+        if ps ${daemon_pid} > /dev/null ; then
+            echo "compress daemon is running with pid = ${daemon_pid}"
+            return 0
+        else
+            echo "compress daemon pid ${daemon_pid} in ${RX_COMPRESS_DAEMON_PID_FILE} is not active."
+            rm ${RX_COMPRESS_DAEMON_PID_FILE}
+        fi
+    fi
+    rx888_compress_daemon &
+    local daemon_pid=$!
+    echo ${daemon_pid} > ${RX_COMPRESS_DAEMON_PID_FILE}
+    echo "Spawned compress daemon which has pid ${daemon_pid}"
+}
+
+function kill_rx_compress_daemon()
+{
+    if [[ -f ${RX_COMPRESS_DAEMON_PID_FILE} ]]; then
+        local daemon_pid=$( < ${RX_COMPRESS_DAEMON_PID_FILE})
+        if ps ${daemon_pid} > /dev/null ; then
+            kill ${daemon_pid}
+            echo "Killed running compress daemon which had pid = ${daemon_pid}"
+        else
+            echo "Found compress daemon pid ${daemon_pid} in ${RX_COMPRESS_DAEMON_PID_FILE} is not active."
+        fi
+        rm ${RX_COMPRESS_DAEMON_PID_FILE}
+    else
+        echo "There is no file ${RX_COMPRESS_DAEMON_PID_FILE}, so compress daemon was not running"
+    fi
+}
+
 function spawn_rx_record_daemon()
 {
     local startup_delay=$1 
@@ -208,14 +318,20 @@ function status_of_daemon()
     else
         echo "There is no file ${RX_RECORD_DAEMON_PID_FILE}, so daemon is not running"
     fi
+    if [[ -f ${RX_COMPRESS_DAEMON_PID_FILE} ]] && ps $( < ${RX_COMPRESS_DAEMON_PID_FILE}) > /dev/null ; then
+        echo "compress daemon is running with pid = $( < ${RX_COMPRESS_DAEMON_PID_FILE})"
+    else
+        echo "compress daemon is not running"
+    fi
     check_kiwi_status
 }
 
 function usage()
 {
     echo "$0 Version ${VERSION}: 
-    -a               start daemon which records the 64.8 Msps output of the RX888 to a local HD
-    -z               kill that daemon
+    -a               start daemon which records the 64.8 Msps output of the RX888 to a local HD, and the daemon which compresses those recordings
+    -z               kill those daemons
+    -c               compress the completed raw files in ${CACHE_DIR} once
     -s               show the daemon status
     -h               print this message
     "
@@ -224,9 +340,14 @@ function usage()
 case ${1--h} in
     -a)
         spawn_rx_record_daemon ${2-0}
+        spawn_rx_compress_daemon
         ;;
     -z)
         kill_rx_record_daemon
+        kill_rx_compress_daemon
+        ;;
+    -c)
+        rx888_compress_cached_files
         ;;
     -s)
         status_of_daemon
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: sdr_calibrate.py
+# Frequency calibration of Soapy SDRs against carriers of known frequency, e.g. the ATSC pilot carriers in atsc.sh.
+# Replaces 'sox -n stat -freq | awk | sort | tail' with a NumPy peak finder which reads the raw 16 bit audio written by
+# 'sdrTest -file', finds the strongest bin of a Hann windowed, zero padded FFT and then interpolates the true frequency from
+# the parabola through the log magnitudes of that bin and its two neighbours.  So the tone frequency is resolved to a few
+# hundredths of a Hz instead of the 2.9 Hz bins of 'sox stat -freq'.
+#
+# Usage:
+#     sdr_calibrate.py peak  RAW_FILE [--sps 12000] [--tuning-freq HZ --expected-audio-freq HZ] [--min-snr-db DB]
+#         prints:  PEAK_AUDIO_HZ  RMS_AMPLITUDE  SNR_DB  [PPM_ERROR]
+#     sdr_calibrate.py sweep --device N --audio-freq HZ CH:CARRIER_HZ ...
+#         runs sdrTest for each carrier and prints:  CH  CARRIER_HZ  TUNING_HZ  MEASURED_AUDIO_HZ  ERROR_HZ  PPM_ERROR
+#         while sdrTest captures one carrier, the capture of the previous carrier is analyzed.  Each sdrTest exits before the next is started
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+SDR_AUDIO_SPS = 12000
+ZERO_PAD_FACTOR = 4
+MIN_RMS_AMPLITUDE = 0.15         # Below this 'sdr_measure_error()' reports that no signal was detected
+
+
+def read_raw_audio(path):
+    # 'sdrTest -file' writes native 16 bit signed mono samples, i.e. 'sox -t raw -e s -b 16 -c 1'
+    return np.fromfile(path, dtype='<i2').astype(np.float64) / 32768.0
+
+
+def find_peak(samples, sps=SDR_AUDIO_SPS, min_freq=50.0, max_freq=None):
+    # Returns (peak frequency in Hz, RMS amplitude, SNR in dB of the peak bin over the median bin)
+    if len(samples) < 16:
+        raise ValueError('only %d samples, too few to find a peak' % len(samples))
+    rms = float(np.sqrt(np.mean(samples * samples)))
+    n_fft = ZERO_PAD_FACTOR * (1 << int(np.ceil(np.log2(len(samples)))))
+    power = np.abs(np.fft.rfft((samples - samples.mean()) * np.hanning(len(samples)), n_fft)) ** 2
+    bin_hz = sps / n_fft
+    low_bin = max(1, int(np.ceil(min_freq / bin_hz)))
+    high_bin = min(len(power) - 2, int((max_freq if max_freq else sps / 2) / bin_hz))
+    if high_bin <= low_bin:
+        raise ValueError('no FFT bins between %.1f and %.1f Hz' % (min_freq, max_freq or sps / 2))
+    peak_bin = low_bin + int(np.argmax(power[low_bin:high_bin + 1]))
+
+    # For a Hann window the log magnitude of the main lobe is very close to a parabola
+    alpha, beta, gamma = np.log(power[peak_bin - 1:peak_bin + 2] + 1e-300)
+    denominator = alpha - 2 * beta + gamma
+    offset = 0.5 * (alpha - gamma) / denominator if denominator < 0 else 0.0
+    snr_db = 10 * np.log10(power[peak_bin] / (np.median(power[low_bin:high_bin + 1]) + 1e-300))
+    return (peak_bin + offset) * bin_hz, rms, float(snr_db)
+
+
+def ppm_error(tuning_freq, expected_audio_freq, measured_audio_freq):
+    # Same sign as ppm.sh:  when the SDR's oscillator is low, the audio tone is too high and the ppm error is negative
+    return 1e6 * (expected_audio_freq - measured_audio_freq) / tuning_freq
+
+
+def snr_too_low(args, snr_db):
+    # Like 'sox stat -freq | awk', only the RMS amplitude decides if there is a signal unless --min-snr-db is given
+    return args.min_snr_db is not None and snr_db < args.min_snr_db
+
+
+def cmd_peak(args):
+    try:
+        peak_freq, rms, snr_db = find_peak(read_raw_audio(args.raw_file), args.sps, args.min_freq, args.max_freq)
+    except (OSError, ValueError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 2
+    line = '%.3f %.6f %.1f' % (peak_freq, rms, snr_db)
+    if args.tuning_freq and args.expected_audio_freq is not None:
+        line += ' %.4f' % ppm_error(args.tuning_freq, args.expected_audio_freq, peak_freq)
+    print(line)
+    return 0 if rms >= MIN_RMS_AMPLITUDE and not snr_too_low(args, snr_db) else 1
+
+
+def start_capture(args, tuning_freq, center_freq, raw_path):
+    cmd = ['sdrTest', '-f', str(tuning_freq), '-fc', str(center_freq), '-usb', '-device', str(args.device),
+           '-faudio', str(args.sps), '-timeout', str(args.seconds), '-file', raw_path]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def sweep_result(args, capture):
+    channel, carrier_freq, tuning_freq, raw_path, returncode, stderr = capture
+    if returncode:
+        return '%-4s %10d ERROR: sdrTest => %d: %s' % (channel, carrier_freq, returncode, stderr.decode(errors='replace').strip()[-200:])
+    try:
+        peak_freq, rms, snr_db = find_peak(read_raw_audio(raw_path), args.sps, args.min_freq, args.max_freq)
+    except (OSError, ValueError) as err:
+        return '%-4s %10d ERROR: %s' % (channel, carrier_freq, err)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    if rms < MIN_RMS_AMPLITUDE or snr_too_low(args, snr_db):
+        return '%-4s %10d %10d ERROR: no signal detected, rms=%.3f snr=%.1f dB' % (channel, carrier_freq, tuning_freq, rms, snr_db)
+    return '%-4s %10d %10d %10.3f %8.3f %9.4f' % (channel, carrier_freq, tuning_freq, peak_freq, args.audio_freq - peak_freq,
+                                                  ppm_error(tuning_freq, args.audio_freq, peak_freq))
+
+
+def cmd_sweep(args):
+    carriers = []
+    for carrier in args.carriers:
+        channel, _, freq = carrier.rpartition(':')
+        carriers.append((channel or freq, int(freq)))
+    tmp_dir = tempfile.mkdtemp(prefix='sdr_calibrate.')
+    print('%-4s %10s %10s %10s %8s %9s' % ('CH', 'CARRIER', 'TUNING', 'AUDIO_HZ', 'ERROR_HZ', 'PPM'))
+    pending = None
+    rc = 0
+    for channel, carrier_freq in carriers:
+        tuning_freq = carrier_freq - args.audio_freq
+        center_freq = carrier_freq - carrier_freq % args.center_step
+        raw_path = os.path.join(tmp_dir, '%s.raw' % channel)
+        proc = start_capture(args, tuning_freq, center_freq, raw_path)
+        if pending:
+            result = sweep_result(args, pending)
+            rc |= 'ERROR' in result
+            print(result, flush=True)
+        # Only one sdrTest may have the SDR open, so this capture must finish before the next one is started
+        _, stderr = proc.communicate()
+        pending = (channel, carrier_freq, tuning_freq, raw_path, proc.returncode, stderr)
+    if pending:
+        result = sweep_result(args, pending)
+        rc |= 'ERROR' in result
+        print(result, flush=True)
+    os.rmdir(tmp_dir)
+    return int(rc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure SDR frequency errors from the audio tones of carriers of known frequency')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    peak_parser = subparsers.add_parser('peak', help='Find the frequency of the strongest tone in a raw 16 bit audio file')
+    sweep_parser = subparsers.add_parser('sweep', help='Capture and measure a list of carriers with sdrTest')
+    for sub_parser in (peak_parser, sweep_parser):
+        sub_parser.add_argument('--sps', type=int, default=SDR_AUDIO_SPS)
+        sub_parser.add_argument('--min-freq', type=float, default=50.0, help='Ignore tones below this audio frequency')
+        sub_parser.add_argument('--max-freq', type=float, default=None, help='Ignore tones above this audio frequency')
+        sub_parser.add_argument('--min-snr-db', type=float, default=None, help='Also report no signal if the peak is less than this many dB over the median bin')
+    peak_parser.add_argument('raw_file')
+    peak_parser.add_argument('--tuning-freq', type=float, default=0, help='Also print the ppm error given the SDR was tuned to this frequency...')
+    peak_parser.add_argument('--expected-audio-freq', type=float, default=None, help='... and the tone should have been at this audio frequency')
+    sweep_parser.add_argument('--device', default='0', help='Soapy device number')
+    sweep_parser.add_argument('--audio-freq', type=int, required=True, help='Tune this many Hz below each carrier, so expect a tone at this audio frequency')
+    sweep_parser.add_argument('--center-step', type=int, default=100000, help='Center the SDR at the multiple of this many Hz below the carrier')
+    sweep_parser.add_argument('--seconds', type=int, default=2, help='Capture this many seconds of audio for each carrier')
+    sweep_parser.add_argument('carriers', nargs='+', metavar='CH:CARRIER_HZ')
+    args = parser.parse_args(argv)
+    if args.command == 'peak':
+        return cmd_peak(args)
+    return cmd_sweep(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
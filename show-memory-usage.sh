@@ -1,3 +1,10 @@
+### If wd_accounting_daemon() is running (WD_ACCOUNTING="yes"), show its per daemon and per helper RSS rather than scanning the pid files
+for ring_file in /dev/shm/wsprdaemon/wd_accounting.ring /tmp/wsprdaemon/wd_accounting.ring /tmp/wspr-captures/wd_accounting.ring; do
+    if [[ -f ${ring_file} && -n "$(find ${ring_file} -mmin -1)" ]]; then
+        exec python3 $(dirname ${BASH_SOURCE[0]})/wd_accounting.py top --ring-file ${ring_file} --minutes 1 --sort rss --watch 10
+    fi
+done
+
 declare pid_file_list=()
 declare pid_last_values_file="show-memory-usage.last"
 declare pid_new_values_file="show-memory-usage.new"
@@ -198,6 +198,42 @@ function get_wsprnet_uploading_job_dir_path(){
     echo ${receiver_posting_path}
 }
 
+### When WSPRNET_UPLOAD_SCHEDULER="yes", the upload_to_wsprnet_daemon() is replaced by a Python daemon which is told by the posting daemons when each band
+### has finished a cycle.  It then uploads each CALL/GRID as soon as all its bands have reported, instead of polling with 'find' and 'ps aux | grep wsprd'
+declare WSPRNET_UPLOAD_SCHEDULER=${WSPRNET_UPLOAD_SCHEDULER-no}
+declare WSPRNET_UPLOAD_SCHEDULER_CMD=${WSPRDAEMON_ROOT_DIR}/wsprnet_upload_scheduler.py
+declare WSPRNET_UPLOAD_SCHEDULER_PORT=${WSPRNET_UPLOAD_SCHEDULER_PORT-58026}              ### UDP port on 127.0.0.1 where 'decode complete' events are sent
+declare WSPRNET_UPLOAD_SCHEDULER_DEADLINE_SECS=${WSPRNET_UPLOAD_SCHEDULER_DEADLINE_SECS-45} ### Upload a cycle this long after the first band reports it, even if other bands haven't
+
+### Called by post_files() once the spots of a RECEIVER/BAND have been queued (or found to be empty) for a cycle
+### Bash writes the datagram itself through /dev/udp, so this costs no fork and never blocks even if the scheduler isn't running
+function wsprnet_upload_scheduler_notify()
+{
+    local wsprnet_uploads_queue_directory=$1
+    local spot_time=$2
+
+    [[ ${WSPRNET_UPLOAD_SCHEDULER} != "yes" ]] && return 0
+    if ! printf "DONE %s %s\n" "${wsprnet_uploads_queue_directory}" "${spot_time}" 2> /dev/null > /dev/udp/127.0.0.1/${WSPRNET_UPLOAD_SCHEDULER_PORT} ; then
+        wd_logger 1 "ERROR: failed to send 'DONE ${wsprnet_uploads_queue_directory} ${spot_time}' to the wsprnet upload scheduler on UDP port ${WSPRNET_UPLOAD_SCHEDULER_PORT}"
+        return 1
+    fi
+    wd_logger 2 "Sent 'DONE ${wsprnet_uploads_queue_directory} ${spot_time}' to the wsprnet upload scheduler"
+    return 0
+}
+
+function wsprnet_upload_scheduler_daemon()
+{
+    local scheduler_args=( --spots-dir ${UPLOADS_WSPRNET_SPOTS_DIR} --port ${WSPRNET_UPLOAD_SCHEDULER_PORT} --version WD_${VERSION}
+                           --deadline-secs ${WSPRNET_UPLOAD_SCHEDULER_DEADLINE_SECS} --timeout ${UPLOADS_WSPNET_CURL_TIMEOUT-300} --max-spots ${MAX_UPLOAD_SPOTS_COUNT}
+                           --wspr-log-file ${WSPR_LOG_FILE} --tmp-dir ${UPLOADS_TMP_WSPRNET_ROOT_DIR} --log-file "${WD_LOGFILE-}" )
+    [[ "${UPLOAD_TO_WSPRNET_DROP_MY_CALL-yes}" == "yes" ]] && scheduler_args+=( --drop-my-call )
+    [[ -n "${UPLOAD_TO_WSPRNET_DROP_REGX+set}" ]]         && scheduler_args+=( --drop-regex "${UPLOAD_TO_WSPRNET_DROP_REGX}" )
+    [[ -n "${WSPR_LOGGING_CMD-}" ]]                       && scheduler_args+=( --logging-cmd ${WSPR_LOGGING_CMD} )
+    [[ -n "${UPLOAD_SPOT_LOG_VERBOSITY-}" ]]              && scheduler_args+=( --upload-spot-log-verbosity ${UPLOAD_SPOT_LOG_VERBOSITY} )
+    [[ ${WD_TRACE-no} == "yes" ]]                         && scheduler_args+=( --trace-file ${WD_TRACE_FILE} )
+    wd_exec_python_daemon ${PWD} ${WSPRNET_UPLOAD_SCHEDULER_CMD} "${scheduler_args[@]}"
+}
+
 declare MAX_SPOTFILE_SECONDS=${MAX_SPOTFILE_SECONDS-40} ### By default wait for the oldest spot file to be 40 seconds old before starting an upload of it and all newer spotfiles
 declare UPLOAD_SLEEP_SECONDS=${UPLOAD_SLEEP_SECONDS-10}
 declare -r WSPR_CYCLE_SECONDS=120
@@ -210,6 +246,17 @@ function upload_to_wsprnet_daemon() {
 
     wd_logger 1 "Starting in $PWD"
 
+    if [[ ${WSPRNET_UPLOAD_SCHEDULER} == "yes" && ${SIGNAL_LEVEL_UPLOAD-no} != "proxy" ]]; then
+        if [[ ! -f ${WSPR_LOG_FILE} ]]; then
+            sudo touch ${WSPR_LOG_FILE}
+            sudo chown $(id -un):$(id -gn) ${WSPR_LOG_FILE}
+        fi
+        if [[ ! -f ${WSPR_LOGROTATE_FILE} ]]; then
+            sudo cp ${WSPRDAEMON_ROOT_DIR}/wspr.rotate ${WSPR_LOGROTATE_FILE}
+        fi
+        wsprnet_upload_scheduler_daemon
+    fi
+
     while true; do
         local spots_files_list=()
 
@@ -243,7 +290,7 @@ function upload_to_wsprnet_daemon() {
               && ps_stdout="$( ps aux )" \
               && [[ ${#spots_files_list[@]} -eq 0 ]] \
               || [[ ${#spots_files_list[@]} -ne ${old_spot_file_count} ]] \
-              || echo "${ps_stdout}" | grep -q "wsprdaemon/bin/wsprd \|wsprd.spread_nodrift.x86 \|wsprdaemon/bin/jt9 \|derived_calc.py" ; do
+              || echo "${ps_stdout}" | grep -q "wsprdaemon/bin/wsprd \|wsprd.spread_nodrift.x86 \|wsprdaemon/bin/jt9 \|derived_calc.py\|wd_py.py run derived_calc " ; do     ### 'wd_py.py run derived_calc' when it is run by the wd-py pool
             ### There are no spot files, new spots are being added, or 'wsprd' and/or 'jt9' is running
             if [[ ${#spots_files_list[@]} -eq 0 ]]; then
                 wd_logger 1 "Not ready to start uploads because there are no spot files"
@@ -254,7 +301,7 @@ function upload_to_wsprnet_daemon() {
                  wd_logger 1 "Not ready to start uploads because there are now ${#spots_files_list[@]} spot files, more than the ${old_spot_file_count} spot files we previously found"
             else
                 local running_jobs
-                running_jobs="$(echo "${ps_stdout}" | grep 'wsprd \|wsprd.spread_nodrift.x86 \|jt9\|derived_calc.py' )"
+                running_jobs="$(echo "${ps_stdout}" | grep 'wsprd \|wsprd.spread_nodrift.x86 \|jt9\|derived_calc.py\|wd_py.py run derived_calc ' )"
                 wd_logger 1 "Not ready to start uploads because there are running 'wsprd', 'wsprd.spread_nodrift', 'jt9' and/or 'derived_calc.py' jobs"
                 wd_logger 2 "${running_jobs}"
             fi
@@ -440,6 +487,9 @@ declare UPLOADS_WSPRNET_LINE_FORMAT_VERSION=1                             ### I
 declare UPLOADS_WSPRDAEMON_SPOT_LINE_FORMAT_VERSION=2
 declare UPLOADS_WSPRDAEMON_NOISE_LINE_FORMAT_VERSION=1
 declare UPLOADS_WSPRDAEMON_PAUSE_SECS=${UPLOADS_WSPRDAEMON_PAUSE_SECS-30} ### How long to wait after the first spot and/or noise file appears before starting to create a tar file
+declare UPLOADS_WSPRDAEMON_PACK_FILES=${UPLOADS_WSPRDAEMON_PACK_FILES-no}  ### Experimental: if "yes", upload the noise records in one columnar noise.wdpack file rather than one .txt file per band.  No server script ingests it yet
+declare UPLOADS_WSPRDAEMON_PACK_FORMAT_VERSION=2
+declare WD_SPOTS_CMD=${WSPRDAEMON_ROOT_DIR}/wd_spots.py
 
 ### Helper function to attempt SFTP upload with automatic host key recovery
 ### Returns 0 on success, non-zero on failure
@@ -551,6 +601,9 @@ function upload_to_wsprdaemon_daemon() {
                  UPLOADS_WSPRDAEMON_NOISE_LINE_FORMAT_VERSION=${UPLOADS_WSPRDAEMON_NOISE_LINE_FORMAT_VERSION}
                  SIGNAL_LEVEL_UPLOAD=${SIGNAL_LEVEL_UPLOAD-no} 
                  $(cat ${RUNNING_JOBS_FILE})" | sed 's/^ *//'                         > ${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH}         ### sed strips off the leading spaces in each line of the file
+        if [[ ${WD_ACCOUNTING-no} == "yes" && -f ${WD_ACCOUNTING_RING_FILE} ]]; then
+            python3 ${WD_ACCOUNTING_CMD} summary --ring-file ${WD_ACCOUNTING_RING_FILE} >> ${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH} 2> /dev/null   ### ACCOUNTING_*= lines with the CPU and RSS of the last hour
+        fi
         local config_relative_path=${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH#$PWD/}
         wd_logger 2 "created ${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH}:\n$(cat ${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH})"
 
@@ -563,6 +616,29 @@ function upload_to_wsprdaemon_daemon() {
         ### So to preserve backwards compatibility we will mimic that behavior by executing tar from ..uploads and prepending 'wsprdaemon' to all the filenames we are tarring
         local tar_source_file_list=( wsprdaemon/${config_relative_path} ${source_file_list[@]/./wsprdaemon} )
 
+        ### With one noise line per file, a noise.wdpack of 28 files (one cycle of 2 receivers x 14 bands) is 59% of the bytes of their text and its .tbz is the same size,
+        ### while a noise.wdpack of 252 files (9 cycles) is 35% of the text and its .tbz is 88% of the size.  wd_noise_ingest.py reads it without splitting every line again
+        ### Only the noise files are packed, since the server's spot processing doesn't read a spots.wdpack, so the spot files are still uploaded as .txt files
+        local -a pack_file_list=()
+        if [[ ${UPLOADS_WSPRDAEMON_PACK_FILES} == "yes" ]]; then
+            local -a noise_pack_file_list=( $( printf "%s\n" ${source_file_list[@]} | grep "_noise.txt\$" ) )
+            if [[ ${#noise_pack_file_list[@]} -gt 0 ]]; then
+                local pack_output
+                pack_output=$( python3 ${WD_SPOTS_CMD} pack --kind noise --root . --output noise.wdpack ${noise_pack_file_list[@]} 2>&1 )
+                local rc=$?
+                if [[ ${rc} -ne 0 ]]; then
+                    wd_logger 1 "ERROR: 'python3 ${WD_SPOTS_CMD} pack --kind noise ...' => ${rc}:\n${pack_output}\nSo upload the .txt files"
+                    rm -f noise.wdpack
+                else
+                    wd_logger 1 "${pack_output}"
+                    pack_file_list=( noise.wdpack )
+                    local -a unpacked_file_list=( $( printf "%s\n" ${source_file_list[@]} | grep -v "_noise.txt\$" ) )
+                    echo "UPLOADS_WSPRDAEMON_PACK_FORMAT_VERSION=${UPLOADS_WSPRDAEMON_PACK_FORMAT_VERSION}" >> ${UPLOADS_WSPRDAEMON_FTP_CONFIG_PATH}
+                    tar_source_file_list=( wsprdaemon/${config_relative_path} ${unpacked_file_list[@]/./wsprdaemon} ${pack_file_list[@]/#/wsprdaemon/} )
+                fi
+            fi
+        fi
+
         local site_name="${SIGNAL_LEVEL_UPLOAD_ID-}"
         if [[ -n "${site_name}" ]]; then
             wd_logger 1 "Use SIGNAL_LEVEL_UPLOAD_ID='${SIGNAL_LEVEL_UPLOAD_ID}' from wsprdaemon.conf as the site name to use in creating the WD .tgz file for upload"
@@ -580,6 +656,9 @@ function upload_to_wsprdaemon_daemon() {
         wd_logger 1 "Creating tar file '${tar_file_path}' with:  '( cd ${UPLOADS_ROOT_DIR}; tar cfj ${tar_file_path} \${tar_source_file_list[*]})"
         ( cd ${UPLOADS_ROOT_DIR}; tar cfj ${tar_file_path} ${tar_source_file_list[*]} )
         local ret_code=$?
+        if [[ ${#pack_file_list[@]} -gt 0 ]]; then
+            rm -f ${pack_file_list[@]}
+        fi
         if [[ ${ret_code} -ne 0 ]]; then
             wd_logger 1 "ERROR: 'tar cfj ${tar_file_path} \${source_file_list[@]}' => ret_code ${ret_code}"
         else
@@ -29,6 +29,9 @@ function watchdog_daemon()
             if [[ ${SIGNAL_LEVEL_LOCAL_GRAPHS-no} == "yes" ]] || [[ ${SIGNAL_LEVEL_UPLOAD_GRAPHS-no} == "yes" ]]; then
                 plot_noise 24
             fi
+            if [[ ${WD_NOISE_STATS-no} == "yes" ]]; then
+                update_noise_stats
+            fi
             check_kiwi_rx_channels
             check_kiwi_gps
             print_new_ov_lines 
@@ -66,6 +69,36 @@ else
     watchdog_daemon_list+=("grape_upload_daemon     ${GRAPE_WAV_ARCHIVE_ROOT_PATH}")
 fi
 
+if [[ ${WD_ARCHIVE_MANAGER-no} == "yes" ]]; then
+    wd_logger 2 "Adding wav_archive_manager_daemon() to the watchdog_daemon_list[] since WD_ARCHIVE_MANAGER=yes in WD.conf"
+    watchdog_daemon_list+=("wav_archive_manager_daemon ${GRAPE_WAV_ARCHIVE_ROOT_PATH}")
+fi
+
+if [[ ${WD_POSTING_ASSEMBLER-no} == "yes" ]]; then
+    wd_logger 2 "Adding posting_assembler_daemon() to the watchdog_daemon_list[] since WD_POSTING_ASSEMBLER=yes in WD.conf"
+    watchdog_daemon_list+=("posting_assembler_daemon ${WSPRDAEMON_TMP_DIR}")
+fi
+
+if [[ ${WD_WAV_READY-no} == "yes" ]]; then
+    wd_logger 2 "Adding wav_ready_daemon() to the watchdog_daemon_list[] since WD_WAV_READY=yes in WD.conf"
+    watchdog_daemon_list+=("wav_ready_daemon ${WSPRDAEMON_TMP_DIR}")
+fi
+
+if [[ ${WD_LOG_COLLECTOR-no} == "yes" ]]; then
+    wd_logger 2 "Adding wd_log_collector_daemon() to the watchdog_daemon_list[] since WD_LOG_COLLECTOR=yes in WD.conf"
+    watchdog_daemon_list+=("wd_log_collector_daemon ${WSPRDAEMON_TMP_DIR}")
+fi
+
+if [[ ${WD_ACCOUNTING-no} == "yes" ]]; then
+    wd_logger 2 "Adding wd_accounting_daemon() to the watchdog_daemon_list[] since WD_ACCOUNTING=yes in WD.conf"
+    watchdog_daemon_list+=("wd_accounting_daemon ${WSPRDAEMON_TMP_DIR}")
+fi
+
+if [[ ${WD_PY_POOL-no} == "yes" ]]; then
+    wd_logger 2 "Adding wd_py_pool_daemon() to the watchdog_daemon_list[] since WD_PY_POOL=yes in WD.conf"
+    watchdog_daemon_list+=("wd_py_pool_daemon ${WSPRDAEMON_TMP_DIR}")
+fi
+
 ### 
 ### Returns 0 if no KA9Q  receive channels are configured in WD.conf, returns 1 if there is one or more KA9Q rx channel.
 ### 
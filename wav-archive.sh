@@ -5,6 +5,55 @@
 declare MIN_ARCHIVE_FILE_SYSTEM_FREE_PERCENT=${MIN_ARCHIVE_FILE_SYSTEM_FREE_PERCENT-25}
 declare MAX_ARCHIVE_FILE_SYSTEM_USED_PERCENT=$(( 100 - MIN_ARCHIVE_FILE_SYSTEM_FREE_PERCENT ))
 
+### When WD_ARCHIVE_MANAGER="yes", the watchdog spawns wav_archive_manager_daemon() which keeps an index of the size and PSWS delivery status of each
+### <DATE>/<CALL_GRID> tree in the archive and purges trees in the background.  Then archive_wav_file() doesn't take the global 'archive-wav-file' mutex
+### or run 'df' for each file.  It only checks for the flag file the manager creates while the archive is too full, and tells the manager about each new file
+declare WD_ARCHIVE_MANAGER=${WD_ARCHIVE_MANAGER-no}
+declare WD_ARCHIVE_MANAGER_CMD=${WSPRDAEMON_ROOT_DIR}/wd_archive_manager.py
+declare WD_ARCHIVE_MANAGER_PORT=${WD_ARCHIVE_MANAGER_PORT-58032}                ### UDP port on 127.0.0.1 where 'ADD' and 'DELIVERED' events are sent
+declare WD_ARCHIVE_MANAGER_FULL_WAIT_SECS=${WD_ARCHIVE_MANAGER_FULL_WAIT_SECS-30}  ### Wait at most this long for the manager to purge a too full archive
+declare WD_ARCHIVE_MANAGER_FULL_FILE_NAME=".wd_archive_full"
+
+function wav_archive_manager_notify()
+{
+    local event=$1
+    local path=$2
+
+    [[ ${WD_ARCHIVE_MANAGER} != "yes" ]] && return 0
+    if ! printf "%s %s\n" "${event}" "${path}" 2> /dev/null > /dev/udp/127.0.0.1/${WD_ARCHIVE_MANAGER_PORT} ; then
+        wd_logger 1 "ERROR: failed to send '${event} ${path}' to the archive manager on UDP port ${WD_ARCHIVE_MANAGER_PORT}"
+        return 1
+    fi
+    wd_logger 2 "Sent '${event} ${path}' to the archive manager"
+    return 0
+}
+
+function wav_archive_manager_daemon()
+{
+    local root_dir=$1
+    local manager_args=( daemon --root ${root_dir} --port ${WD_ARCHIVE_MANAGER_PORT} --fill-percent ${MAX_ARCHIVE_FILE_SYSTEM_USED_PERCENT}
+                         --preserve-dates "${GRAPE_ARCHIVE_PRESERVE_DATES_LIST[*]-}" --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_ARCHIVE_MANAGER_CMD} "${manager_args[@]}"
+}
+
+### Returns when the archive manager has purged the archive below its fill threshold, or after WD_ARCHIVE_MANAGER_FULL_WAIT_SECS in which case archive anyway
+function wav_archive_manager_wait_for_space()
+{
+    local full_file_path=${GRAPE_WAV_ARCHIVE_ROOT_PATH}/${WD_ARCHIVE_MANAGER_FULL_FILE_NAME}
+    local waited_secs=0
+
+    while [[ -f ${full_file_path} ]] && (( waited_secs < WD_ARCHIVE_MANAGER_FULL_WAIT_SECS )); do
+        (( ! waited_secs )) && wd_logger 1 "The archive manager reports the archive file system is too full, so wait for it to purge the oldest trees"
+        sleep 1
+        (( ++waited_secs ))
+    done
+    if [[ -f ${full_file_path} ]]; then
+        wd_logger 1 "ERROR: the archive file system is still too full after waiting ${waited_secs} seconds, but archive anyway"
+        return 1
+    fi
+    return 0
+}
+
 function is_integer() {
     [[ "$1" =~ ^-?[0-9]+$ ]]
 }
@@ -66,40 +115,44 @@ function purge_oldest_archive() {
     fi
 }
 
-function archive_wav_file()
+### Returns when there is space in the archive for another .wv file
+function wav_archive_wait_for_space()
 {
-    local source_wav_file_path=$1
-    local receiver_name=$2
-    local receiver_band=$3
     local rc
 
-    wd_logger 2 "Archive IQ file '${source_wav_file_path}' from receiver ${receiver_name} on band ${receiver_band}"
-
-    if [[ ! -f ${source_wav_file_path} ]]; then
-        wd_logger 1 "ERROR: can't find source_wav_file_path=${source_wav_file_path}"
-        return 1
-    fi
-
-    wd_mutex_lock "archive-wav-file" ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
-    rc=$? ; if (( rc )) ; then
-        wd_logger 1 "ERROR: 'wd_mutex_lock 'archive-wav-file' ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}' which is a timeout after waiting to get mutex within its default ${MUTEX_DEFAULT_TIMEOUT} seconds, but try to archive anyway"
-    fi
-    while ! archive_file_system_has_free_space ${GRAPE_WAV_ARCHIVE_ROOT_PATH} ; do
-        rc=$?
-        wd_logger 1 "Archive file system is too full, so purge the .wv files from the oldest date"
-        purge_oldest_archive ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
-        rc=$? ; if (( rc )); then
-            wd_logger 1 "ERROR: can't free space with 'purge_oldest_archive ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}"
-            sleep 1
-        else
-            wd_logger 1 "Freed space on ${GRAPE_WAV_ARCHIVE_ROOT_PATH}, so check again"
+    if [[ ${WD_ARCHIVE_MANAGER} == "yes" ]]; then
+        wav_archive_manager_wait_for_space
+    else
+        wd_mutex_lock "archive-wav-file" ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
+        rc=$? ; if (( rc )) ; then
+            wd_logger 1 "ERROR: 'wd_mutex_lock 'archive-wav-file' ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}' which is a timeout after waiting to get mutex within its default ${MUTEX_DEFAULT_TIMEOUT} seconds, but try to archive anyway"
+        fi
+        while ! archive_file_system_has_free_space ${GRAPE_WAV_ARCHIVE_ROOT_PATH} ; do
+            rc=$?
+            wd_logger 1 "Archive file system is too full, so purge the .wv files from the oldest date"
+            purge_oldest_archive ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
+            rc=$? ; if (( rc )); then
+                wd_logger 1 "ERROR: can't free space with 'purge_oldest_archive ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}"
+                sleep 1
+            else
+                wd_logger 1 "Freed space on ${GRAPE_WAV_ARCHIVE_ROOT_PATH}, so check again"
+            fi
+        done
+        wd_mutex_unlock "archive-wav-file" ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
+        rc=$? ; if (( rc )) ; then
+            wd_logger 1 "ERROR: 'wd_mutex_unlock 'archive-wav-file' ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}', but try to archive anyway"
         fi
-    done
-    wd_mutex_unlock "archive-wav-file" ${GRAPE_WAV_ARCHIVE_ROOT_PATH}
-    rc=$? ; if (( rc )) ; then
-        wd_logger 1 "ERROR: 'wd_mutex_unlock 'archive-wav-file' ${GRAPE_WAV_ARCHIVE_ROOT_PATH}' => ${rc}', but try to archive anyway"
     fi
     wd_logger 1 "There is enough free space to add this .wv file"
+}
+
+### Returns the path of the .wv file in the archive for a wav file, and creates its directory
+function get_wav_archive_file_path()
+{
+    local return_archive_file_path_variable_name=$1
+    local source_wav_file_path=$2
+    local receiver_name=$3
+    local receiver_band=$4
 
     local source_file_date=${source_wav_file_path##*/}   ### The wav file name starts with YYYYMMDD
     source_file_date=${source_file_date:0:8}
@@ -125,10 +178,33 @@ function archive_wav_file()
  
     local source_wav_file_name="${source_wav_file_path##*/}"
     local archive_file_name="${source_wav_file_name/.wav/.wv}"
-    local archive_file_path="${archive_dir}/${archive_file_name}"
-    wd_logger 1 "Archiving ${source_wav_file_path} to ${archive_file_path}"
-
     mkdir -p ${archive_dir}
+    eval ${return_archive_file_path_variable_name}=\${archive_dir}/\${archive_file_name}
+    return 0
+}
+
+function archive_wav_file()
+{
+    local source_wav_file_path=$1
+    local receiver_name=$2
+    local receiver_band=$3
+    local rc
+
+    wd_logger 2 "Archive IQ file '${source_wav_file_path}' from receiver ${receiver_name} on band ${receiver_band}"
+
+    if [[ ! -f ${source_wav_file_path} ]]; then
+        wd_logger 1 "ERROR: can't find source_wav_file_path=${source_wav_file_path}"
+        return 1
+    fi
+
+    wav_archive_wait_for_space
+
+    local archive_file_path
+    get_wav_archive_file_path archive_file_path ${source_wav_file_path} ${receiver_name} ${receiver_band}
+    rc=$? ; if (( rc )); then
+        return ${rc}
+    fi
+    wd_logger 1 "Archiving ${source_wav_file_path} to ${archive_file_path}"
 
     wavpack -hh ${source_wav_file_path} -o ${archive_file_path}  >& wavpack.log    ##w avpacket's -m (move compressed file) doesn't work as I expect
     rc=$? 
@@ -138,5 +214,53 @@ function archive_wav_file()
         return 1
     fi
     wd_logger 1 "Compressed ${source_wav_file_path} into ${archive_file_path}"
+    wav_archive_manager_notify ADD ${archive_file_path}
     return 0
 }
+
+### When WD_IQ_INGEST="yes", the decoding_daemon() of an I1/J1/K1 receive channel calls this rather than 'sox -n stat', 'sox -n stats' and archive_wav_file()
+### wd_iq_ingest.py reads the IQ file once to check its sample count, get its levels and pipe it to wavpack
+declare WD_IQ_INGEST_LOG_FILE="./wd_iq_ingest.log"
+
+function ingest_iq_file()
+{
+    local iq_file_path=$1
+    local receiver_name=$2
+    local receiver_band=$3
+    local expected_samples=$4
+    local rc
+
+    if [[ ! -f ${iq_file_path} ]]; then
+        wd_logger 1 "ERROR: can't find iq_file_path=${iq_file_path}"
+        return 1
+    fi
+
+    wav_archive_wait_for_space
+
+    local archive_file_path
+    get_wav_archive_file_path archive_file_path ${iq_file_path} ${receiver_name} ${receiver_band}
+    rc=$? ; if (( rc )); then
+        wd_rm ${iq_file_path}
+        return ${rc}
+    fi
+
+    ${WD_PY_CMD} wd_iq_ingest --expected-samples ${expected_samples} --archive-file ${archive_file_path} ${iq_file_path} > ${WD_IQ_INGEST_LOG_FILE} 2>&1
+    rc=$?
+    wd_rm ${iq_file_path}        ### Remove the source wav whether or not a compressed version was created
+    local iq_file_stats_list=( $(head -n 1 ${WD_IQ_INGEST_LOG_FILE}) )
+    case ${rc} in
+        0)
+            wd_logger 1 "IQ file INFO: '${iq_file_path}' contains ${iq_file_stats_list[0]} samples. dbFS peak value = ${iq_file_stats_list[1]}, RMS_dBFS = ${iq_file_stats_list[3]}, RMS Trough dB = ${iq_file_stats_list[4]}"
+            wd_logger 1 "Compressed ${iq_file_path} into ${archive_file_path}"
+            wav_archive_manager_notify ADD ${archive_file_path}
+            ;;
+        2)
+            wd_logger 1 "ERROR: IQ file '${iq_file_path}' has ${iq_file_stats_list[0]-?} samples, not the expected ${expected_samples} samples, so flushed it"
+            ;;
+        *)
+            wd_logger 1 "ERROR: 'wd_iq_ingest --expected-samples ${expected_samples} --archive-file ${archive_file_path} ${iq_file_path}' => ${rc}:\n$(< ${WD_IQ_INGEST_LOG_FILE})"
+            rm -f ${archive_file_path}
+            ;;
+    esac
+    return ${rc}
+}
@@ -9,6 +9,7 @@ set -u
 declare N1_LOG_FILENAME="n3age-1-wspr.log"
 declare N2_LOG_FILENAME="/var/log/wspr.log"
 declare SCRPAER_PID_FILE="scraper.pid"
+declare WD_SPOT_RECONCILE_CMD="${WD_SPOT_RECONCILE_CMD-$(dirname "$(readlink -f "${BASH_SOURCE[0]}")")/wd_spot_reconcile.py}"
 
 function n1-scrape-dameon() {
    while true; do
@@ -115,9 +116,20 @@ function get_all_sample_times() {
     done
 }
 
+### Matches the spots of the two servers by cycle, call and band in one pass over the whole logs, rather than one grep of each log per cycle
+### Prints the spots, unique-decode rate and SNR delta of pcmrecord versus wd-record for each band, and with '-c' the counts of each cycle
+function reconcile-server-spot-logs() {
+    local rc
+    python3 ${WD_SPOT_RECONCILE_CMD} "$@" wd-record=${N1_LOG_FILENAME} pcmrecord=${N2_LOG_FILENAME}
+    rc=$?
+    if (( rc != 0 )); then
+        echo "ERROR: 'python3 ${WD_SPOT_RECONCILE_CMD} $* wd-record=${N1_LOG_FILENAME} pcmrecord=${N2_LOG_FILENAME}' => ${rc}"
+    fi
+    return ${rc}
+}
 
 function wd-spot-differences() {
-while getopts "azst" opt; do
+while getopts "azstrc" opt; do
     case ${opt} in
         a)
             spawn-n1-scrape-dameon
@@ -131,6 +143,12 @@ while getopts "azst" opt; do
         t)
             get_all_sample_times
             ;;
+        r)
+            reconcile-server-spot-logs
+            ;;
+        c)
+            reconcile-server-spot-logs --cycles
+            ;;
         *)
             echo "ERROR: option '${opt}' is not valid"
             ;;
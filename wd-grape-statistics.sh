@@ -19,7 +19,23 @@ function print-header() {
 
 }
 
+declare WD_GRAPE_STATS=${WD_GRAPE_STATS-yes}      ### If "yes", print the table from the incremental index of wd_grape_stats.py rather than a 'find' and 'du -sh' of every site/date
+declare WD_GRAPE_STATS_CMD=${WD_GRAPE_STATS_CMD-$(dirname "$(readlink -f "${BASH_SOURCE[0]}")")/wd_grape_stats.py}
+declare WD_GRAPE_STATS_INDEX_FILE=${WD_GRAPE_STATS_INDEX_FILE-${HOME}/wd_grape_stats_index.json}
+
+### Only lists the site homes which have changed and only walks the OBS dirs which are new or still growing since the last report
+function wd-statistics-indexed() {
+        local sites_list="${WD_PSWS_SITES[*]}"
+        python3 ${WD_GRAPE_STATS_CMD} report --index ${WD_GRAPE_STATS_INDEX_FILE} --sites-root .. --sites "${sites_list// /,}"
+}
+
 function wd-statistics() {
+        if [[ ${WD_GRAPE_STATS} == "yes" ]]; then
+                if wd-statistics-indexed; then
+                        return 0
+                fi
+                echo "ERROR: 'python3 ${WD_GRAPE_STATS_CMD} report' failed, so find and 'du -sh' each site/date"
+        fi
         local site_home_list=(  ${WD_PSWS_SITES[@]/#/..\/} )
         local date_list=( $(find  ${site_home_list[@]} -mindepth 1 -maxdepth 1 -type d -name 'OBS*' -printf "%f\n" 2> /dev/null | sort -u ) )
 
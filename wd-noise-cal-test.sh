@@ -0,0 +1,86 @@
+#!/bin/bash
+### Regression tests for wd_noise_cal.py, which replaced the awk of calculate_nl_adjustments() and the bc chain of the noise corrections in decoding.sh.
+### Usage: ./wd-noise-cal-test.sh      Exits 0 if all pass, 1 otherwise.
+###
+### The noise levels are uploaded to wsprdaemon.org and compared across years and receivers, so the values pinned here are those
+### which the awk and bc code gave for Kiwi and KA9Q receivers.  The coefficients are also checked against the awk code of
+### calculate_nl_adjustments() itself for every WSPR band.
+set -u
+cd "$(dirname "$0")" || exit 1
+declare -i PASS=0 FAIL=0
+declare NOISE_CAL="python3 ./wd_noise_cal.py"
+function wd_logger() { :; }                  ### silence WD logging
+if ! command -v gawk > /dev/null; then
+    function gawk() { awk "$@"; }            ### the Kiwi correction program is also valid mawk
+fi
+eval "$(sed -n '/^declare WSPR_BAND_LIST=(/,/^)/p' config-utils.sh)"
+eval "$(awk '/^function get_wspr_band_freq_khz\(\)/,/^}/' config-utils.sh)"
+eval "$(awk '/^function get_af_db\(\)/,/^}/'               decoding.sh)"
+eval "$(awk '/^function calculate_nl_adjustments\(\)/{p=1} p{print} p && /^EOF$/{heredoc_done=1} heredoc_done && /^}/{exit}' decoding.sh)"   ### its gawk program has a '}' line
+declare TEST_AF_FIELD=""
+function get_receiver_af_list_from_name() { echo "${TEST_AF_FIELD}"; }
+function get_receiver_khz_offset_list_from_name() { echo 0; }
+
+function check() {   ### check <description> <expected> <actual>
+    if [[ "$2" == "$3" ]]; then PASS+=1; printf "  PASS  %s\n" "$1"
+    else FAIL+=1; printf "  FAIL  %s\n        expected: %s\n        actual:   %s\n" "$1" "$2" "$3"; fi
+}
+TMP=$(mktemp -d) || exit 1
+trap 'rm -rf "${TMP}"' EXIT
+
+### ---- coefficients:  pinned ----
+check "20m  Kiwi coefficients"              "-74.33 -187.72" "$(${NOISE_CAL} coefficients --freq-khz 14095.6 --cal-file ${TMP}/none.csv)"
+check "40m  Kiwi coefficients"              "-73.15 -186.54" "$(${NOISE_CAL} coefficients --freq-khz 7038.6  --cal-file ${TMP}/none.csv)"
+check "2200m coefficients with AF -3.5"     "-76.84 -190.24" "$(${NOISE_CAL} coefficients --freq-khz 136.0   --af-db -3.5 --cal-file ${TMP}/none.csv)"
+check "6m has no Kiwi correction above 30 MHz" "-74.31 -187.70" "$(${NOISE_CAL} coefficients --freq-khz 50293.0 --cal-file ${TMP}/none.csv)"
+
+### ---- coefficients:  the same as the awk code for every band, with the default and with a noise_ca_vals.csv ----
+WSPRDAEMON_ROOT_DIR=${TMP}
+receiver_name=KIWI_0
+function compare_with_awk() {   ### compare_with_awk <description> <cal file>
+    local band_info band mismatches=0
+    for band_info in "${WSPR_BAND_LIST[@]}"; do
+        band_info=( ${band_info} )
+        band=${band_info[0]}
+        local rms_nl_adjust fft_nl_adjust
+        WD_NOISE_CAL=no calculate_nl_adjustments rms_nl_adjust fft_nl_adjust ${band}
+        local af=$(get_af_db af ${receiver_name} ${band}; echo ${af})
+        local python_values="$(${NOISE_CAL} coefficients --freq-khz ${band_info[1]} --af-db ${af} --cal-file $2)"
+        if [[ "${python_values}" != "${rms_nl_adjust} ${fft_nl_adjust}" ]]; then
+            printf "        band %s: awk '%s %s', python '%s'\n" ${band} ${rms_nl_adjust} ${fft_nl_adjust} "${python_values}"
+            (( ++mismatches ))
+        fi
+    done
+    check "$1" 0 ${mismatches}
+}
+compare_with_awk "every band, default cal values" ${TMP}/noise_plot/noise_ca_vals.csv
+mkdir -p ${TMP}/noise_plot
+printf "Nom BW,ENBW,RMS offset,FFT offset,FFT band,Threshold,C2 correction\n330,250,-51.2,-41.0,-13.9,13.1,-186.95\n" > ${TMP}/noise_plot/noise_ca_vals.csv
+TEST_AF_FIELD="DEFAULT:1.5,40:-2.25"
+compare_with_awk "every band, noise_ca_vals.csv and antenna factors" ${TMP}/noise_plot/noise_ca_vals.csv
+
+### ---- apply:  pinned results of the bc chain ----
+SOX_LEVELS="-20.51 -45.23 -38.70 -46.12 -18.02 -40.11 -33.25 -41.70 -21.00 -45.80 -39.01 -46.35"
+check "Kiwi, wav normalized from 0 dBFS" \
+      "-93.84 -118.56 -112.03 -119.45 -91.35 -113.44 -106.58 -115.03 -94.33 -119.13 -112.34 -119.68 -119.68 -140.1 -119.6" \
+      "$(${NOISE_CAL} apply --receiver KIWI_0 --band 20 --rms-nl-adjust -74.33 --fft-nl-adjust -187.72 --c2 ' 46.53' --peak-dbfs 0 -- ${SOX_LEVELS})"
+check "Kiwi, int wav with 50 dB channel gain" \
+      "-143.66 -168.38 -161.85 -169.27 -141.17 -163.26 -156.40 -164.85 -144.15 -168.95 -162.16 -169.50 -169.50 -190.0 -169.5" \
+      "$(${NOISE_CAL} apply --receiver KIWI_1 --band 40 --rms-nl-adjust -73.15 --fft-nl-adjust -186.54 --c2 46.53 --channel-gain 50.0 -- ${SOX_LEVELS})"
+check "KA9Q with the 40m band calibration" \
+      "-54.56 -79.28 -72.75 -80.17 -52.07 -74.16 -67.30 -75.75 -55.05 -79.85 -73.06 -80.40 -80.40 -164.7 -80.4" \
+      "$(${NOISE_CAL} apply --receiver KA9Q_0 --band 40 --rms-nl-adjust -73.15 --fft-nl-adjust -186.54 --c2 ' -20.04' --peak-dbfs -12.5 --ka9q-rms-cal-offset -9.4 --ka9q-c2-cal-offset -6.7 -- ${SOX_LEVELS})"
+check "KA9Q without a calibration for its band" \
+      "-45.16 -69.88 -63.35 -70.77 -42.67 -64.76 -57.90 -66.35 -45.65 -70.45 -63.66 -71.00 -71.00 -158.0 -71.0" \
+      "$(${NOISE_CAL} apply --receiver KA9Q_0 --band 40 --rms-nl-adjust -73.15 --fft-nl-adjust -186.54 --c2 ' -20.04' --peak-dbfs -12.5 -- ${SOX_LEVELS})"
+check "KA9Q reporting radiod's N0" \
+      "-45.16 -69.88 -63.35 -70.77 -42.67 -64.76 -57.90 -66.35 -45.65 -70.45 -63.66 -71.00 -158.2 -158.2 -158.2" \
+      "$(${NOISE_CAL} apply --receiver KA9Q_0 --band 40 --rms-nl-adjust -73.15 --fft-nl-adjust -186.54 --c2 ' -20.04' --peak-dbfs -12.5 --ka9q-use-band-cal no --ka9q-use-radiod-n0 yes --ka9q-n0 -158.23 -- ${SOX_LEVELS})"
+check "KA9Q ignores an invalid N0" \
+      "-45.16 -69.88 -63.35 -70.77 -42.67 -64.76 -57.90 -66.35 -45.65 -70.45 -63.66 -71.00 -71.00 -158.0 -71.0" \
+      "$(${NOISE_CAL} apply --receiver KA9Q_0 --band 40 --rms-nl-adjust -73.15 --fft-nl-adjust -186.54 --c2 ' -20.04' --peak-dbfs -12.5 --ka9q-use-band-cal no --ka9q-use-radiod-n0 yes --ka9q-n0 -999.99 -- ${SOX_LEVELS})"
+${NOISE_CAL} apply --receiver KIWI_0 --rms-nl-adjust -74.33 --fft-nl-adjust -187.72 --c2 46.53 -- -inf ${SOX_LEVELS% *} > /dev/null 2>&1
+check "a '-inf' sox level is left to the bc code" 1 $?
+
+printf "\n%d passed, %d failed\n" ${PASS} ${FAIL}
+(( FAIL == 0 ))
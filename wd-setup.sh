@@ -57,7 +57,7 @@ sudo systemctl mask sleep.target suspend.target hibernate.target hybrid-sleep.ta
 
 #####################################################################################################
 ### Install all packages needed by WD and most of the programs it runs
-declare    PACKAGE_NEEDED_LIST=( netcat-openbsd tmux iw time vim at bc curl gawk bind9-host flac postgresql sox zstd avahi-daemon libnss-mdns inotify-tools \
+declare    PACKAGE_NEEDED_LIST=( netcat-openbsd tmux iw time vim at bc curl gawk bind9-host flac postgresql sox zstd python3-zstandard avahi-daemon libnss-mdns inotify-tools \
                 libbsd-dev libavahi-client-dev libfftw3-dev libiniparser-dev libopus-dev opus-tools uuid-dev \
                 libusb-dev libusb-1.0-0 libusb-1.0-0-dev libairspy-dev libairspyhf-dev portaudio19-dev librtlsdr-dev \
                 libncurses-dev bzip2 wavpack libsamplerate0 libsamplerate0-dev lsof )
@@ -26,6 +26,12 @@ declare MAX_RM_ARGS=5000                            ### Limit of the number of f
 declare WD_LOGFILE=${WD_LOGFILE-}                                ### Top level command doesn't log by default since the user needs to get immediate feedback
 declare WD_LOGFILE_SIZE_MAX=${WD_LOGFILE_SIZE_MAX-1000000}        ### Limit log files to 1 Mbyte
 
+### When WD_LOG_COLLECTOR="yes" is in the conf file, wd_logger() sends each line to wd_log_collector_daemon() which batches the writes to each log file. See wd_log_collector.py
+declare WD_LOG_COLLECTOR_CMD=${WSPRDAEMON_ROOT_DIR}/wd_log_collector.py
+declare WD_LOG_COLLECTOR_PORT=${WD_LOG_COLLECTOR_PORT-58033}                    ### UDP port on 127.0.0.1 where the log lines are sent
+declare WD_LOG_COLLECTOR_READY_FILE=${WSPRDAEMON_TMP_DIR-/dev/shm/wsprdaemon}/wd_log_collector.ready   ### Holds the collector's pid while it is listening
+declare WD_LOG_COLLECTOR_MAX_LINE_CHARS=2000                                    ### Longer lines are appended by wd_logger() itself, since they may not fit in one datagram
+
 ### This ensures that 'bc's floating point calculations of spot frequencies give those numbers in a known format irrespective of the LOCALE environment of the host computer
 export LC_ALL="C"
 
@@ -161,14 +167,29 @@ function print_new_log_lines()
     done
 }
 
+### Returns 0 if the ready file holds the pid of a running collector.  If the collector was killed without running its cleanup, its ready file is left behind,
+### and sending to its closed UDP port would silently lose the log lines.  Only builtins are used, since wd_logger() calls this for every line
+function wd_log_collector_is_running()
+{
+    local collector_pid=""
+    read -r collector_pid 2> /dev/null < ${WD_LOG_COLLECTOR_READY_FILE} && [[ -n "${collector_pid}" ]] && kill -0 ${collector_pid} 2> /dev/null
+}
+
 function tail_log_file()
 {
     local log_file=${1}
 
     wd_logger -1 "To view the full log file execute the command: 'less ${log_file}'\n"
     sleep 2
-    wd_logger -1 "Running 'tail -F ${log_file}':\n"
-    tail -F ${log_file}
+    if [[ ${WD_LOG_COLLECTOR-no} == "yes" ]] && wd_log_collector_is_running; then
+        ### The collector flushes the lines it holds for this file before printing them, so 'tail -n 0' starts after them
+        wd_logger -1 "Printing the recent lines held by the log collector, then running 'tail -F -n 0 ${log_file}':\n"
+        python3 ${WD_LOG_COLLECTOR_CMD} tail --port ${WD_LOG_COLLECTOR_PORT} ${log_file}
+        tail -F -n 0 ${log_file}
+    else
+        wd_logger -1 "Running 'tail -F ${log_file}':\n"
+        tail -F ${log_file}
+    fi
     less ${log_file}
 }
 
@@ -226,6 +247,15 @@ function wd_logger() {
         return 0
     fi
 
+    ### If the log collector is running, a single datagram to it replaces the size check, the trimming and the append below
+    if [[ ${WD_LOG_COLLECTOR-no} == "yes" ]] && (( ${#printout_line} < WD_LOG_COLLECTOR_MAX_LINE_CHARS )) && wd_log_collector_is_running; then
+        local collector_log_file_path=${WD_LOGFILE}
+        [[ ${collector_log_file_path} != /* ]] && collector_log_file_path=${PWD}/${collector_log_file_path}
+        local collector_datagram
+        printf -v collector_datagram "\x1e%s\n%b\n" "${collector_log_file_path}" "${printout_line}"
+        echo -n "${collector_datagram}" 2> /dev/null > /dev/udp/127.0.0.1/${WD_LOG_COLLECTOR_PORT} && return 0     ### Usually one write(), so one datagram
+    fi
+
     ### WD_LOGFILE is defined, so truncate if it has grown too large, then append the new log line(s)
     if [[ ! -f $WD_LOGFILE ]] ; then
         local rc
@@ -296,6 +326,87 @@ function decrement_verbosity() {
     signal_verbosity 2
 }
 
+############## Per-cycle span tracing of the decode/post/upload pipeline.  Off unless WD_TRACE="yes" is in the conf file ##############
+### The spans are appended to WD_TRACE_FILE as 64 byte binary records, see wd_trace.py.   'wd_trace.py report' prints per-stage percentiles and the critical path of each cycle
+declare WD_TRACE_CMD=${WSPRDAEMON_ROOT_DIR}/wd_trace.py
+declare WD_TRACE_FILE=${WD_TRACE_FILE-${WSPRDAEMON_TMP_DIR}/wd_trace.bin}
+
+### wd_trace_span STAGE BAND CYCLE START_EPOCH        Records a span from START_EPOCH ('+N' => N seconds after the start of CYCLE) to now, e.g. of a wait
+### Runs in the background so the caller is never delayed by the python startup time
+function wd_trace_span() {
+    [[ ${WD_TRACE-no} != "yes" ]] && return 0
+    local stage=$1
+    local band=$2
+    local cycle=$3
+    local start_epoch=$4
+
+    ( python3 ${WD_TRACE_CMD} --trace-file ${WD_TRACE_FILE} span --receiver "${receiver_name-}" ${stage} "${band}" ${cycle} ${start_epoch} ${EPOCHREALTIME} >& /dev/null & )
+    return 0
+}
+
+### wd_trace_run STAGE BAND CYCLE CMD ARGS...         Runs CMD and records its wall time, CPU time and max RSS. Returns the exit code of CMD
+function wd_trace_run() {
+    local stage=$1
+    local band=$2
+    local cycle=$3
+    shift 3
+    if [[ ${WD_TRACE-no} != "yes" ]]; then
+        "$@"
+        return
+    fi
+    python3 ${WD_TRACE_CMD} --trace-file ${WD_TRACE_FILE} run --receiver "${receiver_name-}" ${stage} "${band}" ${cycle} -- "$@"
+}
+
+### Replaces the calling daemon with 'python3 PYTHON_CMD ARGS...' running in ROOT_DIR, with one '-v' added for each level of verbosity above 1
+### 'exec' so the pid in the <DAEMON_FUNCTION>.pid file written by spawn_daemon() is the pid of the python daemon
+function wd_exec_python_daemon()
+{
+    local root_dir=$1
+    local python_cmd=$2
+    local python_args=( "${@:3}" )
+    local i
+    for (( i = 1; i < verbosity; ++i )); do
+        python_args+=( -v )
+    done
+
+    mkdir -p ${root_dir}
+    cd ${root_dir}
+    wd_logger 1 "Replacing ${FUNCNAME[1]}() with 'python3 ${python_cmd} ${python_args[*]}'"
+    exec python3 ${python_cmd} "${python_args[@]}"
+}
+
+function wd_log_collector_daemon()
+{
+    local root_dir=$1
+    local collector_args=( daemon --port ${WD_LOG_COLLECTOR_PORT} --ready-file ${WD_LOG_COLLECTOR_READY_FILE} --max-bytes ${WD_LOGFILE_SIZE_MAX} --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_LOG_COLLECTOR_CMD} "${collector_args[@]}"
+}
+
+############## Pool of pre-forked python interpreters for the WD python helpers.  Off unless WD_PY_POOL="yes" is in the conf file ##############
+### 'wd-py HELPER ARGS...' runs HELPER.py in the pool if wd_py_pool_daemon() is running, otherwise in a new python3 as before.  See wd_py.py
+declare WD_PY_CMD=${WSPRDAEMON_ROOT_DIR}/wd-py
+declare WD_PY_POOL_CMD=${WSPRDAEMON_ROOT_DIR}/wd_py.py
+export  WD_PY_POOL_SOCKET=${WD_PY_POOL_SOCKET-${WSPRDAEMON_TMP_DIR}/wd_py.sock}
+
+function wd_py_pool_daemon()
+{
+    local root_dir=$1
+    local pool_args=( serve --socket ${WD_PY_POOL_SOCKET} --workers ${WD_PY_POOL_WORKERS-4} --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_PY_POOL_CMD} "${pool_args[@]}"
+}
+
+############## Per daemon and per helper CPU, memory, I/O and context switch accounting.  Off unless WD_ACCOUNTING="yes" is in the conf file ##############
+### 'python3 wd_accounting.py top --ring-file ${WD_ACCOUNTING_RING_FILE}' shows which daemon, band or helper dominates.  See wd_accounting.py
+declare WD_ACCOUNTING_CMD=${WSPRDAEMON_ROOT_DIR}/wd_accounting.py
+declare WD_ACCOUNTING_RING_FILE=${WD_ACCOUNTING_RING_FILE-${WSPRDAEMON_TMP_DIR}/wd_accounting.ring}
+
+function wd_accounting_daemon()
+{
+    local root_dir=$1
+    local accounting_args=( daemon --ring-file ${WD_ACCOUNTING_RING_FILE} --pid-dir ${WSPRDAEMON_ROOT_DIR} --pid-dir ${WSPRDAEMON_TMP_DIR} --interval ${WD_ACCOUNTING_INTERVAL_SECS-10} --log-file "${WD_LOGFILE-}" )
+    wd_exec_python_daemon ${root_dir} ${WD_ACCOUNTING_CMD} "${accounting_args[@]}"
+}
+
 function seconds_until_next_even_minute() {
     local current_min_secs=$(date +%M:%S)
     local current_min=$((10#${current_min_secs%:*}))    ### chop off leading zeros
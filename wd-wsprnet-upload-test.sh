@@ -0,0 +1,112 @@
+#!/bin/bash
+### Regression tests for wsprnet_upload_scheduler.py against its local stand-in for wsprnet.org/meptspots.php.
+### Usage: ./wd-wsprnet-upload-test.sh      Exits 0 if all pass, 1 otherwise.
+###
+### The DONE datagrams are sent by the wsprnet_upload_scheduler_notify() of upload-client-utils.sh, just as the posting daemons send them.
+### A cycle must be uploaded as soon as every RECEIVER/BAND of its CALL_GRID has reported it, or --deadline-secs after its first report.
+### When the upload fails, the spot files must be kept and retried --retry-secs later without the scheduler spinning on the CPU in the meantime.
+set -u
+cd "$(dirname "$0")" || exit 1
+declare -i PASS=0 FAIL=0
+function wd_logger() { :; }                  ### silence WD logging
+eval "$(awk '/^function wsprnet_upload_scheduler_notify\(\)/,/^}/' upload-client-utils.sh)"
+declare WSPRNET_UPLOAD_SCHEDULER=yes
+declare WSPRNET_UPLOAD_SCHEDULER_PORT=$(( 40000 + $$ % 10000 ))
+declare STUB_PORT=$(( WSPRNET_UPLOAD_SCHEDULER_PORT + 1 ))
+declare DEADLINE_SECS=2
+declare RETRY_SECS=4                         ### Longer than DEADLINE_SECS, so the cycle's deadline passes while the scheduler waits to retry
+
+function check() {   ### check <description> <expected> <actual>
+    if [[ "$2" == "$3" ]]; then PASS+=1; printf "  PASS  %s\n" "$1"
+    else FAIL+=1; printf "  FAIL  %s\n        expected: %s\n        actual:   %s\n" "$1" "$2" "$3"; fi
+}
+TMP=$(mktemp -d) || exit 1
+declare stub_pid="" scheduler_pid=""
+trap 'kill ${stub_pid} ${scheduler_pid} 2> /dev/null; wait 2> /dev/null; rm -rf "${TMP}"' EXIT
+
+function start_stub() {
+    python3 wsprnet_upload_scheduler.py --stub-server ${STUB_PORT} --stub-dir ${TMP}/stub --log-file ${TMP}/stub.log &
+    stub_pid=$!
+    wait_for 5 "grep -qs 'listening' ${TMP}/stub.log"
+}
+function stop_stub() {
+    kill ${stub_pid}
+    wait ${stub_pid} 2> /dev/null
+    stub_pid=""
+}
+function wait_for() {   ### wait_for <secs> <command>:  returns 0 as soon as <command> succeeds, 1 if it hasn't after <secs>
+    local -i tries=$(( $1 * 10 ))
+    while (( tries-- > 0 )); do
+        eval "$2" && return 0
+        sleep 0.1
+    done
+    return 1
+}
+function uploads_count() { ls ${TMP}/stub | wc -l | tr -d ' '; }
+function last_upload() { cat "$(ls -1 ${TMP}/stub/* | tail -1)"; }
+function queued_count() { find ${TMP}/spots -name '*_spots.txt' | wc -l | tr -d ' '; }
+function cpu_ticks() { awk '{print $14 + $15}' /proc/$1/stat; }
+function now_ms() { date +%s%3N; }
+function queue_spot() {   ### queue_spot <band> <cycle> <freq> <call> <grid>:  queue a 34 field WD extended spot line
+    mkdir -p ${TMP}/spots/AI6VN_CM88mc/KIWI_0/$1
+    printf "%s %s  0.12 -21.00  0.35 %12s %-14s %-6s  23  0    1    0    0  -11  0    1    0  2  -120.5 -130.2 %4s CM88mc   AI6VN  4000  45.0  37.0 -122.0 270.0  42.0  -71.0  40.0 -95.0    0    0\n" \
+        ${2%_*} ${2#*_} $3 $4 $5 $1 >> ${TMP}/spots/AI6VN_CM88mc/KIWI_0/$1/$2_spots.txt
+}
+
+mkdir -p ${TMP}/stub ${TMP}/spots/AI6VN_CM88mc/KIWI_0/{20,40}
+start_stub
+python3 wsprnet_upload_scheduler.py --spots-dir ${TMP}/spots --port ${WSPRNET_UPLOAD_SCHEDULER_PORT} --url http://127.0.0.1:${STUB_PORT}/meptspots.php \
+    --deadline-secs ${DEADLINE_SECS} --retry-secs ${RETRY_SECS} --log-file ${TMP}/scheduler.log &
+scheduler_pid=$!
+wait_for 5 "grep -qs 'Listening' ${TMP}/scheduler.log"
+
+### ---- every band reports:  upload at once, merged and sorted by frequency ----
+queue_spot 20 251019_1200 14.0971234 K1ABC FN42
+queue_spot 40 251019_1200 7.0401512 K9XYZ/P none
+wsprnet_upload_scheduler_notify AI6VN_CM88mc/KIWI_0/20 251019_1200
+sleep 1
+check "all bands: no upload while 40 hasn't reported"  "0" "$(uploads_count)"
+wsprnet_upload_scheduler_notify AI6VN_CM88mc/KIWI_0/40 251019_1200
+wait_for 2 '(( $(uploads_count) == 1 ))'
+check "all bands: one upload as soon as 40 reports"    "1" "$(uploads_count)"
+check "all bands: WN lines sorted by frequency"        "251019 1200  0.12 -21  0.35    7.0401512 K9XYZ/P               23  0    2
+251019 1200  0.12 -21  0.35   14.0971234 K1ABC          FN42   23  0    2" "$(last_upload)"
+check "all bands: uploaded spot files flushed"         "0" "$(queued_count)"
+
+### ---- a band doesn't report:  upload what we have after --deadline-secs ----
+queue_spot 20 251019_1202 14.0970100 K2DEF FN20
+start_ms=$(now_ms)
+wsprnet_upload_scheduler_notify AI6VN_CM88mc/KIWI_0/20 251019_1202
+wait_for $(( DEADLINE_SECS + 2 )) '(( $(uploads_count) == 2 ))'
+elapsed_ms=$(( $(now_ms) - start_ms ))
+check "deadline: uploaded without 40"                  "2" "$(uploads_count)"
+check "deadline: not before --deadline-secs"           "yes" "$( (( elapsed_ms >= DEADLINE_SECS * 1000 - 200 )) && echo yes || echo "no, after ${elapsed_ms} ms")"
+check "deadline: WN line"                              "251019 1202  0.12 -21  0.35   14.0970100 K2DEF          FN20   23  0    2" "$(last_upload)"
+
+### ---- wsprnet.org is down:  keep the spots, don't spin, and retry after --retry-secs ----
+stop_stub
+queue_spot 20 251019_1204 14.0970200 K3GHI FN31
+queue_spot 40 251019_1204 7.0400300 K4JKL EM73
+wsprnet_upload_scheduler_notify AI6VN_CM88mc/KIWI_0/20 251019_1204
+wsprnet_upload_scheduler_notify AI6VN_CM88mc/KIWI_0/40 251019_1204
+wait_for 2 "grep -qs 'upload failed' ${TMP}/scheduler.log"
+check "retry: the failed upload was logged"            "1" "$(grep -c 'upload failed' ${TMP}/scheduler.log)"
+check "retry: spot files kept"                         "2" "$(queued_count)"
+sleep ${DEADLINE_SECS}
+start_ticks=$(cpu_ticks ${scheduler_pid})
+sleep 1
+check "retry: no CPU spin after the deadline passed"      "yes" "$( (( $(cpu_ticks ${scheduler_pid}) - start_ticks < 20 )) && echo yes || echo no)"
+start_stub
+wait_for ${RETRY_SECS} '(( $(uploads_count) == 3 ))'
+check "retry: uploaded once wsprnet.org is back"       "3" "$(uploads_count)"
+check "retry: WN lines"                                "251019 1204  0.12 -21  0.35    7.0400300 K4JKL          EM73   23  0    2
+251019 1204  0.12 -21  0.35   14.0970200 K3GHI          FN31   23  0    2" "$(last_upload)"
+check "retry: uploaded spot files flushed"             "0" "$(queued_count)"
+
+### ---- a malformed datagram is ignored ----
+printf "BOGUS\n" > /dev/udp/127.0.0.1/${WSPRNET_UPLOAD_SCHEDULER_PORT}
+wait_for 2 "grep -qs 'malformed' ${TMP}/scheduler.log"
+check "malformed: logged and still running"            "1 yes" "$(grep -c 'malformed' ${TMP}/scheduler.log) $(kill -0 ${scheduler_pid} 2> /dev/null && echo yes || echo no)"
+
+printf "\n  %d passed, %d failed\n" "${PASS}" "${FAIL}"
+(( FAIL == 0 ))
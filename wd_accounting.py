@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_accounting.py
+# Per daemon and per helper resource accounting for WD, replacing the 'find *.pid', 'ps', 'awk /proc/PID/status' and 'grep' which
+# show-memory-usage.sh runs for every daemon every 10 seconds, and which only reported RSS.
+#
+# 'daemon' finds the WD daemons from the *.pid files under each --pid-dir, and looks for new ones only every --rescan-secs.  Every
+# --interval seconds it reads /proc/*/stat once, charges each process to the nearest daemon it descends from, and appends one
+# record per daemon and per helper of that daemon (wsprd, jt9, sox, bash, and python helpers by script name, e.g. 'c2_noise.py') to a
+# fixed size ring file.  Each record holds the CPU, read()/write() bytes and voluntary/involuntary context switches of that
+# interval, the number of its processes and their RSS.
+# The CPU of a helper which exits between two samples isn't lost:  it reappears in the cutime/cstime of the process which reaps it,
+# and is charged back to the helpers reaped with it in proportion to the CPU they were seen to use.  The I/O bytes and context
+# switches of a helper's last interval, and the work of processes which start and exit between two samples, are not seen (their
+# CPU is charged to DAEMON:unsampled).  So make --interval shorter than the run time of the helpers of interest.
+#
+# The ring file starts with a header and a table of --name-slots 64 byte names, followed by --ring-records 32 byte records:
+#     uint32 unix time, uint16 name index, uint16 processes, uint32 CPU ms, uint32 RSS KB, uint32 read KB, uint32 write KB,
+#     uint32 voluntary context switches, uint32 involuntary context switches
+#
+# 'top' prints the usage over the last --minutes, by daemon/helper, by helper, or by receiver/band.  'summary' prints it as
+# KEY=VALUE lines for uploads_config.txt
+#
+# Usage:
+#     wd_accounting.py daemon  --ring-file FILE --pid-dir DIR [--pid-dir DIR ...] [--interval 10] [--rescan-secs 60] [--log-file FILE] [-v]
+#     wd_accounting.py top     --ring-file FILE [--minutes 10] [--by key|helper|receiver] [--sort cpu|rss|io|cs] [--limit 25] [--watch SECS]
+#     wd_accounting.py summary --ring-file FILE [--minutes 60] [--top 5]
+
+import argparse
+import os
+import signal
+import struct
+import sys
+import time
+
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+import wd_utils
+
+MAGIC = b'WDAC'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHIIQ')         # magic, version, unused, name slots, ring records, interval secs, records written
+HEADER_SIZE = 64
+NAME_SIZE = 64
+RECORD = struct.Struct('<IHHIIIIII')
+OTHER_NAME = 'OTHER'                        # Name slot 0, used for the records of any names which don't fit in the name table
+PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+UINT32_MAX = 0xffffffff
+
+
+class RingFile:
+    def __init__(self, path, name_slots=1024, ring_records=131072, interval=10, create=False):
+        self.path = path
+        self.fd = None
+        if not create:
+            self.fd = os.open(path, os.O_RDONLY)
+            header = os.pread(self.fd, HEADER.size, 0)
+            magic, version, _, self.name_slots, self.ring_records, self.interval, self.written = HEADER.unpack(header) if len(header) == HEADER.size else (b'',) + (0,) * 6
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("'%s' is not a version %d accounting ring file" % (path, VERSION))
+            self.names = self.read_names()
+            return
+        try:
+            existing = RingFile(path)
+            if (existing.name_slots, existing.ring_records, existing.interval) == (name_slots, ring_records, interval):
+                self.fd = os.open(path, os.O_RDWR)
+                self.name_slots, self.ring_records, self.interval, self.written, self.names = name_slots, ring_records, interval, existing.written, existing.names
+                os.close(existing.fd)
+                return
+            os.close(existing.fd)
+        except (OSError, ValueError):
+            pass
+        # No usable ring file, or it has a different geometry:  create a new, empty one
+        self.name_slots, self.ring_records, self.interval, self.written = name_slots, ring_records, interval, 0
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(fd, HEADER_SIZE + name_slots * NAME_SIZE + ring_records * RECORD.size)
+        os.close(fd)
+        os.replace(tmp_path, path)
+        self.fd = os.open(path, os.O_RDWR)
+        self.names = []
+        self.name_index(OTHER_NAME)
+        self.write_header()
+
+    def read_names(self):
+        data = os.pread(self.fd, self.name_slots * NAME_SIZE, HEADER_SIZE)
+        names = []
+        for slot in range(self.name_slots):
+            name = data[slot * NAME_SIZE:(slot + 1) * NAME_SIZE].rstrip(b'\0')
+            if not name:
+                break
+            names.append(name.decode(errors='replace'))
+        return names
+
+    def name_index(self, name):
+        # Returns the index of name in the name table, adding it if there is room
+        if name in self.names:
+            return self.names.index(name)
+        if len(self.names) >= self.name_slots:
+            return 0
+        encoded = name.encode()[-(NAME_SIZE - 1):]          # Keep the end of a long name, which identifies it
+        os.pwrite(self.fd, encoded.ljust(NAME_SIZE, b'\0'), HEADER_SIZE + len(self.names) * NAME_SIZE)
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def write_header(self):
+        os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, 0, self.name_slots, self.ring_records, self.interval, self.written), 0)
+
+    def append(self, records):
+        # records: [(time, name index, processes, cpu ms, rss kb, read kb, write kb, vcs, ivcs)]
+        for record in records:
+            offset = HEADER_SIZE + self.name_slots * NAME_SIZE + (self.written % self.ring_records) * RECORD.size
+            os.pwrite(self.fd, RECORD.pack(*(min(int(value), UINT32_MAX) if i != 1 and i != 2 else min(int(value), 0xffff) for i, value in enumerate(record))), offset)
+            self.written += 1
+        self.write_header()
+
+    def records_since(self, since):
+        # Returns the records with a time >= since, oldest first
+        count = min(self.written, self.ring_records)
+        first = self.written - count
+        records_offset = HEADER_SIZE + self.name_slots * NAME_SIZE
+        data = os.pread(self.fd, self.ring_records * RECORD.size, records_offset)
+        records = []
+        for n in range(first, self.written):
+            record = RECORD.unpack_from(data, (n % self.ring_records) * RECORD.size)
+            if record[0] >= since:
+                records.append(record)
+        return records
+
+
+##################################################  Sampling /proc  ##################################################
+
+def read_stat(pid):
+    # Returns (comm, ppid, starttime, own cpu ticks, reaped children cpu ticks, rss kb), or None if the process is gone
+    try:
+        with open('/proc/%s/stat' % pid, 'rb') as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    comm_start, comm_end = data.find(b'('), data.rfind(b')')
+    fields = data[comm_end + 2:].split()
+    # fields[0] is field 3 (state) of proc(5)
+    return (data[comm_start + 1:comm_end].decode(errors='replace'), int(fields[1]), int(fields[19]),
+            int(fields[11]) + int(fields[12]), int(fields[13]) + int(fields[14]), int(fields[21]) * PAGE_KB)
+
+
+def read_io_and_switches(pid):
+    # Returns (rchar, wchar, voluntary context switches, involuntary context switches), zeros for those which can't be read
+    values = {}
+    for path in ('/proc/%d/io' % pid, '/proc/%d/status' % pid):
+        try:
+            with open(path, 'rb') as fp:
+                for line in fp:
+                    key, _, value = line.partition(b':')
+                    if key in (b'rchar', b'wchar', b'voluntary_ctxt_switches', b'nonvoluntary_ctxt_switches'):
+                        values[key] = int(value)
+        except (OSError, ValueError):
+            pass
+    return (values.get(b'rchar', 0), values.get(b'wchar', 0), values.get(b'voluntary_ctxt_switches', 0), values.get(b'nonvoluntary_ctxt_switches', 0))
+
+
+def helper_name(pid, comm):
+    # 'wsprd', 'sox', 'bash', ... or the script of a python helper, e.g. 'c2_noise.py'
+    if comm.startswith('python'):
+        try:
+            with open('/proc/%d/cmdline' % pid, 'rb') as fp:
+                argv = fp.read().split(b'\0')
+            for arg in argv[1:]:
+                if arg and not arg.startswith(b'-'):
+                    return os.path.basename(arg.decode(errors='replace'))
+        except OSError:
+            pass
+    return comm
+
+
+class Accountant:
+    def __init__(self, args):
+        self.args = args
+        self.ring = RingFile(args.ring_file, args.name_slots, args.ring_records, args.interval, create=True)
+        self.daemons = {}               # pid => daemon name
+        self.last_rescan = 0.0
+        self.tracked = {}               # (pid, starttime) => [name, ppid key, cpu ticks, reaped ticks, rchar, wchar, vcs, ivcs]
+        self.first_sample = True
+
+    def rescan(self):
+        daemons = {}
+        for pid_dir in self.args.pid_dir:
+            for dir_path, _, file_names in os.walk(pid_dir):
+                for file_name in file_names:
+                    if not file_name.endswith('.pid'):
+                        continue
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        with open(path) as fp:
+                            pid = int(fp.read().split()[0])
+                    except (OSError, ValueError, IndexError):
+                        continue
+                    if os.path.exists('/proc/%d' % pid):
+                        daemons[pid] = os.path.relpath(path, pid_dir)[:-len('.pid')]
+        if daemons != self.daemons:
+            wd_logger(1, 'Accounting for %d daemons' % len(daemons))
+        self.daemons = daemons
+        self.last_rescan = time.time()
+
+    def sample(self, now):
+        stats = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                stat = read_stat(entry)
+                if stat:
+                    stats[int(entry)] = stat
+        if any(pid not in stats for pid in self.daemons) or now - self.last_rescan >= self.args.rescan_secs:
+            self.rescan()
+
+        owners = {}                     # pid => daemon pid, or None
+        def owner(pid):
+            chain = []
+            while pid not in owners:
+                if pid in self.daemons:
+                    owners[pid] = pid
+                    break
+                chain.append(pid)
+                stat = stats.get(pid)
+                if stat is None or stat[1] <= 1:
+                    owners[pid] = None
+                    break
+                pid = stat[1]
+            for link in chain:
+                owners[link] = owners[pid]
+            return owners[pid]
+
+        usage = {}                      # name => [processes, cpu ticks, rss kb, rchar, wchar, vcs, ivcs]
+        def charge(name, processes=0, ticks=0, rss=0, rchar=0, wchar=0, vcs=0, ivcs=0):
+            totals = usage.setdefault(name, [0] * 7)
+            for i, value in enumerate((processes, ticks, rss, rchar, wchar, vcs, ivcs)):
+                totals[i] += value
+
+        tracked = {}
+        vanished_by_parent = {}         # parent key => [state of each tracked child which has exited since the last sample]
+        live_keys = set((pid, stat[2]) for pid, stat in stats.items())
+        for key, state in self.tracked.items():
+            if key not in live_keys:
+                vanished_by_parent.setdefault(state[1], []).append((key, state))
+
+        def charged_ticks(key, state):
+            # The CPU already charged to an exited process and to any of its children which exited with it
+            return state[2] + state[3] + sum(charged_ticks(*child) for child in vanished_by_parent.pop(key, []))
+        for pid, (comm, ppid, starttime, ticks, reaped, rss) in stats.items():
+            daemon_pid = owner(pid)
+            if daemon_pid is None:
+                continue
+            daemon_name = self.daemons[daemon_pid]
+            name = daemon_name if pid == daemon_pid else '%s:%s' % (daemon_name, helper_name(pid, comm))
+            io = read_io_and_switches(pid)
+            key = (pid, starttime)
+            previous = self.tracked.get(key)
+            if previous is None:
+                # A new process:  charge everything it has done, unless this is the first sample, which is the baseline
+                previous = [name, None, 0, 0, 0, 0, 0, 0] if not self.first_sample else [name, None, ticks, reaped] + list(io)
+            charge(name, 1, ticks - previous[2], rss, io[0] - previous[4], io[1] - previous[5], io[2] - previous[6], io[3] - previous[7])
+            # Children which exited since the last sample were reaped into 'reaped':  charge the CPU they used after the last sample to them
+            children = [(child[1][0], charged_ticks(*child)) for child in vanished_by_parent.pop(key, [])]
+            unseen = reaped - previous[3] - sum(charged for _, charged in children)
+            charged_sum = sum(charged for _, charged in children)
+            if unseen > 0 and charged_sum > 0:
+                for child_name, charged in children:
+                    charge(child_name, ticks=unseen * charged / charged_sum)        # In proportion to the CPU each was seen to use
+            elif unseen > 0:
+                charge('%s:unsampled' % daemon_name, ticks=unseen)
+            tracked[key] = [name, (ppid, stats[ppid][2]) if ppid in stats else None, ticks, reaped] + list(io)
+        self.tracked = tracked
+        self.first_sample = False
+
+        records = []
+        for name, (processes, ticks, rss, rchar, wchar, vcs, ivcs) in sorted(usage.items()):
+            records.append((int(now), self.ring.name_index(name), processes, max(0, ticks) * 1000 // CLOCK_TICKS, rss,
+                            max(0, rchar) // 1024, max(0, wchar) // 1024, max(0, vcs), max(0, ivcs)))
+        return records
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        wd_logger(1, "Sampling every %d seconds into '%s'" % (self.args.interval, self.args.ring_file))
+        self.rescan()
+        next_sample = time.time()
+        while True:
+            now = time.time()
+            records = self.sample(now)
+            if records:
+                self.ring.append(records)
+            wd_logger(2, 'Wrote %d records' % len(records))
+            next_sample += self.args.interval
+            time.sleep(max(0.0, next_sample - time.time()))
+
+
+##################################################  Reports  ##################################################
+
+def group_name(name, by):
+    daemon, _, helper = name.partition(':')
+    if by == 'helper':
+        return helper or os.path.basename(daemon)
+    if by == 'receiver':
+        return os.path.dirname(daemon) or '-'
+    return name
+
+
+def usage_report(ring_file, minutes, by):
+    # Returns (window seconds, {group: {'cpu_pct', 'rss_mb', 'rss_peak_mb', 'io_mb', 'cs_per_sec', 'procs'}})
+    ring = RingFile(ring_file)
+    since = time.time() - minutes * 60
+    records = ring.records_since(since)
+    if not records:
+        return 0, {}
+    times = sorted(set(record[0] for record in records))
+    window = max(times[-1] - times[0] + ring.interval, ring.interval)
+    rss_by_time = {}
+    totals = {}
+    for record_time, index, processes, cpu_ms, rss_kb, read_kb, write_kb, vcs, ivcs in records:
+        group = group_name(ring.names[index] if index < len(ring.names) else OTHER_NAME, by)
+        total = totals.setdefault(group, {'cpu_ms': 0, 'io_kb': 0, 'cs': 0, 'procs': 0})
+        total['cpu_ms'] += cpu_ms
+        total['io_kb'] += read_kb + write_kb
+        total['cs'] += vcs + ivcs
+        rss_at = rss_by_time.setdefault(group, {})
+        rss_at[record_time] = rss_at.get(record_time, 0) + rss_kb
+        if record_time == times[-1]:
+            total['procs'] += processes
+    report = {}
+    for group, total in totals.items():
+        rss_values = list(rss_by_time[group].values())
+        report[group] = {'cpu_pct': total['cpu_ms'] / 10.0 / window, 'rss_mb': sum(rss_values) / len(times) / 1024.0,
+                         'rss_peak_mb': max(rss_values) / 1024.0, 'io_mb': total['io_kb'] / 1024.0, 'cs_per_sec': total['cs'] / window,
+                         'procs': total['procs']}
+    return window, report
+
+
+SORT_KEYS = {'cpu': 'cpu_pct', 'rss': 'rss_mb', 'io': 'io_mb', 'cs': 'cs_per_sec'}
+
+
+def print_top(args):
+    window, report = usage_report(args.ring_file, args.minutes, args.by)
+    print('%s: %d groups over the last %d seconds' % (time.strftime('%Y-%m-%d %H:%M:%S'), len(report), window))
+    print('%7s %9s %9s %9s %8s %5s  %s' % ('CPU%', 'RSS_MB', 'PEAK_MB', 'IO_MB', 'CS/S', 'PROCS', args.by.upper()))
+    rows = sorted(report.items(), key=lambda item: item[1][SORT_KEYS[args.sort]], reverse=True)
+    for group, usage in rows[:args.limit]:
+        print('%7.1f %9.1f %9.1f %9.1f %8.1f %5d  %s' % (usage['cpu_pct'], usage['rss_mb'], usage['rss_peak_mb'], usage['io_mb'], usage['cs_per_sec'], usage['procs'], group))
+    if len(rows) > args.limit:
+        print('%7.1f %9.1f %9s %9.1f %8.1f %5s  (%d more)' % (sum(usage['cpu_pct'] for _, usage in rows[args.limit:]), sum(usage['rss_mb'] for _, usage in rows[args.limit:]),
+              '', sum(usage['io_mb'] for _, usage in rows[args.limit:]), sum(usage['cs_per_sec'] for _, usage in rows[args.limit:]), '', len(rows) - args.limit))
+
+
+def print_summary(args):
+    # One KEY=VALUE per line, with no spaces in the values, like the other lines of uploads_config.txt
+    _, by_key = usage_report(args.ring_file, args.minutes, 'key')
+    _, by_helper = usage_report(args.ring_file, args.minutes, 'helper')
+    _, by_receiver = usage_report(args.ring_file, args.minutes, 'receiver')
+    def top(report, field):
+        rows = sorted(report.items(), key=lambda item: item[1][field], reverse=True)[:args.top]
+        return ','.join('%s:%.1f' % (group.replace(' ', '_'), usage[field]) for group, usage in rows)
+    print('ACCOUNTING_MINUTES=%d' % args.minutes)
+    print('ACCOUNTING_CPU_PCT=%.1f' % sum(usage['cpu_pct'] for usage in by_key.values()))
+    print('ACCOUNTING_RSS_MB=%.1f' % sum(usage['rss_mb'] for usage in by_key.values()))
+    print('ACCOUNTING_TOP_CPU_PCT_HELPERS=%s' % top(by_helper, 'cpu_pct'))
+    print('ACCOUNTING_TOP_CPU_PCT_RECEIVERS=%s' % top(by_receiver, 'cpu_pct'))
+    print('ACCOUNTING_TOP_RSS_MB_HELPERS=%s' % top(by_helper, 'rss_mb'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per daemon and per helper CPU, memory, I/O and context switch accounting of WD')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    daemon_parser = subparsers.add_parser('daemon', help='Sample /proc into the ring file')
+    top_parser = subparsers.add_parser('top', help='Print the usage over the last minutes')
+    summary_parser = subparsers.add_parser('summary', help='Print the usage as KEY=VALUE lines')
+    for sub_parser in (daemon_parser, top_parser, summary_parser):
+        sub_parser.add_argument('--ring-file', required=True)
+    daemon_parser.add_argument('--pid-dir', action='append', required=True, help='Look for *.pid files in this dir and its subdirs')
+    daemon_parser.add_argument('--interval', type=int, default=10)
+    daemon_parser.add_argument('--rescan-secs', type=float, default=60.0, help='Look for new pid files this often, or when a daemon exits')
+    daemon_parser.add_argument('--name-slots', type=int, default=1024)
+    daemon_parser.add_argument('--ring-records', type=int, default=131072)
+    daemon_parser.add_argument('--log-file', default='')
+    daemon_parser.add_argument('-v', '--verbose', action='count', default=0)
+    top_parser.add_argument('--minutes', type=float, default=10.0)
+    top_parser.add_argument('--by', choices=('key', 'helper', 'receiver'), default='key')
+    top_parser.add_argument('--sort', choices=tuple(SORT_KEYS), default='cpu')
+    top_parser.add_argument('--limit', type=int, default=25)
+    top_parser.add_argument('--watch', type=float, default=0.0, help='Print again every this many seconds')
+    summary_parser.add_argument('--minutes', type=float, default=60.0)
+    summary_parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'daemon':
+        set_log_file(args.log_file)
+        wd_utils.verbosity += args.verbose
+        setup_verbosity_traps()
+        Accountant(args).run()
+        return 0
+    try:
+        if args.command == 'summary':
+            print_summary(args)
+            return 0
+        while True:
+            if args.watch:
+                sys.stdout.write('\033[H\033[2J')
+            print_top(args)
+            if not args.watch:
+                return 0
+            sys.stdout.flush()
+            time.sleep(args.watch)
+    except (OSError, ValueError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_archive_manager.py
+# Daemon which manages the space used by the GRAPE wav archive:
+#     wav-archive/<YYYYMMDD>/<CALL_GRID>/<RECEIVER>@<PSWS_ID>/<BAND>/*.wv
+# It keeps an index of the files and bytes of each <DATE>/<CALL_GRID> reporter tree and of whether that tree holds the PSWS
+# 'pswsnetwork_upload_completed' marker.  The index is saved in the archive root, loaded at startup, reconciled with one
+# directory walk in the background, and then updated incrementally by datagrams sent by archive_wav_file() and
+# upload_24hour_wavs_to_grape_drf_server() to 127.0.0.1:PORT:
+#     ADD <FILE_PATH>               a .wv file was added to the archive
+#     DELIVERED <REPORTER_DIR>      the marker was created in that <DATE>/<CALL_GRID> tree
+#     RESCAN                        walk the whole archive again
+#
+# So archive_wav_file() no longer takes a global mutex and runs 'df' for each file.  Instead this daemon calls statvfs()
+# every few seconds and while the file system is more than --fill-percent full it creates the flag file
+# <ROOT>/.wd_archive_full and purges whole reporter trees in background batches of --batch-files deletes:
+# the oldest delivered trees first, then as a last resort the oldest undelivered trees.  The current UTC date and the
+# dates in --preserve-dates (GRAPE_ARCHIVE_PRESERVE_DATES_LIST) are never purged.
+#
+# Usage:
+#     wd_archive_manager.py daemon --root DIR [--port 58032] [--fill-percent 75] [--preserve-dates "20240407 ..."] [--dry-run]
+#     wd_archive_manager.py status --root DIR
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+import wd_utils
+
+INDEX_FILE_NAME = '.wd_archive_index.json'
+FULL_FLAG_FILE_NAME = '.wd_archive_full'
+PSWS_UPLOAD_MARKER = 'pswsnetwork_upload_completed'
+ARCHIVE_FILE_SUFFIXES = ('.wv', '.flac')
+
+
+def file_system_used_percent(path):
+    # Same as the Use% column of 'df':  used / (used + available to non-root)
+    st = os.statvfs(path)
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    return 100.0 * used / (used + avail) if used + avail else 0.0
+
+
+class ArchiveIndex:
+    # {'YYYYMMDD/CALL_GRID': {'files': N, 'bytes': N, 'delivered': bool}}
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.trees = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.purge_order = None             # Cached list of tree keys, rebuilt only when trees are added, removed or delivered
+
+    def tree_key(self, path):
+        rel_path = os.path.relpath(os.path.realpath(path), self.root).split(os.sep)
+        if len(rel_path) < 2 or not rel_path[0].isdigit() or len(rel_path[0]) != 8 or rel_path[0] == '..':
+            return None
+        return rel_path[0] + '/' + rel_path[1]
+
+    def load(self):
+        try:
+            with open(os.path.join(self.root, INDEX_FILE_NAME)) as fp:
+                self.trees = json.load(fp)['trees']
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps({'saved_epoch': int(time.time()), 'trees': self.trees}, indent=1)
+            self.dirty = False
+        tmp_path = os.path.join(self.root, INDEX_FILE_NAME + '.tmp')
+        with open(tmp_path, 'w') as fp:
+            fp.write(data)
+        os.replace(tmp_path, os.path.join(self.root, INDEX_FILE_NAME))
+
+    def scan(self):
+        trees = {}
+        for date_name in os.listdir(self.root):
+            date_path = os.path.join(self.root, date_name)
+            if not (len(date_name) == 8 and date_name.isdigit() and os.path.isdir(date_path)):
+                continue
+            for reporter_name in os.listdir(date_path):
+                reporter_path = os.path.join(date_path, reporter_name)
+                if not os.path.isdir(reporter_path):
+                    continue
+                tree = {'files': 0, 'bytes': 0, 'delivered': os.path.exists(os.path.join(reporter_path, PSWS_UPLOAD_MARKER))}
+                for dir_path, _, file_names in os.walk(reporter_path):
+                    for file_name in file_names:
+                        if file_name.endswith(ARCHIVE_FILE_SUFFIXES):
+                            try:
+                                tree['bytes'] += os.lstat(os.path.join(dir_path, file_name)).st_size
+                                tree['files'] += 1
+                            except OSError:
+                                pass
+                trees[date_name + '/' + reporter_name] = tree
+        with self.lock:
+            self.trees = trees
+            self.dirty = True
+            self.purge_order = None
+        return trees
+
+    def add_file(self, path):
+        key = self.tree_key(path)
+        if key is None:
+            return False
+        try:
+            size = os.lstat(path).st_size
+        except OSError:
+            return False
+        with self.lock:
+            if key not in self.trees:
+                self.trees[key] = {'files': 0, 'bytes': 0, 'delivered': False}
+                self.purge_order = None
+            self.trees[key]['files'] += 1
+            self.trees[key]['bytes'] += size
+            self.dirty = True
+        return True
+
+    def set_delivered(self, reporter_dir):
+        key = self.tree_key(os.path.join(reporter_dir, PSWS_UPLOAD_MARKER))
+        with self.lock:
+            if key is None or key not in self.trees:
+                return False
+            self.trees[key]['delivered'] = True
+            self.dirty = True
+            self.purge_order = None
+        return True
+
+    def removed_files(self, key, files, size):
+        with self.lock:
+            tree = self.trees.get(key)
+            if tree:
+                tree['files'] = max(0, tree['files'] - files)
+                tree['bytes'] = max(0, tree['bytes'] - size)
+                self.dirty = True
+
+    def remove_tree(self, key):
+        with self.lock:
+            self.trees.pop(key, None)
+            self.dirty = True
+            self.purge_order = None
+
+    def next_to_purge(self, preserve_dates):
+        # The oldest delivered tree, else the oldest undelivered tree.  Never today's or a preserved date's trees
+        today = time.strftime('%Y%m%d', time.gmtime())
+        with self.lock:
+            if self.purge_order is None:
+                candidates = [key for key in self.trees if key[:8] != today and key[:8] not in preserve_dates]
+                self.purge_order = sorted(candidates, key=lambda key: (not self.trees[key]['delivered'], key))
+            while self.purge_order and (self.purge_order[0] not in self.trees or self.purge_order[0][:8] == today):
+                self.purge_order.pop(0)
+            if not self.purge_order:
+                return None, None
+            key = self.purge_order[0]
+            return key, dict(self.trees[key])
+
+
+class ArchiveManager:
+    def __init__(self, args):
+        self.args = args
+        self.root = os.path.realpath(args.root)
+        self.index = ArchiveIndex(self.root)
+        self.flag_path = os.path.join(self.root, FULL_FLAG_FILE_NAME)
+        self.preserve_dates = set(args.preserve_dates.split())
+        self.used_percent = 0.0
+        self.purge_thread = None
+        self.scan_thread = None
+        self.last_scan = 0.0
+        self.nothing_to_purge_logged = False
+        self.dry_run_logged_key = None
+
+    def start_scan(self):
+        if self.scan_thread and self.scan_thread.is_alive():
+            return
+        self.last_scan = time.time()
+
+        def scan():
+            start = time.perf_counter()
+            trees = self.index.scan()
+            wd_logger(1, 'Indexed %d reporter trees holding %d files in %.1f seconds' %
+                      (len(trees), sum(tree['files'] for tree in trees.values()), time.perf_counter() - start))
+        self.scan_thread = threading.Thread(target=scan, daemon=True)
+        self.scan_thread.start()
+
+    def set_full_flag(self, full):
+        if full and not os.path.exists(self.flag_path):
+            with open(self.flag_path, 'w') as fp:
+                fp.write('%.1f\n' % self.used_percent)
+        elif not full and os.path.exists(self.flag_path):
+            os.remove(self.flag_path)
+
+    def check_space(self):
+        self.used_percent = file_system_used_percent(self.root)
+        if self.used_percent < self.args.fill_percent:
+            self.set_full_flag(False)
+            return
+        self.set_full_flag(True)
+        if self.purge_thread and self.purge_thread.is_alive():
+            return
+        if self.scan_thread and self.scan_thread.is_alive():
+            return                              # Don't choose what to purge from a stale index
+        self.purge_thread = threading.Thread(target=self.purge, daemon=True)
+        self.purge_thread.start()
+
+    def purge(self):
+        # Delete whole reporter trees until the file system is below (fill_percent - hysteresis) percent full
+        low_water = self.args.fill_percent - self.args.hysteresis_percent
+        if self.args.dry_run:
+            key, tree = self.index.next_to_purge(self.preserve_dates)
+            if key != self.dry_run_logged_key:
+                wd_logger(1, 'Would purge %s tree %s with %d files and %d MB' % ('delivered' if tree['delivered'] else 'UNDELIVERED', key, tree['files'], tree['bytes'] // 1000000)
+                          if key else 'There are no trees which could be purged')
+                self.dry_run_logged_key = key
+            return
+        while file_system_used_percent(self.root) >= low_water:
+            key, tree = self.index.next_to_purge(self.preserve_dates)
+            if key is None:
+                if not self.nothing_to_purge_logged:
+                    wd_logger(1, 'ERROR: the archive is %.1f%% full, but there are no trees left to purge other than today and the preserved dates' % file_system_used_percent(self.root))
+                    self.nothing_to_purge_logged = True
+                return
+            self.nothing_to_purge_logged = False
+            if not tree['delivered']:
+                wd_logger(1, 'WARNING: no delivered trees are left to purge, so purging UNDELIVERED tree %s. This site is not keeping up with PSWS uploads' % key)
+            wd_logger(1, 'Purging tree %s with %d files and %d MB' % (key, tree['files'], tree['bytes'] // 1000000))
+            self.purge_tree(key)
+        self.used_percent = file_system_used_percent(self.root)
+        self.set_full_flag(self.used_percent >= self.args.fill_percent)
+
+    def purge_tree(self, key):
+        tree_path = os.path.join(self.root, key)
+        batch = []
+        for dir_path, _, file_names in os.walk(tree_path):
+            batch += [os.path.join(dir_path, file_name) for file_name in file_names]
+            while len(batch) >= self.args.batch_files:
+                self.delete_batch(key, batch[:self.args.batch_files])
+                batch = batch[self.args.batch_files:]
+        self.delete_batch(key, batch)
+        for dir_path, _, _ in sorted(os.walk(tree_path), key=lambda walk: walk[0], reverse=True):
+            try:
+                os.rmdir(dir_path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(os.path.dirname(tree_path))    # The date directory, if this was its last tree
+        except OSError:
+            pass
+        self.index.remove_tree(key)
+
+    def delete_batch(self, key, paths):
+        files = size = 0
+        for path in paths:
+            try:
+                file_size = os.lstat(path).st_size
+                os.unlink(path)
+            except OSError:
+                continue
+            if path.endswith(ARCHIVE_FILE_SUFFIXES):
+                files += 1
+                size += file_size
+        self.index.removed_files(key, files, size)
+        time.sleep(self.args.batch_pause)           # Let the recording and decoding daemons at the disk between batches
+
+    def handle_message(self, message):
+        fields = message.split(None, 1)
+        if not fields:
+            return
+        if fields[0] == 'ADD' and len(fields) == 2:
+            if not self.index.add_file(fields[1].strip()):
+                wd_logger(1, "ERROR: can't index '%s'" % fields[1].strip())
+        elif fields[0] == 'DELIVERED' and len(fields) == 2:
+            if not self.index.set_delivered(fields[1].strip()):
+                wd_logger(1, "ERROR: can't find tree '%s' in the index" % fields[1].strip())
+        elif fields[0] == 'RESCAN':
+            self.start_scan()
+        else:
+            wd_logger(1, "ERROR: unknown message '%s'" % message)
+
+    def run(self):
+        os.makedirs(self.root, exist_ok=True)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', self.args.port))
+        sock.settimeout(self.args.statvfs_secs)
+        if self.index.load():
+            wd_logger(1, 'Loaded the index of %d reporter trees from %s' % (len(self.index.trees), INDEX_FILE_NAME))
+        self.start_scan()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))      # So 'wd -z' saves the index below
+        try:
+            self.serve(sock)
+        finally:
+            self.index.save()
+
+    def serve(self, sock):
+        last_check = last_save = 0.0
+        while True:
+            try:
+                data, _ = sock.recvfrom(4096)
+                for message in data.decode(errors='replace').splitlines():
+                    self.handle_message(message)
+            except socket.timeout:
+                pass
+            now = time.time()
+            if now - last_check >= self.args.statvfs_secs:
+                self.check_space()
+                last_check = now
+            if now - last_save >= 60:
+                self.index.save()
+                last_save = now
+            if now - self.last_scan >= self.args.rescan_hours * 3600:
+                self.start_scan()
+
+
+def cmd_status(args):
+    index = ArchiveIndex(os.path.realpath(args.root))
+    if not index.load():
+        print("No index found in '%s'" % args.root)
+        return 1
+    used_percent = file_system_used_percent(index.root)
+    total_bytes = sum(tree['bytes'] for tree in index.trees.values())
+    print('%s: %.1f%% full, %s, index holds %d trees with %d MB' % (index.root, used_percent,
+          'FULL flag set' if os.path.exists(os.path.join(index.root, FULL_FLAG_FILE_NAME)) else 'FULL flag not set', len(index.trees), total_bytes // 1000000))
+    for key in sorted(index.trees):
+        tree = index.trees[key]
+        print('    %-40s %7d files %9d MB  %s' % (key, tree['files'], tree['bytes'] // 1000000, 'delivered' if tree['delivered'] else 'undelivered'))
+    key, _ = index.next_to_purge(set(args.preserve_dates.split()))
+    print('Next tree to purge: %s' % (key or 'none'))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep the GRAPE wav archive below a fill threshold')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    daemon_parser = subparsers.add_parser('daemon')
+    status_parser = subparsers.add_parser('status')
+    for sub_parser in (daemon_parser, status_parser):
+        sub_parser.add_argument('--root', required=True, help='Root directory of the wav archive')
+        sub_parser.add_argument('--preserve-dates', default='', help='Space separated list of YYYYMMDD dates which are never purged')
+    daemon_parser.add_argument('--port', type=int, default=58032)
+    daemon_parser.add_argument('--fill-percent', type=float, default=75.0, help='Purge when the file system is this full')
+    daemon_parser.add_argument('--hysteresis-percent', type=float, default=2.0, help='Purge until the file system is this much below --fill-percent')
+    daemon_parser.add_argument('--statvfs-secs', type=float, default=5.0)
+    daemon_parser.add_argument('--rescan-hours', type=float, default=6.0)
+    daemon_parser.add_argument('--batch-files', type=int, default=1000)
+    daemon_parser.add_argument('--batch-pause', type=float, default=0.1)
+    daemon_parser.add_argument('--dry-run', action='store_true', help="Log what would be purged, but don't delete anything")
+    daemon_parser.add_argument('--log-file', default='')
+    daemon_parser.add_argument('-v', '--verbose', action='count', default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        return cmd_status(args)
+    set_log_file(args.log_file)
+    wd_utils.verbosity += args.verbose
+    setup_verbosity_traps()
+    wd_logger(1, 'Starting with fill threshold %.1f%%, preserving dates: %s' % (args.fill_percent, args.preserve_dates or 'none'))
+    ArchiveManager(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
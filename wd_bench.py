@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_bench.py
+# Reproducible offline benchmark of the Python signal processing tools run by WD:
+#     c2_noise.py, wav_window.py, wwv_start.py, get-peak-wav-sample.py, derived_calc_2.py and wav2grape.py
+#
+# 'gen' creates deterministic synthetic inputs (same seed => same bytes):
+#     a wsprd -c C2 file of gaussian noise with a known noise floor, a 2 minute 12 kHz wav file, 3 seconds of WWV IQ with a
+#     1 kHz tone burst starting at a known offset, and a wav2grape tree of 24 hour 10 Hz IQ files for each WWV/CHU subchannel
+# 'run' times each tool both cold (a new python3 process, as WD runs them) and warm (the tool run again inside an already
+# started python process), then reports wall time, throughput and peak RSS and compares them against a saved baseline.
+# Tools which wd_py.py can run are also timed in 'pool' mode, i.e. 'wd-py TOOL ARGS' dispatched to a private pool of pre-forked
+# interpreters, so the cold - pool difference is the python startup and import time which WD_PY_POOL="yes" saves on each run.
+# In pool mode RSS_MB is that of the wd-py client, since the helper runs in the pool's worker.
+#
+# Usage:
+#     wd_bench.py gen  [--fixtures-dir DIR] [--seed N]
+#     wd_bench.py run  [--fixtures-dir DIR] [--tools c2_noise,...] [--repeat N] [--baseline FILE] [--save-baseline] [--threshold 0.25] [--no-pool]
+# 'run' exits with 1 if any tool is more than THRESHOLD slower, or uses that much more memory, than in the baseline
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import runpy
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+from wd_py import WD_PY_HELPERS
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = '/tmp/wd_bench_fixtures'
+BASELINE_FILE = os.path.join(WD_ROOT_DIR, 'wd_bench_baseline.json')
+FIXTURES_VERSION = 1
+
+C2_SAMPLES = 45000                  # 120 seconds at 375 sps, as written by 'wsprd -c'
+C2_NOISE_SIGMA = 0.01               # Per I and Q component
+WAV_RATE = 12000
+WAV_SECONDS = 120
+WAV_NOISE_SIGMA = 300.0             # In 16 bit counts, i.e. about -40 dBFS
+WWV_IQ_RATE = 16000
+WWV_IQ_SECONDS = 3
+WWV_TONE_OFFSET_MS = 100.0          # wwv_start.py should report this offset
+GRAPE_RATE = 10
+GRAPE_SECONDS = 24 * 3600
+GRAPE_SUBCHANNELS = ('WWV_2_5', 'WWV_5', 'WWV_10', 'WWV_15', 'WWV_20', 'WWV_25', 'CHU_3', 'CHU_7', 'CHU_14')
+GRAPE_RECEIVER_PATH = '20261019/AI6VN_CM87xj/KA9Q_0_WWV_IQ@S000123_456'
+
+
+def fixture_paths(fixtures_dir):
+    return {
+        'c2': os.path.join(fixtures_dir, '261019_1200.c2'),
+        'wav': os.path.join(fixtures_dir, '261019_1200.wav'),
+        'wwv_iq': os.path.join(fixtures_dir, '20261019T120100Z_5000000_iq.wav'),
+        'grape_dir': os.path.join(fixtures_dir, 'grape', GRAPE_RECEIVER_PATH),
+        'manifest': os.path.join(fixtures_dir, 'manifest.json'),
+    }
+
+
+def write_wav(path, rate, int16_samples, channels=1):
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(int16_samples.astype('<i2').tobytes())
+
+
+def generate_fixtures(fixtures_dir, seed):
+    import numpy as np
+    paths = fixture_paths(fixtures_dir)
+    manifest = {'version': FIXTURES_VERSION, 'seed': seed}
+    try:
+        with open(paths['manifest']) as fp:
+            if json.load(fp) == manifest:
+                print("Fixtures in '%s' are up to date" % fixtures_dir)
+                return paths
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(fixtures_dir, ignore_errors=True)
+    os.makedirs(fixtures_dir)
+    rng = np.random.default_rng(seed)
+
+    # C2 file: the 26 byte header which c2_noise.py unpacks with '<14sid', then interleaved float32 I/Q
+    iq = rng.normal(0.0, C2_NOISE_SIGMA, 2 * C2_SAMPLES).astype(np.float32)
+    with open(paths['c2'], 'wb') as fp:
+        fp.write(struct.pack('<14sid', b'261019_1200.c2', 2, 14.0956))
+        fp.write(iq.tobytes())
+
+    # 2 minute 12 kHz wav of noise plus a -20 dBFS carrier at 1500 Hz
+    t = np.arange(WAV_RATE * WAV_SECONDS) / WAV_RATE
+    audio = rng.normal(0.0, WAV_NOISE_SIGMA, t.size) + 3276.0 * np.sin(2 * np.pi * 1500.0 * t)
+    write_wav(paths['wav'], WAV_RATE, np.clip(np.round(audio), -32768, 32767))
+
+    # WWV IQ: AM carrier whose envelope carries the 0.8 second 1 kHz second marker starting WWV_TONE_OFFSET_MS into the file
+    t = np.arange(WWV_IQ_RATE * WWV_IQ_SECONDS) / WWV_IQ_RATE
+    envelope = np.ones(t.size)
+    burst = (t >= WWV_TONE_OFFSET_MS / 1000.0) & (t < WWV_TONE_OFFSET_MS / 1000.0 + 0.8)
+    envelope[burst] += 0.5 * np.sin(2 * np.pi * 1000.0 * (t[burst] - WWV_TONE_OFFSET_MS / 1000.0))
+    carrier = 8000.0 * envelope * np.exp(2j * np.pi * 10.0 * t)
+    carrier += rng.normal(0.0, 200.0, t.size) + 1j * rng.normal(0.0, 200.0, t.size)
+    write_wav(paths['wwv_iq'], WWV_IQ_RATE, np.round(np.column_stack((carrier.real, carrier.imag))), channels=2)
+
+    # wav2grape tree:  <base>/<YYYYMMDD>/<CALL_GRID>/<RECEIVER>@<PSWS_ID>/<SUBCHANNEL>/<24 hour 10 Hz IQ>.wav
+    for subchannel in GRAPE_SUBCHANNELS:
+        subchannel_dir = os.path.join(paths['grape_dir'], subchannel)
+        os.makedirs(subchannel_dir)
+        iq = rng.normal(0.0, 1000.0, (GRAPE_RATE * GRAPE_SECONDS, 2))
+        write_wav(os.path.join(subchannel_dir, '20261019T000000Z_%s_iq.wav' % subchannel), GRAPE_RATE, np.round(iq), channels=2)
+
+    with open(paths['manifest'], 'w') as fp:
+        json.dump(manifest, fp)
+    print("Created fixtures in '%s' from seed %d" % (fixtures_dir, seed))
+    return paths
+
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+# Each tool: the script, the modules it needs, the input fixture whose size is used for throughput, and a function
+# returning its argv (called before each run so tools which write an output can be given a fresh output path)
+def grape_argv(paths, out_dir):
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    return ['-c', os.path.join(WD_ROOT_DIR, 'wav2grape.conf'), '-i', paths['grape_dir'], '-o', out_dir]
+
+
+TOOLS = {
+    'c2_noise': ('c2_noise.py', ('numpy',), 'c2', lambda p, out: [p['c2']]),
+    'wav_window': ('wav_window.py', ('numpy', 'scipy'), 'wav', lambda p, out: [p['wav'], os.path.join(out, 'windowed.wav')]),
+    'wwv_start': ('wwv_start.py', ('numpy', 'scipy', 'soundfile'), 'wwv_iq', lambda p, out: [p['wwv_iq']]),
+    'get_peak_wav_sample': ('get-peak-wav-sample.py', ('numpy', 'soundfile'), 'wav', lambda p, out: [p['wav']]),
+    'derived_calc_2': ('derived_calc_2.py', ('numpy',), None, lambda p, out: ['FN42ab', 'CM87xj', '14.097100', os.path.join(out, 'azi.csv')]),
+    'derived_calc': ('derived_calc.py', ('numpy',), None, lambda p, out: ['FN42ab', 'CM87xj', '14.097100']),
+    'suntimes': ('suntimes.py', (), None, lambda p, out: ['37.40', '-122.04']),
+    'wav2grape': ('wav2grape.py', ('numpy', 'soundfile', 'digital_rf'), 'grape_dir', grape_argv),
+}
+
+
+def missing_modules(modules):
+    return [module for module in modules if importlib.util.find_spec(module) is None]
+
+
+# A child process's ru_maxrss starts from the RSS high-water mark of the process which forked it, which is carried over by exec.
+# So each tool is started by this small launcher rather than by wd_bench.py, whose RSS grows with the fixtures it has made,
+# and the launcher writes the tool's 'EXIT_CODE WALL_SECS CPU_SECS MAXRSS_KB' to the pipe fd given as its first argument
+RSS_LAUNCHER = """
+import os, sys, time
+report_fd = int(sys.argv[1])
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.close(report_fd)
+    try:
+        os.execvp(sys.argv[2], sys.argv[2:])
+    except OSError as err:
+        os.write(2, ('ERROR: %s: %s\\n' % (sys.argv[2], err)).encode())
+    os._exit(127)
+_, status, rusage = os.wait4(pid, 0)
+wall = time.perf_counter() - start
+os.write(report_fd, ('%d %.6f %.6f %d' % (os.waitstatus_to_exitcode(status), wall, rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss)).encode())
+"""
+
+
+def run_child(cmd, cwd=None, env=None):
+    # Returns (exit code, wall seconds, CPU seconds, peak RSS KB, stdout, stderr) of cmd, measured by RSS_LAUNCHER with wait4() so only that child is counted.
+    # The launcher's own ~9 MB is the floor of the peak RSS, which is below that of any python tool
+    report_read_fd, report_write_fd = os.pipe()
+    with tempfile.TemporaryFile() as stderr_fp, os.fdopen(report_read_fd, 'rb') as report_fp:
+        try:
+            proc = subprocess.Popen([sys.executable, '-S', '-I', '-c', RSS_LAUNCHER, str(report_write_fd)] + cmd, stdout=subprocess.PIPE, stderr=stderr_fp,
+                                    cwd=cwd, env=env, pass_fds=(report_write_fd,))
+        finally:
+            os.close(report_write_fd)
+        stdout = proc.stdout.read()
+        proc.stdout.close()
+        proc.wait()
+        report = report_fp.read().split()
+        stderr_fp.seek(0)
+        stderr = stderr_fp.read().decode(errors='replace')
+    if len(report) != 4:
+        return proc.returncode or 1, 0.0, 0.0, 0, stdout.decode(errors='replace'), stderr
+    return int(report[0]), float(report[1]), float(report[2]), int(report[3]), stdout.decode(errors='replace'), stderr
+
+
+def last_line(text):
+    lines = text.strip().splitlines()
+    return lines[-1] if lines else ''
+
+
+def warm_runs(tool, fixtures_dir, repeat):
+    # Runs in a child 'wd_bench.py _warm' process:  run the tool once to load its modules, then time 'repeat' more runs
+    script, _, _, argv_func = TOOLS[tool]
+    paths = fixture_paths(fixtures_dir)
+    out_dir = os.path.join(fixtures_dir, 'out_warm_' + tool)
+    os.makedirs(out_dir, exist_ok=True)
+    os.chdir(out_dir)                   # derived_calc.py writes its output to the cwd
+    script_path = os.path.join(WD_ROOT_DIR, script)
+    times = []
+    for i in range(repeat + 1):
+        sys.argv = [script_path] + argv_func(paths, out_dir)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            try:
+                runpy.run_path(script_path, run_name='__main__')
+            except SystemExit as err:
+                if err.code not in (None, 0):
+                    raise
+        if i > 0:
+            times.append(time.perf_counter() - start)
+    print(json.dumps(times))
+
+
+@contextlib.contextmanager
+def private_pool(fixtures_dir):
+    # Yields the environment for running 'wd-py' against a wd_py.py pool on a private socket, or None if the pool didn't start
+    socket_path = os.path.join(fixtures_dir, 'wd_py.sock')
+    pool = subprocess.Popen([sys.executable, os.path.join(WD_ROOT_DIR, 'wd_py.py'), 'serve', '--socket', socket_path, '--workers', '2'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(300):
+            if os.path.exists(socket_path) or pool.poll() is not None:
+                break
+            time.sleep(0.1)
+        yield dict(os.environ, WD_PY_POOL_SOCKET=socket_path) if os.path.exists(socket_path) else None
+    finally:
+        pool.terminate()
+        pool.wait()
+
+
+def bench_tool(tool, fixtures_dir, repeat, pool_env=None):
+    script, modules, fixture, argv_func = TOOLS[tool]
+    missing = missing_modules(modules)
+    if missing:
+        return {'skipped': 'missing module(s) %s' % ', '.join(missing)}
+    paths = fixture_paths(fixtures_dir)
+    out_dir = os.path.join(fixtures_dir, 'out_cold_' + tool)
+    os.makedirs(out_dir, exist_ok=True)
+    input_bytes = dir_size(paths[fixture]) if fixture else 0
+
+    cold_walls = []
+    cold_rss = cold_cpu = 0
+    output = ''
+    for _ in range(repeat):
+        rc, wall, cpu, rss_kb, output, errors = run_child([sys.executable, os.path.join(WD_ROOT_DIR, script)] + argv_func(paths, out_dir), cwd=out_dir)
+        if rc != 0:
+            return {'skipped': '%s exited with %d: %s' % (script, rc, last_line(errors))}
+        cold_walls.append(wall)
+        cold_cpu = max(cold_cpu, cpu)
+        cold_rss = max(cold_rss, rss_kb)
+
+    rc, _, _, warm_rss, warm_stdout, errors = run_child([sys.executable, os.path.abspath(__file__), '_warm', tool, '--fixtures-dir', fixtures_dir, '--repeat', str(repeat)])
+    if rc != 0:
+        return {'skipped': 'warm runs of %s failed: %s' % (script, last_line(errors))}
+    warm_walls = json.loads(warm_stdout)
+
+    modes = [('cold', cold_walls, cold_rss), ('warm', warm_walls, warm_rss)]
+    if pool_env and tool in WD_PY_HELPERS:
+        pool_walls = []
+        pool_rss = 0
+        for _ in range(repeat):
+            rc, wall, _, rss_kb, _, errors = run_child([os.path.join(WD_ROOT_DIR, 'wd-py'), tool] + argv_func(paths, out_dir), cwd=out_dir, env=pool_env)
+            if rc != 0:
+                return {'skipped': "'wd-py %s' exited with %d: %s" % (tool, rc, last_line(errors))}
+            pool_walls.append(wall)
+            pool_rss = max(pool_rss, rss_kb)
+        modes.append(('pool', pool_walls, pool_rss))
+
+    result = {'input_bytes': input_bytes, 'output': last_line(output)}
+    for mode, walls, rss_kb in modes:
+        result[mode] = {'wall_median': statistics.median(walls), 'wall_min': min(walls), 'rss_kb': rss_kb}
+    result['cold']['cpu_max'] = cold_cpu
+    return result
+
+
+def print_results(results, baseline, threshold):
+    regressions = []
+    print('%-20s %-5s %9s %9s %9s %9s %8s  %s' % ('TOOL', 'MODE', 'MEDIAN_S', 'MIN_S', 'MB/S', 'RSS_MB', 'VS_BASE', 'OUTPUT'))
+    for tool, result in results.items():
+        if 'skipped' in result:
+            print('%-20s skipped: %s' % (tool, result['skipped']))
+            continue
+        for mode in ('cold', 'warm', 'pool'):
+            if mode not in result:
+                continue
+            stats = result[mode]
+            mb_per_sec = result['input_bytes'] / 1e6 / stats['wall_median'] if result['input_bytes'] else 0.0
+            vs_base = ''
+            base_stats = baseline.get(tool, {}).get(mode)
+            if base_stats:
+                wall_ratio = stats['wall_median'] / base_stats['wall_median']
+                rss_ratio = stats['rss_kb'] / max(base_stats['rss_kb'], 1)
+                vs_base = '%+7.0f%%' % ((wall_ratio - 1.0) * 100)
+                if wall_ratio > 1.0 + threshold:
+                    regressions.append('%s %s wall time %.3f s is %.0f%% more than the baseline %.3f s' % (tool, mode, stats['wall_median'], (wall_ratio - 1) * 100, base_stats['wall_median']))
+                if rss_ratio > 1.0 + threshold:
+                    regressions.append('%s %s peak RSS %.1f MB is %.0f%% more than the baseline %.1f MB' % (tool, mode, stats['rss_kb'] / 1024, (rss_ratio - 1) * 100, base_stats['rss_kb'] / 1024))
+            print('%-20s %-5s %9.3f %9.3f %9.1f %9.1f %8s  %s' % (tool, mode, stats['wall_median'], stats['wall_min'], mb_per_sec, stats['rss_kb'] / 1024.0,
+                  vs_base, result['output'] if mode == 'cold' else ''))
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark of the WD Python signal processing tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    gen_parser = subparsers.add_parser('gen', help='Create the synthetic input files')
+    run_parser = subparsers.add_parser('run', help='Time the tools and compare with the baseline')
+    warm_parser = subparsers.add_parser('_warm')
+    for sub_parser in (gen_parser, run_parser, warm_parser):
+        sub_parser.add_argument('--fixtures-dir', default=FIXTURES_DIR)
+    gen_parser.add_argument('--seed', type=int, default=20261019)
+    run_parser.add_argument('--seed', type=int, default=20261019)
+    run_parser.add_argument('--tools', default=','.join(TOOLS), help='Comma separated list from: %s' % ', '.join(TOOLS))
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--baseline', default=BASELINE_FILE)
+    run_parser.add_argument('--save-baseline', action='store_true', help='Save these results as the new baseline')
+    run_parser.add_argument('--threshold', type=float, default=0.25, help='Fractional slow down or RSS growth reported as a regression')
+    run_parser.add_argument('--no-pool', action='store_true', help="Don't also time the tools run by a wd_py.py pool")
+    warm_parser.add_argument('tool', choices=TOOLS)
+    warm_parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == '_warm':
+        warm_runs(args.tool, args.fixtures_dir, args.repeat)
+        return 0
+    generate_fixtures(args.fixtures_dir, args.seed)
+    if args.command == 'gen':
+        return 0
+
+    tools = args.tools.split(',')
+    for tool in tools:
+        if tool not in TOOLS:
+            print("Unknown tool '%s'" % tool, file=sys.stderr)
+            return 2
+    results = {}
+    with (contextlib.nullcontext() if args.no_pool else private_pool(args.fixtures_dir)) as pool_env:
+        if not args.no_pool and pool_env is None:
+            print("Can't start a wd_py.py pool, so the tools are not timed in pool mode", file=sys.stderr)
+        for tool in tools:
+            results[tool] = bench_tool(tool, args.fixtures_dir, args.repeat, pool_env)
+
+    baseline = {}
+    try:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp).get('tools', {})
+    except (OSError, ValueError):
+        pass
+    print('python %s, numpy %s, %s' % (platform.python_version(), __import__('numpy').__version__, platform.node()))
+    regressions = print_results(results, baseline, args.threshold)
+    if args.save_baseline:
+        baseline.update({tool: result for tool, result in results.items() if 'skipped' not in result})
+        with open(args.baseline, 'w') as fp:
+            json.dump({'python': platform.python_version(), 'tools': baseline}, fp, indent=1)
+        print("Saved baseline to '%s'" % args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
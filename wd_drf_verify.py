@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_drf_verify.py
+# Reads back the Digital RF dataset which wav2grape.py wrote from a receiver dir and checks it against the 24_hour_10sps_iq.wav
+# files it was made from, so that a corrupt or short dataset is found before it is uploaded rather than by the PSWS server:
+#   - the channel's properties:  num_subchannels, sample rate and complex-ness match the band wav files
+#   - the bounds:  the first sample is 00:00 UTC of the dataset's date and the sample count is that of the wav files
+#   - continuity:  the channel is one continuous block, else each missing range is reported
+#   - the metadata:  center_frequencies are those of the band dirs in wav2grape.conf
+#   - the samples:  each subchannel is read in --chunk-secs chunks and its CRC32 is compared with that of the same samples of its wav file
+# It also reports, to the sample, each run of all-zero samples of at least --min-gap-secs in a subchannel, and whether that run
+# covers minutes which grape_wv_archive_check.py or grape_repair_band_bad_compressed_files() filled with one-minute-silent-float.wv.
+#
+# Only one chunk of each dataset is in memory at a time, and the datasets are checked in a process pool.
+# Each dataset is given as RECEIVER_DIR:DATASET_DIR, or as DATASET_DIR alone to check it without its wav files.
+# Prints one 'OK' or 'FAIL' line per dataset and exits with 1 if any dataset failed.
+#
+# Usage:
+#     wd_drf_verify.py [-c wav2grape.conf] [--jobs N] [--chunk-secs 3600] [--min-gap-secs 1] [--json FILE] RECEIVER_DIR:DATASET_DIR ...
+
+import argparse
+import json
+import os
+import re
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser, Error as ConfigParserError
+from datetime import datetime, timezone
+
+import numpy as np
+
+from grape_wv_archive_check import SILENT_WV_FILE_PATH, WV_FILE_REGEX
+from wd_wav_assemble import WavFile, WavFormatError
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+WAV2GRAPE_CONF_PATH = os.path.join(WD_ROOT_DIR, 'wav2grape.conf')
+OBS_DIR_REGEX = re.compile(r'^OBS(\d{4}-\d{2}-\d{2}T\d{2}-\d{2})$')
+DATE_DIR_REGEX = re.compile(r'^\d{8}$')
+
+
+def dataset_start_time(receiver_dir, dataset_dir):
+    # The UTC epoch of the first sample, from the OBS<YYYY-MM-DD>T<HH-MM> name wav2grape.py gave the dataset or else from the receiver dir's date
+    match = OBS_DIR_REGEX.match(os.path.basename(os.path.normpath(dataset_dir)))
+    if match:
+        return datetime.strptime(match.group(1), '%Y-%m-%dT%H-%M').replace(tzinfo=timezone.utc).timestamp()
+    for path_element in (receiver_dir or '').split(os.path.sep):
+        if DATE_DIR_REGEX.match(path_element):
+            return datetime.strptime(path_element, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp()
+    return None
+
+
+def source_subchannels(receiver_dir, subdir2freq):
+    # [(band, wav file path, freq)] in the order in which wav2grape.py's get_subchannels() gave them to digital_rf
+    subchannels = []
+    for subdir in os.listdir(receiver_dir):
+        wav_files = [name for name in os.listdir(os.path.join(receiver_dir, subdir)) if name.endswith('.wav')] if subdir in subdir2freq else []
+        if len(wav_files) == 1:
+            subchannels.append((subdir, os.path.join(receiver_dir, subdir, wav_files[0]), float(subdir2freq[subdir])))
+    subchannels.sort(key=lambda subchannel: subchannel[2])
+    return subchannels
+
+
+def silence_minutes(band_dir):
+    # The minutes of the day which were filled by a link to one-minute-silent-float.wv
+    minutes = set()
+    for name in os.listdir(band_dir):
+        match = WV_FILE_REGEX.match(name)
+        path = os.path.join(band_dir, name)
+        if match and os.path.islink(path) and os.path.basename(os.readlink(path)) == os.path.basename(SILENT_WV_FILE_PATH):
+            minutes.add(int(match.group(2)) * 60 + int(match.group(3)))
+    return minutes
+
+
+def plain_samples(raw):
+    # A [samples][1 or 2] array of the values of one subchannel as read by read_vector_raw(), whose complex samples may be an ('r', 'i') record
+    if raw.dtype.names:
+        return np.stack([raw[name] for name in raw.dtype.names], axis=1)
+    if np.iscomplexobj(raw):
+        return np.stack([raw.real, raw.imag], axis=1)
+    return raw.reshape(-1, 1)
+
+
+class ZeroRuns:
+    # Finds the runs of all-zero samples of one subchannel across the chunks in which it is read
+    def __init__(self):
+        self.open_start = None
+        self.runs = []                      # [(first sample, last sample + 1)]
+
+    def add(self, is_zero, first_sample):
+        edges = np.diff(np.concatenate(([0], is_zero.astype(np.int8), [0])))
+        starts = list(np.flatnonzero(edges == 1))
+        ends = list(np.flatnonzero(edges == -1))
+        if self.open_start is not None:
+            if starts and starts[0] == 0:
+                starts[0] = self.open_start - first_sample
+            else:
+                self.runs.append((self.open_start, first_sample))
+        self.open_start = None
+        if ends and ends[-1] == len(is_zero):
+            self.open_start = first_sample + starts.pop()
+            ends.pop()
+        self.runs += [(first_sample + int(start), first_sample + int(end)) for start, end in zip(starts, ends)]
+
+    def close(self, end_sample):
+        if self.open_start is not None:
+            self.runs.append((self.open_start, end_sample))
+            self.open_start = None
+        return self.runs
+
+
+def verify_dataset(job):
+    # Returns a report dict of one RECEIVER_DIR:DATASET_DIR job
+    receiver_dir, dataset_dir, conf_path, chunk_secs, min_gap_secs = job
+    report = {'dataset': dataset_dir, 'receiver_dir': receiver_dir, 'errors': [], 'warnings': [], 'gaps': []}
+    errors = report['errors']
+    config = ConfigParser(interpolation=None)
+    config.optionxform = str
+    try:
+        if not config.read(conf_path):
+            errors.append("can't read %s" % conf_path)
+            return report
+        channel_name = config['global']['channel name']
+    except KeyError as err:
+        errors.append("%s has no [global] 'channel name': missing %s" % (conf_path, err))
+        return report
+    except ConfigParserError as err:
+        errors.append("can't parse %s: %s" % (conf_path, err))
+        return report
+    try:
+        import digital_rf as drf
+    except ImportError:
+        errors.append('the digital_rf python package is not installed')
+        return report
+    try:
+        reader = drf.DigitalRFReader(dataset_dir)
+        if channel_name not in reader.get_channels():
+            errors.append("has no channel '%s'" % channel_name)
+            return report
+        properties = reader.get_properties(channel_name)
+        first_sample, last_sample = reader.get_bounds(channel_name)
+        blocks = reader.get_continuous_blocks(first_sample, last_sample, channel_name)
+    except (OSError, ValueError, KeyError) as err:
+        errors.append("can't be read: %s" % err)
+        return report
+    sample_rate = float(properties['sample_rate_numerator']) / float(properties['sample_rate_denominator'])
+    num_subchannels = int(properties['num_subchannels'])
+    samples = last_sample - first_sample + 1
+    report.update({'subchannels': num_subchannels, 'sample_rate': sample_rate, 'first_sample': int(first_sample), 'samples': int(samples), 'blocks': len(blocks)})
+
+    start_time = dataset_start_time(receiver_dir, dataset_dir)
+    if start_time is not None and first_sample != int(start_time * sample_rate):
+        errors.append('starts at sample %d, not at sample %d of %s' % (first_sample, int(start_time * sample_rate),
+                      datetime.fromtimestamp(start_time, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')))
+    if len(blocks) > 1:
+        block_list = sorted(blocks.items())
+        for (block_start, block_samples), (next_start, _) in zip(block_list, block_list[1:]):
+            report['gaps'].append({'type': 'missing', 'subchannel': None, 'first_sample': int(block_start + block_samples), 'end_sample': int(next_start)})
+        errors.append('has %d missing ranges' % (len(blocks) - 1))
+
+    subchannels = []
+    if receiver_dir:
+        try:
+            subchannels = source_subchannels(receiver_dir, config['subchannels'])
+        except (KeyError, ValueError, OSError) as err:
+            errors.append("can't find the band wav files of %s with the [subchannels] of %s: %s" % (receiver_dir, conf_path, err))
+        else:
+            if len(subchannels) != num_subchannels:
+                errors.append('has %d subchannels but %s has %d band wav files' % (num_subchannels, receiver_dir, len(subchannels)))
+                subchannels = []
+    wav_files = []
+    for band, wav_path, _ in subchannels:
+        try:
+            wav_files.append(WavFile(wav_path))
+        except (OSError, WavFormatError) as err:
+            errors.append("can't read %s: %s" % (wav_path, err))
+    if subchannels and len(wav_files) == num_subchannels:
+        wav = wav_files[0]
+        if wav.sample_rate != sample_rate:
+            errors.append('has %g sps but the wav files have %d sps' % (sample_rate, wav.sample_rate))
+        if (wav.channels == 2) != bool(properties['is_complex']):
+            errors.append('is_complex=%s but the wav files have %d channels' % (bool(properties['is_complex']), wav.channels))
+        if len(wav.samples) != samples:
+            errors.append('has %d samples but the wav files have %d' % (samples, len(wav.samples)))
+    else:
+        wav_files = []
+
+    try:
+        metadata = drf.DigitalMetadataReader(os.path.join(dataset_dir, channel_name, 'metadata')).read_latest()
+        frequencies = [float(freq) for freq in list(metadata.values())[0]['center_frequencies']]
+        report['center_frequencies'] = frequencies
+        if subchannels and frequencies != [freq for _, _, freq in subchannels]:
+            errors.append('has center_frequencies %s, not %s' % (frequencies, [freq for _, _, freq in subchannels]))
+        elif len(frequencies) != num_subchannels:
+            errors.append('has %d center_frequencies for %d subchannels' % (len(frequencies), num_subchannels))
+    except (OSError, ValueError, KeyError, IndexError) as err:
+        errors.append("can't read its metadata: %s" % err)
+
+    ### Read each continuous block in chunks, CRC each subchannel and find its runs of zeros
+    chunk_samples = max(1, int(chunk_secs * sample_rate))
+    min_gap_samples = max(1, int(min_gap_secs * sample_rate))
+    drf_crcs = [0] * num_subchannels
+    wav_crcs = [0] * num_subchannels
+    bad_chunks = [set() for _ in range(num_subchannels)]
+    zero_runs = [ZeroRuns() for _ in range(num_subchannels)]
+    for block_start, block_samples in sorted(blocks.items()):
+        for chunk_start in range(block_start, block_start + block_samples, chunk_samples):
+            count = min(chunk_samples, block_start + block_samples - chunk_start)
+            try:
+                raw = reader.read_vector_raw(chunk_start, count, channel_name)
+            except (OSError, ValueError) as err:
+                errors.append("can't read samples %d to %d: %s" % (chunk_start, chunk_start + count, err))
+                break
+            raw = raw.reshape(count, num_subchannels)
+            for subchannel in range(num_subchannels):
+                values = plain_samples(raw[:, subchannel])
+                zero_runs[subchannel].add(~values.any(axis=1), chunk_start)
+                if wav_files:
+                    offset = chunk_start - first_sample
+                    wav_values = wav_files[subchannel].samples[offset:offset + count]
+                    drf_bytes = np.ascontiguousarray(values, dtype=wav_values.dtype).tobytes()
+                    wav_bytes = np.ascontiguousarray(wav_values).tobytes()
+                    drf_crcs[subchannel] = zlib.crc32(drf_bytes, drf_crcs[subchannel])
+                    wav_crcs[subchannel] = zlib.crc32(wav_bytes, wav_crcs[subchannel])
+                    if drf_bytes != wav_bytes:
+                        bad_chunks[subchannel].add((chunk_start - first_sample) // chunk_samples)
+                else:
+                    drf_crcs[subchannel] = zlib.crc32(np.ascontiguousarray(values).tobytes(), drf_crcs[subchannel])
+    report['crc32'] = ['%08x' % crc for crc in drf_crcs]
+    for subchannel, chunks in enumerate(bad_chunks):
+        if chunks:
+            errors.append('subchannel %d (%s) differs from its wav file in %d of its %d second chunks, crc32 %08x != %08x' %
+                          (subchannel, subchannels[subchannel][0], len(chunks), chunk_secs, drf_crcs[subchannel], wav_crcs[subchannel]))
+
+    ### Report the zero runs, and whether they are minutes which were filled with silence
+    for subchannel in range(num_subchannels):
+        filled = set()
+        if subchannels:
+            filled = silence_minutes(os.path.dirname(subchannels[subchannel][1]))
+        for run_start, run_end in zero_runs[subchannel].close(first_sample + samples):
+            if run_end - run_start < min_gap_samples:
+                continue
+            first_minute = int((run_start - first_sample) / sample_rate // 60)
+            last_minute = int((run_end - 1 - first_sample) / sample_rate // 60)
+            minutes = sorted(filled.intersection(range(first_minute, last_minute + 1)))
+            report['gaps'].append({'type': 'silence' if minutes else 'zeros', 'subchannel': subchannel, 'first_sample': run_start, 'end_sample': run_end,
+                                   'first_time': datetime.fromtimestamp(run_start / sample_rate, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                                   'silence_minutes': minutes})
+            if not minutes and subchannels:
+                report['warnings'].append('subchannel %d (%s) has %d zero samples from sample %d which are not in a silence-filled minute' %
+                                          (subchannel, subchannels[subchannel][0], run_end - run_start, run_start))
+    return report
+
+
+def summary_line(report):
+    gaps = report['gaps']
+    line = '%s %s subchannels=%s samples=%s blocks=%s silence_gaps=%d zero_gaps=%d missing_gaps=%d' % (
+        'FAIL' if report['errors'] else 'OK', report['dataset'], report.get('subchannels', '-'), report.get('samples', '-'), report.get('blocks', '-'),
+        sum(1 for gap in gaps if gap['type'] == 'silence'), sum(1 for gap in gaps if gap['type'] == 'zeros'), sum(1 for gap in gaps if gap['type'] == 'missing'))
+    for error in report['errors']:
+        line += '\n    ERROR: %s' % error
+    for warning in report['warnings']:
+        line += '\n    WARNING: %s' % warning
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read back and verify the Digital RF datasets written by wav2grape.py before they are uploaded')
+    parser.add_argument('-c', '--conf', default=WAV2GRAPE_CONF_PATH, help='The wav2grape.conf used to write the datasets')
+    parser.add_argument('--jobs', type=int, default=0, help='Datasets verified in parallel (default: one per CPU)')
+    parser.add_argument('--chunk-secs', type=float, default=3600.0, help='Seconds of samples read at a time')
+    parser.add_argument('--min-gap-secs', type=float, default=1.0, help='Report runs of zero samples at least this long')
+    parser.add_argument('--json', default='', help='Also write the full reports to this file')
+    parser.add_argument('datasets', nargs='+', metavar='RECEIVER_DIR:DATASET_DIR')
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for dataset in args.datasets:
+        receiver_dir, _, dataset_dir = dataset.rpartition(':')
+        jobs.append((receiver_dir or None, dataset_dir, args.conf, args.chunk_secs, args.min_gap_secs))
+    reports = []
+    with ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+        for report in pool.map(verify_dataset, jobs):
+            print(summary_line(report))
+            reports.append(report)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(reports, fp, indent=1)
+    return 1 if any(report['errors'] for report in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
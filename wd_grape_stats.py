@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_grape_stats.py
+# Incremental site x date index of the GRAPE uploads on a PSWS server, replacing the 'find' of every site home and the 'du -sh'
+# of every site/date which wd-statistics() in wd-grape-statistics.sh ran on each report.
+#
+# Each site home holds one OBS<YYYY-MM-DD>T<HH-MM> dir per uploaded day, created by wav2grape.py.  'update' lists only the site
+# homes whose mtime has changed since the last update (i.e. which have new or removed OBS dirs), and walks only the OBS dirs which
+# are new, whose mtime changed, or which arrived less than --settle-secs ago and so may still be growing.  For each OBS dir the
+# index keeps its size on disk (as 'du' counts it), file count, subchannel count (from drf_properties.h5 if h5py is installed)
+# and arrival time (the mtime of its newest file).
+# The index is a JSON file with one list per column, so the matrix, the completeness statistics and the CSV/JSON exports are
+# made from it without touching the upload tree.
+#
+# Usage:
+#     wd_grape_stats.py update  [--index FILE] [--sites-root ..] --sites S000042,S000108,... [--settle-secs 7200]
+#     wd_grape_stats.py matrix  [--index FILE] [--days N]
+#     wd_grape_stats.py stats   [--index FILE] [--days N] [--min-fraction 0.9]
+#     wd_grape_stats.py export  [--index FILE] [--format csv|json] [--output FILE]
+#     wd_grape_stats.py report  ... 'update' and then 'matrix', as wd-statistics() printed
+
+import argparse
+import csv
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+INDEX_FILE = os.path.expanduser('~/wd_grape_stats_index.json')
+INDEX_VERSION = 1
+COLUMNS = ('site', 'obs', 'date', 'bytes', 'files', 'subchannels', 'arrival', 'mtime')
+
+
+def du_human(size_bytes):
+    # Formats a size as 'du -sh' does:  rounded up, with one decimal below 10
+    if size_bytes < 1024:
+        return '%d' % size_bytes if size_bytes else '0'
+    value = float(size_bytes)
+    for unit in 'KMGTP':
+        value /= 1024.0
+        if value < 1024 or unit == 'P':
+            break
+    if value < 10:
+        return '%.1f%s' % (math.ceil(value * 10) / 10, unit)
+    return '%d%s' % (math.ceil(value), unit)
+
+
+def subchannel_count(obs_dir):
+    # The num_subchannels which wav2grape.py gave to digital_rf, or None if it can't be read
+    try:
+        import h5py
+    except ImportError:
+        return None
+    for channel in sorted(os.listdir(obs_dir)):
+        path = os.path.join(obs_dir, channel, 'drf_properties.h5')
+        if os.path.isfile(path):
+            try:
+                with h5py.File(path, 'r') as properties:
+                    return int(properties.attrs['num_subchannels'])
+            except (OSError, KeyError, ValueError):
+                return None
+    return None
+
+
+def walk_obs_dir(obs_dir):
+    # Returns (bytes on disk, files, newest mtime) of an OBS dir
+    size = files = 0
+    newest = os.stat(obs_dir).st_mtime
+    for dir_path, dir_names, file_names in os.walk(obs_dir):
+        size += os.lstat(dir_path).st_blocks * 512
+        for file_name in file_names:
+            try:
+                stat = os.lstat(os.path.join(dir_path, file_name))
+            except OSError:
+                continue
+            size += stat.st_blocks * 512
+            files += 1
+            newest = max(newest, stat.st_mtime)
+    return size, files, newest
+
+
+class Index:
+    def __init__(self, path):
+        self.path = path
+        self.site_mtimes = {}
+        self.sites = []
+        self.columns = {column: [] for column in COLUMNS}
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+            if data.get('version') == INDEX_VERSION:
+                self.site_mtimes = data['site_mtimes']
+                self.sites = data['sites']
+                self.columns = {column: data['columns'][column] for column in COLUMNS}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def rows(self):
+        return [dict(zip(COLUMNS, values)) for values in zip(*(self.columns[column] for column in COLUMNS))]
+
+    def set_rows(self, rows):
+        rows.sort(key=lambda row: (row['date'], row['site'], row['obs']))
+        self.columns = {column: [row[column] for row in rows] for column in COLUMNS}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump({'version': INDEX_VERSION, 'updated': time.time(), 'sites': self.sites, 'site_mtimes': self.site_mtimes,
+                       'columns': self.columns}, fp, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def update(self, sites_root, sites, settle_secs):
+        # Returns (sites listed, OBS dirs walked)
+        now = time.time()
+        old_rows = {(row['site'], row['obs']): row for row in self.rows()}
+        rows = [row for row in old_rows.values() if row['site'] in sites]
+        self.sites = list(sites)
+        listed = walked = 0
+        for site in sites:
+            site_home = os.path.join(sites_root, site)
+            try:
+                site_mtime = os.stat(site_home).st_mtime
+            except OSError:
+                rows = [row for row in rows if row['site'] != site]
+                self.site_mtimes.pop(site, None)
+                continue
+            site_rows = {row['obs']: row for row in rows if row['site'] == site}
+            if self.site_mtimes.get(site) == site_mtime:
+                obs_names = list(site_rows)             # No OBS dir was added or removed, so only the recent ones need to be checked
+            else:
+                listed += 1
+                obs_names = sorted(name for name in os.listdir(site_home) if name.startswith('OBS') and os.path.isdir(os.path.join(site_home, name)))
+                self.site_mtimes[site] = site_mtime
+            kept = {}
+            for obs in obs_names:
+                obs_dir = os.path.join(site_home, obs)
+                row = site_rows.get(obs)
+                try:
+                    obs_mtime = os.stat(obs_dir).st_mtime
+                except OSError:
+                    continue
+                if row is None or row['mtime'] != obs_mtime or now - row['arrival'] < settle_secs:
+                    size, files, newest = walk_obs_dir(obs_dir)
+                    walked += 1
+                    row = {'site': site, 'obs': obs, 'date': obs[3:13], 'bytes': size, 'files': files,
+                           'subchannels': subchannel_count(obs_dir), 'arrival': newest, 'mtime': obs_mtime}
+                kept[obs] = row
+            rows = [row for row in rows if row['site'] != site] + list(kept.values())
+        self.set_rows(rows)
+        return listed, walked
+
+
+##################################################  Reports  ##################################################
+
+def recent_dates(rows, days):
+    dates = sorted(set(row['date'] for row in rows))
+    return dates[-days:] if days else dates
+
+
+def print_matrix(index, days):
+    rows = index.rows()
+    dates = recent_dates(rows, days)
+    sizes = {}
+    for row in rows:
+        sizes[(row['date'], row['site'])] = sizes.get((row['date'], row['site']), 0) + row['bytes']
+    header = 'Date/Site#:' + ''.join('  %s' % site[-3:] for site in index.sites)
+    print('Found %d dates in %d WD GRAPE Sites' % (len(dates), len(index.sites)))
+    print(header)
+    for date in dates:
+        print('%s: %s' % (date, ''.join('%4s ' % (du_human(sizes[(date, site)]) if (date, site) in sizes else '') for site in index.sites)))
+    print(header)
+    print('Found %d dates in %d WD GRAPE Sites' % (len(dates), len(index.sites)))
+
+
+def completeness(index, days, min_fraction):
+    # Returns ({site: stats}, {date: stats}).  A day is 'short' if it is smaller than min_fraction of that site's median day
+    rows = index.rows()
+    dates = recent_dates(rows, days)
+    date_set = set(dates)
+    by_site = {site: [row for row in rows if row['site'] == site and row['date'] in date_set] for site in index.sites}
+    site_stats = {}
+    short_days = set()
+    for site, site_rows in by_site.items():
+        days_with_data = sorted(set(row['date'] for row in site_rows))
+        median_bytes = statistics.median(row['bytes'] for row in site_rows) if site_rows else 0
+        subchannels = [row['subchannels'] for row in site_rows if row['subchannels'] is not None]
+        usual_subchannels = statistics.mode(subchannels) if subchannels else None
+        short = [row for row in site_rows if row['bytes'] < min_fraction * median_bytes or
+                 (usual_subchannels is not None and row['subchannels'] is not None and row['subchannels'] < usual_subchannels)]
+        short_days.update((row['site'], row['date']) for row in short)
+        site_stats[site] = {'days': len(days_with_data), 'missing': len(dates) - len(days_with_data), 'short': len(short),
+                            'completeness_pct': 100.0 * (len(days_with_data) - len(short)) / len(dates) if dates else 0.0,
+                            'median_bytes': median_bytes, 'subchannels': usual_subchannels,
+                            'last_arrival': max((row['arrival'] for row in site_rows), default=None)}
+    date_stats = {}
+    for date in dates:
+        sites = set(row['site'] for row in rows if row['date'] == date)
+        date_stats[date] = {'sites': len(sites), 'short': sum(1 for site in sites if (site, date) in short_days),
+                            'bytes': sum(row['bytes'] for row in rows if row['date'] == date)}
+    return site_stats, date_stats
+
+
+def print_stats(index, days, min_fraction):
+    site_stats, date_stats = completeness(index, days, min_fraction)
+    print('%-8s %5s %7s %5s %9s %6s %5s  %s' % ('SITE', 'DAYS', 'MISSING', 'SHORT', 'COMPLETE%', 'MEDIAN', 'SUBCH', 'LAST_ARRIVAL'))
+    for site, stats in site_stats.items():
+        print('%-8s %5d %7d %5d %9.1f %6s %5s  %s' % (site, stats['days'], stats['missing'], stats['short'], stats['completeness_pct'], du_human(stats['median_bytes']),
+              stats['subchannels'] if stats['subchannels'] is not None else '-',
+              time.strftime('%Y-%m-%d %H:%M', time.gmtime(stats['last_arrival'])) if stats['last_arrival'] else '-'))
+    if date_stats:
+        full = sum(1 for stats in date_stats.values() if stats['sites'] - stats['short'] == len(index.sites))
+        print('%d of %d dates have a complete upload from all %d sites.  Sites per date: min %d, median %.1f, max %d' %
+              (full, len(date_stats), len(index.sites), min(stats['sites'] for stats in date_stats.values()),
+               statistics.median(stats['sites'] for stats in date_stats.values()), max(stats['sites'] for stats in date_stats.values())))
+
+
+def export(index, format, output):
+    fp = open(output, 'w', newline='') if output else sys.stdout
+    try:
+        if format == 'json':
+            site_stats, date_stats = completeness(index, 0, 0.9)
+            json.dump({'sites': index.sites, 'uploads': index.rows(), 'site_stats': site_stats, 'date_stats': date_stats}, fp, indent=1)
+            fp.write('\n')
+        else:
+            writer = csv.writer(fp)
+            writer.writerow(COLUMNS)
+            for values in zip(*(index.columns[column] for column in COLUMNS)):
+                writer.writerow(['' if value is None else value for value in values])
+    finally:
+        if output:
+            fp.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental site x date index of the GRAPE uploads on a PSWS server')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parsers = {command: subparsers.add_parser(command) for command in ('update', 'matrix', 'stats', 'export', 'report')}
+    for sub_parser in parsers.values():
+        sub_parser.add_argument('--index', default=INDEX_FILE)
+    for command in ('update', 'report'):
+        parsers[command].add_argument('--sites-root', default='..', help='The dir holding the site homes')
+        parsers[command].add_argument('--sites', required=True, help='Comma or space separated PSWS site ids, e.g. S000042,S000108')
+        parsers[command].add_argument('--settle-secs', type=float, default=7200.0, help='Walk an OBS dir again until its newest file is this old')
+    for command in ('matrix', 'stats', 'report'):
+        parsers[command].add_argument('--days', type=int, default=0, help='Only the last N dates (default: all)')
+    parsers['stats'].add_argument('--min-fraction', type=float, default=0.9, help="A day smaller than this fraction of the site's median day is short")
+    parsers['export'].add_argument('--format', choices=('csv', 'json'), default='csv')
+    parsers['export'].add_argument('--output', default='')
+    args = parser.parse_args(argv)
+
+    index = Index(args.index)
+    try:
+        if args.command in ('update', 'report'):
+            start = time.time()
+            listed, walked = index.update(args.sites_root, args.sites.replace(',', ' ').split(), args.settle_secs)
+            index.save()
+            if args.command == 'update':
+                print('Listed %d site homes and walked %d OBS dirs in %.1f seconds' % (listed, walked, time.time() - start))
+        if args.command in ('matrix', 'report'):
+            print_matrix(index, args.days)
+        elif args.command == 'stats':
+            print_stats(index, args.days, args.min_fraction)
+        elif args.command == 'export':
+            export(index, args.format, args.output)
+    except OSError as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_iq_ingest.py
+# Validates, measures and archives a one minute IQ wav file of an I1/J1/K1 (WWV/CHU, SuperDARN, ...) receive channel in one read,
+# replacing the 'sox FILE -n stat' and 'sox FILE -n stats' which decoding_daemon() ran on every file only to get its sample count
+# and levels, and the separate read of the file by 'wavpack' in archive_wav_file().
+#
+# The file is memory mapped and its sample count is taken from its header.  If it doesn't match --expected-samples (counted like
+# sox's 'Samples read', i.e. frames x channels) nothing is archived and the exit code is 2.  Otherwise the levels are computed in
+# one vectorized pass over the mapped samples, as 'sox -n stats' reports them in its 'Overall' column (RMS Pk/Tr dB of 50 ms
+# windows), and the same mapped bytes are piped to 'wavpack -hh' to create --archive-file.  The archive stays WavPack, since
+# the GRAPE upload, 24 hour wav and archive check code all read .wv files.
+#
+# Prints one line:  SAMPLES  PK_LEV_DB  RMS_LEV_DB  RMS_PK_DB  RMS_TR_DB
+#
+# Usage:  wd_iq_ingest.py --expected-samples 1920000 [--archive-file ARCHIVE.wv] IQ_FILE.wav
+
+import argparse
+import math
+import subprocess
+import sys
+
+import numpy as np
+
+from wd_wav_assemble import WavFile, WavFormatError
+
+RMS_WINDOW_SECS = 0.05                  # The default window of 'sox -n stats'
+EXIT_WRONG_SAMPLE_COUNT = 2
+
+
+def db(power_ratio):
+    return 10 * math.log10(power_ratio) if power_ratio > 0 else -math.inf
+
+
+def iq_levels(wav_file):
+    # Returns (Pk lev dB, RMS lev dB, RMS Pk dB, RMS Tr dB) of all the channels of a WavFile, as sox's 'Overall' column
+    samples = wav_file.samples
+    frames, channels = samples.shape
+    if frames == 0:
+        return -math.inf, -math.inf, -math.inf, -math.inf
+    squares = np.square(samples, dtype=np.float64) / (wav_file.full_scale * wav_file.full_scale)
+    window = max(1, int(round(RMS_WINDOW_SECS * wav_file.sample_rate)))
+    windows = frames // window
+    if windows:
+        window_power = squares[:windows * window].reshape(windows, window, channels).mean(axis=1)
+        rms_pk, rms_tr = float(window_power.max()), float(window_power.min())
+    else:
+        rms_pk = rms_tr = float(squares.mean(axis=0).max())
+    peak = wav_file.peak()
+    return db(peak * peak), db(float(squares.mean())), db(rms_pk), db(rms_tr)
+
+
+def archive(wav_file, archive_path):
+    # Compress the whole mapped file (header and all) with wavpack, just as 'wavpack -hh FILE -o ARCHIVE' did, without it reading FILE again
+    result = subprocess.run(['wavpack', '-hh', '-q', '-y', '-', '-o', archive_path], input=memoryview(wav_file.map),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if result.returncode:
+        raise OSError("'wavpack -hh - -o %s' => %d: %s" % (archive_path, result.returncode, result.stdout.decode(errors='replace').strip()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the sample count and levels of a one minute IQ wav file and archive it in one read')
+    parser.add_argument('--expected-samples', type=int, required=True, help="Frames x channels, as sox's 'Samples read'")
+    parser.add_argument('--archive-file', default='', help='Create this WavPack file if the sample count is as expected')
+    parser.add_argument('iq_file')
+    args = parser.parse_args(argv)
+
+    try:
+        wav_file = WavFile(args.iq_file)
+    except (OSError, WavFormatError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    samples = wav_file.samples.size
+    if samples != args.expected_samples:
+        print('%d' % samples)
+        sys.stdout.flush()
+        print("ERROR: '%s' has %d samples, not the expected %d" % (args.iq_file, samples, args.expected_samples), file=sys.stderr)
+        return EXIT_WRONG_SAMPLE_COUNT
+    print('%d %.2f %.2f %.2f %.2f' % ((samples,) + iq_levels(wav_file)))
+    sys.stdout.flush()
+    if args.archive_file:
+        try:
+            archive(wav_file, args.archive_file)
+        except OSError as err:
+            print('ERROR: %s' % err, file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
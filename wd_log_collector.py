@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_log_collector.py
+# Daemon which writes the log lines of all the WD bash daemons, so wd_logger() no longer runs 'stat' on its log file for
+# every line and rewrites the whole file with 'sed -i' when it grows too large (which also raced with the other writers).
+# When WD_LOG_COLLECTOR="yes", wd_logger() sends each line as a datagram to 127.0.0.1:PORT:
+#     \x1e<LOG_FILE_PATH>\n<LINE(S)>\n
+# bash may split one 'echo' into several datagrams, so a datagram which doesn't start with \x1e holds more lines for the log
+# file named in the last datagram from the same address (each wd_logger() call sends from a new socket).
+# The lines for each log file are buffered and appended in one write every --flush-secs, or sooner if --batch-bytes are
+# pending.  When a log file would grow beyond --max-bytes it is renamed to <LOG_FILE_PATH>.1 (replacing any older one) and a
+# new file is opened, so lines are never rewritten in place.  If something else renames, truncates or deletes a log file
+# (e.g. truncate_file() or logrotate), it is reopened at the next flush.
+# The last --ring-lines lines of each log file are also kept in memory, so 'tail' can print them even before they are flushed:
+#     \0TAIL <COUNT> <LOG_FILE_PATH>      is answered with datagrams holding those lines and then an empty datagram
+# The daemon writes its pid to --ready-file once it is listening and removes the file when it exits.  wd_logger() only sends to the
+# daemon while that file holds the pid of a running process, and otherwise appends to the log file itself as before.
+#
+# Usage:
+#     wd_log_collector.py daemon [--port 58033] [--ready-file FILE] [--max-bytes 1000000] [--flush-secs 0.5] [--log-file FILE]
+#     wd_log_collector.py tail   [--port 58033] [--lines 100] LOG_FILE_PATH
+
+import argparse
+import collections
+import os
+import signal
+import socket
+import sys
+import time
+
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+import wd_utils
+
+MAX_DATAGRAM_BYTES = 65507
+LINES_MARKER = '\x1e'
+TAIL_REQUEST = b'\0TAIL '
+MAX_SENDERS = 1000                  # Remember the log file path of this many recent sender addresses
+TAIL_REPLY_CHUNK_BYTES = 60000
+IDLE_CLOSE_SECS = 300               # Close a log file which has had no lines for this long
+IDLE_FORGET_SECS = 3600             # And forget its ring of recent lines after this long
+
+
+class LogFile:
+    def __init__(self, path, ring_lines):
+        self.path = path
+        self.fp = None
+        self.pending = []
+        self.pending_bytes = 0
+        self.ring = collections.deque(maxlen=ring_lines)
+        self.last_line_time = time.time()
+
+    def add(self, text):
+        data = text.encode(errors='replace')
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        self.ring.extend(text.splitlines())
+        self.last_line_time = time.time()
+
+    def open(self):
+        try:
+            self.fp = open(self.path, 'ab')
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.fp = open(self.path, 'ab')
+            self.fp.write(time.strftime('%a %d %b %Y %H:%M:%S UTC', time.gmtime()).encode() + b': wd_log_collector: had to create the directory of this log file\n')
+
+    def close(self):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+
+    def reopen_if_moved(self):
+        # e.g. truncate_file() replaced it with a shorter copy, or its job directory was removed
+        if not self.fp:
+            return
+        try:
+            moved = os.stat(self.path).st_ino != os.fstat(self.fp.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.close()
+
+    def rotate(self, size):
+        self.close()
+        os.replace(self.path, self.path + '.1')
+        self.open()
+        self.fp.write(('%s: wd_log_collector: renamed this log file of %d bytes to %s.1\n' %
+                       (time.strftime('%a %d %b %Y %H:%M:%S UTC', time.gmtime()), size, os.path.basename(self.path))).encode())
+
+    def flush(self, max_bytes):
+        if not self.pending:
+            return
+        self.reopen_if_moved()
+        if not self.fp:
+            self.open()
+        size = os.fstat(self.fp.fileno()).st_size
+        if size > 0 and size + self.pending_bytes > max_bytes:
+            self.rotate(size)
+        self.fp.write(b''.join(self.pending))
+        self.fp.flush()
+        self.pending = []
+        self.pending_bytes = 0
+
+
+class LogCollector:
+    def __init__(self, args):
+        self.args = args
+        self.log_files = {}
+        self.sender_paths = collections.OrderedDict()
+
+    def log_file(self, path):
+        log_file = self.log_files.get(path)
+        if not log_file:
+            log_file = self.log_files[path] = LogFile(path, self.args.ring_lines)
+        return log_file
+
+    def handle_datagram(self, data, address, sock):
+        if data.startswith(TAIL_REQUEST):
+            self.send_tail(data[len(TAIL_REQUEST):].decode(errors='replace'), address, sock)
+            return
+        text = data.decode(errors='replace')
+        if text.startswith(LINES_MARKER):
+            path, _, text = text[1:].partition('\n')
+            if not path.startswith('/'):
+                wd_logger(1, "ERROR: ignoring lines for '%s' which is not an absolute path" % path)
+                return
+            self.sender_paths[address] = path
+            if len(self.sender_paths) > MAX_SENDERS:
+                self.sender_paths.popitem(last=False)
+        else:
+            path = self.sender_paths.get(address)
+            if not path:
+                wd_logger(1, "ERROR: ignoring a datagram from %s which doesn't name its log file: '%s'" % (address, text[:80]))
+                return
+        if not text:
+            return
+        log_file = self.log_file(path)
+        log_file.add(text if text.endswith('\n') else text + '\n')
+        if log_file.pending_bytes >= self.args.batch_bytes:
+            self.flush(log_file)
+
+    def send_tail(self, request, address, sock):
+        count, _, path = request.partition(' ')
+        lines = []
+        log_file = self.log_files.get(path)
+        if log_file:
+            self.flush(log_file)
+            lines = list(log_file.ring)[-int(count):] if count.isdigit() and int(count) > 0 else list(log_file.ring)
+        reply = ''.join(line + '\n' for line in lines).encode(errors='replace')
+        for offset in range(0, len(reply), TAIL_REPLY_CHUNK_BYTES):
+            sock.sendto(reply[offset:offset + TAIL_REPLY_CHUNK_BYTES], address)
+        sock.sendto(b'', address)
+
+    def flush(self, log_file):
+        try:
+            log_file.flush(self.args.max_bytes)
+        except OSError as err:
+            wd_logger(1, "ERROR: can't write %d bytes to '%s': %s" % (log_file.pending_bytes, log_file.path, err))
+            log_file.close()
+            if log_file.pending_bytes > self.args.max_bytes:
+                log_file.pending = []            # Don't let a log file which can't be written use all our memory
+                log_file.pending_bytes = 0
+
+    def flush_all(self):
+        now = time.time()
+        for path, log_file in list(self.log_files.items()):
+            self.flush(log_file)
+            idle_secs = now - log_file.last_line_time
+            if idle_secs > IDLE_CLOSE_SECS:
+                log_file.close()
+            if idle_secs > IDLE_FORGET_SECS:
+                del self.log_files[path]
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)     # So a burst of lines isn't dropped while we write
+        sock.bind(('127.0.0.1', self.args.port))
+        sock.settimeout(self.args.flush_secs)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))      # So 'wd -z' flushes the pending lines below
+        if self.args.ready_file:
+            with open(self.args.ready_file, 'w') as fp:
+                fp.write('%d\n' % os.getpid())       # wd_logger() checks that this pid is running, in case we are killed without removing the file
+        wd_logger(1, 'Listening on 127.0.0.1:%d' % self.args.port)
+        try:
+            self.serve(sock)
+        finally:
+            if self.args.ready_file and os.path.exists(self.args.ready_file):
+                os.remove(self.args.ready_file)
+            self.flush_all()
+
+    def serve(self, sock):
+        last_flush = time.time()
+        while True:
+            try:
+                data, address = sock.recvfrom(MAX_DATAGRAM_BYTES)
+                self.handle_datagram(data, address, sock)
+            except socket.timeout:
+                pass
+            now = time.time()
+            if now - last_flush >= self.args.flush_secs:
+                self.flush_all()
+                last_flush = now
+
+
+def cmd_tail(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2.0)
+    sock.sendto(TAIL_REQUEST + ('%d %s' % (args.lines, os.path.abspath(args.log_file_path))).encode(), ('127.0.0.1', args.port))
+    try:
+        while True:
+            data = sock.recv(MAX_DATAGRAM_BYTES)
+            if not data:
+                return 0
+            sys.stdout.write(data.decode(errors='replace'))
+    except socket.timeout:
+        print("No reply from the log collector on 127.0.0.1:%d" % args.port, file=sys.stderr)
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch the log lines of the WD daemons into their log files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    daemon_parser = subparsers.add_parser('daemon')
+    tail_parser = subparsers.add_parser('tail', help='Print the recent lines of a log file held by the daemon')
+    for sub_parser in (daemon_parser, tail_parser):
+        sub_parser.add_argument('--port', type=int, default=58033)
+    daemon_parser.add_argument('--ready-file', default='', help='Created while the daemon is listening')
+    daemon_parser.add_argument('--max-bytes', type=int, default=1000000, help='Rename a log file to FILE.1 before it grows beyond this')
+    daemon_parser.add_argument('--flush-secs', type=float, default=0.5)
+    daemon_parser.add_argument('--batch-bytes', type=int, default=65536, help='Write sooner if this many bytes are pending for a log file')
+    daemon_parser.add_argument('--ring-lines', type=int, default=1000, help='Recent lines of each log file kept in memory')
+    daemon_parser.add_argument('--log-file', default='')
+    daemon_parser.add_argument('-v', '--verbose', action='count', default=0)
+    tail_parser.add_argument('--lines', type=int, default=100)
+    tail_parser.add_argument('log_file_path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'tail':
+        return cmd_tail(args)
+    set_log_file(args.log_file)
+    wd_utils.verbosity += args.verbose
+    setup_verbosity_traps()
+    LogCollector(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_noise_cal.py
+# The noise level calibration of decoding.sh in one process, replacing the 'sed', 'awk' and 'gawk' forks of calculate_nl_adjustments()
+# and the chain of about 30 'bc' forks which applied the corrections to the C2 and sox RMS noise levels of each WSPR cycle.
+#
+# 'coefficients' is run once by each decoding daemon.  It loads noise_plot/noise_ca_vals.csv and prints the receiver/band's
+# 'RMS_NL_ADJUST FFT_NL_ADJUST' from the cal values, the Kiwi amplitude versus frequency correction of the band and the antenna factor.
+# 'apply' is run each cycle through the wd-py pool with those coefficients, the C2 noise printed by c2_noise.py and the 12 raw
+# 'sox stats' dB levels of the pre Tx, Tx and post Tx windows.  It applies the RMS calibration, the normalization (or radiod
+# channel gain) correction, the +60 dB Kiwi audio gain term and the KA9Q per band calibration (or radiod N0) and prints the
+# 13 RMS fields and the FFT noise level which decoding.sh adds to the noise line and the spot lines.
+#
+# The results are exactly those of the awk and bc expressions they replace:  'bc' truncates each quotient to 'scale' decimal digits
+# and keeps all the digits of a sum, so the corrections are computed with Decimals, and the awk results are formatted with the same
+# printf formats.  wd-noise-cal-test.sh pins those results for Kiwi and KA9Q receivers.
+#
+# Usage:
+#     wd_noise_cal.py coefficients --freq-khz KHZ [--af-db DB] [--cal-file noise_ca_vals.csv]
+#     wd_noise_cal.py apply --receiver NAME --band BAND --rms-nl-adjust DB --fft-nl-adjust DB --c2 DB [--peak-dbfs DB]
+#                           [--channel-gain DB] [--ka9q-rms-cal-offset DB --ka9q-c2-cal-offset DB] [--ka9q-use-band-cal yes]
+#                           [--ka9q-use-radiod-n0 no --ka9q-n0 DB --ka9q-n0-cal-offset DB]  PRE_PK PRE_RMS PRE_RMS_PK PRE_RMS_TR TX_... POST_...
+
+import argparse
+import math
+import os
+import re
+import sys
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+NOISE_CAL_FILE_PATH = os.path.join(WD_ROOT_DIR, 'noise_plot', 'noise_ca_vals.csv')
+DEFAULT_CAL_VALS = ('320', '246', '-50.4', '-41.0', '-13.9', '13.1', '-187.7')      # nom_bw, ne_bw, rms_offset, fft_offset, fft_band, threshold, c2_correction
+KA9Q_DEFAULT_CHANNEL_GAIN = '60.0'
+KIWI_AUDIO_GAIN_DB = Decimal('60.0')
+SOX_LEVELS_COUNT = 12
+PRE_TX_RMS_TR_INDEX = 3
+POST_TX_RMS_TR_INDEX = 11
+
+
+class NoiseCalError(Exception):
+    pass
+
+
+##################################################  The awk of calculate_nl_adjustments()  ##################################################
+
+def load_cal_vals(path=NOISE_CAL_FILE_PATH):
+    # The values of the lines of noise_ca_vals.csv which start with a digit, as "sed -n '/^[0-9]/s/,/ /gp'" gave them, followed by the defaults of the missing ones
+    cal_vals = []
+    try:
+        with open(path) as fp:
+            for line in fp:
+                if line[:1].isdigit():
+                    cal_vals += line.replace(',', ' ').split()
+    except OSError:
+        pass
+    return cal_vals[:len(DEFAULT_CAL_VALS)] + list(DEFAULT_CAL_VALS[len(cal_vals):])
+
+
+def awk_number(value):
+    # awk's value of a string:  its longest numeric prefix, or 0
+    match = re.match(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?', value)
+    return float(match.group(0)) if match else 0.0
+
+
+def kiwi_amplitude_versus_frequency_correction(freq_mhz):
+    # The gawk polynomial, printed by gawk's 'print' with OFMT '%.6g'.  Returns 0 above 30 MHz, where a Kiwi is fed by a transverter
+    if freq_mhz > 30:
+        return 0.0
+    f = freq_mhz
+    correction = -1 * ((2.2474 * (10 ** -7) * (f ** 6)) - (2.1079 * (10 ** -5) * (f ** 5)) + (7.1058 * (10 ** -4) * (f ** 4)) -
+                       (1.1324 * (10 ** -2) * (f ** 3)) + (1.0013 * (10 ** -1) * (f ** 2)) - (3.7796 * (10 ** -1) * f) - (9.1509 * (10 ** -1)))
+    return float('%.6g' % correction)
+
+
+def nl_adjustments(freq_khz, af_db='0', cal_vals=None):
+    # Returns ('RMS_NL_ADJUST', 'FFT_NL_ADJUST') as calculate_nl_adjustments() printed them
+    cal_vals = cal_vals or load_cal_vals()
+    cal_ne_bw = awk_number(cal_vals[1])
+    if cal_ne_bw == 0:
+        cal_ne_bw = 246.0
+    cal_rms_offset = awk_number(cal_vals[2])
+    cal_c2_correction = awk_number(cal_vals[6])
+    freq_mhz = awk_number('%.6f' % (awk_number(str(freq_khz)) / 1000))
+    total_correction_db = awk_number('%.10f' % (kiwi_amplitude_versus_frequency_correction(freq_mhz) + awk_number(str(af_db))))
+    rms_nl_adjust = '%.2f' % (cal_rms_offset + (10 * (math.log(1 / cal_ne_bw) / math.log(10))) + total_correction_db)
+    fft_nl_adjust = '%.2f' % ((cal_c2_correction + total_correction_db) * 100 / 100)
+    return rms_nl_adjust, fft_nl_adjust
+
+
+##################################################  The bc of each cycle  ##################################################
+
+def bc_number(value):
+    try:
+        number = Decimal(value.strip())
+    except (InvalidOperation, AttributeError):
+        number = None
+    if number is None or not number.is_finite():             # e.g. the '-inf' which sox prints for a silent window
+        raise NoiseCalError("'%s' is not a number which bc can read" % value)
+    return number
+
+
+def bc_truncate(value, scale):
+    # 'scale=N; (...)/1' in bc
+    return value.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_DOWN)
+
+
+def bc_str(value):
+    # The number as bc prints it:  '0' for zero and no leading '0' before the decimal point, e.g. '-.50'
+    if value == 0:
+        return '0'
+    text = format(value, 'f')
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+
+def sdr_noise_level_adjust(peak_dbfs, channel_gain):
+    # The dB by which the wav file's level differs from the +60 dB gain which the calibration assumes
+    if peak_dbfs:
+        return bc_truncate(-bc_number(peak_dbfs) - 60 - 1, 2)              # sox (or wd_wav_assemble.py) normalized it to -1 dBFS
+    if channel_gain != KA9Q_DEFAULT_CHANNEL_GAIN:
+        return bc_truncate(bc_number(channel_gain) - bc_number(KA9Q_DEFAULT_CHANNEL_GAIN), 2)
+    return Decimal(0)
+
+
+def is_a_float(value):
+    return re.match(r'^[+-]?(\d+\.?\d*|\.\d+)$', value or '') is not None
+
+
+def apply_corrections(args, sox_levels):
+    # Returns (rms_line fields, fft noise level, rms noise level), all as bc would print them
+    if len(sox_levels) != SOX_LEVELS_COUNT:
+        raise NoiseCalError('expected %d sox levels, not %d' % (SOX_LEVELS_COUNT, len(sox_levels)))
+    is_kiwi = 'KA9Q' not in args.receiver
+    is_ka9q = args.receiver.startswith('KA9Q')
+    sdr_adjust = sdr_noise_level_adjust(args.peak_dbfs, args.channel_gain)
+    if is_kiwi:
+        sdr_adjust += KIWI_AUDIO_GAIN_DB             # fft_nl_adjust and rms_nl_adjust were calibrated on a Kiwi and so include its +60 dB audio gain
+
+    fft = bc_truncate(bc_number(args.c2) + bc_number(args.fft_nl_adjust), 2)
+    fft = bc_truncate(fft - sdr_adjust, 1)
+
+    rms_nl_adjust = bc_number(args.rms_nl_adjust)
+    levels = [bc_truncate(bc_number(level) + rms_nl_adjust, 2) for level in sox_levels]
+    pre_rms, post_rms = levels[PRE_TX_RMS_TR_INDEX], levels[POST_TX_RMS_TR_INDEX]
+    rms = pre_rms if pre_rms < post_rms else post_rms
+    levels.append(rms)
+    rms = bc_truncate(rms - sdr_adjust, 1)
+    levels = [bc_truncate(level - sdr_adjust, 2) for level in levels]
+
+    if is_ka9q and args.ka9q_use_band_cal == 'yes':
+        if args.ka9q_rms_cal_offset != '0' or args.ka9q_c2_cal_offset != '0':
+            rms_offset, c2_offset = bc_number(args.ka9q_rms_cal_offset), bc_number(args.ka9q_c2_cal_offset)
+            fft = bc_truncate(fft + c2_offset, 1)
+            rms = bc_truncate(rms + rms_offset, 1)
+            levels = [bc_truncate(level + rms_offset, 2) for level in levels]
+    elif is_ka9q and args.ka9q_use_radiod_n0 == 'yes':
+        if is_a_float(args.ka9q_n0) and bc_number(args.ka9q_n0) > -900:
+            fft = rms = levels[-1] = bc_truncate(bc_number(args.ka9q_n0) + bc_number(args.ka9q_n0_cal_offset), 1)
+    return [bc_str(level) for level in levels], bc_str(fft), bc_str(rms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate and apply the WD noise level calibration')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    coefficients_parser = subparsers.add_parser('coefficients', help="Print a band's 'RMS_NL_ADJUST FFT_NL_ADJUST'")
+    coefficients_parser.add_argument('--freq-khz', required=True, help='The WSPR frequency of the band')
+    coefficients_parser.add_argument('--af-db', default='0', help='The antenna factor of the receiver on the band')
+    coefficients_parser.add_argument('--cal-file', default=NOISE_CAL_FILE_PATH)
+    apply_parser = subparsers.add_parser('apply', help="Print the 13 RMS fields and the FFT noise level of a cycle's noise line")
+    apply_parser.add_argument('--receiver', required=True)
+    apply_parser.add_argument('--band', default='')
+    apply_parser.add_argument('--rms-nl-adjust', required=True)
+    apply_parser.add_argument('--fft-nl-adjust', required=True)
+    apply_parser.add_argument('--c2', required=True, help='The noise level printed by c2_noise.py')
+    apply_parser.add_argument('--peak-dbfs', default='', help='The peak level of the input wav files, if the decoded wav file was normalized')
+    apply_parser.add_argument('--channel-gain', default=KA9Q_DEFAULT_CHANNEL_GAIN, help="The radiod channel gain, if the wav file wasn't normalized")
+    apply_parser.add_argument('--ka9q-use-band-cal', default='yes')
+    apply_parser.add_argument('--ka9q-rms-cal-offset', default='0')
+    apply_parser.add_argument('--ka9q-c2-cal-offset', default='0')
+    apply_parser.add_argument('--ka9q-use-radiod-n0', default='no')
+    apply_parser.add_argument('--ka9q-n0', default='-999.99')
+    apply_parser.add_argument('--ka9q-n0-cal-offset', default='0.0')
+    apply_parser.add_argument('sox_levels', nargs='*', help="The 12 dB levels printed by 'sox stats' for the pre Tx, Tx and post Tx windows")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'coefficients':
+            print('%s %s' % nl_adjustments(args.freq_khz, args.af_db, load_cal_vals(args.cal_file)))
+        else:
+            levels, fft, rms = apply_corrections(args, args.sox_levels)
+            print('%s %s %s' % (' '.join(levels), fft, rms))
+    except NoiseCalError as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_noise_ingest.py
+# Server side bulk ingester of the 15 field noise lines uploaded by WD clients.  Replaces running ts_noise.awk over every file,
+# which splits FILENAME again for every line.
+#
+# The uploaded noise files are found in trees of the form   .../<CALL_GRID>/<RECEIVER>/<BAND>/YYMMDD_HHMM_noise.txt
+# This program parses the CALL_GRID/RECEIVER/BAND metadata once per directory, reads all the noise files of a batch into
+# columnar arrays, and then writes each batch with one bulk insert into:
+#     csv:FILE            the same 8 column lines ts_noise.awk printed ('-' for stdout), e.g. for testing or for ts_batch_upload.py
+#     timescale           TimescaleDB through psycopg2, using the INSERT of ts_insert_wd_noise.sql
+#     clickhouse          ClickHouse through its HTTP interface (CLICKHOUSE_HOST / CLICKHOUSE_PORT)
+#
+# Clients with UPLOADS_WSPRDAEMON_PACK_FILES="yes" upload all their noise lines in one 'noise.wdpack' file (see wd_spots.py),
+# whose records are added to the batch without parsing any text.
+#
+# Usage:  wd_noise_ingest.py [--sink csv:-] [--batch-files 20000] [--delete] DIR_OR_FILE ...
+#
+# The wsprdaemon.org scripts which extract the clients' .tbz uploads are not part of this repository, so nothing here runs this program.
+# On the server, run it on the directory of the extracted 'wsprdaemon/noise' trees (and noise.wdpack files) in place of
+# 'awk -f ts_noise.awk FILES > noise.csv; ts_batch_upload.py -s ts_insert_wd_noise.sql -i noise.csv ...', e.g.:
+#     python3 wd_noise_ingest.py --sink timescale -d ${TS_WD_DB} -u ${TS_WD_WO_USER} -p ${TS_WD_WO_PASSWORD} --delete EXTRACTED_DIR
+#     python3 wd_noise_ingest.py --sink clickhouse -u default -p PASSWORD --delete EXTRACTED_DIR      ### into the wsprdaemon_noise_s table
+# Check what it would insert with:
+#     python3 wd_noise_ingest.py --sink csv:- EXTRACTED_DIR | head
+
+import argparse
+import io
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+from array import array
+
+NOISE_FIELD_COUNT = 15
+NOISE_COLUMNS = ('time', 'site', 'receiver', 'rx_grid', 'band', 'rms_level', 'c2_level', 'ov')
+TS_INSERT_WD_NOISE_SQL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ts_insert_wd_noise.sql')
+
+
+class NoiseBatch:
+    # Columnar store of one batch of noise lines.  The per-directory strings are kept once in 'dirs' and each row just refers to them
+    def __init__(self):
+        self.dirs = []                  # (site, receiver, rx_grid, band)
+        self.dir_index = array('i')
+        self.times = []
+        self.rms_level = array('d')
+        self.c2_level = array('d')
+        self.ov = array('q')
+        self.files = []
+        self.bad_files = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def add_dir(self, dir_path):
+        # .../CALL_GRID/RECEIVER/BAND  =>  site, receiver, rx_grid, band
+        path_elements = os.path.normpath(dir_path).split(os.sep)
+        if len(path_elements) < 3:
+            return None
+        call_grid, receiver, band = path_elements[-3:]
+        call_grid_list = call_grid.split('_')
+        site = call_grid_list[0].replace('=', '/')
+        rx_grid = call_grid_list[1] if len(call_grid_list) > 1 else ''
+        self.dirs.append((site, receiver, rx_grid, band))
+        return len(self.dirs) - 1
+
+    def add_file(self, dir_idx, file_path, file_name):
+        # YYMMDD_HHMM_noise.txt  => '20YY-MM-DD HH:MM:00'
+        if len(file_name) < 11:
+            self.bad_files += 1
+            return
+        timestamp = '20%s-%s-%s %s:%s:00' % (file_name[0:2], file_name[2:4], file_name[4:6], file_name[7:9], file_name[9:11])
+        try:
+            with open(file_path, 'rb') as fp:
+                lines = fp.read().split(b'\n')
+        except OSError:
+            self.bad_files += 1
+            return
+        for line in lines:
+            fields = line.split()
+            if len(fields) != NOISE_FIELD_COUNT:
+                continue
+            try:
+                rms_level, c2_level, ov = float(fields[12]), float(fields[13]), int(float(fields[14]))
+            except ValueError:
+                continue
+            self.dir_index.append(dir_idx)
+            self.times.append(timestamp)
+            self.rms_level.append(rms_level)
+            self.c2_level.append(c2_level)
+            self.ov.append(ov)
+        self.files.append(file_path)
+
+    def add_pack_file(self, file_path):
+        # The file names in a noise.wdpack are relative to the client's uploads/wsprdaemon directory, i.e. CALL_GRID/RECEIVER/BAND/YYMMDD_HHMM_noise.txt
+        import wd_spots
+        try:
+            table = wd_spots.read_pack_file(file_path)
+        except (OSError, ValueError):
+            self.bad_files += 1
+            return
+        if table.kind != 'noise':
+            self.bad_files += 1
+            return
+        dir_indexes = {}
+        file_info = []
+        for name in table.files:
+            dir_path, file_name = os.path.split(name)
+            if dir_path not in dir_indexes:
+                dir_indexes[dir_path] = self.add_dir(dir_path)
+            file_info.append((dir_indexes[dir_path],
+                              '20%s-%s-%s %s:%s:00' % (file_name[0:2], file_name[2:4], file_name[4:6], file_name[7:9], file_name[9:11])))
+        scale = wd_spots.field_scale(dict(wd_spots.NOISE_FIELDS)['rms_level'])
+        rms_level = table.columns['rms_level'] / scale
+        c2_level = table.columns['c2_level'] / scale
+        for row, file_idx in enumerate(table.file_index.tolist()):
+            dir_idx, timestamp = file_info[file_idx]
+            if dir_idx is None:
+                continue
+            self.dir_index.append(dir_idx)
+            self.times.append(timestamp)
+            self.rms_level.append(rms_level[row])
+            self.c2_level.append(c2_level[row])
+            self.ov.append(int(table.columns['ov'][row]))
+        self.files.append(file_path)
+
+    def rows(self):
+        dirs = self.dirs
+        for i in range(len(self.times)):
+            site, receiver, rx_grid, band = dirs[self.dir_index[i]]
+            yield (self.times[i], site, receiver, rx_grid, band, self.rms_level[i], self.c2_level[i], self.ov[i])
+
+    def to_csv_text(self):
+        out = io.StringIO()
+        for row in self.rows():
+            out.write('%s,%s,%s,%s,%s,%s,%s,%s\n' % (row[0], row[1], row[2], row[3], row[4], format_level(row[5]), format_level(row[6]), row[7]))
+        return out.getvalue()
+
+
+def format_level(value):
+    # Print the levels the way they appear in the noise files, e.g. '-123.4' and not '-123.40000000000001'
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+
+def find_noise_batches(paths, batch_files):
+    # Yields NoiseBatch objects holding at most batch_files noise files, scanning each directory only once
+    batch = NoiseBatch()
+    for path in paths:
+        if os.path.isfile(path) and path.endswith('.wdpack'):
+            batch.add_pack_file(path)
+            continue
+        if os.path.isfile(path):
+            # The CALL_GRID/RECEIVER/BAND are taken from the directories, so a bare file name needs its absolute path
+            dir_idx = batch.add_dir(os.path.dirname(os.path.abspath(path)))
+            if dir_idx is None:
+                batch.bad_files += 1
+            else:
+                batch.add_file(dir_idx, path, os.path.basename(path))
+            continue
+        if not os.path.isdir(path):
+            batch.bad_files += 1
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            for file_name in file_names:
+                if file_name.endswith('noise.wdpack'):
+                    batch.add_pack_file(os.path.join(dir_path, file_name))
+            noise_file_names = [name for name in file_names if name.endswith('_noise.txt')]
+            if not noise_file_names:
+                continue
+            dir_idx = batch.add_dir(dir_path)
+            if dir_idx is None:
+                continue
+            for file_name in noise_file_names:
+                batch.add_file(dir_idx, os.path.join(dir_path, file_name), file_name)
+                if len(batch.files) >= batch_files:
+                    yield batch
+                    batch = NoiseBatch()
+                    dir_idx = batch.add_dir(dir_path)
+    if batch.files or batch.bad_files:
+        yield batch
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.fp = sys.stdout if path == '-' else open(path, 'a')
+
+    def write(self, batch):
+        self.fp.write(batch.to_csv_text())
+        self.fp.flush()
+
+
+class TimescaleSink:
+    def __init__(self, args):
+        import psycopg2                  # Only the server has psycopg2 installed, see install_ts_recording_packages()
+        import psycopg2.extras
+        self.extras = psycopg2.extras
+        with open(args.sql_file) as fp:
+            sql = fp.read().strip()
+        # execute_values() wants one 'VALUES %s' placeholder for the whole batch
+        self.sql = sql[:sql.upper().index('VALUES')] + 'VALUES %s'
+        self.conn = psycopg2.connect(dbname=args.database, user=args.username, password=args.password, host=args.address, port=args.ip_port)
+
+    def write(self, batch):
+        with self.conn.cursor() as cur:
+            self.extras.execute_values(cur, self.sql, batch.rows(), page_size=10000)
+        self.conn.commit()
+
+
+class ClickHouseSink:
+    def __init__(self, args):
+        self.url = 'http://%s:%s/?query=%s' % (args.address, args.ip_port,
+                                               urllib.parse.quote('INSERT INTO %s (%s) FORMAT CSV' % (args.table, ', '.join(NOISE_COLUMNS))))
+        self.headers = {}
+        if args.username:
+            self.headers['X-ClickHouse-User'] = args.username
+            self.headers['X-ClickHouse-Key'] = args.password
+
+    def write(self, batch):
+        request = urllib.request.Request(self.url, data=batch.to_csv_text().encode(), headers=self.headers)
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+
+
+def open_sink(args):
+    if args.sink.startswith('csv:'):
+        return CsvSink(args.sink[4:])
+    if args.sink == 'timescale':
+        return TimescaleSink(args)
+    if args.sink == 'clickhouse':
+        return ClickHouseSink(args)
+    raise ValueError("unknown sink '%s'" % args.sink)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk ingest WD noise files into TimescaleDB, ClickHouse or a CSV file')
+    parser.add_argument('paths', nargs='+', help='Noise files or directory trees containing .../CALL_GRID/RECEIVER/BAND/*_noise.txt files')
+    parser.add_argument('--sink', default='csv:-', help="'csv:FILE' ('-' for stdout), 'timescale' or 'clickhouse'")
+    parser.add_argument('--batch-files', type=int, default=20000, help='Max number of noise files in one bulk insert')
+    parser.add_argument('--delete', action='store_true', help='Delete noise files once they have been inserted')
+    parser.add_argument('--sql-file', default=TS_INSERT_WD_NOISE_SQL_FILE, help='INSERT query used for the timescale sink')
+    parser.add_argument('--table', default='wsprdaemon_noise_s', help='Table used for the clickhouse sink, by default the TS_WD_NOISE_TABLE of wd-setup.sh')
+    parser.add_argument('-a', '--address', default=os.environ.get('CLICKHOUSE_HOST', 'localhost'))
+    parser.add_argument('-o', '--ip_port', default=None)
+    parser.add_argument('-d', '--database', default='tutorial')
+    parser.add_argument('-u', '--username', default='')
+    parser.add_argument('-p', '--password', default='')
+    parser.add_argument('-q', '--quiet', action='store_true', help="Don't print the files/s and rows/s report")
+    args = parser.parse_args(argv)
+    if args.ip_port is None:
+        args.ip_port = os.environ.get('CLICKHOUSE_PORT', '8123') if args.sink == 'clickhouse' else '5432'
+
+    sink = open_sink(args)
+    start_time = time.perf_counter()
+    total_files = total_rows = total_bad = 0
+    for batch in find_noise_batches(args.paths, args.batch_files):
+        batch_start = time.perf_counter()
+        if len(batch):
+            sink.write(batch)
+        if args.delete:
+            for file_path in batch.files:
+                os.remove(file_path)
+        total_files += len(batch.files)
+        total_rows += len(batch)
+        total_bad += batch.bad_files
+        if not args.quiet:
+            print('Inserted %d rows from %d files in %.3f seconds' % (len(batch), len(batch.files), time.perf_counter() - batch_start), file=sys.stderr)
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    if not args.quiet:
+        print('Ingested %d rows from %d files (%d unreadable) in %.3f seconds: %.0f files/s, %.0f rows/s' %
+              (total_rows, total_files, total_bad, elapsed, total_files / elapsed, total_rows / elapsed), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
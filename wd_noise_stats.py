@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_noise_stats.py
+# Multi-day statistics of the noise lines which decoding.sh appends to signal_levels/RECEIVER/BAND/signal_levels.txt
+#
+# Each signal_levels.txt is summarized in a 'noise_stats.wdns' file next to it which holds fixed bin histograms of the RMS
+# noise (the lower of the pre and post Tx 'RMS Tr dB' fields) and the C2 (FFT) noise for each UTC hour of each of the last
+# 64 days:
+#     header   'WDNS', uint8 version, uint16 days, uint16 bins, float32 dB of bin 0, float32 dB per bin,
+#              int64 time of the newest line folded in, int64 bytes of signal_levels.txt read, int64 its inode
+#     int32    [days]                       day number (days since 1970-01-01) held in each day slot, or -1
+#     uint8    [days][24][2][bins]          count of the RMS and C2 noise levels in each bin, saturating at 255
+# so the 30 lines per band per hour fit in a uint8 and each band takes about 900 KB.  'update' reads only the lines added to
+# signal_levels.txt since it last ran, so percentiles and diurnal profiles of any span of the last 64 days are answered from
+# the histograms without rescanning the history.  noise_plot.py overlays the envelopes when WD_NOISE_STATS="yes".
+#
+# Usage:
+#     wd_noise_stats.py update  [--root ~/wsprdaemon/signal_levels]
+#     wd_noise_stats.py query   [--root DIR] [--days 30] [--hour HH] [--metric rms|c2] [--percentiles 10,50,90] RECEIVER BAND
+#     wd_noise_stats.py info    [--root DIR]
+
+import argparse
+import calendar
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+WDNS_MAGIC = b'WDNS'
+WDNS_VERSION = 1
+WDNS_HEADER = struct.Struct('<4sBHHffqqq')
+WDNS_FILE_NAME = 'noise_stats.wdns'
+SIGNAL_LEVEL_LOG_FILE_NAME = 'signal_levels.txt'
+DEFAULT_DAYS = 64
+DEFAULT_BINS = 300
+DEFAULT_LOW_DB = -200.0
+DEFAULT_DB_PER_BIN = 0.5
+METRICS = ('rms', 'c2')
+NOISE_FIELD_COUNT = 15
+MAX_READ_BYTES = 64 * 1024 * 1024        # Fold a signal_levels.txt of years of lines in several runs rather than all at once
+
+
+class NoiseStatsError(ValueError):
+    pass
+
+
+class NoiseStats:
+    def __init__(self, days=DEFAULT_DAYS, bins=DEFAULT_BINS, low_db=DEFAULT_LOW_DB, db_per_bin=DEFAULT_DB_PER_BIN):
+        self.low_db = low_db
+        self.db_per_bin = db_per_bin
+        self.last_time = 0
+        self.log_offset = 0
+        self.log_inode = 0
+        self.day_numbers = np.full(days, -1, dtype=np.int32)
+        self.counts = np.zeros((days, 24, len(METRICS), bins), dtype=np.uint8)
+
+    @property
+    def days(self):
+        return self.counts.shape[0]
+
+    @property
+    def bins(self):
+        return self.counts.shape[3]
+
+    @classmethod
+    def read(cls, path):
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        if len(data) < WDNS_HEADER.size:
+            raise NoiseStatsError("'%s' is too short" % path)
+        magic, version, days, bins, low_db, db_per_bin, last_time, log_offset, log_inode = WDNS_HEADER.unpack_from(data)
+        if magic != WDNS_MAGIC or version != WDNS_VERSION:
+            raise NoiseStatsError("'%s' is not a version %d noise stats file" % (path, WDNS_VERSION))
+        counts_size = days * 24 * len(METRICS) * bins
+        if len(data) != WDNS_HEADER.size + 4 * days + counts_size:
+            raise NoiseStatsError("'%s' has %d bytes, not the %d expected" % (path, len(data), WDNS_HEADER.size + 4 * days + counts_size))
+        stats = cls(days, bins, low_db, db_per_bin)
+        stats.last_time, stats.log_offset, stats.log_inode = last_time, log_offset, log_inode
+        stats.day_numbers[:] = np.frombuffer(data, dtype=np.int32, count=days, offset=WDNS_HEADER.size)
+        stats.counts[:] = np.frombuffer(data, dtype=np.uint8, offset=WDNS_HEADER.size + 4 * days).reshape(stats.counts.shape)
+        return stats
+
+    def write(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(WDNS_HEADER.pack(WDNS_MAGIC, WDNS_VERSION, self.days, self.bins, self.low_db, self.db_per_bin,
+                                      self.last_time, self.log_offset, self.log_inode))
+            fp.write(self.day_numbers.tobytes())
+            fp.write(self.counts.tobytes())
+        os.replace(tmp_path, path)
+
+    def fold(self, times, rms_levels, c2_levels):
+        # Add the noise levels of the lines at 'times' (seconds since the epoch) to the histograms of their day and hour
+        if len(times) == 0:
+            return 0
+        times = np.asarray(times, dtype=np.int64)
+        day_numbers = times // 86400
+        for day_number in np.unique(day_numbers):
+            slot = day_number % self.days
+            if day_number > self.day_numbers[slot]:         # Recycle the slot of the day 'days' days earlier
+                self.day_numbers[slot] = day_number
+                self.counts[slot] = 0
+        keep = self.day_numbers[day_numbers % self.days] == day_numbers      # Drop lines older than the oldest day we keep
+        folded = 0
+        counts = self.counts.astype(np.uint16)
+        for metric_index, levels in enumerate((rms_levels, c2_levels)):
+            levels = np.asarray(levels, dtype=np.float64)
+            bin_indexes = np.floor((levels - self.low_db) / self.db_per_bin)
+            valid = keep & np.isfinite(levels) & (bin_indexes >= 0) & (bin_indexes < self.bins)
+            np.add.at(counts, (day_numbers[valid] % self.days, (times[valid] // 3600) % 24, metric_index, bin_indexes[valid].astype(np.intp)), 1)
+            folded += int(np.count_nonzero(valid))
+        np.minimum(counts, 255, out=counts)
+        self.counts[:] = counts
+        self.last_time = max(self.last_time, int(times.max()))
+        return folded
+
+    def histograms(self, days, now=None):
+        # Returns the [24][2][bins] sum of the histograms of the last 'days' days up to and including the day of 'now'
+        today = int((time.time() if now is None else now) // 86400)
+        selected = (self.day_numbers > today - min(days, self.days)) & (self.day_numbers <= today)
+        return self.counts[selected].sum(axis=0, dtype=np.int64)
+
+    def percentiles(self, histogram, percentiles):
+        # Interpolated percentiles in dB of a [..][bins] histogram, NaN where it is empty
+        histogram = np.asarray(histogram, dtype=np.float64)
+        cumulative = np.cumsum(histogram, axis=-1)
+        totals = cumulative[..., -1:]
+        results = []
+        for percentile in percentiles:
+            target = totals * (percentile / 100.0)
+            bin_indexes = np.minimum((cumulative < target).sum(axis=-1, keepdims=True), self.bins - 1)
+            below = np.take_along_axis(cumulative, bin_indexes, axis=-1) - np.take_along_axis(histogram, bin_indexes, axis=-1)
+            in_bin = np.take_along_axis(histogram, bin_indexes, axis=-1)
+            fraction = np.divide(target - below, in_bin, out=np.full(target.shape, 0.5), where=in_bin > 0)
+            level = self.low_db + (bin_indexes + fraction) * self.db_per_bin
+            results.append(np.where(totals > 0, level, np.nan)[..., 0])
+        return np.array(results)
+
+    def profile(self, metric, days, percentiles, now=None):
+        # Returns the [len(percentiles)][24] diurnal profile of 'metric' and the [24] count of levels in each hour
+        histograms = self.histograms(days, now)[:, METRICS.index(metric)]
+        return self.percentiles(histograms, percentiles), histograms.sum(axis=-1)
+
+
+def parse_noise_lines(data):
+    # Parse the 'YYMMDD-HHMM: <15 fields>' lines of signal_levels.txt.  Returns arrays of the times, RMS and C2 noise levels
+    times = []
+    rms_levels = []
+    c2_levels = []
+    for line in data.decode(errors='replace').splitlines():
+        if len(line) < 12 or line[6] != '-' or line[11] != ':' or not line[:6].isdigit():
+            continue                # The two header lines, or a line cut short by a crash
+        fields = line[12:].split()
+        if len(fields) != NOISE_FIELD_COUNT:
+            continue
+        try:
+            line_time = calendar.timegm((2000 + int(line[0:2]), int(line[2:4]), int(line[4:6]), int(line[7:9]), int(line[9:11]), 0))
+            values = [float(field) for field in fields]
+        except ValueError:
+            continue
+        times.append(line_time)
+        rms_levels.append(min(values[3], values[11]))
+        c2_levels.append(values[13])
+    return times, rms_levels, c2_levels
+
+
+def stats_path(signal_levels_dir):
+    return os.path.join(signal_levels_dir, WDNS_FILE_NAME)
+
+
+def load_stats(path):
+    if os.path.exists(path):
+        try:
+            return NoiseStats.read(path)
+        except NoiseStatsError as err:
+            print("Replacing '%s': %s" % (path, err), file=sys.stderr)
+    return NoiseStats()
+
+
+def update_stats(signal_levels_dir):
+    # Fold the lines added to signal_levels.txt since the last update into noise_stats.wdns.  Returns the number of levels folded
+    log_path = os.path.join(signal_levels_dir, SIGNAL_LEVEL_LOG_FILE_NAME)
+    path = stats_path(signal_levels_dir)
+    stats = load_stats(path)
+    try:
+        with open(log_path, 'rb') as fp:
+            log_stat = os.fstat(fp.fileno())
+            if log_stat.st_ino != stats.log_inode or log_stat.st_size < stats.log_offset:
+                stats.log_offset = 0            # A new or truncated file.  Lines already folded are skipped by their time below
+                stats.log_inode = log_stat.st_ino
+            if log_stat.st_size == stats.log_offset:
+                return 0
+            fp.seek(stats.log_offset)
+            data = fp.read(MAX_READ_BYTES)
+    except FileNotFoundError:
+        return 0
+    data = data[:data.rfind(b'\n') + 1]         # Leave a line which is still being written for the next update
+    if not data:
+        return 0
+    times, rms_levels, c2_levels = parse_noise_lines(data)
+    new_lines = [index for index, line_time in enumerate(times) if line_time > stats.last_time]
+    folded = stats.fold([times[index] for index in new_lines], [rms_levels[index] for index in new_lines], [c2_levels[index] for index in new_lines])
+    stats.log_offset += len(data)
+    stats.write(path)
+    return folded
+
+
+def signal_levels_dirs(root):
+    # The signal_levels/RECEIVER/BAND dirs under 'root'
+    dirs = []
+    for receiver in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        receiver_dir = os.path.join(root, receiver)
+        if not os.path.isdir(receiver_dir):
+            continue
+        for band in sorted(os.listdir(receiver_dir)):
+            if os.path.isfile(os.path.join(receiver_dir, band, SIGNAL_LEVEL_LOG_FILE_NAME)):
+                dirs.append(os.path.join(receiver_dir, band))
+    return dirs
+
+
+def noise_envelope(signal_levels_dir, metric, days, percentiles=(10, 50, 90)):
+    # For noise_plot.py: the [len(percentiles)][24] hourly percentiles of 'metric' over the last 'days' days, or None if there are no stats
+    path = stats_path(signal_levels_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        levels, counts = NoiseStats.read(path).profile(metric, days, percentiles)
+    except NoiseStatsError:
+        return None
+    return levels if counts.any() else None
+
+
+def cmd_update(args):
+    for signal_levels_dir in signal_levels_dirs(args.root):
+        folded = update_stats(signal_levels_dir)
+        if args.verbose and folded:
+            print("%s: folded %d noise levels" % (signal_levels_dir, folded))
+    return 0
+
+
+def cmd_query(args):
+    path = stats_path(os.path.join(args.root, args.receiver, args.band))
+    try:
+        stats = NoiseStats.read(path)
+    except (OSError, NoiseStatsError) as err:
+        print("ERROR: %s" % err, file=sys.stderr)
+        return 1
+    percentiles = [float(percentile) for percentile in args.percentiles.split(',')]
+    metrics = METRICS if args.metric == 'all' else (args.metric,)
+    hours = range(24) if args.hour is None else (args.hour,)
+    print('%-6s %4s %7s ' % ('metric', 'hour', 'levels') + ' '.join('%7s' % ('p%g' % percentile) for percentile in percentiles))
+    for metric in metrics:
+        levels, counts = stats.profile(metric, args.days, percentiles)
+        for hour in hours:
+            print('%-6s   %02d %7d ' % (metric, hour, counts[hour]) + ' '.join('%7.1f' % level for level in levels[:, hour]))
+    return 0
+
+
+def cmd_info(args):
+    today = int(time.time() // 86400)
+    for signal_levels_dir in signal_levels_dirs(args.root):
+        path = stats_path(signal_levels_dir)
+        if not os.path.exists(path):
+            print('%s: no stats' % signal_levels_dir)
+            continue
+        stats = NoiseStats.read(path)
+        held_days = stats.day_numbers[stats.day_numbers >= 0]
+        print('%s: %d days from %d days ago, %d levels, newest line %s' %
+              (signal_levels_dir, len(held_days), today - held_days.min() if len(held_days) else 0, int(stats.counts.sum(dtype=np.int64)) // len(METRICS),
+               time.strftime('%y%m%d-%H%M', time.gmtime(stats.last_time)) if stats.last_time else 'none'))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hourly percentiles of the noise levels of many days')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help='Fold the new lines of every signal_levels.txt into its noise_stats.wdns')
+    query_parser = subparsers.add_parser('query', help='Print the hourly percentiles of one receiver and band')
+    info_parser = subparsers.add_parser('info', help='Print the span of each noise_stats.wdns')
+    for sub_parser in (update_parser, query_parser, info_parser):
+        sub_parser.add_argument('--root', default=os.path.expanduser('~/wsprdaemon/signal_levels'))
+    update_parser.add_argument('-v', '--verbose', action='count', default=0)
+    query_parser.add_argument('--days', type=int, default=30)
+    query_parser.add_argument('--hour', type=int, choices=range(24), help='Only this UTC hour, rather than the diurnal profile of all 24')
+    query_parser.add_argument('--metric', choices=METRICS + ('all',), default='all')
+    query_parser.add_argument('--percentiles', default='10,50,90')
+    query_parser.add_argument('receiver')
+    query_parser.add_argument('band')
+    args = parser.parse_args(argv)
+
+    return {'update': cmd_update, 'query': cmd_query, 'info': cmd_info}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
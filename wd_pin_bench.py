@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_pin_bench.py
+# Scores candidate wd-cpu-plan.sh layouts on THIS host by running real decode work under each of them, rather than trusting the
+# fixed heuristics (RADIOD_L3_FRACTION, CORES_PER_RADIOD_MAX, DECODERS_USE_OS_CORE) or waiting for drops.log to show that radiod fell behind.
+#
+# For each combination of --cores-per-radiod, --l3-fractions and --os-core, wd-cpu-plan.sh is run with those overrides and its plan is
+# applied to processes started by this script only (nothing in systemd, and no radiod, is touched):
+#   - a synthetic radiod per radiod instance:  an 'fft' process pinned to WD_RADIODn_FFT_CPU which FFTs blocks streamed from a ring
+#     buffer larger than the L3, and an 'rx' process pinned to WD_RADIODn_RX888_CPU which converts int16 blocks into another ring,
+#     standing in for the memory bandwidth of proc_rx888.  Their throughput is measured alone, then while the decoders run
+#   - --cycles decode cycles, each of which decodes every wav file of the replayed set at once with its processes pinned to
+#     WD_DECODER_CPUS, running what decoding_daemon() runs:  wd_wav_assemble.py, wsprd, jt9 (FST4W) and c2_noise.py.
+#     Stages whose binary or python modules can't run on this host are skipped and reported
+#   - with --apply-cat, run as root with resctrl mounted, the plan's L3 masks are applied to those processes in two temporary
+#     resctrl groups.  Without it the L3 fraction changes nothing, so plans which differ only in it are run once
+# If 'perf' can count on this host, each decode stage runs under 'perf stat' and the instructions per cycle and cache miss rate are reported.
+#
+# The recommended plan is the one with the shortest slowest cycle among those which leave the synthetic radiods at least --radiod-min-ratio
+# of their solo throughput, i.e. the one with the most decoder headroom that doesn't starve radiod.  Its overrides are printed in the
+# form of /etc/wd-cpu-plan.conf.  Run it on an otherwise idle host (WD and radiod stopped), or the numbers mean little.
+#
+# Usage:
+#     wd_pin_bench.py [--wav-dir DIR] [--bands 8] [--cycles 3] [--cores-per-radiod 1,2] [--l3-fractions 0.5,0.62,0.75] [--os-core yes,no]
+#                     [--radiod-instances N] [--load-mb 64] [--load-secs 5] [--radiod-min-ratio 0.9] [--apply-cat] [--json FILE]
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import shlex
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from wd_bench import FIXTURES_DIR, generate_fixtures, missing_modules
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESCTRL_DIR = '/sys/fs/resctrl'
+RESCTRL_GROUPS = ('wd_bench_radiod', 'wd_bench_decoders')
+PERF_EVENTS = 'cycles,instructions,cache-references,cache-misses'
+LOAD_BLOCK_SAMPLES = 1 << 18            # 1 MB of float32 per FFT block
+WSPRD_FLAGS = ['-C', '500', '-o', '4', '-d']        # The default WSPRD_CMD_FLAGS
+WSPRD_FREQ_MHZ = '14.0956'
+
+
+def cpu_list(text):
+    # '0,8,2-3' => [0, 8, 2, 3]
+    cpus = []
+    for part in text.replace(' ', '').split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def pin_to(cpus, resctrl_group=None):
+    # Returns a preexec_fn which moves the child to 'cpus' and, if CAT is applied, into a resctrl group
+    def preexec():
+        os.sched_setaffinity(0, cpus)
+        if resctrl_group:
+            with open(os.path.join(RESCTRL_DIR, resctrl_group, 'tasks'), 'w') as fp:
+                fp.write('%d\n' % os.getpid())
+    return preexec
+
+
+def get_plan(plan_cmd, overrides):
+    # Returns the variables printed by wd-cpu-plan.sh when run with these environment overrides
+    env = dict(os.environ, **overrides)
+    result = subprocess.run(['bash', plan_cmd], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+    plan = {}
+    for line in result.stdout.decode(errors='replace').splitlines():
+        for word in shlex.split(line, comments=True):
+            if '=' in word:
+                key, value = word.split('=', 1)
+                plan[key] = value
+    return plan
+
+
+def find_wsjtx_commands():
+    # Returns {'wsprd': path, 'jt9': path} of the bin/ files which run on this host, tested like find_wsjtx_commands() in wd-setup.sh
+    commands = {}
+    for path in sorted(glob.glob(os.path.join(WD_ROOT_DIR, 'bin', '*'))):
+        name = os.path.basename(path)
+        command = 'jt9' if name.startswith('jt9') else 'wsprd' if name.startswith('wsprd') and not name.startswith('wsprd.spread') else None
+        if command is None or command in commands or not os.access(path, os.X_OK):
+            continue
+        try:
+            result = subprocess.run([path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if b'Usage' in result.stdout:
+            commands[command] = path
+    return commands
+
+
+def perf_works():
+    try:
+        return subprocess.run(['perf', 'stat', '-x,', '-e', PERF_EVENTS, '--', 'true'], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def read_perf_counts(path):
+    # 'perf stat -x,' lines are 'VALUE,UNIT,EVENT,...'.  Returns {EVENT: count} of the events which were counted
+    counts = {}
+    try:
+        with open(path) as fp:
+            for line in fp:
+                fields = line.strip().split(',')
+                if len(fields) >= 3 and fields[0].replace('.', '', 1).isdigit():
+                    counts[fields[2].split(':')[0]] = float(fields[0])
+    except OSError:
+        pass
+    return counts
+
+
+##################################################  The synthetic radiod  ##################################################
+
+def load_loop(role, load_mb):
+    # Runs in a child 'wd_pin_bench.py _load' process until SIGTERM.  On each SIGUSR1 prints 'BLOCKS SECONDS' since the last SIGUSR1
+    import numpy as np
+    samples = max(LOAD_BLOCK_SAMPLES * 2, load_mb * (1 << 20) // 4)
+    samples -= samples % LOAD_BLOCK_SAMPLES
+    rng = np.random.default_rng(1)
+    if role == 'fft':
+        ring = rng.standard_normal(samples, dtype=np.float32)
+    else:
+        ring = rng.integers(-32768, 32767, samples, dtype=np.int16)
+        output = np.empty(samples, dtype=np.float32)
+    report = []
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report.append(True))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print('READY', flush=True)
+    blocks = 0
+    offset = 0
+    start = time.perf_counter()
+    while True:
+        block = slice(offset, offset + LOAD_BLOCK_SAMPLES)
+        if role == 'fft':
+            np.fft.rfft(ring[block])
+        else:
+            np.multiply(ring[block], 1.0 / 32768, out=output[block], dtype=np.float32)
+        blocks += 1
+        offset = (offset + LOAD_BLOCK_SAMPLES) % samples
+        if report:
+            report.clear()
+            now = time.perf_counter()
+            print('%d %.6f' % (blocks, now - start), flush=True)
+            blocks = 0
+            start = now
+
+
+class SyntheticRadiods:
+    def __init__(self, plan, load_mb, resctrl_group):
+        self.procs = []
+        for i in range(int(plan.get('WD_RADIOD_INSTANCES', '0'))):
+            for role, cpu_key in (('fft', 'WD_RADIOD%d_FFT_CPU' % i), ('rx', 'WD_RADIOD%d_RX888_CPU' % i)):
+                cpus = cpu_list(plan.get(cpu_key, ''))
+                if cpus:
+                    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '_load', role, '--load-mb', str(load_mb)],
+                                            stdout=subprocess.PIPE, preexec_fn=pin_to(cpus, resctrl_group))
+                    self.procs.append((role, proc))
+        for _, proc in self.procs:
+            if proc.stdout.readline().strip() != b'READY':         # Its SIGUSR1 handler is installed, so checkpoint() won't kill it
+                self.stop()
+                raise OSError('a synthetic radiod process failed to start')
+
+    def checkpoint(self):
+        # Returns the MB/s of each synthetic radiod process since the previous checkpoint
+        rates = []
+        for _, proc in self.procs:
+            proc.send_signal(signal.SIGUSR1)
+        for _, proc in self.procs:
+            line = proc.stdout.readline().split()
+            if len(line) != 2:
+                raise OSError('a synthetic radiod process died')
+            rates.append(int(line[0]) * LOAD_BLOCK_SAMPLES * 4 / 1e6 / max(float(line[1]), 1e-6))
+        return rates
+
+    def stop(self):
+        for _, proc in self.procs:
+            proc.terminate()
+        for _, proc in self.procs:
+            proc.wait()
+
+
+##################################################  The decode cycles  ##################################################
+
+def decode_stages(wav_path, job_dir, commands, c2_fixture):
+    # Returns [(stage, argv)] as decoding_daemon() runs them on one band's wav file
+    decoder_wav = os.path.join(job_dir, 'decoder.wav')
+    stages = [('assemble', [sys.executable, os.path.join(WD_ROOT_DIR, 'wd_wav_assemble.py'), '--output', decoder_wav, wav_path])]
+    if 'wsprd' in commands:
+        stages.append(('wsprd', [commands['wsprd'], '-c'] + WSPRD_FLAGS + ['-f', WSPRD_FREQ_MHZ, decoder_wav]))
+        c2_file = os.path.join(job_dir, '000000_0001.c2')
+    else:
+        c2_file = c2_fixture            # So the noise calculation still runs
+    if 'jt9' in commands:
+        stages.append(('jt9', [commands['jt9'], '-a', job_dir, '--fst4w', '-p', '120', '-f', '1500', '-F', '100', decoder_wav]))
+    stages.append(('c2_noise', [sys.executable, os.path.join(WD_ROOT_DIR, 'c2_noise.py'), c2_file]))
+    return stages
+
+
+def run_job(stages, job_dir, preexec, use_perf, results):
+    stage_walls = {}
+    counts = {}
+    for stage, argv in stages:
+        perf_file = os.path.join(job_dir, stage + '.perf')
+        if use_perf:
+            argv = ['perf', 'stat', '-x,', '-e', PERF_EVENTS, '-o', perf_file, '--'] + argv
+        start = time.perf_counter()
+        rc = subprocess.run(argv, cwd=job_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, preexec_fn=preexec).returncode
+        stage_walls[stage] = time.perf_counter() - start
+        if rc != 0:
+            stage_walls[stage + '_failed'] = rc
+        for event, count in read_perf_counts(perf_file).items():
+            counts[event] = counts.get(event, 0.0) + count
+    results.append((stage_walls, counts))
+
+
+def run_cycle(wav_paths, work_dir, commands, c2_fixture, preexec, use_perf):
+    # Decodes all the wav files at once, as the decoding daemons of all the bands do at the start of each cycle.  Returns (seconds, stage walls, counts)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    threads = []
+    results = []
+    start = time.perf_counter()
+    for index, wav_path in enumerate(wav_paths):
+        job_dir = os.path.join(work_dir, 'band_%02d' % index)
+        os.makedirs(job_dir)
+        thread = threading.Thread(target=run_job, args=(decode_stages(wav_path, job_dir, commands, c2_fixture), job_dir, preexec, use_perf, results))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    cycle_secs = time.perf_counter() - start
+    stage_walls = {}
+    counts = {}
+    for walls, job_counts in results:
+        for stage, wall in walls.items():
+            stage_walls.setdefault(stage, []).append(wall)
+        for event, count in job_counts.items():
+            counts[event] = counts.get(event, 0.0) + count
+    return cycle_secs, stage_walls, counts
+
+
+##################################################  CAT  ##################################################
+
+def cat_setup(plan):
+    # Creates the two resctrl groups with the plan's L3 masks.  Returns an error string, or '' if they were created
+    if not plan.get('WD_L3_RADIOD_MASK'):
+        return 'the plan has no L3 masks'
+    if not os.path.isfile(os.path.join(RESCTRL_DIR, 'schemata')):
+        return '%s is not mounted' % RESCTRL_DIR
+    try:
+        for group, mask in zip(RESCTRL_GROUPS, (plan['WD_L3_RADIOD_MASK'], plan['WD_L3_OTHER_MASK'])):
+            os.makedirs(os.path.join(RESCTRL_DIR, group), exist_ok=True)
+            with open(os.path.join(RESCTRL_DIR, group, 'schemata'), 'w') as fp:
+                fp.write('L3:0=%s\n' % mask)
+    except OSError as err:
+        cat_remove()
+        return str(err)
+    return ''
+
+
+def cat_remove():
+    for group in RESCTRL_GROUPS:
+        try:
+            os.rmdir(os.path.join(RESCTRL_DIR, group))          # Its tasks go back to the default group
+        except OSError:
+            pass
+
+
+##################################################  The benchmark  ##################################################
+
+def candidate_plans(args):
+    # Returns [(label, overrides, plan)] with the plans which would lay out the processes identically removed
+    plans = []
+    seen = set()
+    for cores, fraction, os_core in itertools.product(args.cores_per_radiod.split(','), args.l3_fractions.split(','), args.os_core.split(',')):
+        overrides = {'CORES_PER_RADIOD_MAX': cores, 'RADIOD_L3_FRACTION': fraction, 'DECODERS_USE_OS_CORE': os_core}
+        if args.radiod_instances:
+            overrides['RADIOD_INSTANCES'] = str(args.radiod_instances)
+        plan = get_plan(args.plan_cmd, overrides)
+        label = 'cores=%s l3=%s os_core=%s' % (cores, fraction, os_core)
+        if plan.get('WD_PLAN_OK') != 'yes':
+            print('%s: wd-cpu-plan.sh has no plan: %s' % (label, plan.get('WD_PLAN_REASON', 'it printed no WD_PLAN_OK=yes')))
+            continue
+        key = tuple(sorted((name, value) for name, value in plan.items()
+                           if name.endswith('_CPU') or name.endswith('_CPUS') or (args.apply_cat and name.startswith('WD_L3_') and name.endswith('_MASK'))))
+        if key in seen:
+            continue
+        seen.add(key)
+        plans.append((label, overrides, plan))
+    return plans
+
+
+def bench_plan(label, plan, args, wav_paths, commands, c2_fixture, use_perf):
+    decoder_cpus = cpu_list(plan.get('WD_DECODER_CPUS', ''))
+    result = {'plan': label, 'decoder_cpus': plan.get('WD_DECODER_CPUS', ''),
+              'radiod_cpus': ' '.join(plan.get('WD_RADIOD%d_CPUS' % i, '') for i in range(int(plan.get('WD_RADIOD_INSTANCES', '0'))))}
+    if not decoder_cpus:
+        result['skipped'] = 'no decoder CPUs'
+        return result
+    cat_error = cat_setup(plan) if args.apply_cat else 'not requested'
+    result['cat'] = 'applied' if not cat_error else 'not applied: ' + cat_error
+    try:
+        radiods = SyntheticRadiods(plan, args.load_mb, None if cat_error else RESCTRL_GROUPS[0])
+    except OSError as err:
+        cat_remove()
+        result['skipped'] = str(err)
+        return result
+    try:
+        radiods.checkpoint()
+        time.sleep(args.load_secs)
+        solo = radiods.checkpoint()
+        cycle_secs = []
+        stage_walls = {}
+        counts = {}
+        for cycle in range(args.cycles):
+            secs, walls, cycle_counts = run_cycle(wav_paths, os.path.join(args.work_dir, 'cycle'), commands, c2_fixture,
+                                                  pin_to(decoder_cpus, None if cat_error else RESCTRL_GROUPS[1]), use_perf)
+            cycle_secs.append(secs)
+            for stage, values in walls.items():
+                stage_walls.setdefault(stage, []).extend(values)
+            for event, count in cycle_counts.items():
+                counts[event] = counts.get(event, 0.0) + count
+        loaded = radiods.checkpoint()
+    except OSError as err:
+        result['skipped'] = str(err)
+        return result
+    finally:
+        radiods.stop()
+        if not cat_error:
+            cat_remove()
+    result.update({
+        'cycle_secs': cycle_secs,
+        'cycle_median': statistics.median(cycle_secs),
+        'cycle_max': max(cycle_secs),
+        'stage_median_secs': {stage: statistics.median(values) for stage, values in stage_walls.items() if not stage.endswith('_failed')},
+        'failed_stages': sorted(set(stage[:-len('_failed')] for stage in stage_walls if stage.endswith('_failed'))),
+        'radiod_solo_mb_per_sec': solo,
+        'radiod_loaded_mb_per_sec': loaded,
+        'radiod_ratio': min((l / s for s, l in zip(solo, loaded) if s > 0), default=1.0),
+    })
+    if counts.get('cycles') and counts.get('instructions'):
+        result['ipc'] = counts['instructions'] / counts['cycles']
+    if counts.get('cache-references') and 'cache-misses' in counts:
+        result['cache_miss_pct'] = 100.0 * counts['cache-misses'] / counts['cache-references']
+    return result
+
+
+def recommend(results, min_ratio):
+    # Returns (result, reason)
+    measured = [result for result in results if 'skipped' not in result]
+    if not measured:
+        return None, 'no plan could be measured'
+    eligible = [result for result in measured if result['radiod_ratio'] >= min_ratio]
+    if eligible:
+        return min(eligible, key=lambda result: result['cycle_max']), 'the shortest slowest cycle which keeps every synthetic radiod at >= %.0f%% of its solo throughput' % (100 * min_ratio)
+    return max(measured, key=lambda result: result['radiod_ratio']), 'no plan kept the synthetic radiods at %.0f%% of their solo throughput, so the plan which starved them least' % (100 * min_ratio)
+
+
+def print_results(results):
+    print('%-34s %-16s %-14s %9s %9s %8s %6s %7s  %s' % ('PLAN', 'RADIOD_CPUS', 'DECODER_CPUS', 'CYCLE_MED', 'CYCLE_MAX', 'RADIOD%', 'IPC', 'MISS%', 'CAT'))
+    for result in results:
+        if 'skipped' in result:
+            print('%-34s skipped: %s' % (result['plan'], result['skipped']))
+            continue
+        print('%-34s %-16s %-14s %9.2f %9.2f %7.0f%% %6s %7s  %s' % (result['plan'], result['radiod_cpus'], result['decoder_cpus'], result['cycle_median'],
+              result['cycle_max'], 100 * result['radiod_ratio'], '%.2f' % result['ipc'] if 'ipc' in result else '-',
+              '%.1f' % result['cache_miss_pct'] if 'cache_miss_pct' in result else '-', result['cat']))
+        print('%-34s stage medians: %s%s' % ('', ', '.join('%s %.2fs' % item for item in sorted(result['stage_median_secs'].items())),
+              '   FAILED: %s' % ' '.join(result['failed_stages']) if result['failed_stages'] else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score wd-cpu-plan.sh layouts by decoding wav files under a synthetic radiod load')
+    subparsers = parser.add_subparsers(dest='command')
+    load_parser = subparsers.add_parser('_load')
+    load_parser.add_argument('role', choices=('fft', 'rx'))
+    load_parser.add_argument('--load-mb', type=int, default=64)
+    parser.add_argument('--plan-cmd', default=os.environ.get('WD_CPU_PLAN', os.path.join(WD_ROOT_DIR, 'wd-cpu-plan.sh')))
+    parser.add_argument('--wav-dir', default='', help='Replay the *.wav files in this dir, one per band.  Default: --bands copies of the wd_bench.py 2 minute wav')
+    parser.add_argument('--bands', type=int, default=8)
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--cores-per-radiod', default='1,2')
+    parser.add_argument('--l3-fractions', default='0.5,0.62,0.75')
+    parser.add_argument('--os-core', default='yes,no')
+    parser.add_argument('--radiod-instances', type=int, default=0, help='Default: as wd-cpu-plan.sh detects')
+    parser.add_argument('--load-mb', type=int, default=64, help='Size of the ring buffer of each synthetic radiod process.  Make it larger than the L3')
+    parser.add_argument('--load-secs', type=float, default=5.0, help='Measure the synthetic radiods alone for this long')
+    parser.add_argument('--radiod-min-ratio', type=float, default=0.9)
+    parser.add_argument('--apply-cat', action='store_true', help='Apply the L3 masks with resctrl (needs root)')
+    parser.add_argument('--fixtures-dir', default=FIXTURES_DIR)
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'wd_pin_bench'))
+    parser.add_argument('--json', default='', help='Also save the results to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == '_load':
+        load_loop(args.role, args.load_mb)
+        return 0
+
+    paths = generate_fixtures(args.fixtures_dir, 20261019)
+    if args.wav_dir:
+        wav_paths = sorted(glob.glob(os.path.join(args.wav_dir, '*.wav')))
+        if not wav_paths:
+            print("No *.wav files in '%s'" % args.wav_dir, file=sys.stderr)
+            return 2
+    else:
+        wav_paths = [paths['wav']] * args.bands
+    commands = find_wsjtx_commands()
+    use_perf = perf_works()
+    print('Decoding %d wav files per cycle with: wd_wav_assemble, %s c2_noise.  perf counters: %s' %
+          (len(wav_paths), ''.join('%s, ' % command for command in ('wsprd', 'jt9') if command in commands), 'yes' if use_perf else 'no'))
+    for command in ('wsprd', 'jt9'):
+        if command not in commands:
+            print('WARNING: no bin/%s* runs on this host, so that stage is skipped' % command)
+    if missing_modules(('numpy',)):
+        print('ERROR: numpy is needed by the synthetic radiods and the decode stages', file=sys.stderr)
+        return 1
+
+    plans = candidate_plans(args)
+    if not plans:
+        print('wd-cpu-plan.sh produced no plan to benchmark on this host')
+        return 1
+    results = []
+    for label, overrides, plan in plans:
+        print('Benchmarking %s ...' % label, flush=True)
+        result = bench_plan(label, plan, args, wav_paths, commands, paths['c2'], use_perf)
+        result['overrides'] = overrides
+        results.append(result)
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    print_results(results)
+    best, reason = recommend(results, args.radiod_min_ratio)
+    if best:
+        print('RECOMMENDED: %s, %s.  In /etc/wd-cpu-plan.conf:' % (best['plan'], reason))
+        for name, value in best['overrides'].items():
+            print('%s=%s' % (name, value))
+    else:
+        print('No recommendation: %s' % reason)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({'results': results, 'recommended': best['plan'] if best else None}, fp, indent=1)
+    return 0 if best else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
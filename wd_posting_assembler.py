@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_posting_assembler.py
+# Event driven replacement for the 'find -L posting_suppliers.d ... | sort -u' polling loop of each posting_daemon()
+#
+# The decoding daemons hard link each YYMMDD_HHMM_spots.txt file into the decoding_clients.d/<POSTING_RECEIVER> dir of every
+# posting daemon they supply.  When WD_POSTING_ASSEMBLER="yes", each posting_daemon() instead sends a one line UDP datagram to
+# this daemon on 127.0.0.1:PORT when it starts, and another every POSTING_DAEMON_POLLING_RATE seconds while it is idle:
+#
+#     START <CYCLES_FIFO_PATH> <SUPPLIER_DIR> ...      forget any state of that posting daemon and look for spot files already in its supplier dirs
+#     WATCH <CYCLES_FIFO_PATH> <SUPPLIER_DIR> ...      the same if this daemon doesn't know that posting daemon (e.g. after a restart), otherwise just 'still alive'
+#
+# This daemon watches all the supplier dirs of all the posting daemons with one inotify fd and tracks which suppliers have
+# delivered each cycle.  A cycle is written to the posting daemon's FIFO as one line:
+#
+#     <YYMMDD_HHMM> <SPOT_FILE_PATH> ...
+#
+# as soon as every supplier has delivered it, or when a newer cycle arrives, or --timeout-secs after its first spot file arrived.
+# So a posting daemon blocks in 'read -t' on its FIFO and posts each cycle the moment it is complete, without any 'find'.
+# A posting daemon which hasn't sent WATCH for --expire-secs is forgotten.  If its FIFO has no reader, its cycles are kept
+# until it reopens it, and are written again on its next WATCH or at most once every UNDELIVERABLE_RETRY_SECS.
+#
+# Usage:
+#     wd_posting_assembler.py [--port 58034] [--timeout-secs 30] [--expire-secs 120] [--log-file FILE] [-v]
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+import wd_utils
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct('iIII')
+UNDELIVERABLE_RETRY_SECS = 1.0
+
+spot_filename_regex = re.compile(r'^(\d{6}_\d{4})_spots\.txt$')
+
+
+class Inotify:
+    # The inotify(7) calls through ctypes, so WD needs no python package for them
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch('%s') failed" % path)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        # Returns a list of (wd, mask, name)
+        events = []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_length].rstrip(b'\0').decode(errors='replace')
+            offset += name_length
+            events.append((wd, mask, name))
+        return events
+
+
+class PostingJob:
+    # The suppliers of one posting daemon and the spot files of each cycle they have delivered
+    def __init__(self, fifo_path, supplier_dirs):
+        self.fifo_path = fifo_path
+        self.supplier_dirs = supplier_dirs
+        self.cycles = {}                    # YYMMDD_HHMM => {supplier_dir: spot_file_path}
+        self.first_arrival = {}             # YYMMDD_HHMM => time.time() of the first spot file of that cycle
+        self.last_watch = time.time()
+        self.retry_after = 0.0              # After a cycle couldn't be written to the FIFO, don't try again before this time or the next WATCH
+
+    def add_spot_file(self, supplier_dir, name):
+        match = spot_filename_regex.match(name)
+        if not match:
+            return
+        cycle = match.group(1)
+        self.cycles.setdefault(cycle, {})[supplier_dir] = os.path.join(supplier_dir, name)
+        self.first_arrival.setdefault(cycle, time.time())
+
+    def ready_cycles(self, now, timeout_secs):
+        # Cycles which all suppliers have delivered, which are older than a cycle which has started to arrive, or which have timed out
+        ready = []
+        newest = max(self.cycles) if self.cycles else None
+        for cycle in sorted(self.cycles):
+            if len(self.cycles[cycle]) >= len(self.supplier_dirs) or cycle < newest or now - self.first_arrival[cycle] >= timeout_secs:
+                ready.append(cycle)
+        return ready
+
+    def next_timeout(self, timeout_secs):
+        if not self.first_arrival:
+            return None
+        return max(min(self.first_arrival.values()) + timeout_secs, self.retry_after)
+
+
+class PostingAssembler:
+    def __init__(self, args):
+        self.args = args
+        self.inotify = Inotify()
+        self.jobs = {}                      # CYCLES_FIFO_PATH => PostingJob
+        self.watches = {}                   # inotify wd => supplier dir
+        self.supplier_watches = {}          # supplier dir => inotify wd
+        self.supplier_jobs = {}             # supplier dir => PostingJob
+
+    def watch(self, fifo_path, supplier_dirs, restart=False):
+        job = self.jobs.get(fifo_path)
+        if job and job.supplier_dirs == supplier_dirs and not restart and all(supplier_dir in self.supplier_watches for supplier_dir in supplier_dirs):
+            job.last_watch = time.time()
+            job.retry_after = 0.0
+            return
+        if job:
+            if not restart:
+                wd_logger(1, "The suppliers of '%s' changed to %s" % (fifo_path, ' '.join(supplier_dirs)))
+            self.forget(job)
+        job = self.jobs[fifo_path] = PostingJob(fifo_path, supplier_dirs)
+        for supplier_dir in supplier_dirs:
+            try:
+                wd = self.inotify.add_watch(supplier_dir)
+            except OSError as err:
+                wd_logger(1, 'ERROR: %s' % err)
+                continue
+            self.watches[wd] = supplier_dir
+            self.supplier_watches[supplier_dir] = wd
+            self.supplier_jobs[supplier_dir] = job
+            for name in os.listdir(supplier_dir):      # Spot files which arrived before this WATCH
+                job.add_spot_file(supplier_dir, name)
+        wd_logger(1, "Watching %d supplier dirs for '%s'" % (len(supplier_dirs), fifo_path))
+
+    def forget(self, job):
+        for supplier_dir in job.supplier_dirs:
+            wd = self.supplier_watches.pop(supplier_dir, None)
+            if wd is not None:
+                self.inotify.rm_watch(wd)
+                self.watches.pop(wd, None)
+            if self.supplier_jobs.get(supplier_dir) is job:
+                del self.supplier_jobs[supplier_dir]
+        self.jobs.pop(job.fifo_path, None)
+
+    def handle_message(self, message):
+        fields = message.split()
+        if len(fields) >= 3 and fields[0] in ('START', 'WATCH'):
+            self.watch(fields[1], fields[2:], restart=(fields[0] == 'START'))
+        else:
+            wd_logger(1, "ERROR: unknown message '%s'" % message)
+
+    def handle_inotify_events(self):
+        for wd, mask, name in self.inotify.read_events():
+            supplier_dir = self.watches.get(wd)
+            if supplier_dir is None:
+                continue
+            if mask & IN_IGNORED:
+                # The supplier dir was removed, e.g. by a schedule change.  The next WATCH will add it again if it comes back
+                del self.watches[wd]
+                self.supplier_watches.pop(supplier_dir, None)
+                continue
+            job = self.supplier_jobs.get(supplier_dir)
+            if job:
+                job.add_spot_file(supplier_dir, name)
+
+    def post_ready_cycles(self, now):
+        for job in list(self.jobs.values()):
+            if now - job.last_watch > self.args.expire_secs:
+                wd_logger(1, "Forgetting '%s' which hasn't sent WATCH for %d seconds" % (job.fifo_path, now - job.last_watch))
+                self.forget(job)
+                continue
+            if now < job.retry_after:
+                continue
+            for cycle in job.ready_cycles(now, self.args.timeout_secs):
+                spot_files = [path for path in job.cycles[cycle].values() if os.path.exists(path)]
+                if spot_files and not self.write_cycle(job, cycle, spot_files):
+                    job.retry_after = now + UNDELIVERABLE_RETRY_SECS
+                    break                   # Try again later, in order
+                wd_logger(2, "'%s' cycle %s: %d of %d suppliers after %.1f seconds" %
+                          (job.fifo_path, cycle, len(spot_files), len(job.supplier_dirs), now - job.first_arrival[cycle]))
+                del job.cycles[cycle]
+                del job.first_arrival[cycle]
+
+    def write_cycle(self, job, cycle, spot_files):
+        line = ('%s %s\n' % (cycle, ' '.join(spot_files))).encode()
+        try:
+            fd = os.open(job.fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as err:
+            if err.errno not in (errno.ENXIO, errno.ENOENT):        # No reader (e.g. the posting daemon is restarting) or no FIFO yet
+                wd_logger(1, "ERROR: can't open '%s': %s" % (job.fifo_path, err))
+            return False
+        try:
+            os.write(fd, line)                                      # Lines shorter than PIPE_BUF are written atomically
+        except OSError as err:
+            wd_logger(1, "ERROR: can't write cycle %s to '%s': %s" % (cycle, job.fifo_path, err))
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def next_timeout(self, now):
+        timeouts = [timeout for timeout in (job.next_timeout(self.args.timeout_secs) for job in self.jobs.values()) if timeout]
+        return max(0.0, min(timeouts + [now + self.args.expire_secs]) - now)
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', self.args.port))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        wd_logger(1, 'Listening on 127.0.0.1:%d with a cycle timeout of %.0f seconds' % (self.args.port, self.args.timeout_secs))
+        while True:
+            readable, _, _ = select.select([sock, self.inotify.fd], [], [], self.next_timeout(time.time()))
+            if sock in readable:
+                data, _ = sock.recvfrom(65536)
+                for message in data.decode(errors='replace').splitlines():
+                    self.handle_message(message)
+            if self.inotify.fd in readable:
+                self.handle_inotify_events()
+            self.post_ready_cycles(time.time())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tell the posting daemons when each WSPR cycle of spot files is complete')
+    parser.add_argument('--port', type=int, default=58034)
+    parser.add_argument('--timeout-secs', type=float, default=30.0, help='Post a cycle this long after its first spot file arrived, even if some suppliers have not delivered it')
+    parser.add_argument('--expire-secs', type=float, default=120.0, help="Forget a posting daemon which hasn't sent WATCH for this long")
+    parser.add_argument('--log-file', default='')
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+    args = parser.parse_args(argv)
+
+    set_log_file(args.log_file)
+    wd_utils.verbosity += args.verbose
+    setup_verbosity_traps()
+    PostingAssembler(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
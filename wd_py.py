@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_py.py
+# A pool of pre-forked python interpreters for the WD python helpers which bash runs every cycle (c2_noise.py,
+# derived_calc.py, get-peak-wav-sample.py, suntimes.py, noise_plot.py, wav_window.py, ...), so they no longer each pay for
+# starting python and importing numpy, scipy and soundfile.
+#
+# 'serve' imports the available heavy modules and the helpers once, then keeps --workers forked children blocked in accept()
+# on a UNIX socket.  Each child runs one request and exits, and the server forks a replacement, so every request starts in a
+# fresh copy of the pre-imported interpreter.  A request carries the helper name, its args, the caller's cwd and nice level,
+# and the caller's stdin, stdout and stderr file descriptors (SCM_RIGHTS), so the helper behaves as if bash had run it.
+# The 'wd-py' bash script is the client:
+#     wd-py HELPER ARGS ...        e.g. 'wd-py c2_noise 000000_0001.c2'
+# It runs 'wd_py.py run' if the pool's socket exists, and otherwise runs 'python3 HELPER.py ARGS ...' as before.
+# 'run' also falls back to running the helper in a new python3 if the server can't import it.
+#
+# Usage:
+#     wd_py.py serve [--socket PATH] [--workers 4] [--preload numpy,scipy.signal,...] [--log-file FILE]
+#     wd_py.py run   [--socket PATH] HELPER [ARGS ...]
+#
+# Only the modules needed by 'run' are imported at the top of this file, so the client is little more than a bare 'python3 -S -I'.
+# It uses the C _socket module since importing 'socket' (and its enum and selectors imports) alone takes longer than the rest of the client.
+# On the 1 CPU bench VM, where a bare 'python3 -S -I' takes 8-11 ms to start, 'wd-py suntimes' takes 16-25 ms (median 18 ms) against
+# 23-32 ms for 'python3 suntimes.py', and the pool's share of that is about 1 ms.  So the dispatch overhead is that of starting the
+# python3 client, and a dispatch in under 10 ms would need a client which isn't python.  The saving grows with the helper's imports,
+# e.g. c2_noise goes from 135 ms cold to 28 ms
+
+import _socket
+import os
+import struct
+import sys
+
+WD_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+WD_PY_POOL_SOCKET = '/dev/shm/wsprdaemon/wd_py.sock'
+WD_PY_PRELOAD = 'numpy,numpy.fft,scipy.signal,scipy.io.wavfile,soundfile'
+WD_PY_HELPERS = ('c2_noise', 'derived_calc', 'get_peak_wav_sample', 'noise_plot', 'suntimes', 'wav_window', 'wd_iq_ingest', 'wd_noise_cal', 'wd_noise_stats', 'wd_wav_assemble', 'wwv_start')
+
+REQUEST_STARTED = b'S'              # The child is running the helper.  Its exit code follows as a little endian int32
+REQUEST_FALLBACK = b'F'             # The server can't run the helper, so the client should run it in a new python3
+MAX_REQUEST_BYTES = 1 << 20
+
+
+def helper_path(helper):
+    # 'c2_noise' => c2_noise.py,  'get_peak_wav_sample' => get-peak-wav-sample.py
+    path = os.path.join(WD_ROOT_DIR, helper + '.py')
+    if not os.path.exists(path):
+        path = os.path.join(WD_ROOT_DIR, helper.replace('_', '-') + '.py')
+    return path
+
+
+def run_in_new_python(helper, args):
+    os.execvp('python3', ['python3', helper_path(helper)] + args)
+
+
+def recv_exactly(sock, count):
+    data = b''
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def cmd_run(socket_path, helper, args):
+    # Fields of the request are NUL separated:  helper, cwd, nice level, args...
+    request = b'\0'.join([os.fsencode(helper), os.fsencode(os.getcwd()), b'%d' % os.nice(0)] + [os.fsencode(arg) for arg in args])
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendmsg([struct.pack('<I', len(request)) + request], [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, struct.pack('3i', 0, 1, 2))])
+        reply = sock.recv(1)
+    except OSError:
+        reply = b''
+    if reply != REQUEST_STARTED:
+        sock.close()
+        run_in_new_python(helper, args)          # Never returns
+    status = recv_exactly(sock, 4)
+    if len(status) != 4:
+        print("wd-py: the pool worker running '%s' died" % helper, file=sys.stderr)
+        return 1
+    return struct.unpack('<i', status)[0]
+
+
+# ---------------------------------------------------------------- server ----------------------------------------------------------------
+
+def load_helper(helper):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('wd_py_helper_' + helper, helper_path(helper))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not callable(getattr(module, 'main', None)):
+        raise ImportError('%s has no main(argv)' % spec.origin)
+    return module
+
+
+def exit_code(code):
+    # The exit code python would give for 'sys.exit(code)'
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xff
+    print(code, file=sys.stderr)
+    return 1
+
+
+def run_request(conn, helpers):
+    # In a pool child:  receive one request, run the helper with the caller's fds and cwd, and return its exit code
+    import socket
+    import threading
+    import traceback
+    header, fds, _, _ = socket.recv_fds(conn, 4 + MAX_REQUEST_BYTES, 3)
+    if len(header) < 4 or len(fds) != 3:
+        return
+    length = struct.unpack_from('<I', header)[0]
+    request = header[4:] + recv_exactly(conn, length - len(header) + 4)
+    fields = request.split(b'\0')
+    helper, cwd, nice = os.fsdecode(fields[0]), os.fsdecode(fields[1]), int(fields[2])
+    args = [os.fsdecode(field) for field in fields[3:]]
+    if helper not in helpers:
+        conn.sendall(REQUEST_FALLBACK)
+        return
+    try:
+        os.chdir(cwd)
+    except OSError:
+        conn.sendall(REQUEST_FALLBACK)
+        return
+    for fd, target in zip(fds, (0, 1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False)
+    os.nice(max(nice - os.nice(0), 0))
+    conn.sendall(REQUEST_STARTED)
+
+    def exit_if_caller_dies():
+        # e.g. when 'timeout' kills the wd-py client, the helper is killed too
+        conn.recv(1)
+        os._exit(1)
+    threading.Thread(target=exit_if_caller_dies, daemon=True).start()
+
+    sys.argv = [helper_path(helper)] + args
+    try:
+        rc = exit_code(helpers[helper].main(args))
+    except SystemExit as err:
+        rc = exit_code(err.code)
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except OSError:
+            pass
+    conn.sendall(struct.pack('<i', rc))
+
+
+def pool_child(listener, helpers):
+    import signal
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        conn, _ = listener.accept()
+        listener.close()
+        run_request(conn, helpers)
+    except OSError:
+        pass
+    finally:
+        os._exit(0)         # Never return into the server's loop
+
+
+def cmd_serve(args):
+    import importlib
+    import signal
+    import socket
+    from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+    import wd_utils
+
+    set_log_file(args.log_file)
+    wd_utils.verbosity += args.verbose
+    setup_verbosity_traps()
+    sys.path.insert(0, WD_ROOT_DIR)
+
+    for module_name in args.preload.split(','):
+        try:
+            importlib.import_module(module_name)
+        except Exception as err:
+            wd_logger(1, "Can't preload '%s': %s" % (module_name, err))
+    helpers = {}
+    for helper in args.helpers.split(','):
+        try:
+            helpers[helper] = load_helper(helper)
+        except Exception as err:
+            wd_logger(1, "Can't load helper '%s', so it will be run in a new python3: %s" % (helper, err))
+    wd_logger(1, 'Loaded helpers: %s' % ' '.join(sorted(helpers)))
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(args.socket + '.tmp')
+    listener.listen(64)
+    os.replace(args.socket + '.tmp', args.socket)      # So a client never finds a socket which isn't listening yet
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+
+    children = set()
+    try:
+        while True:
+            while len(children) < args.workers:
+                pid = os.fork()
+                if pid == 0:
+                    pool_child(listener, helpers)
+                children.add(pid)
+            pid, _ = os.wait()
+            children.discard(pid)
+    finally:
+        os.unlink(args.socket)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        wd_logger(1, 'Stopped')
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    socket_path = os.environ.get('WD_PY_POOL_SOCKET', WD_PY_POOL_SOCKET)
+    if argv[:1] == ['run']:
+        # Parsed by hand, since importing argparse would double the time the client takes
+        args = argv[1:]
+        if args[:1] == ['--socket'] and len(args) >= 2:
+            socket_path = args[1]
+            args = args[2:]
+        if not args:
+            print('usage: wd_py.py run [--socket PATH] HELPER [ARGS ...]', file=sys.stderr)
+            return 2
+        return cmd_run(socket_path, args[0], args[1:])
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Pool of pre-forked python interpreters for the WD python helpers')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--socket', default=socket_path)
+    serve_parser.add_argument('--workers', type=int, default=4, help='Number of idle pre-forked interpreters')
+    serve_parser.add_argument('--preload', default=WD_PY_PRELOAD, help='Comma separated modules to import before forking')
+    serve_parser.add_argument('--helpers', default=','.join(WD_PY_HELPERS))
+    serve_parser.add_argument('--log-file', default='')
+    serve_parser.add_argument('-v', '--verbose', action='count', default=0)
+    subparsers.add_parser('run', help='Run a helper in the pool')
+    args = parser.parse_args(argv)
+    return cmd_serve(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
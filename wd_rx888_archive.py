@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_rx888_archive.py
+# Compresses the one minute raw sample files which rx888-record.sh caches in /dev/shm/RX888_recording_cache into seekable
+# archive files on the USB3 archive disk, and extracts any time slice or sample range of an archive without decompressing the rest.
+#
+# A minute at 64.8 Msps is about 7.8 GB, which one 'zstd' process can't compress in a minute on a modest CPU.  So each file is
+# split into frames of --frame-samples samples which are compressed independently by a pool of --jobs processes and written in order.
+# Only 2 frames per process are in flight, so the memory used doesn't grow with the file size.  Before compression the bytes of
+# each frame are 'shuffled' into planes of the low and the high bytes of its samples, which are compressed faster and smaller
+# than the interleaved int16 samples.  A frame which doesn't compress is stored as is.
+#
+# The frames are compressed with zstd by the 'zstandard' python package (python3-zstandard, installed by wd-setup.sh).  Without it
+# 'compress' exits with an error unless '--codec zlib' is given, since zlib compresses only about 40 MB/s per core and so needs
+# more than 3 busy cores to keep up with the 129.6 MB/s of a RX888, and rx888-record.sh then compresses with 'zstd -T0' instead.
+# No zstd dictionary is used, since the frames are megabytes of ADC noise and a dictionary only helps small frames.
+# 'compress' prints the rate it achieved as a multiple of the real time rate of the samples, and warns if it is slower than real time.
+#
+# An archive file is:
+#     b'WDRX888\n'  frame data ...  JSON index  uint64 index offset  uint64 index length  b'WDRX888\n'
+# where the index holds the sample rate and format, the codec and the (offset, length, stored, crc32) of each frame.
+# The CRC32 is of the raw frame, so 'verify' checks the archive against the samples which were recorded.
+#
+# Usage:
+#     wd_rx888_archive.py compress [--output-dir DIR] [--jobs N] [--frame-samples 4194304] [--codec zstd|zlib] [--level N]
+#                                  [--sample-rate 64800000] [--sample-format int16] [--no-shuffle] [--delete] RAW_FILE ...
+#     wd_rx888_archive.py extract  [--start-sample N | --start-secs S] [--samples N | --secs S] [--output FILE] ARCHIVE
+#     wd_rx888_archive.py info     ARCHIVE ...
+#     wd_rx888_archive.py verify   ARCHIVE ...
+
+import argparse
+import collections
+import json
+import os
+import re
+import signal
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+ARCHIVE_MAGIC = b'WDRX888\n'
+ARCHIVE_TRAILER = struct.Struct('<QQ8s')
+ARCHIVE_FILE_SUFFIX = '.wdrx'
+ARCHIVE_VERSION = 1
+RX888_SAMPLE_RATE = 64800000
+SAMPLE_FORMATS = {'int16': 2, 'int8': 1, 'float32': 4, 'cint16': 4}     # bytes per sample
+DEFAULT_FRAME_SAMPLES = 4 * 1024 * 1024
+DEFAULT_LEVELS = {'zstd': 1, 'zlib': 1}
+FRAMES_IN_FLIGHT_PER_JOB = 2
+FILE_TIME_REGEX = re.compile(r'(\d{8})T?(\d{6})Z?')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def zstandard_module():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_codec(codec):
+    # zlib is only used if asked for, since it is too slow to keep up with a RX888
+    if codec == 'zstd' and not zstandard_module():
+        raise ArchiveError("the 'zstandard' python package (python3-zstandard) is needed for zstd frames.  '--codec zlib' is too slow to keep up with a RX888")
+    return codec
+
+
+def compressor(codec, level):
+    if codec == 'zstd':
+        return zstandard_module().ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, level)
+
+
+def decompressor(codec):
+    if codec == 'zstd':
+        zstandard = zstandard_module()
+        if zstandard is None:
+            raise ArchiveError("the 'zstandard' python package is needed to read zstd frames")
+        zstd_decompressor = zstandard.ZstdDecompressor()
+        return lambda data, raw_length: zstd_decompressor.decompress(data, max_output_size=raw_length)
+    if codec == 'zlib':
+        return lambda data, raw_length: zlib.decompress(data)
+    raise ArchiveError("unknown codec '%s'" % codec)
+
+
+def shuffle_bytes(data, sample_bytes):
+    # [s0b0 s0b1 s1b0 s1b1 ...] => [s0b0 s1b0 ... s0b1 s1b1 ...]
+    if sample_bytes == 1:
+        return data
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, sample_bytes).T.tobytes()
+
+
+def unshuffle_bytes(data, sample_bytes):
+    if sample_bytes == 1:
+        return data
+    return np.frombuffer(data, dtype=np.uint8).reshape(sample_bytes, -1).T.tobytes()
+
+
+def file_start_time(path, duration_secs):
+    # The UTC start of the recording from a 'YYYYMMDDTHHMMSSZ' in its file name, else from its mtime
+    match = FILE_TIME_REGEX.search(os.path.basename(path))
+    if match:
+        try:
+            return datetime.strptime(''.join(match.groups()), '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    return os.stat(path).st_mtime - duration_secs
+
+
+##################################################  compress  ##################################################
+
+_worker = {}
+
+
+def init_compress_worker(codec, level, shuffle, sample_bytes):
+    _worker.update(compress=compressor(codec, level), shuffle=shuffle, sample_bytes=sample_bytes)
+
+
+def compress_frame(job):
+    # Runs in a pool process.  Returns (frame data, stored, crc32 of the raw frame)
+    path, offset, length = job
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        raw = fp.read(length)
+    if len(raw) != length:
+        raise ArchiveError("'%s' was truncated while it was being compressed" % path)
+    crc = zlib.crc32(raw)
+    data = _worker['compress'](shuffle_bytes(raw, _worker['sample_bytes']) if _worker['shuffle'] else raw)
+    if len(data) >= length:
+        return raw, True, crc
+    return data, False, crc
+
+
+def write_frames(pool, jobs, fp, frame_jobs):
+    # Writes the frames in order as the pool compresses them.  Returns the (offset, length, stored, crc32) of each frame
+    frames = []
+    in_flight = collections.deque()
+    while True:
+        while len(in_flight) < FRAMES_IN_FLIGHT_PER_JOB * jobs:
+            job = next(frame_jobs, None)
+            if job is None:
+                break
+            in_flight.append(pool.submit(compress_frame, job))
+        if not in_flight:
+            return frames
+        data, stored, crc = in_flight.popleft().result()
+        frames.append((fp.tell(), len(data), int(stored), crc))
+        fp.write(data)
+
+
+def compress_file(pool, jobs, path, output_path, args, codec, level):
+    # Returns (raw file size, archive file size)
+    sample_bytes = SAMPLE_FORMATS[args.sample_format]
+    file_size = os.stat(path).st_size
+    if file_size % sample_bytes:
+        raise ArchiveError("'%s' is %d bytes, which is not a whole number of %s samples" % (path, file_size, args.sample_format))
+    total_samples = file_size // sample_bytes
+    frame_bytes = args.frame_samples * sample_bytes
+    frame_jobs = ((path, offset, min(frame_bytes, file_size - offset)) for offset in range(0, file_size, frame_bytes))
+    temp_path = output_path + '.part'
+    try:
+        with open(temp_path, 'wb') as fp:
+            fp.write(ARCHIVE_MAGIC)
+            frames = write_frames(pool, jobs, fp, frame_jobs)
+            index = {'version': ARCHIVE_VERSION, 'source': os.path.basename(path), 'codec': codec, 'level': level,
+                     'shuffle': args.shuffle, 'sample_format': args.sample_format, 'sample_bytes': sample_bytes,
+                     'sample_rate': args.sample_rate, 'start_time': file_start_time(path, total_samples / args.sample_rate),
+                     'frame_samples': args.frame_samples, 'total_samples': total_samples, 'frames': frames}
+            index_offset = fp.tell()
+            index_data = json.dumps(index, separators=(',', ':')).encode()
+            fp.write(index_data)
+            fp.write(ARCHIVE_TRAILER.pack(index_offset, len(index_data), ARCHIVE_MAGIC))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, output_path)
+    return file_size, os.stat(output_path).st_size
+
+
+##################################################  read  ##################################################
+
+class Rx888Archive:
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, 'rb')
+        try:
+            self.index = self.read_index()
+        except Exception:
+            self.fp.close()
+            raise
+        self.sample_bytes = self.index['sample_bytes']
+        self.frame_samples = self.index['frame_samples']
+        self.total_samples = self.index['total_samples']
+        self.sample_rate = self.index['sample_rate']
+        self.decompress = decompressor(self.index['codec'])
+
+    def read_index(self):
+        self.fp.seek(0, os.SEEK_END)
+        file_size = self.fp.tell()
+        self.fp.seek(0)
+        if file_size < len(ARCHIVE_MAGIC) + ARCHIVE_TRAILER.size or self.fp.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ArchiveError("'%s' is not a RX888 archive file" % self.path)
+        self.fp.seek(file_size - ARCHIVE_TRAILER.size)
+        index_offset, index_length, magic = ARCHIVE_TRAILER.unpack(self.fp.read(ARCHIVE_TRAILER.size))
+        if magic != ARCHIVE_MAGIC or index_offset + index_length + ARCHIVE_TRAILER.size != file_size:
+            raise ArchiveError("'%s' has no index, so it was not completely written" % self.path)
+        self.fp.seek(index_offset)
+        index = json.loads(self.fp.read(index_length))
+        if index.get('version') != ARCHIVE_VERSION:
+            raise ArchiveError("'%s' is a version %s archive, not version %d" % (self.path, index.get('version'), ARCHIVE_VERSION))
+        return index
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def frame_raw_length(self, frame_number):
+        return min(self.frame_samples, self.total_samples - frame_number * self.frame_samples) * self.sample_bytes
+
+    def read_frame(self, frame_number, check_crc=False):
+        offset, length, stored, crc = self.index['frames'][frame_number]
+        raw_length = self.frame_raw_length(frame_number)
+        self.fp.seek(offset)
+        data = self.fp.read(length)
+        if not stored:
+            try:
+                data = self.decompress(data, raw_length)
+            except Exception as err:            # zlib.error or zstandard.ZstdError
+                raise ArchiveError("frame %d of '%s' is corrupt: %s" % (frame_number, self.path, err))
+            if self.index['shuffle']:
+                data = unshuffle_bytes(data, self.sample_bytes)
+        if len(data) != raw_length or (check_crc and zlib.crc32(data) != crc):
+            raise ArchiveError("frame %d of '%s' is corrupt" % (frame_number, self.path))
+        return data
+
+    def read_samples(self, start_sample, sample_count):
+        # Yields the raw bytes of the samples, decompressing only the frames which hold them
+        if start_sample < 0 or sample_count < 0 or start_sample + sample_count > self.total_samples:
+            raise ArchiveError("samples %d to %d are outside the %d samples of '%s'"
+                               % (start_sample, start_sample + sample_count, self.total_samples, self.path))
+        end_sample = start_sample + sample_count
+        for frame_number in range(start_sample // self.frame_samples, (end_sample + self.frame_samples - 1) // self.frame_samples):
+            frame_start = frame_number * self.frame_samples
+            data = self.read_frame(frame_number)
+            first = max(start_sample - frame_start, 0) * self.sample_bytes
+            last = (min(end_sample, frame_start + self.frame_samples) - frame_start) * self.sample_bytes
+            yield data[first:last]
+
+
+##################################################  commands  ##################################################
+
+def compress_command(args):
+    codec = resolve_codec(args.codec)
+    level = DEFAULT_LEVELS[codec] if args.level is None else args.level
+    jobs = args.jobs or os.cpu_count() or 1
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_compress_worker,
+                             initargs=(codec, level, args.shuffle, SAMPLE_FORMATS[args.sample_format])) as pool:
+        for path in args.raw_files:
+            output_path = os.path.join(args.output_dir or os.path.dirname(path) or '.', os.path.basename(path) + ARCHIVE_FILE_SUFFIX)
+            start = time.monotonic()
+            try:
+                raw_size, archive_size = compress_file(pool, jobs, path, output_path, args, codec, level)
+            except (OSError, ArchiveError) as err:
+                print('ERROR: %s' % err, file=sys.stderr)
+                failures += 1
+                continue
+            elapsed = max(time.monotonic() - start, 1e-6)
+            if args.delete:
+                os.remove(path)
+            real_time_rate = args.sample_rate * SAMPLE_FORMATS[args.sample_format] / 1e6
+            speed = raw_size / elapsed / 1e6
+            print('%s: %d => %d bytes (%.1f%%) in %.1f secs, %.0f MB/s which is %.2f x the real time rate of %.1f MB/s'
+                  % (output_path, raw_size, archive_size, 100.0 * archive_size / max(raw_size, 1), elapsed, speed, speed / real_time_rate, real_time_rate))
+            if speed < real_time_rate:
+                print('WARNING: %s was compressed slower than real time, so the raw files will pile up in the cache' % path, file=sys.stderr)
+    return 1 if failures else 0
+
+
+def extract_command(args):
+    with Rx888Archive(args.archive) as archive:
+        start_sample = args.start_sample if args.start_secs is None else int(round(args.start_secs * archive.sample_rate))
+        if args.samples is not None:
+            sample_count = args.samples
+        elif args.secs is not None:
+            sample_count = int(round(args.secs * archive.sample_rate))
+        else:
+            sample_count = archive.total_samples - start_sample
+        if args.output == '-':
+            for data in archive.read_samples(start_sample, sample_count):
+                sys.stdout.buffer.write(data)
+            return 0
+        # Like compress_file(), so a failed extract never leaves an empty or partial output file behind
+        temp_path = args.output + '.part'
+        try:
+            with open(temp_path, 'wb') as output:
+                for data in archive.read_samples(start_sample, sample_count):
+                    output.write(data)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.rename(temp_path, args.output)
+    return 0
+
+
+def info_command(args):
+    for path in args.archives:
+        with Rx888Archive(path) as archive:
+            index = archive.index
+            compressed = sum(frame[1] for frame in index['frames'])
+            start = datetime.fromtimestamp(index['start_time'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            print('%s: %s  %d %s samples at %d sps (%.3f secs) from %s, %d frames of %d samples, %s level %d%s, %.1f%% of %d bytes'
+                  % (path, index['source'], index['total_samples'], index['sample_format'], index['sample_rate'],
+                     index['total_samples'] / index['sample_rate'], start, len(index['frames']), index['frame_samples'],
+                     index['codec'], index['level'], ' shuffled' if index['shuffle'] else '',
+                     100.0 * compressed / max(index['total_samples'] * index['sample_bytes'], 1), index['total_samples'] * index['sample_bytes']))
+    return 0
+
+
+def verify_command(args):
+    failures = 0
+    for path in args.archives:
+        try:
+            with Rx888Archive(path) as archive:
+                for frame_number in range(len(archive.index['frames'])):
+                    archive.read_frame(frame_number, check_crc=True)
+            print('OK    %s' % path)
+        except (ArchiveError, ValueError, zlib.error) as err:
+            print('FAIL  %s: %s' % (path, err))
+            failures += 1
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compress RX888 raw sample files into seekable archives and extract samples from them')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compress_parser = subparsers.add_parser('compress', help='Compress raw sample files')
+    compress_parser.add_argument('--output-dir', default='', help='Where to write the archives (default: beside the raw files)')
+    compress_parser.add_argument('--jobs', type=int, default=0, help='Frames compressed in parallel (default: one per CPU)')
+    compress_parser.add_argument('--frame-samples', type=int, default=DEFAULT_FRAME_SAMPLES, help='Samples in each independently compressed frame')
+    compress_parser.add_argument('--codec', choices=('zstd', 'zlib'), default='zstd')
+    compress_parser.add_argument('--level', type=int, default=None, help='The compression level (default: 1)')
+    compress_parser.add_argument('--sample-rate', type=int, default=RX888_SAMPLE_RATE)
+    compress_parser.add_argument('--sample-format', choices=sorted(SAMPLE_FORMATS), default='int16')
+    compress_parser.add_argument('--no-shuffle', dest='shuffle', action='store_false', help="Don't split the samples into byte planes")
+    compress_parser.add_argument('--delete', action='store_true', help='Delete each raw file once its archive is written')
+    compress_parser.add_argument('raw_files', nargs='+', metavar='RAW_FILE')
+    extract_parser = subparsers.add_parser('extract', help='Write the raw bytes of a range of samples')
+    start_group = extract_parser.add_mutually_exclusive_group()
+    start_group.add_argument('--start-sample', type=int, default=0)
+    start_group.add_argument('--start-secs', type=float, default=None, help='Seconds after the start of the archive')
+    count_group = extract_parser.add_mutually_exclusive_group()
+    count_group.add_argument('--samples', type=int, default=None)
+    count_group.add_argument('--secs', type=float, default=None)
+    extract_parser.add_argument('--output', default='-', help="The output file, or '-' for stdout")
+    extract_parser.add_argument('archive', metavar='ARCHIVE')
+    info_parser = subparsers.add_parser('info', help='Print the index of archives')
+    info_parser.add_argument('archives', nargs='+', metavar='ARCHIVE')
+    verify_parser = subparsers.add_parser('verify', help='Decompress archives and check the CRC32 of each frame')
+    verify_parser.add_argument('archives', nargs='+', metavar='ARCHIVE')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compress' and args.frame_samples <= 0:
+        parser.error('--frame-samples must be greater than 0')
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))     # So a killed 'compress' removes its .part file and stops its pool
+    try:
+        return {'compress': compress_command, 'extract': extract_command, 'info': info_command, 'verify': verify_command}[args.command](args)
+    except (OSError, ValueError, ArchiveError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_schedule.py
+# Compiles the WSPR_SCHEDULE[] of wsprdaemon.conf into a job table indexed by the local minute of the day.
+# update_hhmm_sched_file() in job-management.sh runs it only when the conf file or the local date has changed, passing the
+# receivers and the schedule on stdin:
+#     RECEIVER <NAME> <MAIDENHEAD_GRID>
+#     SCHEDULE <HH:MM|sunrise[+-]HH:MM|sunset[+-]HH:MM> <RECEIVER,BAND[,MODES]> ...
+# The sunrise and sunset of all the grids are computed together with the NOAA equations used by suntimes.py, then it writes:
+#     hhmm.sched        HHMM_SCHED[] in the same format as the bash code wrote it, for the other users of that file
+#     compiled.sched    COMPILED_SCHED_KEY, COMPILED_SCHED_JOBS[] with the jobs of each entry and
+#                       COMPILED_SCHED_INDEX[] with the index in COMPILED_SCHED_JOBS[] for each of the 1440 minutes of the day
+# and prints what changed since the previous compile, so setup_expected_jobs_file() finds the jobs for the current minute with
+# one array lookup instead of resolving the time of every entry each time the watchdog runs.
+#
+# Usage:
+#     wd_schedule.py compile --key KEY --compiled-file FILE --hhmm-sched-file FILE < RECEIVERS_AND_SCHEDULE
+#     wd_schedule.py suntimes GRID ...         ### print 'GRID SUNRISE SUNSET' in local HH:MM like the suntimes file
+
+import argparse
+import calendar
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+HHMM_RE = re.compile(r'^([01][0-9]|2[0-3]):([0-5][0-9])$')
+SUN_TIME_RE = re.compile(r'^(sunrise|sunset)(?:([+-])([0-9]{1,2}):([0-5][0-9]))?$')
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def maidenhead_to_lon_lat(grids):
+    # Same approximation as maidenhead_to_long_lat() in config-utils.sh:  the SW corner of the 4 character square
+    lon = np.array([(ord(g[0].upper()) - 65) * 20 + (ord(g[2]) - 48) * 2 - 180 for g in grids], dtype=np.float64)
+    lat = np.array([(ord(g[1].upper()) - 65) * 10 + (ord(g[3]) - 48) - 90 for g in grids], dtype=np.float64)
+    return lon, lat
+
+
+def sun_times_minutes(grids, now=None):
+    # Returns arrays of the local minute of the day of sunrise and sunset at each grid
+    now = time.time() if now is None else now
+    utc = time.gmtime(now)
+    n_days = 366 if calendar.isleap(utc.tm_year) else 365
+    gamma = 2 * np.pi / n_days * (utc.tm_yday - 1 + (utc.tm_hour - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma) - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    lon, lat = maidenhead_to_lon_lat(grids)
+    lat_rad = np.radians(lat)
+    cos_ha = np.cos(np.radians(90.833)) / (np.cos(lat_rad) * np.cos(decl)) - np.tan(lat_rad) * np.tan(decl)
+    ha = np.degrees(np.arccos(np.clip(cos_ha, -1.0, 1.0)))
+    tz_offset_minutes = time.localtime(now).tm_gmtoff // 60
+    sunrise = (np.floor(720 - 4 * (lon + ha) - eqtime).astype(int) + tz_offset_minutes) % MINUTES_PER_DAY
+    sunset = (np.floor(720 - 4 * (lon - ha) - eqtime).astype(int) + tz_offset_minutes) % MINUTES_PER_DAY
+
+    # Same as suntimes.py for polar day and polar night
+    sunrise = np.where(np.abs(cos_ha) > 1.0, 0, sunrise)
+    sunset = np.where(cos_ha < -1.0, MINUTES_PER_DAY - 1, np.where(cos_ha > 1.0, 1, sunset))
+    return sunrise, sunset
+
+
+def hhmm(minute):
+    return '%02d:%02d' % (minute // 60, minute % 60)
+
+
+def parse_input(lines):
+    receiver_grids = {}
+    schedule = []
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == 'RECEIVER' and len(fields) >= 3:
+            receiver_grids[fields[1]] = fields[2]
+        elif fields[0] == 'SCHEDULE' and len(fields) >= 3:
+            schedule.append((fields[1], fields[2:]))
+        else:
+            raise ScheduleError("invalid input line '%s'" % line.strip())
+    return receiver_grids, schedule
+
+
+def compile_schedule(receiver_grids, schedule, now=None):
+    # Returns the list of (minute, [jobs]) sorted by time and starting at 00:00, with ',DEFAULT' added to jobs without modes
+    sun_grids = sorted({receiver_grids.get(jobs[0].split(',')[0], '') for time_spec, jobs in schedule if not HHMM_RE.match(time_spec)})
+    bad_grids = [grid for grid in sun_grids if not re.match(r'^[A-Ra-r]{2}[0-9]{2}', grid)]
+    if bad_grids:
+        raise ScheduleError("can't compute sunrise/sunset for receiver grid(s) '%s'" % ' '.join(bad_grids))
+    sun_times = {}
+    if sun_grids:
+        sunrise, sunset = sun_times_minutes(sun_grids, now)
+        sun_times = {grid: (int(sunrise[i]), int(sunset[i])) for i, grid in enumerate(sun_grids)}
+
+    entries = []
+    for time_spec, jobs in schedule:
+        match = HHMM_RE.match(time_spec)
+        if match:
+            minute = int(match.group(1)) * 60 + int(match.group(2))
+        else:
+            match = SUN_TIME_RE.match(time_spec)
+            if not match:
+                raise ScheduleError("time specification '%s' is not valid" % time_spec)
+            # All the receivers of an entry are assumed to be in the grid of its first receiver
+            sunrise_minute, sunset_minute = sun_times[receiver_grids.get(jobs[0].split(',')[0], '')]
+            minute = sunrise_minute if match.group(1) == 'sunrise' else sunset_minute
+            if match.group(2):
+                offset = int(match.group(3)) * 60 + int(match.group(4))
+                minute = (minute + offset if match.group(2) == '+' else minute - offset) % MINUTES_PER_DAY
+        jobs = [job if job.count(',') >= 2 else job + ',DEFAULT' for job in jobs]
+        entries.append((minute, jobs))
+    if not entries:
+        raise ScheduleError('WSPR_SCHEDULE[] has no entries')
+
+    entries.sort(key=lambda entry: (entry[0], ' '.join(entry[1])))
+    if entries[0][0] != 0:
+        entries.insert(0, (0, entries[-1][1]))      # The latest entry of the day is also in effect at 00:00
+    return entries
+
+
+def read_compiled(path):
+    # Returns {minute: 'jobs'} of the entries in a compiled.sched
+    entries = {}
+    try:
+        with open(path) as fp:
+            text = fp.read()
+    except OSError:
+        return entries
+    for match in re.finditer(r'^  \[(\d+)\]="([^"]*)"', text, re.M):
+        entries[int(match.group(1))] = match.group(2)
+    return entries
+
+
+def write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        fp.write(text)
+    os.replace(tmp_path, path)
+
+
+def cmd_compile(args):
+    try:
+        receiver_grids, schedule = parse_input(sys.stdin)
+        entries = compile_schedule(receiver_grids, schedule)
+    except ScheduleError as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+
+    index = np.zeros(MINUTES_PER_DAY, dtype=int)
+    for i, (minute, _) in enumerate(entries):
+        index[minute:] = i
+    compiled = ['declare COMPILED_SCHED_KEY="%s"' % args.key, 'declare -a COMPILED_SCHED_JOBS=(']
+    compiled += ['  [%d]="%s"' % (minute, ' '.join(jobs)) for minute, jobs in entries]
+    compiled += [')', 'declare -a COMPILED_SCHED_INDEX=(']
+    compiled += [' '.join(str(entries[i][0]) for i in index[hour * 60:(hour + 1) * 60]) for hour in range(24)]
+    compiled += [')', '']
+
+    # Print what changed since the previous compile
+    old_entries = read_compiled(args.compiled_file)
+    new_entries = {minute: ' '.join(jobs) for minute, jobs in entries}
+    if not old_entries:
+        print('Compiled %d schedule entries' % len(entries))
+    elif old_entries == new_entries:
+        print('No change to the %d schedule entries' % len(entries))
+    else:
+        for minute in sorted(set(old_entries) | set(new_entries)):
+            if old_entries.get(minute) != new_entries.get(minute):
+                print('%s: %s' % (hhmm(minute), ('removed' if minute not in new_entries else new_entries[minute])))
+
+    write_atomic(args.hhmm_sched_file, 'declare HHMM_SCHED=(\n' + ''.join('  "%s %s" \n' % (hhmm(minute), ' '.join(jobs)) for minute, jobs in entries) + ')\n')
+    write_atomic(args.compiled_file, '\n'.join(compiled))
+    return 0
+
+
+def cmd_suntimes(args):
+    sunrise, sunset = sun_times_minutes(args.grids)
+    for i, grid in enumerate(args.grids):
+        print('%s %s %s' % (grid, hhmm(int(sunrise[i])), hhmm(int(sunset[i]))))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile WSPR_SCHEDULE[] into a job table indexed by minute of the day')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile')
+    compile_parser.add_argument('--key', required=True, help='Saved in the compiled file, so the caller can tell when it needs to compile again')
+    compile_parser.add_argument('--compiled-file', required=True)
+    compile_parser.add_argument('--hhmm-sched-file', required=True)
+    suntimes_parser = subparsers.add_parser('suntimes')
+    suntimes_parser.add_argument('grids', nargs='+')
+    args = parser.parse_args(argv)
+    if args.command == 'compile':
+        return cmd_compile(args)
+    return cmd_suntimes(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
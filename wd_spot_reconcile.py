@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_spot_reconcile.py
+# Compares the WSPR spots decoded by any number of receivers or servers, e.g. the wd-record and pcmrecord servers of
+# wd-compare-server-spot-counts.sh, so a recorder or decoder A/B experiment can be evaluated over weeks of logs.
+#
+# Each source is a spot log (ALL_WSPR.TXT, wspr.log or WD *_spots.txt lines, optionally gzipped) whose lines start with 'YYMMDD HHMM'.
+# The logs are read as one time ordered stream and each cycle's spots are indexed by (call, band) in one dict per source,
+# so a spot is matched across the sources with one lookup.  Only the last --window cycles are held in memory, so multi-day logs
+# are read in bounded memory;  a line for a cycle which has already been reported is counted as 'late' and ignored.
+# If a source logs the same call on the same band more than once in a cycle, e.g. from the standard and spreading decodes,
+# the best SNR is kept and the others are counted as duplicates.
+#
+# By default only the cycles in which every source logged at least one spot are compared, so that a server which was down or
+# restarting is not counted as missing spots.  For each band and each source it reports the spots, the spots which only that
+# source decoded (the unique-decode rate), and the spots it shares with the first (reference) source with the mean and median SNR delta.
+#
+# Usage:
+#     wd_spot_reconcile.py [--format all_wspr|wd_spots] [--fields SNR,FREQ,CALL] [--window 4] [--all-cycles] [--cycles] [--json FILE]
+#                          [LABEL=]SPOT_LOG [LABEL=]SPOT_LOG ...
+
+import argparse
+import collections
+import gzip
+import heapq
+import json
+import os
+import sys
+
+# The 1-based (snr, freq MHz, call) fields of each line format
+SPOT_LINE_FORMATS = {
+    'all_wspr': (3, 5, 6),          # date time snr dt freq call ...  as written by wsprd and best_spots.awk
+    'wd_spots': (4, 6, 7),          # date time sync_quality snr dt freq call ...  the 3.0 SPOT_LINE_FORMAT of decoding.sh
+}
+# (band, dial kHz) of the WSPR bands in WSPR_BAND_LIST of config-utils.sh.  The WSPR signals are 1400 to 1600 Hz above the dial frequency
+WSPR_BAND_DIAL_KHZ = (
+    ('2200', 136.0), ('630', 474.2), ('160', 1836.6), ('80', 3568.6), ('80eu', 3592.6), ('60', 5287.2), ('60eu', 5364.7),
+    ('40', 7038.6), ('30', 10138.7), ('22', 13553.9), ('20', 14095.6), ('17', 18104.6), ('15', 21094.6), ('12', 24924.6),
+    ('10', 28124.6), ('8', 40680.0), ('6', 50293.0), ('4', 70091.0), ('2', 144489.0), ('1', 432300.0), ('0', 1296500.0))
+WSPR_AUDIO_KHZ = 1.5
+MAX_BAND_OFFSET_KHZ = 5.0
+ALL_BANDS = 'ALL'
+SNR_DELTA_RESOLUTION = 10       # the SNR deltas are counted in 0.1 dB steps, so the median needs no list of the deltas
+
+
+class SpotLogError(Exception):
+    pass
+
+
+def band_of_freq(freq_mhz):
+    # The WSPR band of a spot frequency, or its frequency to the kHz if it isn't near a WSPR band
+    freq_khz = freq_mhz * 1000
+    band, dial_khz = min(WSPR_BAND_DIAL_KHZ, key=lambda band_dial: abs(freq_khz - WSPR_AUDIO_KHZ - band_dial[1]))
+    if abs(freq_khz - WSPR_AUDIO_KHZ - dial_khz) <= MAX_BAND_OFFSET_KHZ:
+        return band
+    return '%.0fkHz' % freq_khz
+
+
+def parse_source(source):
+    # 'LABEL=PATH' or 'PATH', which is labeled with its file name
+    label, sep, path = source.partition('=')
+    if not sep or not label or os.path.exists(source):
+        return os.path.basename(source), source
+    return label, path
+
+
+class SpotLog:
+    # Yields (cycle, source index, call, band, snr) for each spot line of one log file
+    def __init__(self, index, label, path, fields):
+        self.index = index
+        self.label = label
+        self.path = path
+        self.snr_field, self.freq_field, self.call_field = (field - 1 for field in fields)
+        self.min_field_count = max(fields)
+        self.lines = 0
+        self.bad_lines = 0
+        self.duplicates = 0
+        self.late_spots = 0
+        self.band_cache = {}
+
+    def open(self):
+        try:
+            if self.path.endswith('.gz'):
+                return gzip.open(self.path, 'rt', errors='replace')
+            return open(self.path, errors='replace')
+        except OSError as err:
+            raise SpotLogError("can't open the spot log '%s': %s" % (self.path, err))
+
+    def band(self, freq):
+        band = self.band_cache.get(freq)
+        if band is None:
+            band = self.band_cache[freq] = band_of_freq(float(freq))
+        return band
+
+    def __iter__(self):
+        with self.open() as fp:
+            for line in fp:
+                self.lines += 1
+                tokens = line.split()
+                if (len(tokens) < self.min_field_count or len(tokens[0]) != 6 or len(tokens[1]) != 4
+                        or not tokens[0].isdigit() or not tokens[1].isdigit()):
+                    self.bad_lines += 1
+                    continue
+                call = tokens[self.call_field]
+                if call == '<...>':             # an unresolved type 3 call, which create_enhanced_spots_file_and_queue_to_posting_daemon() drops
+                    continue
+                try:
+                    snr = float(tokens[self.snr_field])
+                    band = self.band(tokens[self.freq_field][:9])      # 1 Hz is enough to find the band and keeps the cache small
+                except ValueError:
+                    self.bad_lines += 1
+                    continue
+                yield int(tokens[0] + tokens[1]), self.index, call, band, snr
+
+
+class BandStats:
+    def __init__(self, sources_count):
+        self.spots = [0] * sources_count
+        self.unique = [0] * sources_count
+        self.common_with_reference = [0] * sources_count
+        self.snr_delta_sum = [0.0] * sources_count
+        self.snr_delta_counts = [collections.Counter() for _ in range(sources_count)]
+        self.decoded_by_all = 0
+
+    def add(self, spot_snrs):
+        # spot_snrs is the SNR of one (call, band) in each source, or None if the source didn't decode it
+        present = [index for index, snr in enumerate(spot_snrs) if snr is not None]
+        for index in present:
+            self.spots[index] += 1
+        if len(present) == 1:
+            self.unique[present[0]] += 1
+        if len(present) == len(spot_snrs):
+            self.decoded_by_all += 1
+        reference_snr = spot_snrs[0]
+        if reference_snr is None:
+            return
+        for index in present[1:]:
+            delta = spot_snrs[index] - reference_snr
+            self.common_with_reference[index] += 1
+            self.snr_delta_sum[index] += delta
+            self.snr_delta_counts[index][round(delta * SNR_DELTA_RESOLUTION)] += 1
+
+    def snr_delta_median(self, index):
+        counts = self.snr_delta_counts[index]
+        total = sum(counts.values())
+        if total == 0:
+            return None
+        # The mean of the two middle deltas if their count is even
+        middle_rows, passed, values = ((total - 1) // 2, total // 2), 0, []
+        for delta in sorted(counts):
+            passed += counts[delta]
+            while len(values) < 2 and passed > middle_rows[len(values)]:
+                values.append(delta)
+            if len(values) == 2:
+                break
+        return sum(values) / 2 / SNR_DELTA_RESOLUTION
+
+    def report(self, labels):
+        report = {'decoded_by_all': self.decoded_by_all, 'sources': {}}
+        for index, label in enumerate(labels):
+            spots = self.spots[index]
+            source_report = {'spots': spots, 'unique': self.unique[index],
+                             'unique_rate_percent': round(100.0 * self.unique[index] / spots, 2) if spots else None}
+            if index > 0:
+                common = self.common_with_reference[index]
+                source_report.update({'common_with_reference': common,
+                                      'snr_delta_mean': round(self.snr_delta_sum[index] / common, 2) if common else None,
+                                      'snr_delta_median': self.snr_delta_median(index)})
+            report['sources'][label] = source_report
+        return report
+
+
+class Reconciler:
+    def __init__(self, logs, window, all_cycles, cycle_callback=None):
+        self.logs = logs
+        self.labels = [log.label for log in logs]
+        self.window = max(1, window)
+        self.all_cycles = all_cycles
+        self.cycle_callback = cycle_callback
+        self.open_cycles = {}             # {cycle: [{(call, band): snr} of each source]}
+        self.last_reported_cycle = -1
+        self.cycles_compared = 0
+        self.cycles_skipped = 0
+        self.first_cycle = self.last_cycle = None
+        self.bands = collections.defaultdict(lambda: BandStats(len(self.logs)))
+
+    def run(self):
+        for cycle, index, call, band, snr in heapq.merge(*self.logs, key=lambda spot: spot[0]):
+            if cycle <= self.last_reported_cycle:
+                self.logs[index].late_spots += 1
+                continue
+            tables = self.open_cycles.get(cycle)
+            if tables is None:
+                tables = self.open_cycles[cycle] = [{} for _ in self.logs]
+                while len(self.open_cycles) > self.window:
+                    self.reconcile_cycle(min(self.open_cycles))
+            table = tables[index]
+            old_snr = table.get((call, band))
+            if old_snr is not None:
+                self.logs[index].duplicates += 1
+                if old_snr >= snr:
+                    continue
+            table[(call, band)] = snr
+        while self.open_cycles:
+            self.reconcile_cycle(min(self.open_cycles))
+
+    def reconcile_cycle(self, cycle):
+        tables = self.open_cycles.pop(cycle)
+        self.last_reported_cycle = max(self.last_reported_cycle, cycle)
+        if not self.all_cycles and not all(tables):
+            self.cycles_skipped += 1
+            return
+        self.cycles_compared += 1
+        self.first_cycle = cycle if self.first_cycle is None else min(self.first_cycle, cycle)
+        self.last_cycle = cycle if self.last_cycle is None else max(self.last_cycle, cycle)
+        all_bands = self.bands[ALL_BANDS]
+        common = 0
+        only = [0] * len(tables)
+        for key in set().union(*tables):
+            spot_snrs = [table.get(key) for table in tables]
+            self.bands[key[1]].add(spot_snrs)
+            all_bands.add(spot_snrs)
+            present = [index for index, snr in enumerate(spot_snrs) if snr is not None]
+            if len(present) == len(tables):
+                common += 1
+            elif len(present) == 1:
+                only[present[0]] += 1
+        if self.cycle_callback:
+            self.cycle_callback(cycle, [len(table) for table in tables], common, only)
+
+    def report(self):
+        return {'sources': [{'label': log.label, 'path': log.path, 'lines': log.lines, 'bad_lines': log.bad_lines,
+                             'duplicates': log.duplicates, 'late_spots': log.late_spots} for log in self.logs],
+                'reference': self.labels[0],
+                'first_cycle': cycle_str(self.first_cycle), 'last_cycle': cycle_str(self.last_cycle),
+                'cycles_compared': self.cycles_compared, 'cycles_skipped': self.cycles_skipped,
+                'bands': {band: stats.report(self.labels) for band, stats in sorted(self.bands.items(), key=band_sort_key)}}
+
+
+def cycle_str(cycle):
+    if cycle is None:
+        return None
+    text = '%010d' % cycle
+    return '%s %s' % (text[:6], text[6:])
+
+
+def band_sort_key(band_item):
+    # The WSPR bands from 2200m up in frequency, then the other frequencies, then the totals
+    band = band_item[0]
+    band_names = [name for name, _ in WSPR_BAND_DIAL_KHZ]
+    if band in band_names:
+        return 0, band_names.index(band), 0.0
+    if band == ALL_BANDS:
+        return 2, 0, 0.0
+    return 1, 0, float(band[:-3])
+
+
+def format_value(value, fmt):
+    return '-' if value is None else fmt % value
+
+
+def print_summary(report):
+    labels = [source['label'] for source in report['sources']]
+    print('Compared %d cycles from %s to %s, skipped %d cycles in which not every source logged spots.  Reference is %s'
+          % (report['cycles_compared'], report['first_cycle'], report['last_cycle'], report['cycles_skipped'], report['reference']))
+    for source in report['sources']:
+        print('  %-16s %9d lines  %6d bad  %6d duplicates  %6d late   %s'
+              % (source['label'], source['lines'], source['bad_lines'], source['duplicates'], source['late_spots'], source['path']))
+    print('%-8s %-16s %8s %8s %8s %8s %7s %7s' % ('Band', 'Source', 'Spots', 'Unique', 'Unique%', 'Common', 'dSNR', 'dSNRmed'))
+    for band, band_report in report['bands'].items():
+        for label in labels:
+            source = band_report['sources'][label]
+            print('%-8s %-16s %8d %8d %8s %8s %7s %7s'
+                  % (band, label, source['spots'], source['unique'], format_value(source['unique_rate_percent'], '%.2f'),
+                     format_value(source.get('common_with_reference'), '%d'),
+                     format_value(source.get('snr_delta_mean'), '%+.2f'), format_value(source.get('snr_delta_median'), '%+.1f')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconcile the WSPR spots decoded by several receivers or servers')
+    parser.add_argument('--format', choices=sorted(SPOT_LINE_FORMATS), default='all_wspr', help='The format of the spot lines')
+    parser.add_argument('--fields', default='', help="The 1-based 'SNR,FREQ,CALL' fields of the spot lines, if not those of --format")
+    parser.add_argument('--window', type=int, default=4, help='Cycles held open for lines which are logged out of order')
+    parser.add_argument('--all-cycles', action='store_true', help='Also compare the cycles in which some sources logged no spots')
+    parser.add_argument('--cycles', action='store_true', help='Print the spot counts and differences of each cycle as it is reconciled')
+    parser.add_argument('--json', default='', help='Also write the report to this file')
+    parser.add_argument('sources', nargs='+', metavar='[LABEL=]SPOT_LOG', help='The first source is the reference of the SNR deltas')
+    args = parser.parse_args(argv)
+
+    fields = SPOT_LINE_FORMATS[args.format]
+    if args.fields:
+        try:
+            fields = tuple(int(field) for field in args.fields.split(','))
+        except ValueError:
+            fields = ()
+        if len(fields) != 3 or min(fields) < 3:
+            parser.error("--fields must be three field numbers after the date and time, e.g. '3,5,6'")
+    logs = [SpotLog(index, *parse_source(source), fields) for index, source in enumerate(args.sources)]
+    labels = [log.label for log in logs]
+    if len(set(labels)) != len(labels):
+        parser.error("the sources must have different labels, e.g. 'wd-record=%s'" % args.sources[0])
+
+    cycle_callback = None
+    if args.cycles:
+        def cycle_callback(cycle, counts, common, only):
+            print('%11s: %s  common %5d  only %s' % (cycle_str(cycle), ' '.join('%s %5d' % item for item in zip(labels, counts)), common,
+                                                     ' '.join('%s %4d' % item for item in zip(labels, only))), flush=True)
+    reconciler = Reconciler(logs, args.window, args.all_cycles, cycle_callback)
+    try:
+        reconciler.run()
+    except SpotLogError as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    report = reconciler.report()
+    print_summary(report)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
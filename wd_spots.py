@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_spots.py
+# Typed schemas, a vectorized parser and a compact columnar 'pack' encoding of the spot and noise files which WD clients
+# upload to wsprdaemon.org, shared by the client (upload_to_wsprdaemon_daemon()) and the server (wd_noise_ingest.py).
+#
+# Record versions:
+#     spots 3.0    34 fields written by decoding.sh with SPOT_LINE_FORMAT
+#     spots 2.10   32 fields from WD 2.x, converted to 3.0 as wd_spots_to_ts.awk does
+#     noise        15 fields:  12 sox signal level stats, RMS noise, C2 FFT noise and overload count
+#
+# Each file is parsed with one bytes.split() and, when every line has the expected number of fields, converted a whole
+# column at a time by NumPy.  The numeric fields are held as integers scaled by the number of decimals in their printf format,
+# e.g. '%5.2f' => x100, so a pack file holds the exact values of the text lines and 'unpack' recreates the same spot files.
+# The noise levels are printed by sox and bc with a varying number of decimals, so they are kept to 3 decimals and unpacked
+# without trailing zeros, e.g. '-.50' => '-0.5'.
+# A pack file is:
+#     b'WDPACK2\n'  uint32 header length  JSON header  column data
+# where string columns are dictionary encoded and numeric columns are stored as (value - min) / GCD in the smallest unsigned type which
+# holds them, or not at all if every value is the same.  The file names are split into dictionary coded columns of their directories
+# (CALL_GRID, RECEIVER, BAND) and the date and time of their names, so each file costs a few bytes and not a JSON path string.
+# The rows of values like '-0.00', which printf gives for small negative numbers, are listed in the header so they are unpacked the same.
+#
+# Usage:
+#     wd_spots.py pack   --output FILE.wdpack [--kind spots|noise] [--root DIR] FILE_OR_DIR ...   ### pack the *_spots.txt or *_noise.txt files
+#     wd_spots.py unpack --root DIR FILE.wdpack ...                          ### recreate the text files under DIR
+#     wd_spots.py cat    FILE.wdpack|FILE.txt ...                            ### print the records as text lines
+
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+# (name, printf format) of the 3.0 spot line.  Field 18 is 'for_wsprnet' and field 34 'pkt_mode' in the lists of wd_spots_to_ts.awk,
+# but decoding.sh writes the packet mode in field 18 and the proxy upload flag in field 34
+SPOT_FIELDS_3_0 = (
+    ('date', '%6s'), ('time', '%4s'), ('sync_quality', '%5.2f'), ('snr', '%6.2f'), ('dt', '%5.2f'), ('freq', '%12.7f'),
+    ('call', '%-14s'), ('grid', '%-6s'), ('pwr', '%2d'), ('drift', '%2d'), ('decode_cycles', '%4d'), ('jitter', '%4d'),
+    ('blocksize', '%4d'), ('metric', '%4d'), ('osd_decode', '%2d'), ('ipass', '%3d'), ('nhardmin', '%3d'), ('pkt_mode', '%2d'),
+    ('rms_noise', '%6.1f'), ('c2_noise', '%6.1f'), ('band', '%4d'), ('my_grid', '%6s'), ('my_call_sign', '%12s'), ('km', '%5d'),
+    ('rx_az', '%6.1f'), ('rx_lat', '%6.1f'), ('rx_lon', '%6.1f'), ('tx_az', '%6.1f'), ('tx_lat', '%6.1f'), ('tx_lon', '%6.1f'),
+    ('v_lat', '%6.1f'), ('v_lon', '%6.1f'), ('overload_counts', '%4d'), ('proxy_upload', '%4d'))
+SPOT_FIELDS_2_10_COUNT = 32
+
+# sox prints the levels with a varying number of decimals, so keep 3 and print them without trailing zeros
+NOISE_FIELDS = tuple(('level_%d' % i, '%.3g') for i in range(1, 13)) + (('rms_level', '%.3g'), ('c2_level', '%.3g'), ('ov', '%d'))
+
+SCHEMAS = {'spots': SPOT_FIELDS_3_0, 'noise': NOISE_FIELDS}
+PACK_MAGIC = b'WDPACK2\n'
+PACK_FILE_SUFFIX = '.wdpack'
+
+
+class SpotFormatError(ValueError):
+    pass
+
+
+def field_scale(fmt):
+    # '%6s' => None (a string),  '%4d' => 1,  '%5.2f' => 100,  '%.3g' => 1000
+    if fmt.endswith('s'):
+        return None
+    if fmt.endswith('d'):
+        return 1
+    return 10 ** int(fmt.rsplit('.', 1)[1][:-1])
+
+
+def format_value(fmt, value, scale):
+    if scale is None:
+        return fmt % value
+    if fmt.endswith('d'):
+        return fmt % value
+    if fmt.endswith('g'):
+        return ('%.*f' % (len(str(scale)) - 1, value / scale)).rstrip('0').rstrip('.')
+    return fmt % (value / scale)
+
+
+class RecordTable:
+    # Columnar records of one kind.  Row i came from files[file_index[i]]
+    def __init__(self, kind):
+        self.kind = kind
+        self.fields = SCHEMAS[kind]
+        self.files = []
+        self.file_index = np.zeros(0, dtype=np.int32)
+        self.columns = {name: np.zeros(0, dtype=object if field_scale(fmt) is None else np.int64) for name, fmt in self.fields}
+        self.negative_zeros = {}    # {name: array of the rows of '-0.0' values}
+        self.bad_lines = 0
+
+    def __len__(self):
+        return len(self.file_index)
+
+    def extend(self, token_rows, file_index):
+        # token_rows is a 2D array of byte strings with one column per field
+        new_columns = {}
+        for i, (name, fmt) in enumerate(self.fields):
+            scale = field_scale(fmt)
+            if scale is None:
+                new_columns[name] = token_rows[:, i].astype('U')
+                continue
+            new_columns[name] = np.rint(token_rows[:, i].astype(np.float64) * scale).astype(np.int64)
+            if scale > 1:
+                negative_zero_rows = np.nonzero((new_columns[name] == 0) & (np.char.startswith(token_rows[:, i], b'-')))[0]
+                if len(negative_zero_rows):
+                    self.negative_zeros[name] = np.concatenate((self.negative_zeros.get(name, np.zeros(0, dtype=np.int64)), negative_zero_rows + len(self)))
+        for name in self.columns:
+            self.columns[name] = np.concatenate((self.columns[name], new_columns[name]))
+        self.file_index = np.concatenate((self.file_index, np.asarray(file_index, dtype=np.int32)))
+
+    def lines(self, rows=None):
+        rows = range(len(self)) if rows is None else rows
+        formats = [(fmt, field_scale(fmt), self.columns[name], set(self.negative_zeros.get(name, ()))) for name, fmt in self.fields]
+        for row in rows:
+            yield ' '.join(format_value(fmt, -0.0 if row in negative_zero_rows else column[row], scale)
+                           for fmt, scale, column, negative_zero_rows in formats)
+
+
+def fix_2_10_spot_tokens(tokens):
+    # Convert a 32 field WD 2.x spot line to 3.0 the same way as wd_spots_to_ts.awk
+    tokens = list(tokens)
+    if tokens[17] != b'0':
+        # Some 2.10 type 2 spots had 'none' for the grid and the following fields shifted right by one
+        tokens[7:19] = tokens[8:20]
+    tokens[17] = b'2'                       # All WD 2.x spots are WSPR-2
+    return tokens + [b'0', b'0']            # No overload counts or proxy upload flag in WD 2.x
+
+
+def parse_lines(data, kind):
+    # Returns a 2D array of the tokens of the valid lines in data and the number of invalid lines
+    field_count = len(SCHEMAS[kind])
+    tokens = data.split()
+    line_count = data.count(b'\n') + (0 if data.endswith(b'\n') or not data else 1)
+    if tokens and len(tokens) == line_count * field_count:
+        token_rows = np.array(tokens, dtype=bytes).reshape(-1, field_count)    # The common case:  every line has the expected fields
+    else:
+        rows = []
+        for line in data.splitlines():
+            line_tokens = line.split()
+            if kind == 'spots' and len(line_tokens) == SPOT_FIELDS_2_10_COUNT:
+                line_tokens = fix_2_10_spot_tokens(line_tokens)
+            if len(line_tokens) == field_count:
+                rows.append(line_tokens)
+        token_rows = np.array(rows, dtype=bytes).reshape(-1, field_count)
+    good_rows = validate_token_rows(token_rows, kind)
+    bad_lines = sum(1 for line in data.splitlines() if line.strip()) - int(good_rows.sum())
+    return token_rows[good_rows], bad_lines
+
+
+def validate_token_rows(token_rows, kind):
+    # Returns a boolean mask of the rows whose numeric fields are all numbers
+    good_rows = np.ones(len(token_rows), dtype=bool)
+    for i, (name, fmt) in enumerate(SCHEMAS[kind]):
+        if field_scale(fmt) is None:
+            continue
+        try:
+            token_rows[:, i].astype(np.float64)
+        except ValueError:
+            for row in np.nonzero(good_rows)[0]:
+                try:
+                    float(token_rows[row, i])
+                except ValueError:
+                    good_rows[row] = False
+    return good_rows
+
+
+def file_kind(path):
+    if path.endswith('_spots.txt'):
+        return 'spots'
+    if path.endswith('_noise.txt'):
+        return 'noise'
+    return None
+
+
+def find_text_files(paths, kind):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in sorted(file_names):
+                if file_kind(file_name) == kind:
+                    yield os.path.join(dir_path, file_name)
+
+
+def read_text_files(paths, kind, root=None):
+    # Returns a RecordTable of the records in the text files.  The file names are saved relative to root
+    table = RecordTable(kind)
+    all_rows = []
+    all_index = []
+    for path in paths:
+        with open(path, 'rb') as fp:
+            token_rows, bad_lines = parse_lines(fp.read(), kind)
+        table.files.append(os.path.relpath(path, root) if root else path)
+        table.bad_lines += bad_lines
+        all_rows.append(token_rows)
+        all_index.append(np.full(len(token_rows), len(table.files) - 1, dtype=np.int32))
+    if all_rows:
+        table.extend(np.concatenate(all_rows), np.concatenate(all_index))
+    return table
+
+
+def file_name_parts(name):
+    # 'noise/AI6VN_CM88mc/KIWI_0/20/251019_1200_noise.txt' => the directories and the '_' separated parts of the file name:
+    # ['noise', 'AI6VN_CM88mc', 'KIWI_0', '20', '251019', '1200', 'noise.txt'] and (4, 3), the number of each
+    dir_parts = name.split('/')
+    name_parts = dir_parts.pop().split('_', 2)
+    return dir_parts + name_parts, (len(dir_parts), len(name_parts))
+
+
+def join_file_name_parts(parts, shape):
+    return '/'.join(list(parts[:shape[0]]) + ['_'.join(parts[shape[0]:])])
+
+
+def encode_column(name, values):
+    # Returns the [name, dtype, offset, step(, dictionary)] header entry of a column and its data.  Strings are dictionary
+    # coded and integers are saved as (value - offset) / step in the smallest unsigned type, or not at all if every value is the same
+    dictionary = None
+    if values.dtype == object or values.dtype.kind == 'U':
+        dictionary, values = np.unique(values.astype('U'), return_inverse=True) if len(values) else (np.zeros(0, dtype='U1'), values)
+        dictionary = dictionary.tolist()
+    values = np.asarray(values, dtype=np.int64)
+    offset = int(values.min()) if len(values) else 0
+    values = values - offset
+    step = int(np.gcd.reduce(values)) if len(values) else 0
+    if step > 1:
+        values = values // step
+    dtype = ''
+    if step:
+        dtype = next(dtype for dtype in ('<u1', '<u2', '<u4', '<u8') if values.max() <= np.iinfo(np.dtype(dtype)).max)
+    column = [name, dtype, offset, max(step, 1)]
+    if dictionary is not None:
+        column.append(dictionary)
+    return column, values.astype(dtype).tobytes() if dtype else b''
+
+
+def decode_column(column, data, offset, count):
+    # Returns the values of a column encoded by encode_column() and the offset of the next column's data
+    name, dtype, value_offset, step = column[:4]
+    if dtype:
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=offset).astype(np.int64) * step + value_offset
+        offset += count * np.dtype(dtype).itemsize
+    else:
+        values = np.full(count, value_offset, dtype=np.int64)
+    if len(column) > 4:
+        values = np.array(column[4], dtype='U')[values] if count else np.zeros(0, dtype='U1')
+    return values, offset
+
+
+def encode_pack(table):
+    # The file names are saved as one dictionary coded column per directory and per '_' separated part of the file name, so the
+    # call/grid, receiver, band, date and time of each file cost a byte or less.  The rows of each file follow each other,
+    # so only the number of rows of each file is saved
+    header = {'kind': table.kind, 'rows': len(table), 'files': len(table.files), 'columns': [],
+              'negative_zeros': {name: rows.tolist() for name, rows in table.negative_zeros.items()}}
+    if np.any(np.diff(table.file_index) < 0):
+        raise SpotFormatError('the rows of each file must follow each other')
+    columns = [('_rows', np.bincount(table.file_index, minlength=len(table.files)))]
+    split_names = [file_name_parts(name) for name in table.files]
+    shapes = set(shape for _, shape in split_names)
+    if len(shapes) == 1:
+        header['file_name_shape'] = list(shapes.pop())
+        columns += [('_file_%d' % i, np.array([parts[i] for parts, _ in split_names], dtype='U')) for i in range(sum(header['file_name_shape']))]
+    else:
+        header['file_names'] = table.files         # The names don't all have the same form, so list them
+    columns += [(name, table.columns[name]) for name, _ in table.fields]
+    blobs = []
+    for name, values in columns:
+        column, blob = encode_column(name, values)
+        header['columns'].append(column)
+        blobs.append(blob)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    return PACK_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + b''.join(blobs)
+
+
+def decode_pack(data):
+    if not data.startswith(PACK_MAGIC):
+        raise SpotFormatError('not a version %s WD pack file' % PACK_MAGIC[6:7].decode())
+    offset = len(PACK_MAGIC)
+    (header_length,) = struct.unpack_from('<I', data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + header_length])
+    offset += header_length
+    if header.get('kind') not in SCHEMAS:
+        raise SpotFormatError("unknown record kind '%s'" % header.get('kind'))
+    table = RecordTable(header['kind'])
+    table.negative_zeros = {name: np.array(rows, dtype=np.int64) for name, rows in header.get('negative_zeros', {}).items()}
+    file_name_columns = []
+    try:
+        for column in header['columns']:
+            name = column[0]
+            values, offset = decode_column(column, data, offset, header['files'] if name.startswith('_') else header['rows'])
+            if name == '_rows':
+                table.file_index = np.repeat(np.arange(header['files'], dtype=np.int32), values)
+            elif name.startswith('_file_'):
+                file_name_columns.append(values)
+            elif name in table.columns:
+                table.columns[name] = values
+    except (ValueError, IndexError) as err:
+        raise SpotFormatError('truncated or corrupt pack file: %s' % err)
+    if 'file_names' in header:
+        table.files = header['file_names']
+    else:
+        table.files = [join_file_name_parts(parts, header['file_name_shape']) for parts in zip(*file_name_columns)] if header['files'] else []
+    if len(table.file_index) != header['rows']:
+        raise SpotFormatError('the files have %d rows, not %d' % (len(table.file_index), header['rows']))
+    return table
+
+
+def read_pack_file(path):
+    with open(path, 'rb') as fp:
+        return decode_pack(fp.read())
+
+
+def read_any(path, kind=None):
+    # A pack file, or a text file of the kind given by its name
+    if path.endswith(PACK_FILE_SUFFIX):
+        return read_pack_file(path)
+    return read_text_files([path], kind or file_kind(path) or 'spots')
+
+
+def cmd_pack(args):
+    kind = args.kind
+    paths = list(find_text_files(args.paths, kind))
+    table = read_text_files(paths, kind, args.root)
+    data = encode_pack(table)
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(data)
+    os.replace(tmp_path, args.output)
+    text_bytes = sum(os.path.getsize(path) for path in paths)
+    print('Packed %d %s records from %d files (%d bad lines) into %d bytes, %.1f%% of the %d bytes of text' %
+          (len(table), kind, len(paths), table.bad_lines, len(data), 100.0 * len(data) / max(text_bytes, 1), text_bytes), file=sys.stderr)
+    return 0
+
+
+def cmd_unpack(args):
+    for path in args.pack_files:
+        table = read_pack_file(path)
+        order = np.argsort(table.file_index, kind='stable')
+        boundaries = np.searchsorted(table.file_index[order], np.arange(len(table.files) + 1))
+        for file_idx, file_name in enumerate(table.files):
+            out_path = os.path.join(args.root, file_name)
+            if os.path.isabs(file_name) or '..' in file_name.split('/'):
+                print("ERROR: skipping unsafe file name '%s' in %s" % (file_name, path), file=sys.stderr)
+                continue
+            os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+            with open(out_path, 'w') as fp:
+                for line in table.lines(order[boundaries[file_idx]:boundaries[file_idx + 1]]):
+                    fp.write(line + '\n')
+    return 0
+
+
+def cmd_cat(args):
+    try:
+        for path in args.paths:
+            table = read_any(path, args.kind)
+            for line in table.lines():
+                print(line)
+    except BrokenPipeError:
+        sys.stderr.close()          # e.g. piped to 'head'
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse, pack and unpack WD spot and noise files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help='Pack text files into one columnar file')
+    pack_parser.add_argument('--output', required=True)
+    pack_parser.add_argument('--kind', choices=sorted(SCHEMAS), default='spots')
+    pack_parser.add_argument('--root', default=None, help='Save the file names relative to this directory')
+    pack_parser.add_argument('paths', nargs='+')
+    unpack_parser = subparsers.add_parser('unpack', help='Recreate the text files of pack files')
+    unpack_parser.add_argument('--root', default='.')
+    unpack_parser.add_argument('pack_files', nargs='+')
+    cat_parser = subparsers.add_parser('cat', help='Print the records of pack or text files as text lines')
+    cat_parser.add_argument('--kind', choices=sorted(SCHEMAS), default=None)
+    cat_parser.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'pack':
+            return cmd_pack(args)
+        if args.command == 'unpack':
+            return cmd_unpack(args)
+        return cmd_cat(args)
+    except (OSError, SpotFormatError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
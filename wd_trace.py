@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_trace.py
+# Lightweight per-cycle span tracing of the decode => post => upload pipeline.
+#
+# Each span is one fixed size 64 byte binary record appended with a single O_APPEND write() to WD_TRACE_FILE, so the bash
+# daemons (through the CLI below and wd_trace_span()/wd_trace_run() in wd-utils.sh) and the Python tools (through span())
+# can all write to the same file without any locking:
+#     start epoch, wall seconds, CPU seconds, max RSS KB, pid, cycle start epoch, stage, band, receiver
+#
+# Usage:
+#     wd_trace.py span   STAGE BAND CYCLE START_EPOCH [END_EPOCH]     ### record a span timed by the caller, e.g. a wait.  START '+N' => CYCLE + N secs
+#     wd_trace.py run    STAGE BAND CYCLE -- CMD ARGS...             ### run CMD, record its wall/CPU/RSS, return its exit code
+#     wd_trace.py report [--since HOURS] [--stage STAGE] [--cycles N] ### per-stage percentiles and the critical path of each cycle
+# CYCLE is either the epoch of the cycle start or 'YYMMDD_HHMM'
+
+import argparse
+import os
+import resource
+import struct
+import sys
+import time
+from contextlib import contextmanager
+
+from wd_utils import WSPR_CYCLE_SECONDS, cycle_to_epoch, epoch_to_cycle
+
+TRACE_RECORD = struct.Struct('<dffIII16s8s12s')
+assert TRACE_RECORD.size == 64
+
+WD_TRACE_FILE = os.environ.get('WD_TRACE_FILE', os.path.join(os.environ.get('WSPRDAEMON_TMP_DIR', '/tmp/wsprdaemon'), 'wd_trace.bin'))
+WD_TRACE_FILE_SIZE_MAX = int(os.environ.get('WD_TRACE_FILE_SIZE_MAX', '10000000'))    # When exceeded, the trace file is renamed to '.old'
+
+
+def parse_cycle(cycle):
+    if cycle is None or cycle == '':
+        return 0
+    cycle = str(cycle)
+    if '_' in cycle:
+        return cycle_to_epoch(cycle[:11])
+    return int(float(cycle))
+
+
+def write_span(stage, band, cycle, start_epoch, wall_secs, cpu_secs=0.0, rss_kb=0, receiver='', pid=None, trace_file=None):
+    record = TRACE_RECORD.pack(start_epoch, wall_secs, cpu_secs, max(0, int(rss_kb)), pid or os.getpid(), parse_cycle(cycle),
+                               stage.encode()[:16], band.encode()[:8], receiver.encode()[:12])
+    try:
+        fd = os.open(trace_file or WD_TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664)
+    except OSError:
+        return
+    try:
+        os.write(fd, record)
+        if os.fstat(fd).st_size > WD_TRACE_FILE_SIZE_MAX:
+            os.replace(trace_file or WD_TRACE_FILE, (trace_file or WD_TRACE_FILE) + '.old')
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def span(stage, band='', cycle=0, receiver='', trace_file=None):
+    # with wd_trace.span('upload', 'all', cycle):  ...
+    start_epoch = time.time()
+    start_perf = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        write_span(stage, band, cycle, start_epoch, time.perf_counter() - start_perf, time.process_time() - start_cpu,
+                   resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, receiver, trace_file=trace_file)
+
+
+def read_spans(trace_file):
+    data = b''
+    for path in (trace_file + '.old', trace_file):
+        try:
+            with open(path, 'rb') as fp:
+                path_data = fp.read()
+        except OSError:
+            continue
+        data += path_data[:len(path_data) - len(path_data) % TRACE_RECORD.size]
+    spans = []
+    for offset in range(0, len(data) - TRACE_RECORD.size + 1, TRACE_RECORD.size):
+        start, wall, cpu, rss_kb, pid, cycle, stage, band, receiver = TRACE_RECORD.unpack_from(data, offset)
+        spans.append((start, wall, cpu, rss_kb, pid, cycle, stage.rstrip(b'\0').decode(errors='replace'),
+                      band.rstrip(b'\0').decode(errors='replace'), receiver.rstrip(b'\0').decode(errors='replace')))
+    return spans
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def stage_report(spans, out):
+    by_stage = {}
+    for sp in spans:
+        by_stage.setdefault(sp[6], []).append(sp)
+    print('%-16s %6s %8s %8s %8s %8s %8s %8s %8s' % ('STAGE', 'COUNT', 'WALL_P50', 'WALL_P90', 'WALL_P99', 'WALL_MAX', 'CPU_P50', 'CPU_P99', 'RSS_MAX'), file=out)
+    for stage in sorted(by_stage, key=lambda s: min(sp[0] - sp[5] for sp in by_stage[s])):
+        walls = sorted(sp[1] for sp in by_stage[stage])
+        cpus = sorted(sp[2] for sp in by_stage[stage])
+        rss_max_mb = max(sp[3] for sp in by_stage[stage]) / 1024.0
+        print('%-16s %6d %8.3f %8.3f %8.3f %8.3f %8.3f %8.3f %7.1fM' % (stage, len(walls), percentile(walls, 50), percentile(walls, 90),
+              percentile(walls, 99), walls[-1], percentile(cpus, 50), percentile(cpus, 99), rss_max_mb), file=out)
+
+
+def critical_path_report(spans, max_cycles, out):
+    # For each cycle, the band whose last span ends latest is the one which delayed the cycle's spots.  Print its chain of
+    # spans (decoding of each of its receivers, then posting) as offsets from the end of the WSPR cycle, followed by the
+    # cycle wide spans of band 'all', e.g. the wsprnet upload
+    by_cycle = {}
+    for sp in spans:
+        if sp[5]:
+            by_cycle.setdefault(sp[5], []).append(sp)
+    for cycle in sorted(by_cycle)[-max_cycles:]:
+        cycle_end = cycle + WSPR_CYCLE_SECONDS
+        cycle_spans = by_cycle[cycle]
+        band_end = {}
+        for sp in cycle_spans:
+            if sp[7] and sp[7] != 'all':
+                band_end[sp[7]] = max(band_end.get(sp[7], 0.0), sp[0] + sp[1])
+        last_end = max(sp[0] + sp[1] for sp in cycle_spans)
+        print('%s: last span ended %.1f seconds after the end of the cycle' % (epoch_to_cycle(cycle), last_end - cycle_end), file=out)
+        critical_band = max(band_end, key=band_end.get) if band_end else None
+        path = [sp for sp in cycle_spans if sp[7] == critical_band or not sp[7] or sp[7] == 'all']
+        for sp in sorted(path, key=lambda sp: sp[0]):
+            print('    %+7.1f %+7.1f  %-16s %-8s %-12s wall=%.3f cpu=%.3f rss=%.1fM' % (sp[0] - cycle_end, sp[0] + sp[1] - cycle_end, sp[6], sp[7], sp[8],
+                  sp[1], sp[2], sp[3] / 1024.0), file=out)
+
+
+def cmd_span(args):
+    end_epoch = float(args.end_epoch) if args.end_epoch else time.time()
+    if args.start_epoch.startswith('+'):
+        start_epoch = parse_cycle(args.cycle) + float(args.start_epoch[1:])      ### '+120' => 120 seconds after the start of the cycle
+    else:
+        start_epoch = float(args.start_epoch)
+    write_span(args.stage, args.band, args.cycle, start_epoch, end_epoch - start_epoch, 0.0, 0, args.receiver,
+               pid=os.getppid(), trace_file=args.trace_file)
+    return 0
+
+
+def cmd_run(args):
+    cmd = args.cmd[1:] if args.cmd and args.cmd[0] == '--' else args.cmd
+    if not cmd:
+        print('wd_trace.py run: no command given', file=sys.stderr)
+        return 2
+    start_epoch = time.time()
+    start_perf = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(cmd[0], cmd)
+        except OSError as err:
+            print('wd_trace.py run: %s: %s' % (cmd[0], err), file=sys.stderr)
+            os._exit(127)
+    while True:
+        try:
+            _, status, rusage = os.wait4(pid, 0)
+            break
+        except InterruptedError:
+            continue
+    write_span(args.stage, args.band, args.cycle, start_epoch, time.perf_counter() - start_perf, rusage.ru_utime + rusage.ru_stime,
+               rusage.ru_maxrss, args.receiver, pid=pid, trace_file=args.trace_file)
+    return os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else (status >> 8)
+
+
+def cmd_report(args):
+    spans = read_spans(args.trace_file)
+    if args.since:
+        oldest = time.time() - args.since * 3600
+        spans = [sp for sp in spans if sp[0] >= oldest]
+    if args.stage:
+        spans = [sp for sp in spans if sp[6] == args.stage]
+    if not spans:
+        print("No spans found in '%s'" % args.trace_file)
+        return 1
+    stage_report(spans, sys.stdout)
+    if args.cycles:
+        print()
+        critical_path_report(spans, args.cycles, sys.stdout)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record and report per-cycle pipeline spans')
+    parser.add_argument('--trace-file', default=WD_TRACE_FILE)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    span_parser = subparsers.add_parser('span', help='Record a span timed by the caller')
+    run_parser = subparsers.add_parser('run', help='Run a command and record its wall time, CPU time and RSS')
+    for sub_parser in (span_parser, run_parser):
+        sub_parser.add_argument('stage')
+        sub_parser.add_argument('band')
+        sub_parser.add_argument('cycle')
+        sub_parser.add_argument('--receiver', default=os.environ.get('WD_TRACE_RECEIVER', ''))
+    span_parser.add_argument('start_epoch')
+    span_parser.add_argument('end_epoch', nargs='?')
+    run_parser.add_argument('cmd', nargs=argparse.REMAINDER)
+
+    report_parser = subparsers.add_parser('report', help='Print per-stage percentiles and the critical path of the most recent cycles')
+    report_parser.add_argument('--since', type=float, default=0, help='Only report spans which started in the last HOURS')
+    report_parser.add_argument('--stage', default='', help='Only report this stage')
+    report_parser.add_argument('--cycles', type=int, default=5, help='Print the critical path of the last N cycles (0 => none)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'report':
+        return cmd_report(args)
+    if args.command == 'span':
+        return cmd_span(args)
+    return cmd_run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_utils.py
+# Small set of helpers shared by the long running wsprdaemon Python daemons so that they log and
+# handle WSPR cycle names the same way the bash daemons in wd-utils.sh do
+
+import os
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+
+verbosity = int(os.environ.get('verbosity', '1'))
+log_file_path = os.environ.get('WD_LOGFILE', '')
+log_file_size_max = int(os.environ.get('WD_LOGFILE_SIZE_MAX', '1000000'))
+
+WSPR_CYCLE_SECONDS = 120
+
+
+def wd_logger(log_at_level, printout_string):
+    # Same line format as wd_logger() in wd-utils.sh:  'Mon 19 Oct 2026 12:00:00 UTC: function() message'
+    global verbosity
+    print_time_and_calling_function_name = True
+    if log_at_level < 0:
+        print_time_and_calling_function_name = False
+        log_at_level = -log_at_level
+    if verbosity < log_at_level:
+        return
+    printout_line = printout_string
+    if print_time_and_calling_function_name:
+        time_str = datetime.now(timezone.utc).strftime('%a %d %b %Y %H:%M:%S UTC')
+        printout_line = '%s: %s() %s' % (time_str, sys._getframe(1).f_code.co_name, printout_string)
+
+    if not log_file_path:
+        print(printout_line, flush=True)
+        return
+    try:
+        if os.path.getsize(log_file_path) > log_file_size_max:
+            # Like wd_logger(), trim off the oldest 25% of the log file
+            with open(log_file_path, 'rb') as fp:
+                lines = fp.readlines()
+            with open(log_file_path, 'wb') as fp:
+                fp.writelines(lines[len(lines) // 4:])
+    except OSError:
+        pass
+    with open(log_file_path, 'a') as fp:
+        print(printout_line, file=fp)
+
+
+def setup_verbosity_traps():
+    # Same as setup_verbosity_traps() in wd-utils.sh, so 'wd -d' and 'wd -D' work on Python daemons too
+    def verbosity_increment(signum, frame):
+        global verbosity
+        verbosity += 1
+        wd_logger(0, 'verbosity now = %d' % verbosity)
+
+    def verbosity_decrement(signum, frame):
+        global verbosity
+        if verbosity > 0:
+            verbosity -= 1
+        wd_logger(0, 'verbosity now = %d' % verbosity)
+
+    signal.signal(signal.SIGUSR1, verbosity_increment)
+    signal.signal(signal.SIGUSR2, verbosity_decrement)
+
+
+def set_log_file(path):
+    global log_file_path
+    log_file_path = path or ''
+
+
+def cycle_to_epoch(cycle):
+    # 'YYMMDD_HHMM' as used in all the *_spots.txt and *_noise.txt filenames => epoch seconds
+    return int(datetime.strptime(cycle, '%y%m%d_%H%M').replace(tzinfo=timezone.utc).timestamp())
+
+
+def epoch_to_cycle(epoch_secs):
+    return datetime.fromtimestamp(epoch_secs, tz=timezone.utc).strftime('%y%m%d_%H%M')
+
+
+def cycle_start_epoch(epoch_secs=None):
+    # The start of the WSPR cycle which contains epoch_secs
+    if epoch_secs is None:
+        epoch_secs = time.time()
+    return int(epoch_secs) - (int(epoch_secs) % WSPR_CYCLE_SECONDS)
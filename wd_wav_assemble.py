@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_wav_assemble.py
+# One pass replacement for the sox and python commands which decoding_daemon() runs to create the 2/5/15/30 minute wav file
+# which wsprd and jt9 decode from the one minute wav files:
+#     sox --combine concatenate FILES -n stat                                      ### only to get 'Maximum amplitude'
+#     sox --combine concatenate FILES -b 16 -e signed-integer OUTPUT --norm=-1     ### the decoder input
+#     sox OUTPUT -n stats                                                          ### 'Pk lev dB' for the overrange check
+#     get-peak-wav-sample.py FILES                                                 ### the peak for sdr_noise_level_adjust_float
+# Each one minute file (16/24/32 bit int or 32/64 bit float PCM) is memory mapped once.  Its peak is found, then all the files
+# are scaled by the gain which puts that peak at --norm dBFS and written as one 16 bit wav file, whose peak and RMS are
+# measured as they are written.  Ints are scaled to floats as sox and soundfile do, so the levels printed are the ones those
+# commands reported.  Unlike sox, the 16 bit samples are rounded without dither.
+#
+# Prints these lines, in this order, so bash can get them with 'read':
+#     peak of the input files (linear)             as printed by get-peak-wav-sample.py
+#     peak of the input files (dBFS)               as printed by get-peak-wav-sample.py
+#     gain applied (dB)
+#     peak of OUTPUT (dBFS)                        'Pk lev dB' of 'sox OUTPUT -n stats'
+#     RMS of OUTPUT (dBFS)                         'RMS lev dB' of 'sox OUTPUT -n stats'
+#     samples per channel in OUTPUT
+#
+# Usage:  wd_wav_assemble.py [--norm -1] --output OUTPUT.wav ONE_MINUTE.wav ...
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+RIFF_HEADER = struct.Struct('<4sI4s')
+CHUNK_HEADER = struct.Struct('<4sI')
+FMT_CHUNK = struct.Struct('<HHIIHH')
+WAV_16_BIT_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+INT16_FULL_SCALE = 32768.0
+
+
+class WavFormatError(ValueError):
+    pass
+
+
+class WavFile:
+    # A memory mapped wav file whose samples are 'samples', a read-only [frames][channels] view of the mapped data chunk
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        riff, _, wave = RIFF_HEADER.unpack_from(self.map) if len(self.map) >= RIFF_HEADER.size else (b'', 0, b'')
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise WavFormatError("'%s' is not a RIFF WAVE file" % path)
+        offset = RIFF_HEADER.size
+        fmt = None
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            chunk_id, chunk_size = CHUNK_HEADER.unpack_from(self.map, offset)
+            offset += CHUNK_HEADER.size
+            if chunk_id == b'fmt ':
+                fmt = FMT_CHUNK.unpack_from(self.map, offset)
+                if fmt[0] == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                    fmt = (struct.unpack_from('<H', self.map, offset + 24)[0],) + fmt[1:]      # The format code of the SubFormat GUID
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise WavFormatError("'%s' has no 'fmt ' chunk before its 'data' chunk" % path)
+                data_size = min(chunk_size, len(self.map) - offset)      # pcmrecord may not have updated the size of a file it is still writing
+                break
+            offset += chunk_size + (chunk_size & 1)
+        else:
+            raise WavFormatError("'%s' has no 'data' chunk" % path)
+        format_code, self.channels, self.sample_rate, _, block_align, bits = fmt
+        if format_code == WAVE_FORMAT_PCM and bits in (16, 32):
+            dtype, self.full_scale = np.dtype('<i%d' % (bits // 8)), float(1 << (bits - 1))
+        elif format_code == WAVE_FORMAT_PCM and bits == 24:
+            dtype, self.full_scale = None, float(1 << 23)
+        elif format_code == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+            dtype, self.full_scale = np.dtype('<f%d' % (bits // 8)), 1.0
+        else:
+            raise WavFormatError("'%s' has format %d with %d bit samples, which is not 16/24/32 bit int or 32/64 bit float PCM" % (path, format_code, bits))
+        frames = data_size // block_align
+        if dtype is None:
+            packed = np.frombuffer(self.map, dtype=np.uint8, count=frames * block_align, offset=offset).reshape(-1, 3)
+            self.samples = ((packed[:, 0].astype(np.int32) << 8 | packed[:, 1].astype(np.int32) << 16 | packed[:, 2].astype(np.int32) << 24) >> 8).reshape(frames, self.channels)
+        else:
+            self.samples = np.frombuffer(self.map, dtype=dtype, count=frames * self.channels, offset=offset).reshape(frames, self.channels)
+
+    def peak(self):
+        # The largest magnitude of any sample, as a fraction of full scale
+        if self.samples.size == 0:
+            return 0.0
+        return max(abs(float(self.samples.max())), abs(float(self.samples.min()))) / self.full_scale
+
+
+def assemble(input_paths, output_path, norm_dbfs):
+    # Returns (input peak, gain dB, output peak dBFS, output RMS dBFS, frames)
+    wav_files = [WavFile(path) for path in input_paths]
+    first = wav_files[0]
+    for wav_file in wav_files[1:]:
+        if (wav_file.sample_rate, wav_file.channels) != (first.sample_rate, first.channels):
+            raise WavFormatError("'%s' has %d sps and %d channels, but '%s' has %d sps and %d channels" %
+                                 (wav_file.path, wav_file.sample_rate, wav_file.channels, first.path, first.sample_rate, first.channels))
+    input_peak = max(wav_file.peak() for wav_file in wav_files)
+    gain = 10 ** (norm_dbfs / 20) / input_peak if input_peak > 0 else 1.0
+
+    frames = sum(len(wav_file.samples) for wav_file in wav_files)
+    data_bytes = frames * first.channels * 2
+    output_peak = 0
+    sum_of_squares = 0.0
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(WAV_16_BIT_HEADER.pack(b'RIFF', 36 + data_bytes, b'WAVE', b'fmt ', 16, WAVE_FORMAT_PCM, first.channels, first.sample_rate,
+                                        first.sample_rate * first.channels * 2, first.channels * 2, 16, b'data', data_bytes))
+        for wav_file in wav_files:
+            scaled = wav_file.samples.astype(np.float64) * (gain * INT16_FULL_SCALE / wav_file.full_scale)
+            output = np.clip(np.rint(scaled), -INT16_FULL_SCALE, INT16_FULL_SCALE - 1).astype('<i2')
+            fp.write(output.tobytes())
+            if output.size:
+                output_peak = max(output_peak, -int(output.min()), int(output.max()))
+                sum_of_squares += float(np.dot(output.ravel().astype(np.float64), output.ravel().astype(np.float64)))
+            wav_file.samples = None
+            wav_file.map.close()
+    os.replace(tmp_path, output_path)
+
+    samples = frames * first.channels
+    output_peak_dbfs = 20 * math.log10(output_peak / INT16_FULL_SCALE) if output_peak else -math.inf
+    output_rms_dbfs = 10 * math.log10(sum_of_squares / samples) - 20 * math.log10(INT16_FULL_SCALE) if sum_of_squares else -math.inf
+    return input_peak, 20 * math.log10(gain), output_peak_dbfs, output_rms_dbfs, frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concatenate, normalize and measure the one minute wav files of a decoding cycle in one pass')
+    parser.add_argument('--norm', type=float, default=-1.0, help='dBFS of the peak of the output, as sox --norm')
+    parser.add_argument('--output', required=True, help='The 16 bit wav file to create')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    try:
+        input_peak, gain_db, output_peak_dbfs, output_rms_dbfs, frames = assemble(args.files, args.output, args.norm)
+    except (OSError, ValueError) as err:
+        print('ERROR: %s' % err, file=sys.stderr)
+        return 1
+    input_peak_dbfs = 20 * math.log10(input_peak) if input_peak > 0 else -math.inf
+    print('%.12f' % input_peak)
+    print('%.12f' % input_peak_dbfs)
+    print('%.2f' % gain_db)
+    print('%.2f' % output_peak_dbfs)
+    print('%.2f' % output_rms_dbfs)
+    print('%d' % frames)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
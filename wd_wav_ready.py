@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wd_wav_ready.py
+# Event driven replacement for the 'lsof', 'stat' and one second 'sleep' loops with which get_wav_file_list() waits for the
+# one minute wav files written by pcmrecord (which renames each WAV.tmp to WAV when it is complete) and by kiwirecorder
+# (which closes and reopens its WAV after every write) to be complete.
+#
+# When WD_WAV_READY="yes", each decoding_daemon() sends a one line UDP datagram to this daemon on 127.0.0.1:PORT when it starts
+# waiting, and another each time it waits again:
+#
+#     START <READY_FIFO_PATH> <RECORDING_DIR> <WAV_FILE_GLOB>     forget what was reported to that decoder and report the complete wav files already in the dir
+#     WATCH <READY_FIFO_PATH> <RECORDING_DIR> <WAV_FILE_GLOB>     the same if this daemon doesn't know that decoder (e.g. after a restart), otherwise just 'still alive'
+#
+# This daemon watches all the recording dirs with one inotify fd.  A wav file is complete when it is renamed into the dir, or when
+# it is closed after being written and its header reports a full minute of samples, or --quiet-secs after it was last closed.
+# Then its header is read and this line is written to the FIFO of each decoder whose glob matches it:
+#
+#     READY <WAV_FILE_PATH> <FRAMES> <SAMPLE_RATE>
+#
+# So a decoder blocks in 'read -t' on its FIFO and starts within milliseconds of the file being closed.  A decoder which hasn't
+# sent WATCH for --expire-secs is forgotten.
+#
+# Usage:
+#     wd_wav_ready.py [--port 58035] [--quiet-secs 2] [--expire-secs 180] [--log-file FILE] [-v]
+
+import argparse
+import errno
+import fnmatch
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+from wd_posting_assembler import Inotify, IN_CLOSE_WRITE, IN_IGNORED, IN_MOVED_TO
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file
+from wd_wav_assemble import WavFile
+import wd_utils
+
+FULL_MINUTE_SECS = 59.5                 # A file closed with at least this many seconds of samples is complete, even if it is written by kiwirecorder
+
+
+def wav_file_frames(path):
+    # Returns (frames, sample rate) from the header of a wav file, or None if it isn't a valid wav file
+    try:
+        wav_file = WavFile(path)
+    except (OSError, ValueError) as err:
+        wd_logger(2, "Can't read the header of '%s': %s" % (path, err))
+        return None
+    frames = len(wav_file.samples)
+    wav_file.samples = None
+    wav_file.map.close()
+    return frames, wav_file.sample_rate
+
+
+class DecoderJob:
+    # The recording dir and wav file name glob of one decoding daemon, and the wav files reported to it
+    def __init__(self, fifo_path, recording_dir, glob):
+        self.fifo_path = fifo_path
+        self.recording_dir = recording_dir
+        self.glob = glob
+        self.reported = set()
+        self.pending = []                   # READY lines which couldn't be written since the decoder hadn't opened its FIFO
+        self.last_watch = time.time()
+
+    def matches(self, recording_dir, name):
+        return recording_dir == self.recording_dir and fnmatch.fnmatch(name, self.glob)
+
+
+class WavReady:
+    def __init__(self, args):
+        self.args = args
+        self.inotify = Inotify()
+        self.jobs = {}                      # READY_FIFO_PATH => DecoderJob
+        self.watches = {}                   # inotify wd => recording dir
+        self.dir_watches = {}               # recording dir => inotify wd
+        self.quiet_deadlines = {}           # wav file path => time it is complete if it isn't closed again
+
+    def watch(self, fifo_path, recording_dir, glob, restart=False):
+        job = self.jobs.get(fifo_path)
+        if job and (job.recording_dir, job.glob) == (recording_dir, glob) and not restart and recording_dir in self.dir_watches:
+            job.last_watch = time.time()
+            return
+        job = self.jobs[fifo_path] = DecoderJob(fifo_path, recording_dir, glob)
+        if recording_dir not in self.dir_watches:
+            try:
+                wd = self.inotify.add_watch(recording_dir)
+            except OSError as err:
+                wd_logger(1, 'ERROR: %s' % err)
+                return
+            self.watches[wd] = recording_dir
+            self.dir_watches[recording_dir] = wd
+        wd_logger(1, "Reporting '%s' wav files in '%s' to '%s'" % (glob, recording_dir, fifo_path))
+        now = time.time()
+        for name in sorted(os.listdir(recording_dir)):      # Wav files completed before this START
+            path = os.path.join(recording_dir, name)
+            if name.endswith('.wav') and job.matches(recording_dir, name) and path not in self.quiet_deadlines:
+                try:
+                    quiet = now - os.stat(path).st_mtime >= self.args.quiet_secs
+                except FileNotFoundError:
+                    continue
+                frames_and_rate = wav_file_frames(path)
+                if frames_and_rate and (quiet or frames_and_rate[0] >= FULL_MINUTE_SECS * frames_and_rate[1]):
+                    self.report(job, path, frames_and_rate)
+        self.write_pending(job)
+        self.forget_unused_watches()
+
+    def forget_unused_watches(self):
+        watched_dirs = set(job.recording_dir for job in self.jobs.values())
+        for recording_dir in list(self.dir_watches):
+            if recording_dir not in watched_dirs:
+                wd = self.dir_watches.pop(recording_dir)
+                self.watches.pop(wd, None)
+                self.inotify.rm_watch(wd)
+
+    def handle_message(self, message):
+        fields = message.split()
+        if len(fields) == 4 and fields[0] in ('START', 'WATCH'):
+            self.watch(fields[1], fields[2], fields[3], restart=(fields[0] == 'START'))
+        else:
+            wd_logger(1, "ERROR: unknown message '%s'" % message)
+
+    def handle_inotify_events(self, now):
+        for wd, mask, name in self.inotify.read_events():
+            recording_dir = self.watches.get(wd)
+            if recording_dir is None:
+                continue
+            if mask & IN_IGNORED:
+                # The recording dir was removed.  The next WATCH will add it again if it comes back
+                del self.watches[wd]
+                self.dir_watches.pop(recording_dir, None)
+                continue
+            if not mask & (IN_CLOSE_WRITE | IN_MOVED_TO) or not name.endswith('.wav'):
+                continue                    # e.g. pcmrecord's WAV.tmp, or the WAV.120-secs markers of get_wav_file_list()
+            if not any(job.matches(recording_dir, name) for job in self.jobs.values()):
+                continue
+            path = os.path.join(recording_dir, name)
+            frames_and_rate = wav_file_frames(path)
+            if not frames_and_rate:
+                continue
+            if mask & IN_MOVED_TO or frames_and_rate[0] >= FULL_MINUTE_SECS * frames_and_rate[1]:
+                self.ready(path, frames_and_rate)
+            else:
+                self.quiet_deadlines[path] = now + self.args.quiet_secs      # kiwirecorder may write more samples to it
+
+    def ready(self, path, frames_and_rate):
+        self.quiet_deadlines.pop(path, None)
+        recording_dir, name = os.path.split(path)
+        for job in self.jobs.values():
+            if job.matches(recording_dir, name):
+                self.report(job, path, frames_and_rate)
+                self.write_pending(job)
+
+    def report(self, job, path, frames_and_rate):
+        if path in job.reported:
+            return
+        job.reported.add(path)
+        job.pending.append('READY %s %d %d\n' % ((path,) + frames_and_rate))
+
+    def write_pending(self, job):
+        if not job.pending:
+            return
+        try:
+            fd = os.open(job.fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as err:
+            if err.errno not in (errno.ENXIO, errno.ENOENT):        # No reader (e.g. the decoding daemon is restarting) or no FIFO yet
+                wd_logger(1, "ERROR: can't open '%s': %s" % (job.fifo_path, err))
+            return
+        try:
+            while job.pending:
+                os.write(fd, job.pending[0].encode())               # Lines shorter than PIPE_BUF are written atomically
+                job.pending.pop(0)
+        except OSError as err:
+            wd_logger(1, "ERROR: can't write to '%s': %s" % (job.fifo_path, err))
+        finally:
+            os.close(fd)
+
+    def expire(self, now):
+        for path, deadline in list(self.quiet_deadlines.items()):
+            if now >= deadline:
+                frames_and_rate = wav_file_frames(path)
+                if frames_and_rate:
+                    self.ready(path, frames_and_rate)
+                else:
+                    del self.quiet_deadlines[path]
+        for job in list(self.jobs.values()):
+            if now - job.last_watch > self.args.expire_secs:
+                wd_logger(1, "Forgetting '%s' which hasn't sent WATCH for %d seconds" % (job.fifo_path, now - job.last_watch))
+                del self.jobs[job.fifo_path]
+                self.forget_unused_watches()
+                continue
+            job.reported = set(path for path in job.reported if os.path.exists(path))
+            self.write_pending(job)
+
+    def next_timeout(self, now):
+        return max(0.0, min(list(self.quiet_deadlines.values()) + [now + 1.0]) - now)
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', self.args.port))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        wd_logger(1, 'Listening on 127.0.0.1:%d' % self.args.port)
+        last_expire = time.time()
+        while True:
+            readable, _, _ = select.select([sock, self.inotify.fd], [], [], self.next_timeout(time.time()))
+            now = time.time()
+            if sock in readable:
+                data, _ = sock.recvfrom(65536)
+                for message in data.decode(errors='replace').splitlines():
+                    self.handle_message(message)
+            if self.inotify.fd in readable:
+                self.handle_inotify_events(now)
+            if now - last_expire >= 1.0 or any(now >= deadline for deadline in self.quiet_deadlines.values()):
+                self.expire(now)
+                last_expire = now
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tell the decoding daemons as soon as each one minute wav file is complete')
+    parser.add_argument('--port', type=int, default=58035)
+    parser.add_argument('--quiet-secs', type=float, default=2.0, help='A wav file with less than a minute of samples is complete when it has not been closed again for this long')
+    parser.add_argument('--expire-secs', type=float, default=180.0, help="Forget a decoding daemon which hasn't sent WATCH for this long")
+    parser.add_argument('--log-file', default='')
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+    args = parser.parse_args(argv)
+
+    set_log_file(args.log_file)
+    wd_utils.verbosity += args.verbose
+    setup_verbosity_traps()
+    WavReady(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Filename: wsprnet_upload_scheduler.py
+# Event driven replacement for the 'find ... ; ps aux | grep wsprd' polling loop of upload_to_wsprnet_daemon()
+#
+# The posting daemons queue WN format spot files in  <spots_dir>/<CALL_GRID>/<RECEIVER>/<BAND>/YYMMDD_HHMM_spots.txt
+# and then, through wsprnet_upload_scheduler_notify() in upload-client-utils.sh, send a one line UDP datagram to this daemon:
+#
+#     DONE <CALL_GRID>/<RECEIVER>/<BAND> <YYMMDD_HHMM>
+#
+# The spots of each CALL_GRID are uploaded in one MEPT transaction as soon as all of the RECEIVER/BANDs which have recently
+# reported for that CALL_GRID have reported the cycle, or when --deadline-secs have passed since the first report of that cycle.
+# The merge, sort and wn_from_wd_spot_file.awk formatting are all done in this process.
+#
+# A slow sweep of the spots tree (--sweep-secs) catches spot files left over from a restart or a lost datagram.
+#
+# For testing, '--stub-server PORT' runs a local HTTP server which stands in for wsprnet.org/meptspots.php, e.g.:
+#     ./wsprnet_upload_scheduler.py --stub-server 8088 &
+#     ./wsprnet_upload_scheduler.py --spots-dir /tmp/spots --url http://127.0.0.1:8088/meptspots.php
+# wd-wsprnet-upload-test.sh runs both of them to test the uploads, the deadline and the retries.
+
+import argparse
+import email.parser
+import http.server
+import os
+import re
+import select
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from wd_utils import wd_logger, setup_verbosity_traps, set_log_file, cycle_to_epoch
+import wd_utils
+import wd_trace
+
+WSPRNET_URL = 'http://wsprnet.org/meptspots.php'
+MAX_UPLOAD_SPOTS_COUNT = 999       # Limit of number of spots to upload in one curl MEPT upload transaction
+EXPECTED_MAX_MISSED_CYCLES = 3     # Stop waiting for a RECEIVER/BAND which hasn't reported in this many cycles
+RETRY_SECS = 30                    # After a failed upload, wait this long before trying that CALL_GRID again
+
+spot_filename_regex = re.compile(r'^(\d{6}_\d{4})_spots\.txt$')
+
+# wn_from_wd_spot_file.awk: map the WD pkt_mode in field 18 of an extended spot line to the mode wsprnet.org expects
+wd_to_wn_pkt_mode = {2: 2, 15: 15, 3: 3, 6: 5, 16: 15, 31: 30}
+
+
+def wn_line_from_spot_line(line):
+    # Returns a wsprnet.org MEPT spot line from either a 34 field WD extended spot line or an already formatted 11 field WN line
+    fields = line.split()
+    if len(fields) == 34:
+        if fields[7] == 'none':
+            fields[7] = '      '
+        try:
+            wn_pkt_mode = wd_to_wn_pkt_mode[int(fields[17])]
+        except (ValueError, KeyError):
+            wd_logger(1, "ERROR: WD spot line has pkt_mode = '%s', not one of the expected 2/3/5/15/16/30 values: %s" % (fields[17], line.rstrip()))
+            wn_pkt_mode = 2
+        return '%6s %4s %5.2f %3d %5.2f %12.7f %-14s %-6s %2d %2d %4d' % (fields[0], fields[1], float(fields[2]), int(float(fields[3])), float(fields[4]),
+                                                                          float(fields[5]), fields[6], fields[7], int(float(fields[8])), int(float(fields[9])), wn_pkt_mode)
+    if len(fields) == 11 or len(fields) == 10:
+        return line.rstrip('\n').replace('none', '    ')
+    wd_logger(1, 'ERROR: skipping spot line with %d fields instead of the expected 11 or 34 fields: %s' % (len(fields), line.rstrip()))
+    return None
+
+
+def wn_sort_key(wn_line):
+    # Same order as "sort -k 1,1 -k 2,2 -k 6,6n":  date, time, then ascending frequency
+    fields = wn_line.split()
+    try:
+        freq = float(fields[5])
+    except (IndexError, ValueError):
+        freq = 0.0
+    return (fields[0], fields[1], freq)
+
+
+def parse_wsprnet_response(response_text):
+    # Returns (spots_xfered, spots_offered), or None if the response doesn't contain 'N out of M spot(s) added'
+    for response_line in response_text.splitlines():
+        if re.search(r'spot.* added', response_line):
+            fields = response_line.split()
+            if len(fields) >= 4 and fields[0].isdigit() and fields[3].isdigit():
+                return int(fields[0]), int(fields[3])
+    return None
+
+
+def encode_multipart(form_fields, file_field, file_name, file_bytes):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form_fields.items():
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary, name, value)).encode())
+    parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: text/plain\r\n\r\n' % (boundary, file_field, file_name)).encode())
+    parts.append(file_bytes)
+    parts.append(('\r\n--%s--\r\n' % boundary).encode())
+    return b''.join(parts), 'multipart/form-data; boundary=%s' % boundary
+
+
+class UploadScheduler:
+    def __init__(self, args):
+        self.args = args
+        self.spots_dir = args.spots_dir
+        self.cycles = {}                 # (call_grid, cycle) => {'reported': set(rx/band), 'first_report': epoch}
+        self.expected = {}               # call_grid => {rx/band: epoch of the last cycle it reported}
+        self.retry_after = {}            # call_grid => epoch before which we shouldn't retry a failed upload
+        self.drop_regex = re.compile(args.drop_regex) if args.drop_regex else None
+        self.last_sweep = 0.0
+
+    def learn_expected_from_tree(self):
+        # The posting daemons create their CALL_GRID/RECEIVER/BAND queue dirs when they start, so seed the expected set from them
+        now = time.time()
+        for call_grid, rx_band in self.walk_queue_dirs():
+            self.expected.setdefault(call_grid, {}).setdefault(rx_band, now)
+
+    def walk_queue_dirs(self):
+        try:
+            call_grid_list = [e.name for e in os.scandir(self.spots_dir) if e.is_dir()]
+        except FileNotFoundError:
+            return
+        for call_grid in call_grid_list:
+            call_grid_path = os.path.join(self.spots_dir, call_grid)
+            for rx in os.scandir(call_grid_path):
+                if not rx.is_dir():
+                    continue
+                for band in os.scandir(rx.path):
+                    if band.is_dir():
+                        yield call_grid, rx.name + '/' + band.name
+
+    def handle_event(self, message):
+        fields = message.split()
+        if len(fields) != 3 or fields[0] != 'DONE':
+            wd_logger(1, "ERROR: ignoring malformed event '%s'" % message)
+            return
+        path_elements = fields[1].rstrip('/').split('/')
+        if len(path_elements) < 3:
+            wd_logger(1, "ERROR: ignoring event with bad queue dir '%s'" % fields[1])
+            return
+        call_grid, rx_band = path_elements[-3], path_elements[-2] + '/' + path_elements[-1]
+        cycle = fields[2]
+        try:
+            cycle_epoch = cycle_to_epoch(cycle)
+        except ValueError:
+            wd_logger(1, "ERROR: ignoring event with bad cycle '%s'" % cycle)
+            return
+        self.expected.setdefault(call_grid, {})[rx_band] = cycle_epoch
+        state = self.cycles.setdefault((call_grid, cycle), {'reported': set(), 'first_report': time.time()})
+        state['reported'].add(rx_band)
+        wd_logger(2, '%s reported cycle %s for %s' % (rx_band, cycle, call_grid))
+
+    def expected_rx_bands(self, call_grid, cycle_epoch):
+        # Drop RECEIVER/BANDs which have stopped reporting, e.g. after a schedule change
+        expected = self.expected.get(call_grid, {})
+        oldest_epoch = cycle_epoch - EXPECTED_MAX_MISSED_CYCLES * wd_utils.WSPR_CYCLE_SECONDS
+        for rx_band in [rx_band for rx_band, last_epoch in expected.items() if last_epoch < oldest_epoch]:
+            wd_logger(1, '%s of %s has not reported for %d cycles, so no longer wait for it' % (rx_band, call_grid, EXPECTED_MAX_MISSED_CYCLES))
+            del expected[rx_band]
+        return set(expected)
+
+    def ready_call_grids(self, now):
+        # Returns {call_grid: newest cycle which is ready for upload}
+        ready = {}
+        for (call_grid, cycle), state in sorted(self.cycles.items()):
+            if now < self.retry_after.get(call_grid, 0):
+                continue
+            missing = self.expected_rx_bands(call_grid, cycle_to_epoch(cycle)) - state['reported']
+            if not missing:
+                wd_logger(1, 'All %d RECEIVER/BANDs of %s have reported cycle %s' % (len(state['reported']), call_grid, cycle))
+                ready[call_grid] = cycle
+            elif now - state['first_report'] >= self.args.deadline_secs:
+                wd_logger(1, 'After %d seconds %s is still missing cycle %s from %s, so upload what we have' % (self.args.deadline_secs, call_grid, cycle, ' '.join(sorted(missing))))
+                ready[call_grid] = cycle
+        return ready
+
+    def sweep(self, now, ready):
+        # Add to 'ready' the queued spot files which no event told us about, e.g. left over from before a restart
+        for call_grid, rx_band in self.walk_queue_dirs():
+            if now < self.retry_after.get(call_grid, 0):
+                continue
+            for entry in os.scandir(os.path.join(self.spots_dir, call_grid, rx_band)):
+                m = spot_filename_regex.match(entry.name)
+                if m and (call_grid, m.group(1)) not in self.cycles and now - entry.stat().st_mtime >= self.args.deadline_secs:
+                    ready[call_grid] = max(ready.get(call_grid, ''), m.group(1))
+
+    def queued_spot_files(self, call_grid):
+        # Returns {cycle: [spot_file_path, ...]} for all the spot files queued under call_grid
+        cycle_files = {}
+        call_grid_path = os.path.join(self.spots_dir, call_grid)
+        for rx in os.scandir(call_grid_path):
+            if not rx.is_dir():
+                continue
+            for band in os.scandir(rx.path):
+                if not band.is_dir():
+                    continue
+                for entry in os.scandir(band.path):
+                    m = spot_filename_regex.match(entry.name)
+                    if m:
+                        cycle_files.setdefault(m.group(1), []).append(entry.path)
+        return cycle_files
+
+    def upload_call_grid(self, call_grid, newest_cycle):
+        # Upload the spots of all the queued cycles of call_grid up to and including newest_cycle
+        call = call_grid.rsplit('_', 1)[0].replace('=', '/')     # '/' in calls is replaced by '=' in the dir name
+        grid = call_grid.rsplit('_', 1)[-1]
+        cycle_files = {cycle: files for cycle, files in self.queued_spot_files(call_grid).items() if cycle <= newest_cycle}
+        if not cycle_files:
+            wd_logger(2, 'Found no spot files under %s from cycles up to %s' % (call_grid, newest_cycle))
+            self.forget_cycles(call_grid, newest_cycle)
+            return True
+
+        # Like upload_wsprnet_create_spot_file_list_file(): add whole cycles, oldest first, until MAX_UPLOAD_SPOTS_COUNT
+        upload_file_list = []
+        wn_lines = []
+        uploaded_cycles = []
+        for cycle in sorted(cycle_files):
+            cycle_lines = []
+            for spot_file in cycle_files[cycle]:
+                with open(spot_file) as fp:
+                    for line in fp:
+                        if line.strip():
+                            wn_line = wn_line_from_spot_line(line)
+                            if wn_line is not None:
+                                cycle_lines.append(wn_line)
+            if upload_file_list and len(wn_lines) + len(cycle_lines) > self.args.max_spots:
+                wd_logger(2, 'Adding the %d spots in cycle %s would exceed the max %d spots for an MEPT upload' % (len(cycle_lines), cycle, self.args.max_spots))
+                break
+            upload_file_list += cycle_files[cycle]
+            wn_lines += cycle_lines
+            uploaded_cycles.append(cycle)
+
+        wn_lines.sort(key=wn_sort_key)
+        if self.args.drop_my_call:
+            my_call_regex = re.compile(r'(^|\W)%s(\W|$)' % re.escape(call), re.IGNORECASE)
+            kept_lines = [line for line in wn_lines if not my_call_regex.search(line)]
+            if len(kept_lines) != len(wn_lines):
+                wd_logger(1, 'Dropping %d spots with my reporter_id %s' % (len(wn_lines) - len(kept_lines), call))
+            wn_lines = kept_lines
+        if self.drop_regex:
+            kept_lines = [line for line in wn_lines if not self.drop_regex.search(line)]
+            if len(kept_lines) != len(wn_lines):
+                wd_logger(1, "Dropping %d spots which match regex '%s'" % (len(wn_lines) - len(kept_lines), self.args.drop_regex))
+            wn_lines = kept_lines
+
+        if not wn_lines:
+            wd_logger(1, 'Found %d spot files but there are no spot lines in them, so flushing those spot files' % len(upload_file_list))
+            self.flush(call_grid, upload_file_list, uploaded_cycles[-1])
+            return True
+
+        spots_text = ''.join(line + '\n' for line in wn_lines)
+        wd_logger(1, 'Uploading %s at %s %d spots from %d files in cycles %s' % (call, grid, len(wn_lines), len(upload_file_list), ' '.join(uploaded_cycles)))
+        body, content_type = encode_multipart({'version': self.args.version, 'call': call, 'grid': grid}, 'allmept', 'spots.txt', spots_text.encode())
+        request = urllib.request.Request(self.args.url, data=body, headers={'Content-Type': content_type})
+        start_time = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=self.args.timeout) as response:
+                response_text = response.read().decode(errors='replace')
+        except (urllib.error.URLError, OSError) as e:
+            wd_logger(1, 'After %.1f seconds, upload failed with %s.  So leave spot files for a retry in %d seconds' % (time.time() - start_time, e, self.args.retry_secs))
+            self.retry_after[call_grid] = time.time() + self.args.retry_secs
+            return False
+        upload_secs = time.time() - start_time
+
+        self.log_uploaded_spots(spots_text)
+        counts = parse_wsprnet_response(response_text)
+        if re.search(r'Upload limit.*reached', response_text):
+            wd_logger(1, 'WARNING: wsprnet.org rejected upload and returned this message. So flush the files which contain the spots which we attempted to upload:\n%s' % response_text)
+        elif counts is None:
+            wd_logger(1, "WARNING: Couldn't extract 'spots added' from the end of the server's response:\n%s So presume spots were recorded and flush them from our cache" % '\n'.join(response_text.splitlines()[-10:]))
+        else:
+            spots_xfered, spots_offered = counts
+            wd_logger(1, 'After %.1f seconds, wsprnet reported %d of the %d offered spots were added' % (upload_secs, spots_xfered, spots_offered))
+            upload_spot_log_verbosity = self.args.upload_spot_log_verbosity
+            wd_logger(upload_spot_log_verbosity, '\n' + spots_text)
+        self.flush(call_grid, upload_file_list, uploaded_cycles[-1])
+        return True
+
+    def flush(self, call_grid, spot_file_list, newest_cycle):
+        for spot_file in spot_file_list:
+            try:
+                os.remove(spot_file)
+            except FileNotFoundError:
+                pass
+        self.forget_cycles(call_grid, newest_cycle)
+
+    def forget_cycles(self, call_grid, newest_cycle):
+        for key in [key for key in self.cycles if key[0] == call_grid and key[1] <= newest_cycle]:
+            del self.cycles[key]
+
+    def log_uploaded_spots(self, spots_text):
+        # Phil KA9Q wants a log of all uploaded spots in /var/log/wspr.log.  upload_to_wsprnet_daemon() has already set up its ownership
+        if self.args.wspr_log_file:
+            try:
+                with open(self.args.wspr_log_file, 'a') as fp:
+                    fp.write(spots_text)
+            except OSError as e:
+                wd_logger(1, "ERROR: can't append to '%s': %s" % (self.args.wspr_log_file, e))
+        if self.args.logging_cmd:
+            spots_file = os.path.join(self.args.tmp_dir, 'spots.txt')
+            with open(spots_file, 'w') as fp:
+                fp.write(spots_text)
+            rc = subprocess.call([self.args.logging_cmd, spots_file])
+            if rc:
+                wd_logger(1, "ERROR: '%s %s' => %d" % (self.args.logging_cmd, spots_file, rc))
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', self.args.port))
+        self.learn_expected_from_tree()
+        wd_logger(1, 'Listening for decode complete events on UDP port %d, watching %s' % (self.args.port, self.spots_dir))
+        self.last_sweep = 0.0       # Sweep immediately so spots queued before a restart get uploaded
+        while True:
+            now = time.time()
+            timeout = max(0.0, min(self.next_deadline(now), self.last_sweep + self.args.sweep_secs) - now)
+            readable, _, _ = select.select([sock], [], [], timeout)
+            if readable:
+                data = sock.recv(4096)
+                for message in data.decode(errors='replace').splitlines():
+                    if message.strip():
+                        self.handle_event(message)
+            now = time.time()
+            ready = self.ready_call_grids(now)
+            if now - self.last_sweep >= self.args.sweep_secs:
+                self.sweep(now, ready)
+                self.last_sweep = now
+            for call_grid, newest_cycle in sorted(ready.items()):
+                if not self.args.trace_file:
+                    self.upload_call_grid(call_grid, newest_cycle)
+                    continue
+                with wd_trace.span('wsprnet_upload', 'all', newest_cycle, receiver=call_grid, trace_file=self.args.trace_file):
+                    self.upload_call_grid(call_grid, newest_cycle)
+
+    def next_deadline(self, now):
+        # A deadline which has passed was acted on by ready_call_grids() in this pass, and the cycles of a call_grid which is waiting to
+        # retry a failed upload aren't ready before its retry time.  So leave both out, else select() gets a timeout of 0 and run() spins
+        deadlines = [t for t in self.retry_after.values() if t > now]
+        for (call_grid, cycle), state in self.cycles.items():
+            deadline = state['first_report'] + self.args.deadline_secs
+            if deadline > now and now >= self.retry_after.get(call_grid, 0):
+                deadlines.append(deadline)
+        return min(deadlines) if deadlines else now + self.args.sweep_secs
+
+
+class StubMeptHandler(http.server.BaseHTTPRequestHandler):
+    # Accepts MEPT uploads the way wsprnet.org/meptspots.php does and replies with its 'N out of M spot(s) added' line
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+        fields = {}
+        for part in message.get_payload():
+            fields[part.get_param('name', header='content-disposition')] = part.get_payload(decode=True)
+        spot_lines = [line for line in fields.get('allmept', b'').decode().splitlines() if line.strip()]
+        if self.server.stub_dir:
+            stub_file = os.path.join(self.server.stub_dir, '%d_%s.txt' % (time.time() * 1000, fields.get('call', b'').decode().replace('/', '=')))
+            with open(stub_file, 'w') as fp:
+                fp.write('\n'.join(spot_lines) + '\n')
+        reply = '%d out of %d spot(s) added\n' % (len(spot_lines), len(spot_lines))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(reply.encode())
+
+    def log_message(self, format, *args):
+        wd_logger(1, format % args)
+
+
+def run_stub_server(port, stub_dir):
+    server = http.server.HTTPServer(('127.0.0.1', port), StubMeptHandler)
+    server.stub_dir = stub_dir
+    wd_logger(1, 'Stub wsprnet.org server listening on http://127.0.0.1:%d/meptspots.php' % port)
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Event driven uploader of queued spot files to wsprnet.org')
+    parser.add_argument('--spots-dir', default='.', help='The UPLOADS_WSPRNET_SPOTS_DIR tree of CALL_GRID/RECEIVER/BAND queues')
+    parser.add_argument('--port', type=int, default=58026, help='UDP port on 127.0.0.1 where decode complete events arrive')
+    parser.add_argument('--url', default=WSPRNET_URL)
+    parser.add_argument('--version', default='WD_unknown', help="The 'version' form field sent to wsprnet.org")
+    parser.add_argument('--deadline-secs', type=float, default=45, help='Upload a cycle this long after its first report even if some bands are missing')
+    parser.add_argument('--sweep-secs', type=float, default=60, help='How often to look for queued spot files which no event told us about')
+    parser.add_argument('--timeout', type=float, default=300, help='Timeout for each upload transaction')
+    parser.add_argument('--retry-secs', type=float, default=RETRY_SECS, help='After a failed upload, wait this long before trying that CALL_GRID again')
+    parser.add_argument('--max-spots', type=int, default=MAX_UPLOAD_SPOTS_COUNT)
+    parser.add_argument('--drop-my-call', action='store_true', help='Drop spots of our own call')
+    parser.add_argument('--drop-regex', default='', help='Drop spot lines which match this regex')
+    parser.add_argument('--wspr-log-file', default='', help='Append all uploaded spots to this file, i.e. /var/log/wspr.log')
+    parser.add_argument('--logging-cmd', default='', help='Run WSPR_LOGGING_CMD with a file of the uploaded spots')
+    parser.add_argument('--upload-spot-log-verbosity', type=int, default=1)
+    parser.add_argument('--tmp-dir', default='/tmp')
+    parser.add_argument('--log-file', default='', help='Append log lines to this file instead of stdout')
+    parser.add_argument('--trace-file', default='', help='Record a wd_trace.py span for each upload in this file')
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+    parser.add_argument('--stub-server', type=int, metavar='PORT', help='Instead of uploading, run a local stand-in for wsprnet.org on PORT')
+    parser.add_argument('--stub-dir', default='', help='Where the stub server saves the spots it receives')
+    args = parser.parse_args(argv)
+
+    wd_utils.verbosity += args.verbose
+    set_log_file(args.log_file)
+    setup_verbosity_traps()
+
+    if args.stub_server:
+        run_stub_server(args.stub_server, args.stub_dir)
+        return 0
+    UploadScheduler(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
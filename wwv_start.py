@@ -1,14 +1,14 @@
 #!/home/wsprdaemon/wsprdaemon/venv/bin/python3
 
 import numpy as np
-import os
-import soundfile as sf
 import sys
-from pathlib import Path
-from scipy import signal
 import re
 
 def cross_file(filename):
+    # soundfile and scipy are imported here, so loading this file (e.g. by the wd_py.py pool) doesn't pay for them
+    import soundfile as sf
+    from scipy import signal
+
     # look for 0.8 seconds of 1 kHz (eventually, also 1.5 kHz at top of hour)
 
     # determine tone burst frequency from filename, if possible
@@ -55,8 +55,10 @@ def cross_file(filename):
     print(f'{1000.0 * (wav_peak / wav_sample_rate):.2f} ms')
     return
 
-def main():
-    cross_file(sys.argv[1])
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cross_file(argv[0])
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())